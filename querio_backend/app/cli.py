@@ -0,0 +1,89 @@
+"""
+Command-line maintenance tasks.
+
+Usage:
+    python -m app.cli rebuild [--namespace NS] [--reset] [--readers 8] [--batch-size 10000]
+
+Run it while the API is stopped: both would otherwise write the same index files.
+"""
+
+import argparse
+import logging
+import threading
+
+from app.config import settings
+from app.services.embedding_service import EmbeddingService
+from app.services.index_migration_service import IndexMigrationService, load_alias
+from app.services.index_rebuild_service import IndexRebuildService
+from app.services.local_storage import LocalStorageBackend
+from app.services.vector_service import VectorService, validate_namespace
+
+
+def rebuild(args: argparse.Namespace):
+    alias = load_alias()
+    vector_service = VectorService(generation=alias["generation"])
+    service = IndexRebuildService(
+        vector_service=vector_service,
+        storage=LocalStorageBackend(),
+        index_migration=IndexMigrationService(
+            vector_service, EmbeddingService(model=alias["embedding_model"], dimensions=alias["dimensions"])
+        ),
+        embedding_model=None if args.any_model else alias["embedding_model"],
+        readers=args.readers,
+        batch_size=args.batch_size
+    )
+
+    done = threading.Event()
+
+    def report():
+        while not done.wait(2.0):
+            p = service.get_progress()
+            if p.get("status") == "running":
+                print(
+                    f"  {p['documents_done']}/{p['documents_total']} documents, "
+                    f"{p['chunks_written']}/{p['chunks_total']} chunks, {p['chunks_per_sec']} chunks/sec"
+                )
+
+    reporter = threading.Thread(target=report, daemon=True)
+    reporter.start()
+    try:
+        progress = service.rebuild(namespace=args.namespace, reset=args.reset)
+    finally:
+        done.set()
+
+    print(
+        f"{progress['status']}: {progress.get('chunks_written', 0)} chunks from "
+        f"{progress.get('documents_done', 0)} documents in {progress.get('elapsed_s', 0)}s "
+        f"({progress.get('chunks_per_sec', 0)} chunks/sec), "
+        f"{progress.get('documents_skipped', 0)} skipped, {len(progress.get('errors', []))} errors"
+    )
+    for error in progress.get("errors", []):
+        print(f"  {error['item']}: {error['error']}")
+    if progress.get("error"):
+        print(f"  {progress['error']}")
+
+    return 0 if progress["status"] == "completed" and not progress.get("errors") else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild_parser = commands.add_parser("rebuild", help="Rebuild the vector index from the document cache")
+    rebuild_parser.add_argument("--namespace", type=validate_namespace, help="Only restore this namespace")
+    rebuild_parser.add_argument("--reset", action="store_true", help="Drop what the cache does not have from the restored namespaces")
+    rebuild_parser.add_argument("--readers", type=int, default=settings.REBUILD_READERS)
+    rebuild_parser.add_argument("--batch-size", type=int, default=settings.REBUILD_BATCH_SIZE)
+    rebuild_parser.add_argument(
+        "--any-model", action="store_true", help="Also restore documents embedded with another model"
+    )
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.command == "rebuild":
+        raise SystemExit(rebuild(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -10,4 +10,127 @@ class Settings:
     SUPABASE_DB_USER = os.getenv("SUPABASE_DB_USER")
     SUPABASE_DB_PASSWORD = os.getenv("SUPABASE_DB_PASSWORD")
 
+    # Ollama backends (comma-separated base URLs); requests are load balanced across them
+    OLLAMA_HOSTS = [
+        host.strip()
+        for host in os.getenv("OLLAMA_HOSTS", os.getenv("OLLAMA_HOST", "http://localhost:11434")).split(",")
+        if host.strip()
+    ]
+    OLLAMA_HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", 10))
+    OLLAMA_HEDGE_ENABLED = os.getenv("OLLAMA_HEDGE_ENABLED", "false").lower() == "true"
+    OLLAMA_HEDGE_MIN_MS = float(os.getenv("OLLAMA_HEDGE_MIN_MS", 200))
+
+    # Ollama calls allowed to run concurrently across all backends
+    # (default: OLLAMA_NUM_PARALLEL-style 2 per backend)
+    OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", 2 * len(OLLAMA_HOSTS)))
+
+    # Texts embedded per scheduler slot; ingestion can be preempted between batches
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 16))
+    # Chunks an upload embeds and writes at a time: its memory use depends on this,
+    # not on the document's size (searches may see a re-upload half written meanwhile)
+    INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 256))
+    # Chunk boundaries: "content" (content-defined, so an edit only changes nearby chunks)
+    # or "fixed" (every 500 characters)
+    CHUNKING_MODE = os.getenv("CHUNKING_MODE", "content")
+    # Re-uploads reuse the stored embeddings of unchanged chunks and only embed the rest
+    INCREMENTAL_INGEST_ENABLED = os.getenv("INCREMENTAL_INGEST_ENABLED", "true").lower() == "true"
+    # Store and embed each distinct chunk of a namespace once (exact copies, same chunk_hash),
+    # listing every file it came from. Changing CHUNK_DEDUP_ENABLED needs
+    # `python -m app.cli rebuild --reset`
+    CHUNK_DEDUP_ENABLED = os.getenv("CHUNK_DEDUP_ENABLED", "true").lower() == "true"
+    # Opt-in: also merge near duplicates from other files, chunks whose estimated word 3-gram
+    # (MinHash) similarity reaches this. A merged chunk is served with the stored chunk's text,
+    # so a one-word change (a negation, an amount, an identifier) is lost from search
+    CHUNK_DEDUP_THRESHOLD = float(os.getenv("CHUNK_DEDUP_THRESHOLD")) if os.getenv("CHUNK_DEDUP_THRESHOLD") else None
+    CHUNK_REGISTRY_PATH = os.getenv("CHUNK_REGISTRY_PATH", "data/chunk_registry.sqlite3")
+    # Embedding model of a fresh index; afterwards the alias manifest records the model the
+    # live index was built with, and POST /vectors/migrate changes it
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "nomic-embed-text-v2-moe")
+
+    # Per-call-type models; each tier falls back to LLM_MODEL_DEFAULT when its output is rejected
+    LLM_MODEL_DEFAULT = os.getenv("LLM_MODEL_DEFAULT", "gemma2:9b")
+    LLM_MODEL_SPLIT = os.getenv("LLM_MODEL_SPLIT", LLM_MODEL_DEFAULT)
+    LLM_MODEL_SQL = os.getenv("LLM_MODEL_SQL", LLM_MODEL_DEFAULT)
+    LLM_MODEL_ANSWER = os.getenv("LLM_MODEL_ANSWER", LLM_MODEL_DEFAULT)
+    LLM_MODEL_SYNTHESIS = os.getenv("LLM_MODEL_SYNTHESIS", LLM_MODEL_DEFAULT)
+
+    # Deterministic (temperature 0) LLM response cache
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+    LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "data/llm_cache/responses.sqlite3")
+    LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", 64))
+
+    # Semantic RAG answer cache (paraphrased questions over the same retrieved chunks)
+    SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))
+    SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 1000))
+    SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", 3600))
+
+    # RAG prompt context: token budget, and an optional HuggingFace tokenizer.json
+    # matching the answer model (without it token counts are estimates, scaled to the
+    # prompt_eval_count Ollama reports for answered prompts)
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1500))
+    TOKENIZER_PATH = os.getenv("TOKENIZER_PATH")
+
+    # Retrieval-confidence gating on Chroma distances (lower = closer).
+    # Past RAG_MAX_DISTANCE a chunk is ignored; with no chunks left the no-information
+    # answer is returned without an LLM call. Unset disables the gate.
+    RAG_MAX_DISTANCE = float(os.getenv("RAG_MAX_DISTANCE")) if os.getenv("RAG_MAX_DISTANCE") else None
+    # Fast extractive answers (best-matching sentences, no LLM) when the top chunk is this close
+    RAG_EXTRACTIVE_ENABLED = os.getenv("RAG_EXTRACTIVE_ENABLED", "false").lower() == "true"
+    RAG_EXTRACTIVE_DISTANCE = float(os.getenv("RAG_EXTRACTIVE_DISTANCE", 0.3))
+    RAG_EXTRACTIVE_SENTENCES = int(os.getenv("RAG_EXTRACTIVE_SENTENCES", 3))
+
+    # Vector store: "chroma", "flat" (exact in-process memory-mapped NumPy index)
+    # or "ivf" (approximate inverted-file index on the same storage)
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+    FLAT_INDEX_DIR = os.getenv("FLAT_INDEX_DIR", "data/flat_index")
+    # Scan matrix format: float32, float16 or int8 (per-vector scale). Compact formats keep
+    # a float32 copy on disk to rescore the top candidates unless FLAT_INDEX_RESCORE=false
+    FLAT_INDEX_DTYPE = os.getenv("FLAT_INDEX_DTYPE", "float32")
+    FLAT_INDEX_RESCORE = os.getenv("FLAT_INDEX_RESCORE", "true").lower() == "true"
+    FLAT_INDEX_RESCORE_FACTOR = int(os.getenv("FLAT_INDEX_RESCORE_FACTOR", 4))
+    FLAT_INDEX_THREADS = int(os.getenv("FLAT_INDEX_THREADS", os.cpu_count() or 1))
+    IVF_NLIST = int(os.getenv("IVF_NLIST", 1024))
+    IVF_NPROBE = int(os.getenv("IVF_NPROBE", 16))
+    IVF_TRAIN_MIN = int(os.getenv("IVF_TRAIN_MIN", 10000))
+    # Matryoshka two-stage search (flat/ivf): scan normalized leading-dimension prefixes of
+    # this size first, then rerank MATRYOSHKA_CANDIDATE_FACTOR x top_k candidates on all
+    # dimensions (0 = single stage)
+    MATRYOSHKA_DIMS = int(os.getenv("MATRYOSHKA_DIMS", 0))
+    MATRYOSHKA_CANDIDATE_FACTOR = int(os.getenv("MATRYOSHKA_CANDIDATE_FACTOR", 10))
+    # Namespace (tenant) partitions kept open besides the default one (which always stays
+    # open), and idle time before one is closed (0 = only close when over the limit)
+    VECTOR_MAX_OPEN_NAMESPACES = int(os.getenv("VECTOR_MAX_OPEN_NAMESPACES", 16))
+    VECTOR_NAMESPACE_IDLE_SECONDS = int(os.getenv("VECTOR_NAMESPACE_IDLE_SECONDS", 900))
+    # Lexical (BM25) retrieval next to the vectors. RETRIEVAL_MODE: "vector", "lexical" or
+    # "hybrid" (reciprocal-rank fusion of HYBRID_CANDIDATES results from each side)
+    LEXICAL_INDEX_ENABLED = os.getenv("LEXICAL_INDEX_ENABLED", "true").lower() == "true"
+    # BM25 indexes of closed namespaces are saved here and loaded when they reopen
+    LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", "data/lexical")
+    RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+    HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 20))
+    RRF_K = int(os.getenv("RRF_K", 60))
+    # Secondary indexes on chunk metadata (filename, page, heading, uploaded_at). Filters
+    # matching at most METADATA_PREFILTER_SELECTIVITY of a partition score only the matching
+    # chunks; broader ones are applied during a full search
+    METADATA_INDEX_ENABLED = os.getenv("METADATA_INDEX_ENABLED", "true").lower() == "true"
+    METADATA_PREFILTER_SELECTIVITY = float(os.getenv("METADATA_PREFILTER_SELECTIVITY", 0.2))
+    # Live index generation and embedding model, plus migration checkpoints
+    VECTOR_ALIAS_PATH = os.getenv("VECTOR_ALIAS_PATH", "data/vector_alias.json")
+    # Re-embedding rate of a migration (0 = as fast as the ingest priority class allows),
+    # and whether an interrupted migration resumes at startup
+    MIGRATION_MAX_CHUNKS_PER_SEC = float(os.getenv("MIGRATION_MAX_CHUNKS_PER_SEC", 0))
+    MIGRATION_AUTO_RESUME = os.getenv("MIGRATION_AUTO_RESUME", "true").lower() == "true"
+    # Most questions accepted by one batch search request
+    BATCH_SEARCH_MAX_QUERIES = int(os.getenv("BATCH_SEARCH_MAX_QUERIES", 64))
+
+    # Document cache (original file, chunks, embeddings, metadata per content hash)
+    CACHE_DIR = os.getenv("CACHE_DIR", "data/cached_chunks")
+    EMBEDDING_STORAGE_FORMAT = os.getenv("EMBEDDING_STORAGE_FORMAT", "float32")
+    # Write every upload to the cache, so the vector index can be rebuilt without re-embedding
+    DOCUMENT_CACHE_ENABLED = os.getenv("DOCUMENT_CACHE_ENABLED", "true").lower() == "true"
+    # Index rebuild from the cache: reader threads and chunks per vector store write
+    REBUILD_READERS = int(os.getenv("REBUILD_READERS", 4))
+    REBUILD_BATCH_SIZE = int(os.getenv("REBUILD_BATCH_SIZE", 5000))
+
 settings = Settings()
\ No newline at end of file
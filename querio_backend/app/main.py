@@ -1,16 +1,26 @@
 """
-Hybrid RAG + Text-to-SQL API (Ollama + Supabase + Chroma)
-Clean Version – No Cache, No Deployment Extras
+Hybrid RAG + Text-to-SQL API (Ollama + Supabase + Chroma or flat/IVF indexes)
+Caches: deterministic LLM responses (LLMResponseCache, keyed by model
+digest), RAG answers for paraphrased questions (SemanticAnswerCache) and
+ingested documents' chunks and embeddings (DocumentCacheService).
 """
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import Depends, FastAPI, UploadFile, File, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware  # Add this import
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from pathlib import Path
-import shutil
+from typing import BinaryIO, List, Optional
+import logging
+import os
+import time
 
+from app.config import settings
+from app.services.document_cache_service import DocumentCacheService, FileTooLargeError, copy_and_hash
 from app.services.document_service import DocumentService
 from app.services.embedding_service import EmbeddingService
-from app.services.vector_service import VectorService
+from app.services.vector_service import DEFAULT_NAMESPACE, SEARCH_MODES, VectorService, validate_namespace
 from app.services.rag_service import RAGService
 from app.services.text_to_sql_service import TextToSQLService
 from app.services.router_service import QueryRouter
@@ -18,7 +28,18 @@ from app.services.ollama_llm_service import OllamaLLMService
 from app.services.db_executor import DBExecutor
 from app.services.sql_schema_service import SQLSchemaService
 from app.services.hybrid_combiner_service import HybridCombinerService
+from app.services.index_migration_service import IndexMigrationService, load_alias
+from app.services.index_rebuild_service import IndexRebuildService
+from app.services.ingest_pipeline import IngestPipeline
+from app.services.local_storage import LocalStorageBackend
 from app.services.intent_splitter_service import IntentSplitterService
+from app.services.maintenance import MaintenanceInProgressError, MaintenanceLock
+from app.services.ollama_client import get_ollama_client
+from app.services.model_router import get_model_router
+from app.streaming import sse_stream, stream_metrics
+from app.utils import FileValidator
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Hybrid RAG + SQL API")
 
@@ -41,10 +62,44 @@ app.add_middleware(
 UPLOAD_DIR = Path("data/uploads")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
-embedding_service = EmbeddingService()
-vector_service = VectorService()
-rag_service = RAGService()
+# The alias manifest names the live index generation and the model it was embedded with
+vector_alias = load_alias()
+embedding_service = EmbeddingService(model=vector_alias["embedding_model"], dimensions=vector_alias["dimensions"])
+vector_service = VectorService(generation=vector_alias["generation"])
+rag_service = RAGService(
+    embedding_service=embedding_service,
+    vector_service=vector_service
+)
 document_service = DocumentService()
+document_storage = LocalStorageBackend()
+document_cache = DocumentCacheService(document_storage) if settings.DOCUMENT_CACHE_ENABLED else None
+# Rebuilds and migrations both switch index generations: one may run at a time
+index_migration = IndexMigrationService(
+    vector_service=vector_service,
+    embedding_service=embedding_service,
+    max_chunks_per_sec=settings.MIGRATION_MAX_CHUNKS_PER_SEC,
+    document_cache=document_cache,
+    maintenance=MaintenanceLock()
+)
+index_rebuild = IndexRebuildService(
+    vector_service=vector_service,
+    storage=document_storage,
+    index_migration=index_migration,
+    embedding_model=embedding_service.model,
+    readers=settings.REBUILD_READERS,
+    batch_size=settings.REBUILD_BATCH_SIZE
+)
+index_migration.add_listener(lambda model: setattr(index_rebuild, "embedding_model", model))
+if settings.MIGRATION_AUTO_RESUME:
+    index_migration.resume()
+ingest_pipeline = IngestPipeline(
+    document_service=document_service,
+    embedding_service=embedding_service,
+    vector_service=vector_service,
+    index_migration=index_migration,
+    document_cache=document_cache,
+    batch_size=settings.INGEST_BATCH_SIZE
+)
 llm_service = OllamaLLMService()
 db_executor = DBExecutor()
 schema_service = SQLSchemaService()
@@ -66,54 +121,211 @@ def health():
     return {"status": "ok"}
 
 
+# =========================
+# LLM Stats
+# =========================
+
+@app.get("/stats/llm")
+def llm_stats():
+    stats = get_ollama_client().get_stats()
+    stats["model_tiers"] = get_model_router().get_stats()
+    stats["context_packing"] = rag_service.context_packer.get_stats()
+    stats["rag_paths"] = rag_service.get_path_stats()
+    if rag_service.answer_cache is not None:
+        stats["semantic_cache"] = rag_service.answer_cache.get_stats()
+    return stats
+
+
 # =========================
 # Upload Document
 # =========================
 
-@app.post("/upload")
-async def upload_document(file: UploadFile = File(...)):
+def check_namespace(namespace: str) -> str:
+    try:
+        return validate_namespace(namespace)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    file_path = UPLOAD_DIR / file.filename
 
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+@app.post("/upload")
+async def upload_document(file: UploadFile = File(...), namespace: str = DEFAULT_NAMESPACE):
 
-    # Parse + Chunk
-    text = document_service.load_text(str(file_path))
-    chunks = document_service.chunk_text(text)
+    check_namespace(namespace)
 
-    # Embed
-    texts = [c["text"] for c in chunks]
-    embeddings = embedding_service.generate_embeddings(texts)
+    # Tenants may upload files with the same name
+    upload_dir = UPLOAD_DIR if namespace == DEFAULT_NAMESPACE else UPLOAD_DIR / namespace
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    file_path = upload_dir / file.filename
 
-    # Store in Chroma
-    vector_service.add_documents(
-        chunks=chunks,
-        embeddings=embeddings,
-        filename=file.filename
-    )
+    # Streamed to disk off the event loop, hashed while writing (the SHA-256 is the document cache key)
+    try:
+        document_id = await run_in_threadpool(save_upload, file.file, file_path)
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    # Ingestion is blocking work; keep it off the event loop so queries stay responsive
+    ingest = await run_in_threadpool(ingest_pipeline.ingest, file_path, file.filename, namespace, document_id)
 
     return {
         "status": "uploaded",
-        "chunks": len(chunks)
+        "namespace": namespace,
+        "chunks": ingest.pop("chunks"),
+        "document_id": document_id,
+        "cache_hit": ingest.pop("cache_hit"),
+        "ingest": ingest
     }
 
 
+def save_upload(source: BinaryIO, file_path: Path) -> str:
+    """
+    Copy an upload to file_path in 1 MB blocks, up to FileValidator.MAX_FILE_SIZE;
+    an earlier upload there is only replaced once the copy is complete.
+
+    Returns:
+        SHA-256 of the content
+    """
+    partial = file_path.with_name(file_path.name + ".part")
+    try:
+        with open(partial, "wb") as buffer:
+            document_id = copy_and_hash(source, buffer, max_bytes=FileValidator.MAX_FILE_SIZE)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    os.replace(partial, file_path)
+    return document_id
+
+
+@app.get("/upload/progress")
+def upload_progress():
+    """
+    Uploads being ingested: text read, chunks embedded and written so far.
+    """
+    return ingest_pipeline.get_progress()
+
+
 # =========================
 # RAG Query
 # =========================
 
+class SearchOptions:
+    """
+    Retrieval options accepted by the query endpoints: namespace (tenant
+    partition searched), mode ("vector", "lexical" or "hybrid"), metadata
+    filters (filename, page, heading, uploaded_after / uploaded_before in
+    epoch seconds; combined with AND) and, for the flat/ivf backends, nprobe
+    (IVF lists scanned), prefix_dims (Matryoshka first-stage size, 0 = single
+    stage) and candidates (first-stage results reranked).
+    """
+
+    def __init__(
+        self,
+        namespace: str = DEFAULT_NAMESPACE,
+        mode: Optional[str] = None,
+        filename: Optional[str] = None,
+        page: Optional[int] = None,
+        heading: Optional[str] = None,
+        uploaded_after: Optional[float] = None,
+        uploaded_before: Optional[float] = None,
+        nprobe: Optional[int] = Query(None, ge=1),
+        prefix_dims: Optional[int] = Query(None, ge=0),
+        candidates: Optional[int] = Query(None, ge=1)
+    ):
+        if mode is not None and mode not in SEARCH_MODES:
+            raise HTTPException(status_code=400, detail=f"mode must be one of {SEARCH_MODES}")
+
+        self.namespace = check_namespace(namespace)
+        self.mode = mode
+        self.filter_dict = self._filter(filename, page, heading, uploaded_after, uploaded_before)
+        self.nprobe = nprobe
+        self.prefix_dims = prefix_dims
+        self.candidates = candidates
+
+    @staticmethod
+    def _filter(filename, page, heading, uploaded_after, uploaded_before):
+        clauses = []
+        if filename is not None:
+            clauses.append({"filename": filename})
+        if page is not None:
+            clauses.append({"page": page})
+        if heading is not None:
+            clauses.append({"heading": heading})
+        if uploaded_after is not None:
+            clauses.append({"uploaded_at": {"$gte": uploaded_after}})
+        if uploaded_before is not None:
+            clauses.append({"uploaded_at": {"$lt": uploaded_before}})
+
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def as_dict(self):
+        return {name: value for name, value in vars(self).items() if value is not None}
+
+
+# Plain (sync) handlers run in the threadpool, so concurrent identical
+# questions can share one in-flight generation.
 @app.post("/query/documents")
-async def query_documents(question: str, top_k: int = 3):
+def query_documents(question: str, top_k: int = 3, search: SearchOptions = Depends()):
 
     result = rag_service.generate_answer(
         question=question,
-        top_k=top_k
+        top_k=top_k,
+        search_options=search.as_dict()
     )
 
     return result
 
 
+class BatchSearchRequest(BaseModel):
+    questions: List[str]
+    top_k: int = 3
+    namespace: str = DEFAULT_NAMESPACE
+    mode: Optional[str] = None
+    filename: Optional[str] = None
+    page: Optional[int] = None
+    heading: Optional[str] = None
+    uploaded_after: Optional[float] = None
+    uploaded_before: Optional[float] = None
+    nprobe: Optional[int] = Field(None, ge=1)
+    prefix_dims: Optional[int] = Field(None, ge=0)
+    candidates: Optional[int] = Field(None, ge=1)
+
+
+# Retrieval only: one embedding batch and one vector query for all questions
+@app.post("/search/batch")
+def search_batch(request: BatchSearchRequest):
+    if len(request.questions) > settings.BATCH_SEARCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.BATCH_SEARCH_MAX_QUERIES} questions per batch"
+        )
+
+    search = SearchOptions(**request.model_dump(exclude={"questions", "top_k"}))
+
+    return rag_service.retrieve_batch(
+        questions=request.questions,
+        top_k=request.top_k,
+        search_options=search.as_dict()
+    )
+
+
+@app.post("/query/documents/stream")
+def query_documents_stream(question: str, top_k: int = 3, search: SearchOptions = Depends()):
+    """
+    Server-Sent Events: `sources` once retrieval is done, then `token` events, then `done`.
+    """
+    started = time.perf_counter()
+
+    return StreamingResponse(
+        sse_stream(
+            "/query/documents/stream",
+            rag_service.stream_answer(question=question, top_k=top_k, search_options=search.as_dict()),
+            started
+        ),
+        media_type="text/event-stream"
+    )
+
+
 # =========================
 # SQL Query
 # =========================
@@ -131,7 +343,7 @@ def query_sql(question: str):
 # =========================
 
 @app.post("/query")
-async def unified_query(question: str, top_k: int = 3):
+def unified_query(question: str, top_k: int = 3, search: SearchOptions = Depends()):
 
     route = QueryRouter.route(question)
 
@@ -148,7 +360,8 @@ async def unified_query(question: str, top_k: int = 3):
     elif route == "DOCUMENTS":
         response["rag_result"] = rag_service.generate_answer(
             question=question,
-            top_k=top_k
+            top_k=top_k,
+            search_options=search.as_dict()
         )
 
     # ---------- HYBRID ----------
@@ -169,7 +382,8 @@ async def unified_query(question: str, top_k: int = 3):
         if split["rag_part"]:
             rag_result = rag_service.generate_answer(
                 question=split["rag_part"],
-                top_k=top_k
+                top_k=top_k,
+                search_options=search.as_dict()
             )
 
         # ---- Step 4: Combine ----
@@ -186,11 +400,149 @@ async def unified_query(question: str, top_k: int = 3):
     return response
 
 
+# =========================
+# Unified Hybrid Query (Streaming)
+# =========================
+
+@app.post("/query/stream")
+def unified_query_stream(question: str, top_k: int = 3, search: SearchOptions = Depends()):
+    """
+    Server-Sent Events version of /query. Emits `route` immediately, then
+    `sql_result` / `rag_result` / `sources` as each is ready, then answer
+    `token` events and `done`.
+    """
+    started = time.perf_counter()
+
+    return StreamingResponse(
+        sse_stream("/query/stream", unified_query_events(question, top_k, search), started),
+        media_type="text/event-stream"
+    )
+
+
+def unified_query_events(question: str, top_k: int, search: SearchOptions):
+
+    route = QueryRouter.route(question)
+
+    yield "route", {"question": question, "route": route}
+
+    # ---------- SQL ----------
+    if route == "SQL":
+        yield "sql_result", sql_service.run(question)
+        yield "done", {}
+
+    # ---------- DOCUMENTS ----------
+    elif route == "DOCUMENTS":
+        yield from rag_service.stream_answer(question=question, top_k=top_k, search_options=search.as_dict())
+
+    # ---------- HYBRID ----------
+    elif route == "HYBRID":
+
+        split = intent_splitter.split(question)
+        yield "split", split
+
+        sql_result = None
+        rag_result = None
+
+        if split["sql_part"]:
+            sql_result = sql_service.run(split["sql_part"])
+            yield "sql_result", sql_result
+
+        if split["rag_part"]:
+            rag_result = rag_service.generate_answer(
+                question=split["rag_part"],
+                top_k=top_k,
+                search_options=search.as_dict()
+            )
+            yield "rag_result", rag_result
+
+        parts = []
+        for piece in hybrid_combiner.combine_stream(
+            question=question,
+            sql_result=sql_result,
+            rag_result=rag_result
+        ):
+            parts.append(piece)
+            yield "token", {"text": piece}
+
+        yield "done", {"answer": "".join(parts).strip()}
+
+
+@app.get("/stats/vectors")
+def vector_stats(namespace: str = DEFAULT_NAMESPACE):
+    return vector_service.get_index_stats(check_namespace(namespace))
+
+
+@app.get("/stats/namespaces")
+def namespace_stats():
+    return vector_service.get_namespace_stats()
+
+
+@app.get("/stats/documents")
+def document_cache_stats():
+    stats = {"enabled": document_cache is not None, "storage": document_storage.get_stats()}
+    if document_cache is not None:
+        stats["lookups"] = document_cache.get_stats()
+    return stats
+
+
+@app.get("/stats/streaming")
+def streaming_stats():
+    return stream_metrics.get_stats()
+
+
 # =========================
 # Clear Vectors
 # =========================
 
 @app.delete("/vectors/clear")
-def clear_vectors():
-    vector_service.delete_all_vectors()
-    return {"status": "cleared"}
\ No newline at end of file
+def clear_vectors(namespace: str = DEFAULT_NAMESPACE):
+    index_migration.delete_all(check_namespace(namespace))
+    return {"status": "cleared", "namespace": namespace}
+
+
+# =========================
+# Rebuild Vectors From Cache
+# =========================
+
+@app.post("/vectors/rebuild")
+def rebuild_vectors(namespace: Optional[str] = None, reset: bool = False):
+    """
+    Restore the vector index from the document cache in the background
+    (no embedding calls). Poll GET /vectors/rebuild for progress.
+    """
+    if namespace is not None:
+        check_namespace(namespace)
+
+    try:
+        return index_rebuild.start(namespace=namespace, reset=reset)
+    except MaintenanceInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/vectors/rebuild")
+def rebuild_progress():
+    return index_rebuild.get_progress()
+
+
+# =========================
+# Embedding Model Migration
+# =========================
+
+@app.post("/vectors/migrate")
+def migrate_vectors(embedding_model: str):
+    """
+    Re-embed the corpus with another model into a shadow index, then switch
+    searches to it. Searches keep using the current index until then.
+    Posting the same model again resumes an interrupted migration.
+    """
+    try:
+        return index_migration.start(embedding_model)
+    except MaintenanceInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/vectors/migrate")
+def migration_progress():
+    return index_migration.get_progress()
\ No newline at end of file
@@ -0,0 +1,457 @@
+"""
+Chunk Deduplication
+Registry of the unique chunks stored in each vector partition and of the
+file chunks they stand for.
+
+Boilerplate (legal notices, headers, footers) repeats across many files.
+With deduplication each distinct chunk is stored and embedded once, under a
+content-addressed ID; every file chunk that is an exact copy (same hash) of
+it is recorded as a reference, so the stored row can list all of its source
+files. Near duplicates (MinHash similarity over word 3-grams) are only merged
+when a threshold is configured: they are then served with the stored text.
+"""
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+import json
+import logging
+import re
+import sqlite3
+import threading
+import zlib
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 64
+BANDS = 16  # of NUM_PERM // BANDS rows: pairs above ~0.8 similarity almost always share a band
+
+_PRIME = 4294967291  # largest prime below 2**32, so hashes fit in uint32
+_rng = np.random.RandomState(1)
+_A = _rng.randint(1, _PRIME, size=NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, _PRIME, size=NUM_PERM).astype(np.uint64)
+
+_WORD = re.compile(r"\w+")
+_ROW_ID = re.compile(r"^chunk_([0-9a-f]{32})$")
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    """
+    MinHash signature (NUM_PERM uint32 values) of a text's word 3-grams.
+    """
+    words = _WORD.findall(text.lower())
+    shingles = {" ".join(words[i:i + 3]) for i in range(max(len(words) - 2, 1))}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    return ((np.outer(hashes, _A) + _B) % _PRIME).min(axis=0).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    Estimated Jaccard similarity of two signatures.
+    """
+    return float(np.mean(a == b))
+
+
+def band_keys(signature: np.ndarray) -> List[int]:
+    rows = NUM_PERM // BANDS
+    return [
+        (band << 32) | zlib.crc32(signature[band * rows:(band + 1) * rows].tobytes())
+        for band in range(BANDS)
+    ]
+
+
+def dedup_row_id(chunk_hash: str) -> str:
+    """
+    Vector store ID of a unique chunk.
+    """
+    return f"chunk_{chunk_hash}"
+
+
+def chunk_sources(metadata: Dict[str, Any]) -> List[str]:
+    """
+    Every file a stored chunk came from (its filename unless deduplicated).
+    """
+    if metadata.get("sources"):
+        return metadata["sources"].split("\n")
+    return [metadata.get("filename", "Unknown")]
+
+
+def row_chunk_hash(row_id: str) -> Optional[str]:
+    """
+    The chunk hash in a dedup_row_id(), or None for another ID.
+    """
+    match = _ROW_ID.match(row_id)
+    return match.group(1) if match else None
+
+
+class ChunkRegistry:
+    """SQLite registry of unique chunks and their references, per partition (scope)."""
+
+    def __init__(self, path: str = "data/chunk_registry.sqlite3"):
+        """
+        Args:
+            path: SQLite database file
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        # One commit per stored file: the write-ahead log keeps them cheap
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                scope TEXT NOT NULL,
+                chunk_hash TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                PRIMARY KEY (scope, chunk_hash)
+            );
+            CREATE TABLE IF NOT EXISTS bands (
+                scope TEXT NOT NULL,
+                band_key INTEGER NOT NULL,
+                chunk_hash TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_bands_key ON bands (scope, band_key);
+            CREATE INDEX IF NOT EXISTS idx_bands_chunk ON bands (scope, chunk_hash);
+            CREATE TABLE IF NOT EXISTS refs (
+                scope TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                chunk_hash TEXT NOT NULL,
+                canonical TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                text TEXT NOT NULL,
+                PRIMARY KEY (scope, filename, chunk_index)
+            );
+            CREATE INDEX IF NOT EXISTS idx_refs_canonical ON refs (scope, canonical, filename, chunk_index);
+            CREATE TABLE IF NOT EXISTS staged_refs (
+                scope TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                upload TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                chunk_hash TEXT NOT NULL,
+                canonical TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                text TEXT NOT NULL,
+                PRIMARY KEY (scope, filename, upload, chunk_index)
+            );
+            CREATE INDEX IF NOT EXISTS idx_staged_canonical ON staged_refs (scope, canonical, filename, chunk_index);
+            """
+        )
+        self._conn.commit()
+
+        logger.info(f"ChunkRegistry initialized at {self.path}")
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Group registry changes; they are rolled back if the block raises.
+        """
+        with self._lock:
+            try:
+                yield
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+
+    # ---------- Unique chunks ----------
+
+    def match(
+        self,
+        scope: str,
+        chunk_hash: str,
+        signature: np.ndarray,
+        threshold: Optional[float],
+        filename: str
+    ) -> Optional[str]:
+        """
+        The unique chunk a new file chunk duplicates: one with the same hash,
+        else (with a threshold) the most similar near duplicate (similarity
+        >= threshold) referenced by another file. A file's own chunks are not
+        near duplicates of each other, so an edited paragraph is embedded again.
+
+        Returns:
+            Hash of the unique chunk, or None
+        """
+        with self._lock:
+            if self._conn.execute(
+                "SELECT 1 FROM chunks WHERE scope = ? AND chunk_hash = ?", (scope, chunk_hash)
+            ).fetchone():
+                return chunk_hash
+
+            if threshold is None:
+                return None
+
+            keys = band_keys(signature)
+            candidates = self._conn.execute(
+                f"""
+                SELECT DISTINCT c.chunk_hash, c.signature FROM bands b
+                JOIN chunks c ON c.scope = b.scope AND c.chunk_hash = b.chunk_hash
+                WHERE b.scope = ? AND b.band_key IN ({",".join("?" * len(keys))})
+                AND EXISTS (
+                    SELECT 1 FROM refs r WHERE r.scope = c.scope AND r.canonical = c.chunk_hash AND r.filename != ?
+                )
+                """,
+                (scope, *keys, filename)
+            ).fetchall()
+
+        best, best_similarity = None, threshold
+        for candidate, blob in candidates:
+            score = similarity(signature, np.frombuffer(blob, dtype=np.uint32))
+            if score >= best_similarity:
+                best, best_similarity = candidate, score
+        return best
+
+    def add_chunk(self, scope: str, chunk_hash: str, signature: np.ndarray):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chunks (scope, chunk_hash, signature) VALUES (?, ?, ?)",
+                (scope, chunk_hash, signature.astype(np.uint32).tobytes())
+            )
+            self._conn.executemany(
+                "INSERT INTO bands (scope, band_key, chunk_hash) VALUES (?, ?, ?)",
+                [(scope, key, chunk_hash) for key in band_keys(signature)]
+            )
+
+    def has_chunk(self, scope: str, chunk_hash: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM chunks WHERE scope = ? AND chunk_hash = ?", (scope, chunk_hash)
+            ).fetchone() is not None
+
+    def remove_chunk(self, scope: str, chunk_hash: str):
+        """
+        Forget a unique chunk and any references left to it.
+        """
+        with self._lock:
+            for table, column in (
+                ("chunks", "chunk_hash"), ("bands", "chunk_hash"), ("refs", "canonical"), ("staged_refs", "canonical")
+            ):
+                self._conn.execute(f"DELETE FROM {table} WHERE scope = ? AND {column} = ?", (scope, chunk_hash))
+
+    # ---------- References ----------
+
+    def add_reference(
+        self,
+        scope: str,
+        filename: str,
+        metadata: Dict[str, Any],
+        text: str,
+        canonical: str
+    ) -> Optional[str]:
+        """
+        Record a file chunk (its stored metadata and text) as a copy of a unique chunk.
+
+        Returns:
+            The unique chunk the file chunk at that index referenced before, if any
+        """
+        with self._lock:
+            previous = self._conn.execute(
+                "SELECT canonical FROM refs WHERE scope = ? AND filename = ? AND chunk_index = ?",
+                (scope, filename, metadata["chunk_index"])
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO refs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    scope, filename, metadata["chunk_index"], metadata["chunk_hash"], canonical,
+                    json.dumps(metadata), text
+                )
+            )
+        return previous[0] if previous else None
+
+    def remove_file(self, scope: str, filename: str, from_index: int = 0) -> Set[str]:
+        """
+        Drop a file's references (those from chunk index from_index on).
+
+        Returns:
+            Hashes of the unique chunks they referenced
+        """
+        with self._lock:
+            canonical = {
+                row[0] for row in self._conn.execute(
+                    "SELECT canonical FROM refs WHERE scope = ? AND filename = ? AND chunk_index >= ?",
+                    (scope, filename, from_index)
+                )
+            }
+            self._conn.execute(
+                "DELETE FROM refs WHERE scope = ? AND filename = ? AND chunk_index >= ?", (scope, filename, from_index)
+            )
+        return canonical
+
+    def references(self, scope: str, canonical: str, staged: bool = False) -> List[Tuple[str, int]]:
+        """
+        File chunks (filename, chunk index) standing for a unique chunk, in that order.
+
+        Args:
+            staged: Those of uploads still being written (stage_reference) instead
+        """
+        table = "staged_refs" if staged else "refs"
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT DISTINCT filename, chunk_index FROM {table} WHERE scope = ? AND canonical = ? "
+                "ORDER BY filename, chunk_index",
+                (scope, canonical)
+            ).fetchall()
+
+    def reference(
+        self,
+        scope: str,
+        filename: str,
+        chunk_index: int,
+        staged: bool = False
+    ) -> Tuple[Dict[str, Any], str]:
+        """
+        Stored metadata and text of one file chunk (of an upload still being
+        written with staged).
+        """
+        table = "staged_refs" if staged else "refs"
+        with self._lock:
+            metadata, text = self._conn.execute(
+                f"SELECT metadata, text FROM {table} WHERE scope = ? AND filename = ? AND chunk_index = ? LIMIT 1",
+                (scope, filename, chunk_index)
+            ).fetchone()
+        return json.loads(metadata), text
+
+    # ---------- Uploads written in batches ----------
+
+    def stage_reference(
+        self,
+        scope: str,
+        filename: str,
+        upload: str,
+        metadata: Dict[str, Any],
+        text: str,
+        canonical: str
+    ):
+        """
+        Record a file chunk of an upload still being written. It does not
+        count as a reference of the file until commit_upload().
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO staged_refs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    scope, filename, upload, metadata["chunk_index"], metadata["chunk_hash"], canonical,
+                    json.dumps(metadata), text
+                )
+            )
+
+    def commit_upload(self, scope: str, filename: str, upload: str, keep: Set[str] = frozenset()) -> Set[str]:
+        """
+        Make an upload's staged chunks the file's references, replacing its
+        earlier version. Staged chunks of other uploads of the file that are
+        not in keep (left by a failed or interrupted upload) are dropped.
+
+        Returns:
+            Hashes of the unique chunks referenced before or staged
+        """
+        with self._lock:
+            touched = self.remove_file(scope, filename)
+            self._conn.execute(
+                "INSERT INTO refs SELECT scope, filename, chunk_index, chunk_hash, canonical, metadata, text "
+                "FROM staged_refs WHERE scope = ? AND filename = ? AND upload = ?",
+                (scope, filename, upload)
+            )
+            stale = [
+                row[0] for row in self._conn.execute(
+                    "SELECT DISTINCT upload FROM staged_refs WHERE scope = ? AND filename = ?", (scope, filename)
+                )
+                if row[0] not in keep
+            ]
+        return touched | self.drop_uploads(scope, filename, stale)
+
+    def drop_uploads(self, scope: str, filename: str, uploads: List[str]) -> Set[str]:
+        """
+        Forget the staged chunks of uploads of a file.
+
+        Returns:
+            Hashes of the unique chunks they referenced
+        """
+        touched = set()
+        with self._lock:
+            for upload in uploads:
+                touched.update(
+                    row[0] for row in self._conn.execute(
+                        "SELECT canonical FROM staged_refs WHERE scope = ? AND filename = ? AND upload = ?",
+                        (scope, filename, upload)
+                    )
+                )
+                self._conn.execute(
+                    "DELETE FROM staged_refs WHERE scope = ? AND filename = ? AND upload = ?", (scope, filename, upload)
+                )
+        return touched
+
+    def file_canonicals(
+        self,
+        scope: str,
+        filename: str,
+        from_index: int = 0,
+        limit: int = 5000
+    ) -> List[Tuple[int, str, str]]:
+        """
+        (chunk index, chunk hash, unique chunk) of a file's chunks from
+        from_index on, in chunk order, at most limit of them.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT chunk_index, chunk_hash, canonical FROM refs "
+                "WHERE scope = ? AND filename = ? AND chunk_index >= ? ORDER BY chunk_index LIMIT ?",
+                (scope, filename, from_index, limit)
+            ).fetchall()
+
+    def file_chunks(self, scope: str, filename: str) -> List[Dict[str, Any]]:
+        """
+        A file's chunks (metadata, text and unique chunk), in chunk order.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT metadata, text, canonical FROM refs WHERE scope = ? AND filename = ? ORDER BY chunk_index",
+                (scope, filename)
+            ).fetchall()
+        return [{"metadata": json.loads(m), "text": t, "canonical": c} for m, t, c in rows]
+
+    def clear(self, scope: str):
+        """
+        Forget everything recorded for a partition.
+        """
+        with self.transaction():
+            for table in ("chunks", "bands", "refs", "staged_refs"):
+                self._conn.execute(f"DELETE FROM {table} WHERE scope = ?", (scope,))
+
+    def get_stats(self, scope: str) -> Dict[str, int]:
+        """
+        Unique chunks, file chunks and files recorded for a partition (uploads
+        still being written are not counted).
+        """
+        with self._lock:
+            chunks, files, unique = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT filename), COUNT(DISTINCT canonical) FROM refs WHERE scope = ?",
+                (scope,)
+            ).fetchone()
+        return {
+            "unique_chunks": unique,
+            "file_chunks": chunks,
+            "files": files,
+            "duplicates_removed": chunks - unique
+        }
+
+
+_registries: Dict[str, ChunkRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_chunk_registry(path: str) -> ChunkRegistry:
+    """
+    The process-wide registry stored at a path (live and shadow index
+    generations share one database, each under its own scopes).
+    """
+    key = str(Path(path).resolve())
+    with _registries_lock:
+        if key not in _registries:
+            _registries[key] = ChunkRegistry(path)
+        return _registries[key]
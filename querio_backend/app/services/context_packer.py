@@ -0,0 +1,276 @@
+"""
+Context Packer
+Builds the RAG prompt context from retrieved chunks within a token budget.
+Adjacent/overlapping chunks of the same file are merged (chunking overlaps
+repeat text at every boundary), near-duplicate passages are dropped, and the
+remaining passages are packed best-first until the budget is used.
+"""
+
+from typing import Any, Dict, List, Optional, Set, Tuple
+import logging
+import re
+import threading
+
+from app.services.token_counter import TokenCounter, get_token_counter
+
+logger = logging.getLogger(__name__)
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+# Shortest suffix/prefix match treated as chunk overlap when offsets are missing
+_MIN_OVERLAP = 8
+
+
+class ContextPacker:
+    """Merges, deduplicates and budgets retrieved chunks into prompt context."""
+
+    def __init__(
+        self,
+        budget_tokens: int = 1500,
+        duplicate_threshold: float = 0.8,
+        shingle_size: int = 3,
+        token_counter: Optional[TokenCounter] = None
+    ):
+        """
+        Args:
+            budget_tokens: Maximum tokens of packed context
+            duplicate_threshold: Shingle Jaccard similarity at which a passage is a near-duplicate
+            shingle_size: Words per shingle
+            token_counter: Token counter (shared one if omitted)
+        """
+        self.budget_tokens = budget_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self.shingle_size = shingle_size
+        self.token_counter = token_counter or get_token_counter()
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.raw_tokens = 0
+        self.packed_tokens = 0
+
+    def pack(self, chunks: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+        """
+        Build the context string for retrieved chunks.
+
+        Args:
+            chunks: Search results (id, score = distance, text, metadata)
+
+        Returns:
+            (context, report) where report has token counts before/after packing
+        """
+        raw_tokens = self.token_counter.count(self.format_context(self._as_passages(chunks)))
+
+        passages = self._merge_adjacent(chunks)
+        merged = len(chunks) - len(passages)
+
+        passages, duplicates = self._drop_duplicates(passages)
+
+        packed = []
+        used_tokens = 0
+        dropped_for_budget = 0
+
+        for passage in passages:
+            tokens = self.token_counter.count(self._format_passage(len(packed) + 1, passage))
+            if used_tokens + tokens > self.budget_tokens:
+                if packed:
+                    dropped_for_budget += 1
+                    continue
+                # The best passage alone exceeds the budget: keep its head
+                passage = self._truncate(passage, tokens)
+                tokens = self.token_counter.count(self._format_passage(1, passage))
+            packed.append(passage)
+            used_tokens += tokens
+
+        context = self.format_context(packed)
+        packed_tokens = self.token_counter.count(context)
+
+        report = {
+            "raw_tokens": raw_tokens,
+            "packed_tokens": packed_tokens,
+            "saved_tokens": raw_tokens - packed_tokens,
+            "passages": len(packed),
+            "chunks_merged": merged,
+            "duplicates_dropped": duplicates,
+            "dropped_for_budget": dropped_for_budget,
+            "budget_tokens": self.budget_tokens,
+            "tokenizer": self.token_counter.name,
+            "estimated": self.token_counter.estimated
+        }
+
+        with self._lock:
+            self.requests += 1
+            self.raw_tokens += raw_tokens
+            self.packed_tokens += packed_tokens
+
+        return context, report
+
+    def format_context(self, passages: List[Dict[str, Any]]) -> str:
+        """
+        Render passages as the prompt context block.
+        """
+        return "\n".join(
+            self._format_passage(i, passage) for i, passage in enumerate(passages, 1)
+        )
+
+    def _format_passage(self, position: int, passage: Dict[str, Any]) -> str:
+        indexes = passage["chunk_indexes"]
+        chunk_label = (
+            f"chunks {indexes[0]}-{indexes[-1]}" if len(indexes) > 1 else f"chunk {indexes[0]}"
+        )
+
+        return (
+            f"[Source {position}: {passage['filename']} {chunk_label} | relevance={passage['score']:.3f}]\n"
+            f"{passage['text']}\n"
+        )
+
+    def _truncate(self, passage: Dict[str, Any], tokens: int) -> Dict[str, Any]:
+        """
+        Shorten a passage until it fits the budget on its own.
+        """
+        text = passage["text"]
+        length = int(len(text) * self.budget_tokens / tokens)
+
+        while length > 0:
+            candidate = {**passage, "text": text[:length]}
+            if self.token_counter.count(self._format_passage(1, candidate)) <= self.budget_tokens:
+                return candidate
+            length = int(length * 0.9)
+
+        return {**passage, "text": ""}
+
+    @staticmethod
+    def _as_passages(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        One passage per chunk, unmerged (what the prompt would hold without packing).
+        """
+        passages = []
+
+        for chunk in chunks:
+            metadata = chunk.get("metadata", {})
+            passages.append({
+                "filename": metadata.get("filename", "Unknown"),
+                "chunk_indexes": [metadata.get("chunk_index", 0)],
+                "score": chunk.get("score", 0.0),
+                "text": chunk.get("text", ""),
+                "start_char": metadata.get("start_char", 0),
+                "end_char": metadata.get("end_char", 0)
+            })
+
+        return passages
+
+    def _merge_adjacent(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Merge chunks of the same file with consecutive chunk indexes, removing
+        the overlapping text. Passages come back ordered by best score.
+        """
+        by_file: Dict[str, List[Dict[str, Any]]] = {}
+        for passage in self._as_passages(chunks):
+            by_file.setdefault(passage["filename"], []).append(passage)
+
+        merged = []
+
+        for passages in by_file.values():
+            passages.sort(key=lambda p: p["chunk_indexes"][0])
+            current = passages[0]
+
+            for passage in passages[1:]:
+                if passage["chunk_indexes"][0] == current["chunk_indexes"][-1] + 1:
+                    current = {
+                        "filename": current["filename"],
+                        "chunk_indexes": current["chunk_indexes"] + passage["chunk_indexes"],
+                        "score": min(current["score"], passage["score"]),
+                        "text": self._join(current, passage),
+                        "start_char": current["start_char"],
+                        "end_char": passage["end_char"]
+                    }
+                else:
+                    merged.append(current)
+                    current = passage
+
+            merged.append(current)
+
+        # Chroma scores are distances: lower is more relevant
+        merged.sort(key=lambda p: p["score"])
+        return merged
+
+    @staticmethod
+    def _join(first: Dict[str, Any], second: Dict[str, Any]) -> str:
+        """
+        Concatenate two neighbouring chunks without repeating their overlap.
+        """
+        a, b = first["text"], second["text"]
+
+        # Character offsets are stored for chunks ingested with them
+        if first["end_char"] and second["end_char"]:
+            return a + b[max(0, first["end_char"] - second["start_char"]):]
+
+        # Older chunks: find the longest suffix of `a` that prefixes `b`
+        # (overlaps are a small fraction of a chunk; cap the search accordingly)
+        for size in range(min(len(a), len(b)) // 2, _MIN_OVERLAP - 1, -1):
+            if a.endswith(b[:size]):
+                return a + b[size:]
+
+        return a + "\n" + b
+
+    def _shingles(self, text: str) -> Set[Tuple[str, ...]]:
+        words = _WORD_PATTERN.findall(text.lower())
+        if len(words) < self.shingle_size:
+            return {tuple(words)} if words else set()
+
+        return {
+            tuple(words[i:i + self.shingle_size])
+            for i in range(len(words) - self.shingle_size + 1)
+        }
+
+    def _drop_duplicates(
+        self,
+        passages: List[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Keep the best-scored passage of each near-duplicate group.
+        """
+        kept = []
+        kept_shingles: List[Set[Tuple[str, ...]]] = []
+        dropped = 0
+
+        for passage in passages:
+            shingles = self._shingles(passage["text"])
+
+            duplicate = False
+            for other in kept_shingles:
+                union = len(shingles | other)
+                if union and len(shingles & other) / union >= self.duplicate_threshold:
+                    duplicate = True
+                    break
+
+            if duplicate:
+                dropped += 1
+                continue
+
+            kept.append(passage)
+            kept_shingles.append(shingles)
+
+        return kept, dropped
+
+    def calibrate(self, messages: List[Dict[str, Any]], prompt_eval_count: Optional[int]) -> None:
+        """
+        Feed the prompt token count Ollama reported back to the token counter.
+        """
+        self.token_counter.calibrate(
+            "\n".join(message.get("content", "") for message in messages),
+            prompt_eval_count
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cumulative prompt token savings (estimates unless a tokenizer is loaded).
+        """
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "raw_tokens": self.raw_tokens,
+                "packed_tokens": self.packed_tokens,
+                "saved_tokens": self.raw_tokens - self.packed_tokens,
+                "saved_ratio": round(1 - self.packed_tokens / self.raw_tokens, 3) if self.raw_tokens else 0.0,
+                **self.token_counter.get_stats()
+            }
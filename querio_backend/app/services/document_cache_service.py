@@ -0,0 +1,250 @@
+"""
+Document Cache Service
+Keeps every ingested document in the storage backend (original file,
+chunks, embeddings, metadata) keyed by the SHA-256 of its content, so the
+vector index can be rebuilt without re-embedding, and a byte-identical
+upload is linked to its cached chunks and embeddings instead of being
+parsed and embedded again.
+
+metadata.json records the embedding model and dimension, and "sources":
+every (namespace, filename) the content was uploaded as, with its upload time.
+"""
+
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+import hashlib
+import logging
+import threading
+import time
+
+import numpy as np
+
+from app.services.document_service import chunk_hash
+from app.services.storage_backend import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+_HASH_BLOCK = 1024 * 1024
+
+
+def file_sha256(file_path: Path) -> str:
+    """
+    SHA-256 of a file, read in 1 MB blocks.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FileTooLargeError(ValueError):
+    """An upload exceeds the size limit."""
+
+
+def copy_and_hash(source: BinaryIO, destination: BinaryIO, max_bytes: Optional[int] = None) -> str:
+    """
+    Copy a stream in 1 MB blocks, hashing it on the way (uploads are hashed
+    while they are written, not read back).
+
+    Args:
+        max_bytes: Size limit, checked as the blocks are copied
+
+    Returns:
+        SHA-256 of the content
+
+    Raises:
+        FileTooLargeError: once more than max_bytes were read
+    """
+    digest = hashlib.sha256()
+    copied = 0
+    for block in iter(lambda: source.read(_HASH_BLOCK), b""):
+        copied += len(block)
+        if max_bytes is not None and copied > max_bytes:
+            raise FileTooLargeError(f"File exceeds the {max_bytes // (1024 * 1024)} MB limit")
+        digest.update(block)
+        destination.write(block)
+    return digest.hexdigest()
+
+
+def file_extension(filename: str) -> str:
+    return Path(filename).suffix.lstrip(".").lower() or "bin"
+
+
+class DocumentCacheService:
+    def __init__(self, storage: StorageBackend):
+        self.storage = storage
+        # Sources are read-modify-written in metadata.json
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(
+        self,
+        document_id: str,
+        filename: str,
+        embedding_model: str
+    ) -> Optional[Tuple[List[Dict[str, Any]], np.ndarray]]:
+        """
+        Cached chunks and embeddings of a document, if it was cached from a
+        file of the same type and embedded with `embedding_model`.
+
+        Returns:
+            (chunks, embeddings), or None on a miss
+        """
+        extension = file_extension(filename)
+        try:
+            metadata = self.storage.load_metadata(document_id, extension)
+            hit = (
+                metadata.get("file_extension") == extension
+                and metadata.get("embedding_model") == embedding_model
+                and self.storage.exists(document_id, extension)
+            )
+            if hit:
+                chunks = self.storage.load_chunks(document_id, extension)
+                embeddings = self.storage.load_embeddings(document_id, extension)
+                hit = len(chunks) == len(embeddings)
+        except (FileNotFoundError, ValueError) as e:
+            logger.debug(f"Document cache miss for {document_id[:12]}: {e}")
+            hit = False
+
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        return (chunks, embeddings) if hit else None
+
+    def add_source(self, document_id: str, filename: str, namespace: str, uploaded_at: Optional[float] = None):
+        """
+        Record another (namespace, filename) a cached document was uploaded as.
+        """
+        extension = file_extension(filename)
+        uploaded_at = uploaded_at if uploaded_at is not None else time.time()
+
+        with self._lock:
+            metadata = self.storage.load_metadata(document_id, extension)
+            metadata["sources"] = self._merge_source(metadata.get("sources", []), filename, namespace, uploaded_at)
+            self.storage.save_metadata(document_id, extension, metadata)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def store(
+        self,
+        file_path: Path,
+        filename: str,
+        namespace: str,
+        chunks: Iterable[Dict[str, Any]],
+        embeddings: np.ndarray,
+        embedding_model: str,
+        uploaded_at: Optional[float] = None,
+        document_id: Optional[str] = None
+    ) -> str:
+        """
+        Cache an ingested document and record where it was uploaded.
+
+        Args:
+            chunks: The document's chunks, iterated once (they may be spooled to disk)
+            embeddings: One row per chunk (may be memory-mapped)
+            document_id: Content SHA-256 if already known (hashed otherwise)
+
+        Returns:
+            Document ID (content SHA-256)
+        """
+        document_id = document_id or file_sha256(file_path)
+        extension = file_extension(filename)
+        uploaded_at = uploaded_at if uploaded_at is not None else time.time()
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+
+        with self._lock:
+            cached = self.storage.exists(document_id, extension)
+            metadata = self.storage.load_metadata(document_id, extension) if cached else {}
+
+            if not cached or metadata.get("embedding_model") != embedding_model:
+                self.storage.save_document(document_id, file_path, extension)
+                self.storage.save_chunks(document_id, extension, chunks)
+                self.storage.save_embeddings(document_id, extension, embeddings)
+
+            sources = self._merge_source(metadata.get("sources", []), filename, namespace, uploaded_at)
+
+            self.storage.save_metadata(document_id, extension, {
+                "document_id": document_id,
+                "file_extension": extension,
+                "chunk_count": len(embeddings),
+                "embedding_model": embedding_model,
+                "embedding_dim": int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+                "sources": sources
+            })
+
+        logger.info(f"Cached {filename} ({namespace}) as {document_id[:12]}: {len(embeddings)} chunks")
+        return document_id
+
+    def documents(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Every cached document with its metadata (unreadable ones are skipped).
+
+        Yields:
+            (document ID, metadata)
+        """
+        for document_id in self.storage.list_documents():
+            try:
+                yield document_id, self.storage.load_metadata(document_id, "")
+            except (FileNotFoundError, ValueError) as e:
+                logger.debug(f"Skipping cached document {document_id[:12]}: {e}")
+
+    def replace_embeddings(
+        self,
+        document_id: str,
+        extension: str,
+        embeddings: Dict[str, Any],
+        embedding_model: str
+    ) -> bool:
+        """
+        Replace a cached document's embeddings with ones made by another
+        model (an embedding model migration).
+
+        Args:
+            embeddings: Chunk hash -> embedding, for at least every cached chunk
+
+        Returns:
+            False (and nothing changed) if a cached chunk has no embedding
+        """
+        with self._lock:
+            chunks = self.storage.load_chunks(document_id, extension)
+            try:
+                rows = np.asarray([embeddings[chunk_hash(c["text"])] for c in chunks], dtype=np.float32)
+            except KeyError:
+                return False
+
+            # No model while the embeddings are rewritten: a crash leaves a miss, not wrong vectors
+            metadata = self.storage.load_metadata(document_id, extension)
+            self.storage.save_metadata(document_id, extension, {**metadata, "embedding_model": None})
+            self.storage.save_embeddings(document_id, extension, rows)
+            self.storage.save_metadata(document_id, extension, {
+                **metadata,
+                "embedding_model": embedding_model,
+                "embedding_dim": int(rows.shape[1]) if rows.ndim == 2 else 0
+            })
+        return True
+
+    @staticmethod
+    def _merge_source(
+        sources: List[Dict[str, Any]],
+        filename: str,
+        namespace: str,
+        uploaded_at: float
+    ) -> List[Dict[str, Any]]:
+        sources = [
+            source for source in sources
+            if (source["namespace"], source["filename"]) != (namespace, filename)
+        ]
+        sources.append({"namespace": namespace, "filename": filename, "uploaded_at": uploaded_at})
+        return sources
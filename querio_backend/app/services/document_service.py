@@ -3,12 +3,72 @@ Document Service
 Handles document loading and chunking.
 """
 
+import hashlib
 import os
-from typing import List, Dict
-from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
+import numpy as np
 from PyPDF2 import PdfReader
 
+from app.config import settings
+
+CHUNKING_MODES = ("fixed", "content")
+
+_TEXT_BLOCK = 1024 * 1024  # characters read at a time from a .txt file
+
+# Rolling hash over the last _CDC_WINDOW characters, with a fixed random value per byte
+_CDC_WINDOW = 16
+_CDC_MULTIPLIER = 0x01000193
+_CDC_TABLE = np.random.default_rng(0x5EED).integers(0, 2 ** 32, size=256, dtype=np.uint64).astype(np.uint32)
+_CDC_POWERS = [np.uint32(pow(_CDC_MULTIPLIER, k, 2 ** 32)) for k in range(_CDC_WINDOW)]
+_WHITESPACE = np.array([ord(c) for c in " \t\n\r"], dtype=np.uint32)
+
+
+def chunk_hash(text: str) -> str:
+    """
+    Content hash of a chunk's text (matches unchanged chunks across versions).
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def content_defined_boundaries(text: str, min_size: int, max_size: int, mask: int = 31) -> List[int]:
+    """
+    Chunk end offsets chosen by content rather than position: a chunk ends
+    after a whitespace character whose preceding 16 characters hash to a
+    multiple of mask + 1, at least min_size and at most max_size characters
+    after its start. The same text gets the same cuts wherever it sits, so
+    an edit only changes the chunks around it.
+    """
+    n = len(text)
+    if n <= min_size:
+        return [n] if n else []
+
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    values = _CDC_TABLE[codes & 0xFF]
+
+    rolling = np.zeros(n, dtype=np.uint32)
+    for k, power in enumerate(_CDC_POWERS):
+        rolling[k:] += values[:n - k] * power
+
+    cut_after = ((rolling >> 11) & mask == 0) & np.isin(codes, _WHITESPACE)
+    candidates = np.flatnonzero(cut_after) + 1
+
+    boundaries = []
+    start = 0
+    while start < n:
+        if n - start <= min_size:
+            end = n
+        else:
+            i = np.searchsorted(candidates, start + min_size)
+            if i < len(candidates) and candidates[i] <= start + max_size:
+                end = int(candidates[i])
+            else:
+                end = min(n, start + max_size)
+        boundaries.append(end)
+        start = end
+
+    return boundaries
+
 
 class DocumentService:
     def __init__(self, upload_dir: str = "data/uploads"):
@@ -28,13 +88,29 @@ class DocumentService:
         """
         Extract text from PDF or TXT.
         """
+        return "".join(text for _, text in self.iter_pages(file_path))
+
+    def iter_pages(self, file_path: str) -> Iterator[Tuple[Optional[int], str]]:
+        """
+        Extract text piece by piece, so a large document is never held in
+        memory at once: a PDF page by page (pages after the first start with
+        the newline load_text puts between pages), a TXT file in 1M-character blocks.
+
+        Yields:
+            (page number from 1, or None for TXT, text)
+        """
         if file_path.endswith(".txt"):
-            return Path(file_path).read_text(encoding="utf-8")
+            with open(file_path, encoding="utf-8") as f:
+                for block in iter(lambda: f.read(_TEXT_BLOCK), ""):
+                    yield None, block
+            return
 
         if file_path.endswith(".pdf"):
             reader = PdfReader(file_path)
-            pages = [page.extract_text() or "" for page in reader.pages]
-            return "\n".join(pages)
+            for number, page in enumerate(reader.pages, start=1):
+                text = page.extract_text() or ""
+                yield number, text if number == 1 else "\n" + text
+            return
 
         raise ValueError("Unsupported file type")
 
@@ -42,26 +118,98 @@ class DocumentService:
         self,
         text: str,
         chunk_size: int = 500,
-        overlap: int = 50
+        overlap: int = 50,
+        mode: Optional[str] = None
     ) -> List[Dict]:
         """
         Split text into overlapping chunks.
+
+        Args:
+            chunk_size: Chunk length ("fixed") or average length ("content")
+            overlap: Characters repeated from the end of the previous chunk
+            mode: "fixed" (every chunk_size characters) or "content"
+                (content-defined boundaries, 0.6x to 1.5x chunk_size, stable
+                under edits elsewhere in the text); defaults to settings.CHUNKING_MODE
         """
-        chunks = []
-        start = 0
-        index = 0
+        return list(self.iter_chunks([(None, text)], chunk_size, overlap, mode))
+
+    def iter_chunks(
+        self,
+        pages: Iterable[Tuple[Optional[int], str]],
+        chunk_size: int = 500,
+        overlap: int = 50,
+        mode: Optional[str] = None
+    ) -> Iterator[Dict]:
+        """
+        Chunk text arriving in pieces (see iter_pages) as it arrives, keeping
+        only the text not yet chunked. The chunks are the ones chunk_text
+        makes of the whole text; those of numbered pages also list the pages
+        they span in "page_numbers".
 
-        while start < len(text):
-            end = start + chunk_size
-            chunk_text = text[start:end]
+        Args:
+            pages: (page number or None, text) pieces, in order
+            chunk_size, overlap, mode: As for chunk_text
+        """
+        mode = mode or settings.CHUNKING_MODE
+        if mode not in CHUNKING_MODES:
+            raise ValueError(f"Unknown chunking mode {mode}; expected one of {CHUNKING_MODES}")
 
-            chunks.append({
-                "text": chunk_text,
+        min_size, max_size = chunk_size * 3 // 5, chunk_size * 3 // 2
+
+        buffer = ""
+        offset = 0  # position of buffer[0] in the whole text
+        start = 0  # where the next chunk starts (before its overlap)
+        page_starts: List[Tuple[int, int]] = []  # (position, page number) of pages not yet chunked past
+        index = 0
+
+        def make_chunk(begin: int, end: int) -> Dict:
+            text = buffer[begin - offset:end - offset]
+            chunk = {
+                "text": text,
                 "chunk_index": index,
-                "token_count": len(chunk_text.split())
-            })
+                "token_count": len(text.split()),
+                "start_char": begin,
+                "end_char": begin + len(text)
+            }
+            if page_starts:
+                chunk["page_numbers"] = [
+                    number for i, (position, number) in enumerate(page_starts)
+                    if position < end and (i + 1 == len(page_starts) or page_starts[i + 1][0] > begin)
+                ]
+            return chunk
 
-            start = end - overlap
-            index += 1
+        def spans(final: bool) -> Iterator[Tuple[int, int]]:
+            """Chunks that later text can no longer change (all of them once final)."""
+            nonlocal start
+            length = offset + len(buffer)
+            if mode == "content":
+                # A cut only depends on the text up to max_size past the chunk's start
+                segment_start = start
+                for end in content_defined_boundaries(buffer[start - offset:], min_size, max_size):
+                    if not final and length - start <= max_size:
+                        return
+                    begin, start = start, segment_start + end
+                    yield max(0, begin - overlap), start
+            else:
+                while start < length and (final or start + chunk_size <= length):
+                    yield start, min(length, start + chunk_size)
+                    start += chunk_size - overlap
 
-        return chunks
\ No newline at end of file
+        for number, text in pages:
+            if number is not None:
+                page_starts.append((offset + len(buffer), number))
+            buffer += text
+            for begin, end in spans(final=False):
+                yield make_chunk(begin, end)
+                index += 1
+
+            # Keep the text from the next chunk's start (and overlap) on
+            keep = max(offset, start - overlap if mode == "content" else start)
+            buffer = buffer[keep - offset:]
+            offset = keep
+            while len(page_starts) > 1 and page_starts[1][0] <= offset:
+                page_starts.pop(0)
+
+        for begin, end in spans(final=True):
+            yield make_chunk(begin, end)
+            index += 1
@@ -0,0 +1,60 @@
+"""
+Embedding Quantization
+Compact storage formats for embeddings: float16, and int8 with a per-vector
+scale (x ~= codes * scale). At 768 dimensions a vector takes 3 KB as float32,
+1.5 KB as float16 and 772 bytes as int8 + scale.
+"""
+
+from typing import Optional, Tuple
+
+import numpy as np
+
+FORMATS = ("float32", "float16", "int8")
+
+CODE_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+
+def quantize(vectors: np.ndarray, fmt: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Encode float vectors.
+
+    Args:
+        vectors: (n, dim) float array
+        fmt: "float32", "float16" or "int8"
+
+    Returns:
+        (codes, scales) where scales is a float32 (n,) array for int8, else None
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported embedding format {fmt}; expected one of {FORMATS}")
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+
+    if fmt != "int8":
+        return vectors.astype(CODE_DTYPES[fmt]), None
+
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+
+    return codes, scales.astype(np.float32)
+
+
+def dequantize(codes: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Decode vectors back to float32.
+    """
+    vectors = np.asarray(codes, dtype=np.float32)
+
+    if scales is not None:
+        vectors = vectors * np.asarray(scales, dtype=np.float32)[:, None]
+
+    return vectors
+
+
+def bytes_per_vector(dim: int, fmt: str) -> int:
+    """
+    Storage size of one vector in the given format.
+    """
+    size = dim * np.dtype(CODE_DTYPES[fmt]).itemsize
+    return size + 4 if fmt == "int8" else size
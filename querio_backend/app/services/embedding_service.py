@@ -3,34 +3,66 @@ Embedding Service
 Generates text embeddings using Ollama (local).
 """
 
-from typing import List
+from typing import List, Optional
 import logging
-import ollama
+
+import numpy as np
+
+from app.config import settings
+from app.services.ollama_client import get_ollama_client
+from app.services.ollama_scheduler import INGEST, INTERACTIVE
 
 logger = logging.getLogger(__name__)
 
 
+def truncate_embeddings(embeddings, dims: int) -> np.ndarray:
+    """
+    Matryoshka view: keep the leading `dims` dimensions and re-normalize.
+
+    nomic-embed-text models are trained so that prefixes (e.g. 256 or 128 of
+    768 dims) remain usable embeddings at a modest quality loss.
+    """
+    prefix = np.asarray(embeddings, dtype=np.float32)[..., :dims]
+    norms = np.linalg.norm(prefix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return prefix / norms
+
+
 class EmbeddingService:
     """Service for generating text embeddings using Ollama."""
 
-    def __init__(self, model: str = "nomic-embed-text-v2-moe"):
+    def __init__(self, model: Optional[str] = None, dimensions: int = 768):
         """
         Initialize the embedding service.
 
         Args:
-            model: Ollama embedding model name
+            model: Ollama embedding model name (defaults to settings.EMBEDDING_MODEL)
+            dimensions: Its output size (768 for nomic-embed-text-v2-moe)
         """
-        self.model = model
-        self.dimensions = 768  # nomic-embed-text-v2-moe output size
+        self.model = model or settings.EMBEDDING_MODEL
+        self.dimensions = dimensions
+        self.batch_size = settings.EMBEDDING_BATCH_SIZE
+        self.client = get_ollama_client()
 
         logger.info(f"EmbeddingService initialized with model: {self.model}")
 
-    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+    def generate_embeddings(
+        self,
+        texts: List[str],
+        priority: str = INGEST,
+        model: Optional[str] = None
+    ) -> List[List[float]]:
         """
         Generate embeddings for a list of texts.
 
+        Texts are embedded in batches of `batch_size`. Each batch is one
+        /api/embed request holding one scheduler slot, so higher-priority
+        traffic can run between batches.
+
         Args:
             texts: List of text strings
+            priority: Scheduler class (bulk ingestion by default)
+            model: Embed with this model instead of the current one (migrations)
 
         Returns:
             List of embedding vectors
@@ -38,15 +70,13 @@ class EmbeddingService:
         if not texts:
             return []
 
+        model = model or self.model
         embeddings = []
 
-        for text in texts:
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
             try:
-                response = ollama.embeddings(
-                    model=self.model,
-                    prompt=text
-                )
-                embeddings.append(response["embedding"])
+                embeddings.extend(self.client.embed(model, batch, priority=priority))
             except Exception as e:
                 raise Exception(f"Failed to generate embedding: {str(e)}")
 
@@ -54,9 +84,23 @@ class EmbeddingService:
 
     def generate_single_embedding(self, text: str) -> List[float]:
         """
-        Generate embedding for a single text.
+        Generate embedding for a single text (query path, interactive priority).
+        """
+        return self.generate_embeddings([text], priority=INTERACTIVE)[0]
+
+    def generate_query_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Generate embeddings for a batch of queries (interactive priority).
+        """
+        return self.generate_embeddings(texts, priority=INTERACTIVE)
+
+    def truncate(self, embeddings, dims: int) -> np.ndarray:
+        """
+        Get the normalized `dims`-dimensional prefix of embeddings.
         """
-        return self.generate_embeddings([text])[0]
+        if not 0 < dims <= self.dimensions:
+            raise ValueError(f"Prefix dimension must be in 1..{self.dimensions}, got {dims}")
+        return truncate_embeddings(embeddings, dims)
 
     def get_embedding_dimension(self) -> int:
         """
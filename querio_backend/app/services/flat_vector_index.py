@@ -0,0 +1,1096 @@
+"""
+Flat Vector Index
+Exact in-process vector search over a memory-mapped NumPy matrix. Drop-in
+replacement for the subset of the Chroma collection API that VectorService
+uses (add / query / delete / count), selected with VECTOR_BACKEND=flat.
+
+On disk (one directory per index; CURRENT names the data directory holding
+the live files, which compaction and reset replace as a whole):
+- scan matrix of L2-normalized rows: `vectors.f32`, `vectors.f16` or `vectors.i8`
+  (int8 rows come with per-vector scales in `scales.f32`)
+- full.f32: full-precision rows used to rescore candidates when the scan matrix is compact
+- prefix.f32: normalized Matryoshka prefixes (leading dims) for a fast first-stage scan
+- rows.jsonl: append-only log of added rows (id, metadata) and deletes;
+  a replace is one record holding both, so it is replayed whole or not at all
+- documents.jsonl: document and metadata of every row, one line per row in row
+  order, with the byte range of each line in documents.idx; only the rows a
+  search returns are read, so texts never need to fit in memory
+- index.json: dimension, dtype, prefix size, whether full-precision rows are kept
+  and the live row count as of the last close
+
+Metadata filters are resolved through an in-memory MetadataIndex rebuilt
+from rows.jsonl on open; selective filters score only their candidate rows.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from app.services.embedding_quantization import CODE_DTYPES, FORMATS, quantize
+from app.services.embedding_service import truncate_embeddings
+from app.services.metadata_index import MetadataIndex, matches_where
+
+logger = logging.getLogger(__name__)
+
+_SUFFIXES = {"float32": "f32", "float16": "f16", "int8": "i8"}
+
+_CURRENT = "CURRENT"
+
+Rows = Union[slice, np.ndarray]
+
+# Scoring pools shared by every open index (indexes come and go with namespaces)
+_executors: Dict[int, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def _data_dir(path: Path) -> Path:
+    """
+    Directory of the live index files: the one CURRENT names, or the index
+    directory itself for an index never compacted or reset.
+    """
+    current = path / _CURRENT
+    return path / current.read_text().strip() if current.exists() else path
+
+
+def _fsync(path: Path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _shared_executor(threads: int) -> Optional[ThreadPoolExecutor]:
+    if threads <= 1:
+        return None
+    with _executors_lock:
+        if threads not in _executors:
+            _executors[threads] = ThreadPoolExecutor(max_workers=threads)
+        return _executors[threads]
+
+
+class _Storage(NamedTuple):
+    """
+    The index as seen by one search, unaffected by concurrent growth and
+    compaction: rows only ever get appended to these arrays, the ID list and
+    the documents file, and compaction replaces them with new ones.
+    """
+    count: int
+    vectors: np.ndarray
+    scales: Optional[np.ndarray]
+    full: Optional[np.ndarray]
+    prefix: Optional[np.ndarray]
+    ids: List[str]
+    offsets: Optional[np.ndarray]
+    documents: Any
+
+
+class FlatVectorIndex:
+    """Exact top-k search with blocked matrix-vector products."""
+
+    # State tied to the data directory, taken over from the copy a compaction builds
+    _DATA_STATE = (
+        "_data", "dim", "_count", "_capacity", "_vectors", "_scales", "_full", "_prefix",
+        "_offsets", "_documents", "ids", "_alive", "_row_by_id", "_metadata_index"
+    )
+
+    def __init__(
+        self,
+        path: str,
+        name: str = "documents",
+        dtype: str = "float32",
+        block_rows: int = 16384,
+        threads: Optional[int] = None,
+        rescore: bool = True,
+        rescore_factor: int = 4,
+        prefix_dims: int = 0,
+        prefix_factor: int = 10,
+        metadata_index: bool = True,
+        prefilter_selectivity: float = 0.2
+    ):
+        """
+        Args:
+            path: Directory holding the index files
+            name: Index name (reported like a Chroma collection name)
+            dtype: Scan matrix format: "float32", "float16" or "int8" (per-vector scale)
+            block_rows: Rows scored per block
+            threads: Worker threads for scoring blocks (default: CPU count)
+            rescore: With a compact dtype, also keep float32 rows and rescore the
+                best candidates with them
+            rescore_factor: Candidates rescored per requested result
+            prefix_dims: Store normalized leading-dimension prefixes of this size
+                for a two-stage search (0 = single stage)
+            prefix_factor: First-stage candidates per requested result
+            metadata_index: Index filename, page, heading and upload time so
+                filters resolve to candidate rows instead of a metadata scan
+            prefilter_selectivity: Filters matching at most this share of the
+                live rows are searched by scoring only the matching rows; broader
+                ones by a full scan that skips the rest
+        """
+        if dtype not in FORMATS:
+            raise ValueError(f"Unsupported dtype {dtype}; expected one of {FORMATS}")
+
+        self.name = name
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._data = _data_dir(self.path)
+        self._remove_stale_files()
+        self.block_rows = block_rows
+        self.threads = threads or os.cpu_count() or 1
+        self._executor = _shared_executor(self.threads)
+
+        self._lock = threading.RLock()
+
+        manifest_path = self._data / "index.json"
+        manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+
+        self.dtype = manifest.get("dtype", dtype)
+        self.rescore = manifest.get("rescore", rescore) and self.dtype != "float32"
+        self.rescore_factor = rescore_factor
+        self.prefix_dims = prefix_dims
+        self.prefix_factor = prefix_factor
+        self.prefilter_selectivity = prefilter_selectivity
+        self.dim: Optional[int] = manifest.get("dim")
+        self._count = 0
+        self._capacity = 0
+        self._vectors: Optional[np.memmap] = None
+        self._scales: Optional[np.memmap] = None
+        self._full: Optional[np.memmap] = None
+        self._prefix: Optional[np.memmap] = None
+        # Byte range (start, end) of each row's line in documents.jsonl
+        self._offsets: Optional[np.memmap] = None
+        self._documents = None
+
+        self.ids: List[str] = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._row_by_id: Dict[str, int] = {}
+        self._metadata_index = MetadataIndex() if metadata_index else None
+
+        if self.dim is not None:
+            self.prefix_dims = min(self.prefix_dims, self.dim)
+            self._open_storage(1)
+            self._load_rows()
+
+            # Prefix size changed (or newly enabled): rebuild the prefix view
+            if self.prefix_dims and manifest.get("prefix_dims") != self.prefix_dims:
+                self._build_prefix()
+
+        logger.info(f"FlatVectorIndex '{name}' opened at {self.path} ({self.count()} vectors, {self.dtype})")
+
+    # ---------- Storage ----------
+
+    @property
+    def _storage_files(self) -> List[str]:
+        files = [f"vectors.{_SUFFIXES[self.dtype]}"]
+        if self.dtype == "int8":
+            files.append("scales.f32")
+        if self.rescore:
+            files.append("full.f32")
+        if self.prefix_dims:
+            files.append("prefix.f32")
+        return files
+
+    def _map(self, name: str, dtype, cols: Optional[int], capacity: int):
+        """
+        Memory-map one storage file, growing it to at least `capacity` rows.
+        """
+        path = self._data / name
+        row_bytes = np.dtype(dtype).itemsize * (cols or 1)
+
+        with open(path, "ab") as f:
+            if f.tell() < capacity * row_bytes:
+                f.truncate(capacity * row_bytes)
+
+        rows = os.path.getsize(path) // row_bytes
+        shape = (rows, cols) if cols else (rows,)
+        return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+    def _open_storage(self, capacity: int):
+        """
+        (Re)map the storage files with room for `capacity` rows.
+        """
+        self._vectors = self._map(self._storage_files[0], CODE_DTYPES[self.dtype], self.dim, capacity)
+        self._capacity = capacity = len(self._vectors)
+
+        if self.dtype == "int8":
+            self._scales = self._map("scales.f32", np.float32, None, capacity)
+        if self.rescore:
+            self._full = self._map("full.f32", np.float32, self.dim, capacity)
+        if self.prefix_dims:
+            self._prefix = self._map("prefix.f32", np.float32, self.prefix_dims, capacity)
+
+        self._offsets = self._map("documents.idx", np.int64, 2, capacity)
+        if self._documents is None:
+            # Appends go to the end; reads use os.pread at recorded offsets
+            self._documents = open(self._data / "documents.jsonl", "a+b")
+
+    def _build_prefix(self):
+        """
+        Recompute the prefix view of every stored row.
+        """
+        with self._lock:
+            for start in range(0, self._count, self.block_rows):
+                end = min(start + self.block_rows, self._count)
+                self._prefix[start:end] = truncate_embeddings(self._read_vectors(slice(start, end)), self.prefix_dims)
+            self._flush()
+            self._write_manifest()
+
+        logger.info(f"Built {self.prefix_dims}-dim prefix view for {self._count} rows")
+
+    def _flush(self):
+        for array in (self._vectors, self._scales, self._full, self._prefix, self._offsets):
+            if array is not None:
+                array.flush()
+        if self._documents is not None:
+            self._documents.flush()
+
+    def _snapshot(self) -> _Storage:
+        return _Storage(
+            self._count, self._vectors, self._scales, self._full, self._prefix,
+            self.ids, self._offsets, self._documents
+        )
+
+    def _read_vectors(self, rows: Rows, storage: Optional[_Storage] = None) -> np.ndarray:
+        """
+        Float32 copy of the given rows at the best precision stored (in
+        `storage` when given, else in the current files).
+        """
+        storage = storage or self._snapshot()
+        if storage.full is not None:
+            return np.array(storage.full[rows], dtype=np.float32)
+
+        vectors = np.array(storage.vectors[rows], dtype=np.float32)
+        if storage.scales is not None:
+            vectors *= storage.scales[rows][:, None]
+
+        return vectors
+
+    def _load_rows(self):
+        """
+        Replay the row log. Vectors and documents are flushed before their
+        rows are logged, so every logged row has both on disk. Document texts
+        are not read: only IDs, and metadata for the metadata index.
+        """
+        rows_path = self._data / "rows.jsonl"
+        if not rows_path.exists():
+            self._count = 0
+            return
+
+        # Drop a partially written last line left by a crash
+        with open(rows_path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+        alive = []
+        legacy = None
+        with open(rows_path, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+
+                deleted = record.get("delete", [])
+                for row in deleted:
+                    alive[row] = False
+                if deleted and self._metadata_index is not None:
+                    self._metadata_index.remove(deleted)
+
+                added = record.get("rows", [record] if "id" in record else [])
+                if added and legacy is None:
+                    # Logs written before documents.jsonl held the documents themselves
+                    legacy = "document" in added[0]
+                    if legacy:
+                        self._documents.truncate(0)
+                if legacy:
+                    self._append_documents(
+                        len(alive), [row["document"] for row in added], [row["metadata"] for row in added]
+                    )
+
+                if self._metadata_index is not None:
+                    self._metadata_index.add(range(len(alive), len(alive) + len(added)), [row["metadata"] for row in added])
+                self.ids.extend(row["id"] for row in added)
+                alive.extend([True] * len(added))
+
+        self._count = len(self.ids)
+        self._alive = np.array(alive, dtype=bool)
+        self._row_by_id = {
+            row_id: row for row, row_id in enumerate(self.ids) if self._alive[row]
+        }
+
+        if legacy:
+            self._flush()
+            self._rewrite_log()
+            logger.info(f"Moved the documents of flat index '{self.name}' out of its row log")
+        else:
+            # Drop documents written after the last logged row (crash before logging)
+            end = int(self._offsets[self._count - 1, 1]) if self._count else 0
+            if os.fstat(self._documents.fileno()).st_size > end:
+                self._documents.truncate(end)
+
+    def _rewrite_log(self):
+        """
+        Write the row log without documents (they are in documents.jsonl now),
+        replacing the old log atomically.
+        """
+        tmp = self._data / "rows.jsonl.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for start in range(0, self._count, self.block_rows):
+                rows = np.arange(start, min(start + self.block_rows, self._count))
+                _, metadatas = self._read_rows(self._snapshot(), rows)
+                records = [{"id": self.ids[row], "metadata": metadata} for row, metadata in zip(rows, metadatas)]
+                f.write(json.dumps({"rows": records}) + "\n")
+
+            deleted = np.flatnonzero(~self._alive).tolist()
+            for start in range(0, len(deleted), self.block_rows):
+                f.write(json.dumps({"delete": deleted[start:start + self.block_rows]}) + "\n")
+
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._data / "rows.jsonl")
+
+    def _append_documents(self, start: int, documents: List[str], metadatas: List[Dict[str, Any]]):
+        """
+        Write the document lines of rows start, start + 1, ... and record their byte ranges.
+        """
+        lines = [
+            json.dumps({"document": document, "metadata": metadata}).encode("utf-8") + b"\n"
+            for document, metadata in zip(documents, metadatas)
+        ]
+        if not lines:
+            return
+
+        self._documents.seek(0, os.SEEK_END)
+        offset = self._documents.tell()
+        ends = offset + np.cumsum([len(line) for line in lines])
+
+        self._documents.write(b"".join(lines))
+        self._offsets[start:start + len(lines), 0] = np.concatenate([[offset], ends[:-1]])
+        self._offsets[start:start + len(lines), 1] = ends
+
+    def _read_rows(self, storage: _Storage, rows) -> Tuple[List[str], List[Dict[str, Any]]]:
+        """
+        Documents and metadatas of the given rows, read from documents.jsonl
+        with one read per run of consecutive rows (at most block_rows long).
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        records: List[Any] = [None] * len(rows)
+        if len(rows) == 0:
+            return [], []
+
+        order = np.argsort(rows, kind="stable")
+        ordered = rows[order]
+        offsets = np.asarray(storage.offsets)
+        fd = storage.documents.fileno()
+
+        i = 0
+        while i < len(order):
+            first = ordered[i]
+            j = i + 1
+            while j < len(order) and ordered[j] - ordered[j - 1] <= 1 and ordered[j] - first < self.block_rows:
+                j += 1
+
+            base = int(offsets[first, 0])
+            data = os.pread(fd, int(offsets[ordered[j - 1], 1]) - base, base)
+            for k in order[i:j]:
+                start, end = offsets[rows[k]] - base
+                records[k] = json.loads(data[start:end])
+            i = j
+
+        return [record["document"] for record in records], [record["metadata"] for record in records]
+
+    def _metadatas(self, rows: np.ndarray):
+        """
+        Metadata of the given rows, read a block at a time. Called with the lock held.
+        """
+        storage = self._snapshot()
+        for start in range(0, len(rows), self.block_rows):
+            yield from self._read_rows(storage, rows[start:start + self.block_rows])[1]
+
+    def _write_manifest(self):
+        manifest = {
+            "dim": self.dim,
+            "dtype": self.dtype,
+            "rescore": self.rescore,
+            "prefix_dims": self.prefix_dims,
+            "count": self.count()
+        }
+        tmp = self._data / "index.json.tmp"
+        tmp.write_text(json.dumps(manifest))
+        os.replace(tmp, self._data / "index.json")
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    @staticmethod
+    def stored_count(path: str) -> Optional[int]:
+        """
+        Live row count recorded by the last close, without opening the index
+        (None if never recorded).
+        """
+        manifest_path = _data_dir(Path(path)) / "index.json"
+        if not manifest_path.exists():
+            return None
+        return json.loads(manifest_path.read_text()).get("count")
+
+    def size_bytes(self) -> int:
+        """
+        Disk space of the index files (storage files include preallocated rows).
+        """
+        return sum(f.stat().st_size for f in self._data.iterdir() if f.is_file())
+
+    def close(self):
+        """
+        Flush the storage files and record the row count. Searches already
+        running keep their snapshot; the memory is released with the object.
+        """
+        with self._lock:
+            if self.dim is None:
+                return
+            self._flush()
+            self._write_manifest()
+
+    def get_metadata_stats(self) -> Optional[Dict[str, int]]:
+        """
+        Get metadata index sizes (None when disabled).
+        """
+        return self._metadata_index.get_stats() if self._metadata_index is not None else None
+
+    # ---------- Collection API ----------
+
+    def count(self) -> int:
+        return int(self._alive.sum())
+
+    def add(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: Optional[List[str]] = None,
+        metadatas: Optional[List[Dict[str, Any]]] = None
+    ):
+        """
+        Append vectors. IDs that already exist are skipped (like Chroma's add).
+        """
+        with self._lock:
+            keep = [i for i, row_id in enumerate(ids) if row_id not in self._row_by_id]
+            if len(keep) < len(ids):
+                logger.warning(f"Skipped {len(ids) - len(keep)} existing IDs")
+            if not keep:
+                return
+
+            self._append(ids, embeddings, documents, metadatas, keep, [])
+
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: Optional[List[str]] = None,
+        metadatas: Optional[List[Dict[str, Any]]] = None
+    ):
+        """
+        Add vectors, replacing the rows of IDs that already exist (like Chroma's upsert).
+        """
+        self.replace(ids, embeddings, documents, metadatas)
+
+    def replace(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: Optional[List[str]] = None,
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        delete_ids: Optional[List[str]] = None
+    ):
+        """
+        Upsert vectors and delete the rows matching `where` that were not
+        re-added (e.g. the stale chunks of a shorter new version of a file),
+        plus the rows in `delete_ids`. Searches see either the old rows or
+        the new ones, never a mix, and the change is logged as one record.
+        """
+        with self._lock:
+            # Last occurrence wins for IDs repeated in the call
+            keep = list({row_id: i for i, row_id in enumerate(ids)}.values())
+            new_ids = set(ids)
+
+            deleted = {self._row_by_id[i] for i in new_ids if i in self._row_by_id}
+            if where:
+                rows, _ = self._filter_rows(self._alive, where)
+                deleted.update(int(row) for row in rows if self.ids[row] not in new_ids)
+            if delete_ids:
+                deleted.update(self._row_by_id[i] for i in delete_ids if i in self._row_by_id and i not in new_ids)
+
+            if not keep and not deleted:
+                return
+
+            self._append(ids, embeddings, documents, metadatas, keep, sorted(deleted))
+
+            if self._alive.sum() < self._count / 2:
+                self.compact()
+
+    def _append(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: Optional[List[str]],
+        metadatas: Optional[List[Dict[str, Any]]],
+        keep: List[int],
+        deleted: List[int]
+    ):
+        """
+        Write the vectors of the `keep` positions, then log the new rows
+        together with the `deleted` rows they replace. Called with the lock held.
+        """
+        documents = documents or [""] * len(ids)
+        metadatas = metadatas or [{} for _ in ids]
+
+        start = end = self._count
+        if keep:
+            vectors = self._normalize(np.asarray([embeddings[i] for i in keep], dtype=np.float32))
+
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self.prefix_dims = min(self.prefix_dims, self.dim)
+                self._write_manifest()
+                self._open_storage(max(len(keep), 1024))
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} != index dimension {self.dim}")
+
+            end = start + len(keep)
+            if end > self._capacity:
+                self._flush()
+                self._open_storage(max(end, 2 * self._capacity))
+
+            codes, scales = quantize(vectors, self.dtype)
+            self._vectors[start:end] = codes
+            if self._scales is not None:
+                self._scales[start:end] = scales
+            if self._full is not None:
+                self._full[start:end] = vectors
+            if self._prefix is not None:
+                self._prefix[start:end] = truncate_embeddings(vectors, self.prefix_dims)
+            self._append_documents(start, [documents[i] for i in keep], [metadatas[i] for i in keep])
+            self._flush()
+
+        record: Dict[str, Any] = {"rows": [{"id": ids[i], "metadata": metadatas[i]} for i in keep]}
+        if deleted:
+            record["delete"] = deleted
+        with open(self._data / "rows.jsonl", "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+        self._forget(deleted)
+
+        for offset, i in enumerate(keep):
+            self.ids.append(ids[i])
+            self._row_by_id[ids[i]] = start + offset
+
+        if self._metadata_index is not None:
+            self._metadata_index.add(range(start, end), [metadatas[i] for i in keep])
+
+        self._alive = np.concatenate([self._alive, np.ones(len(keep), dtype=bool)])
+        self._count = end
+
+    def _forget(self, rows: List[int]):
+        """
+        Mark rows deleted in memory (the caller logs them).
+        """
+        if not rows:
+            return
+        self._alive[rows] = False
+        for row in rows:
+            self._row_by_id.pop(self.ids[row], None)
+        if self._metadata_index is not None:
+            self._metadata_index.remove(rows)
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        include: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Fetch rows by ID or filter, in row order (Chroma's `get`).
+
+        Args:
+            include: Any of "documents", "metadatas", "embeddings" (default:
+                documents and metadatas); embeddings are normalized float32
+        """
+        include = include if include is not None else ["documents", "metadatas"]
+
+        with self._lock:
+            if ids is not None:
+                rows = sorted(self._row_by_id[i] for i in ids if i in self._row_by_id)
+            else:
+                rows = self._filter_rows(self._alive, where)[0].tolist()
+            rows = rows[offset:offset + limit if limit is not None else None]
+
+            results: Dict[str, Any] = {"ids": [self.ids[row] for row in rows]}
+            if "documents" in include or "metadatas" in include:
+                documents, metadatas = self._read_rows(self._snapshot(), rows)
+                if "documents" in include:
+                    results["documents"] = documents
+                if "metadatas" in include:
+                    results["metadatas"] = metadatas
+            if "embeddings" in include:
+                results["embeddings"] = (
+                    self._read_vectors(np.array(rows, dtype=np.int64)) if rows else np.zeros((0, self.dim or 0), dtype=np.float32)
+                )
+
+        return results
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        """
+        Delete rows by ID and/or metadata filter (an empty filter deletes everything).
+        """
+        with self._lock:
+            if ids is not None:
+                rows = [self._row_by_id[i] for i in ids if i in self._row_by_id]
+            else:
+                rows = self._filter_rows(self._alive, where)[0].tolist()
+
+            if not rows:
+                return
+
+            rows = [int(row) for row in rows]
+            with open(self._data / "rows.jsonl", "a", encoding="utf-8") as f:
+                f.write(json.dumps({"delete": rows}) + "\n")
+            self._forget(rows)
+
+            # Mostly tombstones: rewrite the files without them
+            if self._alive.sum() < self._count / 2:
+                self.compact()
+
+    def compact(self):
+        """
+        Rewrite the index without deleted rows. The live rows are copied block
+        by block into a new data directory, which replaces the current one
+        only once it is on disk: a crash at any point leaves one of the two whole.
+        """
+        with self._lock:
+            live = np.flatnonzero(self._alive)
+            compacted = self._empty_copy()
+            self._carry_over(compacted)
+
+            storage = self._snapshot()
+            for start in range(0, len(live), self.block_rows):
+                rows = live[start:start + self.block_rows]
+                documents, metadatas = self._read_rows(storage, rows)
+                compacted.add(
+                    ids=[self.ids[row] for row in rows],
+                    embeddings=self._read_vectors(rows),
+                    documents=documents,
+                    metadatas=metadatas
+                )
+            if compacted.dim is None:
+                compacted.dim = self.dim
+
+            self._switch_to(compacted)
+
+        logger.info(f"Compacted flat index '{self.name}' to {len(live)} rows")
+
+    def reset(self):
+        """
+        Delete every row by switching to a new, empty data directory: constant
+        time whatever the row count, unlike delete(where={}). The next add
+        sets the dimension.
+        """
+        with self._lock:
+            self._switch_to(self._empty_copy())
+
+        logger.info(f"Reset flat index '{self.name}'")
+
+    def _options(self) -> Dict[str, Any]:
+        """
+        Constructor arguments reproducing this index's settings.
+        """
+        return dict(
+            name=self.name,
+            dtype=self.dtype,
+            block_rows=self.block_rows,
+            threads=self.threads,
+            rescore=self.rescore,
+            rescore_factor=self.rescore_factor,
+            prefix_dims=self.prefix_dims,
+            prefix_factor=self.prefix_factor,
+            metadata_index=self._metadata_index is not None,
+            prefilter_selectivity=self.prefilter_selectivity
+        )
+
+    def _empty_copy(self) -> "FlatVectorIndex":
+        """
+        An empty index with the same settings in the next data directory
+        (not live until passed to _switch_to).
+        """
+        number = int(self._data.name.rsplit("-", 1)[1]) + 1 if self._data != self.path else 1
+        data = self.path / f"data-{number}"
+        shutil.rmtree(data, ignore_errors=True)
+        return type(self)(str(data), **self._options())
+
+    def _carry_over(self, compacted: "FlatVectorIndex"):
+        """
+        Hand the copy a compaction builds what it keeps besides the rows.
+        """
+
+    def _switch_to(self, other: "FlatVectorIndex"):
+        """
+        Make the data directory of `other` live: sync its files to disk,
+        atomically point CURRENT at it, take over its state and remove the
+        old files. Called with the lock held.
+        """
+        other._flush()
+        if other.dim is not None:
+            other._write_manifest()
+        for f in other.path.iterdir():
+            _fsync(f)
+        _fsync(other.path)
+
+        tmp = self.path / f"{_CURRENT}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(other.path.name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path / _CURRENT)
+        _fsync(self.path)
+
+        for name in self._DATA_STATE:
+            setattr(self, name, getattr(other, name))
+
+        # Searches still holding the old files keep reading them until they finish
+        self._remove_stale_files()
+
+    def _remove_stale_files(self):
+        """
+        Remove what a compaction or reset leaves behind: data directories
+        other than the live one (also half-built ones after a crash) and,
+        once CURRENT exists, the files of the original single-directory layout.
+        """
+        for entry in self.path.iterdir():
+            if entry == self._data or entry.name == _CURRENT:
+                continue
+            if entry.is_dir():
+                if entry.name.startswith("data-"):
+                    shutil.rmtree(entry, ignore_errors=True)
+            elif self._data != self.path:
+                entry.unlink(missing_ok=True)
+
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        **search_options: Any
+    ) -> Dict[str, List[List[Any]]]:
+        """
+        Top-k search. Distances are squared L2 between normalized
+        vectors (2 - 2 * cosine), comparable to Chroma's default space.
+        Several query embeddings are scored together, one matrix product per
+        block, so a batch costs far less than the same queries one by one.
+
+        Args:
+            search_options: Per-query knobs:
+                prefix_dims: First-stage prefix size (0 disables the prefix stage;
+                    at most the stored prefix size)
+                candidates: First-stage candidates kept for reranking
+                nprobe: Inverted lists scanned (IVF only)
+
+        Returns:
+            Chroma-style results, plus "stats": per query, the cost of each search
+            stage, and with a filter "filter": the plan chosen for it
+        """
+        results = {"ids": [], "distances": [], "documents": [], "metadatas": [], "stats": []}
+        subset = None
+
+        with self._lock:
+            storage = self._snapshot()
+            mask = self._alive.copy()
+            if where:
+                subset, results["filter"] = self._plan_filter(where, mask)
+
+        stages: List[List[Dict[str, Any]]] = [[] for _ in query_embeddings]
+
+        if storage.vectors is None or not mask.any() or not query_embeddings:
+            found = [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))] * len(query_embeddings)
+        else:
+            queries = self._normalize(np.asarray(query_embeddings, dtype=np.float32))
+            if queries.shape[1] != self.dim:
+                raise ValueError(f"Query dimension {queries.shape[1]} != index dimension {self.dim}")
+            found = self._search(storage, mask, queries, n_results, stages, subset=subset, **search_options)
+
+        for (rows, scores), query_stages in zip(found, stages):
+            results["stats"].append({"stages": query_stages})
+
+            documents, metadatas = self._read_rows(storage, rows)
+            results["ids"].append([storage.ids[row] for row in rows])
+            results["distances"].append([float(2 - 2 * score) for score in scores])
+            results["documents"].append(documents)
+            results["metadatas"].append(metadatas)
+
+        return results
+
+    def _filter_rows(self, mask: np.ndarray, where: Optional[Dict[str, Any]]) -> Tuple[np.ndarray, bool]:
+        """
+        Rows set in `mask` that match a filter, in row order.
+
+        Returns:
+            (rows, whether the metadata index resolved the filter)
+        """
+        if not where:
+            return np.flatnonzero(mask), False
+
+        resolved = self._metadata_index.resolve(where) if self._metadata_index is not None else None
+        if resolved is None:
+            rows = np.flatnonzero(mask)
+            keep = np.fromiter((matches_where(m, where) for m in self._metadatas(rows)), dtype=bool, count=len(rows))
+            return rows[keep], False
+
+        rows, residual = resolved
+        rows = rows[rows < len(mask)]
+        rows = rows[mask[rows]]
+        if residual:
+            keep = np.fromiter((matches_where(m, residual) for m in self._metadatas(rows)), dtype=bool, count=len(rows))
+            rows = rows[keep]
+
+        return rows, True
+
+    def _plan_filter(self, where: Dict[str, Any], mask: np.ndarray) -> Tuple[Optional[np.ndarray], Dict[str, Any]]:
+        """
+        Narrow `mask` to the rows matching a filter and choose how to search
+        them: "prefilter" scores only those rows (gathered, so costlier per
+        row), "postfilter" scans every row and drops the others.
+
+        Returns:
+            (rows to score for a prefilter, else None; plan stats)
+        """
+        started = time.perf_counter()
+
+        live = int(mask.sum())
+        rows, indexed = self._filter_rows(mask, where)
+        mask[:] = False
+        mask[rows] = True
+
+        prefilter = len(rows) <= self.prefilter_selectivity * live
+        stats = {
+            "plan": "prefilter" if prefilter else "postfilter",
+            "indexed": indexed,
+            "candidates": len(rows),
+            "selectivity": round(len(rows) / live, 4) if live else 0.0,
+            "ms": round((time.perf_counter() - started) * 1000, 3)
+        }
+
+        return (rows if prefilter else None), stats
+
+    def _search(
+        self,
+        storage: _Storage,
+        mask: np.ndarray,
+        queries: np.ndarray,
+        k: int,
+        stages: List[List[Dict[str, Any]]],
+        prefix_dims: Optional[int] = None,
+        candidates: Optional[int] = None,
+        subset: Optional[np.ndarray] = None,
+        **search_options
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Score all live rows (or only the `subset` rows, when given) block by
+        block against every query and keep the k best per query, scanning the
+        prefix view first when one is stored.
+        """
+        dims = self._prefix_stage_dims(storage, prefix_dims)
+        name = "prefilter_scan" if subset is not None else "scan"
+
+        if dims:
+            keep = max(candidates or k * self.prefix_factor, k)
+            q_prefix = truncate_embeddings(queries, dims)
+            scorer = lambda rows: self._prefix_scores(storage, rows, q_prefix, dims)
+
+            found = self._scan(storage, mask, scorer, keep, stages, f"{name}_prefix_{dims}d", subset)
+            return [
+                self._rerank(storage, rows, q, k, query_stages)
+                for (rows, _), q, query_stages in zip(found, queries, stages)
+            ]
+
+        found = self._scan(
+            storage,
+            mask,
+            lambda rows: self._scores(storage, rows, queries),
+            self._candidates(storage, k),
+            stages,
+            name,
+            subset
+        )
+
+        return [
+            self._rescore(storage, rows, scores, q, k, query_stages)
+            for (rows, scores), q, query_stages in zip(found, queries, stages)
+        ]
+
+    def _scan(
+        self,
+        storage: _Storage,
+        mask: np.ndarray,
+        scorer,
+        keep: int,
+        stages: List[List[Dict[str, Any]]],
+        name: str,
+        subset: Optional[np.ndarray] = None
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Blocked scan with `scorer` (rows x queries scores), keeping the `keep`
+        best per query: over all rows skipping those not in `mask`, or over
+        the sorted `subset` rows only.
+        """
+        started = time.perf_counter()
+        total = storage.count if subset is None else len(subset)
+
+        def score_block(start: int):
+            end = min(start + self.block_rows, total)
+            if subset is not None:
+                rows = subset[start:end]
+                scores = scorer(rows)
+            else:
+                scores = scorer(slice(start, end))
+                scores[~mask[start:end]] = -np.inf
+                rows = np.arange(start, end)
+            return [self._top_k(rows, column, keep) for column in scores.T]
+
+        starts = range(0, total, self.block_rows)
+        if self._executor is not None and total > self.block_rows:
+            blocks = list(self._executor.map(score_block, starts))
+        else:
+            blocks = [score_block(start) for start in starts]
+
+        found = [
+            self._top_k(
+                np.concatenate([block[i][0] for block in blocks]),
+                np.concatenate([block[i][1] for block in blocks]),
+                keep
+            )
+            for i in range(len(stages))
+        ]
+
+        for query_stages in stages:
+            self._record_stage(query_stages, name, total, started, queries=len(stages))
+        return found
+
+    def _prefix_stage_dims(self, storage: _Storage, prefix_dims: Optional[int]) -> int:
+        """
+        Prefix size for the first stage: the stored size unless overridden (0 = off).
+        """
+        if storage.prefix is None:
+            return 0
+        if prefix_dims is None:
+            return self.prefix_dims
+        return max(0, min(prefix_dims, self.prefix_dims))
+
+    def _prefix_scores(self, storage: _Storage, rows: Rows, q_prefix: np.ndarray, dims: int) -> np.ndarray:
+        """
+        First-stage scores from the stored prefixes (cosine on the leading `dims`),
+        one column per query when `q_prefix` holds several.
+        """
+        prefix = np.asarray(storage.prefix)[rows]
+
+        if dims == self.prefix_dims:
+            return prefix @ q_prefix.T
+
+        # Shorter than stored: the stored prefixes need re-normalizing at this size,
+        # which makes the scan slower than one at the stored size
+        prefix = prefix[:, :dims]
+        norms = np.sqrt(np.einsum("ij,ij->i", prefix, prefix))
+        norms[norms == 0] = 1.0
+        scores = prefix @ q_prefix.T
+        return scores / (norms[:, None] if scores.ndim == 2 else norms)
+
+    def _rerank(self, storage: _Storage, rows: np.ndarray, q: np.ndarray, k: int, stages: List[Dict[str, Any]]):
+        """
+        Second stage: rescore first-stage candidates on all dimensions.
+        """
+        started = time.perf_counter()
+
+        reranked = len(rows)
+        rows = np.sort(rows)
+        rows, scores = self._top_k(rows, self._scores(storage, rows, q), self._candidates(storage, k))
+
+        self._record_stage(stages, f"rerank_{self.dim}d", reranked, started)
+        return self._rescore(storage, rows, scores, q, k, stages)
+
+    @staticmethod
+    def _record_stage(stages: List[Dict[str, Any]], name: str, rows: int, started: float, queries: int = 1):
+        stage = {
+            "stage": name,
+            "rows": int(rows),
+            "ms": round((time.perf_counter() - started) * 1000, 3)
+        }
+        # Stage shared by a batch of queries: the time covers all of them
+        if queries > 1:
+            stage["queries"] = queries
+        stages.append(stage)
+
+    def _candidates(self, storage: _Storage, k: int) -> int:
+        """
+        How many scan results to keep: extra ones when they will be rescored.
+        """
+        return k * self.rescore_factor if storage.full is not None else k
+
+    @staticmethod
+    def _scores(storage: _Storage, rows: Rows, q: np.ndarray) -> np.ndarray:
+        """
+        Scores from the scan matrix (approximate for compact dtypes), one
+        column per query when `q` holds several.
+        """
+        # Index through a plain ndarray view: memmap.__getitem__ adds per-call overhead
+        scores = np.asarray(storage.vectors)[rows].astype(np.float32, copy=False) @ q.T
+
+        if storage.scales is not None:
+            scales = storage.scales[rows]
+            scores *= scales[:, None] if scores.ndim == 2 else scales
+
+        return scores
+
+    def _rescore(
+        self,
+        storage: _Storage,
+        rows: np.ndarray,
+        scores: np.ndarray,
+        q: np.ndarray,
+        k: int,
+        stages: List[Dict[str, Any]]
+    ):
+        """
+        Re-rank scan candidates with the full-precision rows, when kept.
+        """
+        if storage.full is None or len(rows) == 0:
+            return self._top_k(rows, scores, k)
+
+        started = time.perf_counter()
+
+        rows = np.sort(rows)
+        exact = np.asarray(storage.full)[rows] @ q
+
+        self._record_stage(stages, "rescore_full_precision", len(rows), started)
+        return self._top_k(rows, exact, k)
+
+    @staticmethod
+    def _top_k(rows: np.ndarray, scores: np.ndarray, k: int):
+        """
+        Best k (row, score) pairs, highest score first; masked (-inf) rows dropped.
+        """
+        keep = np.isfinite(scores)
+        rows, scores = rows[keep], scores[keep]
+
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[top], scores[top]
+
+        order = np.argsort(-scores)
+        return rows[order], scores[order]
@@ -1,3 +1,8 @@
+from typing import Iterator
+
+from app.services.ollama_scheduler import HYBRID
+
+
 class HybridCombinerService:
     def __init__(self, llm_service):
         self.llm_service = llm_service
@@ -9,7 +14,43 @@ class HybridCombinerService:
         rag_result: dict
     ) -> str:
 
-        prompt = f"""
+        prompt = self._build_prompt(question, sql_result, rag_result)
+
+        # Long-form synthesis runs on the "synthesis" tier; empty output falls back
+        response = self.llm_service.generate_text(
+            prompt,
+            task="synthesis",
+            validate=lambda text: bool(text.strip()),
+            priority=HYBRID
+        )
+
+        return response.strip()
+
+    def combine_stream(
+        self,
+        question: str,
+        sql_result: dict,
+        rag_result: dict
+    ) -> Iterator[str]:
+        """
+        Same synthesis as combine(), yielding answer pieces as they are generated.
+        """
+        prompt = self._build_prompt(question, sql_result, rag_result)
+
+        yield from self.llm_service.stream_text(
+            prompt,
+            task="synthesis",
+            priority=HYBRID
+        )
+
+    def _build_prompt(
+        self,
+        question: str,
+        sql_result: dict,
+        rag_result: dict
+    ) -> str:
+
+        return f"""
 You are an intelligent business assistant.
 
 User Question:
@@ -28,8 +69,4 @@ Instructions:
 - Do NOT mention SQL or internal system.
 - Do NOT output JSON.
 - Provide a clean, human-friendly response.
-"""
-
-        response = self.llm_service.generate_text(prompt)
-
-        return response.strip()
\ No newline at end of file
+"""
\ No newline at end of file
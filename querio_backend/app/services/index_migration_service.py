@@ -0,0 +1,746 @@
+"""
+Index Migration Service
+Changes the embedding model without search downtime.
+
+The corpus is re-embedded in the background (ingest priority, optionally
+rate limited) into a shadow index: the next vector index generation. Live
+traffic keeps using the current generation, and uploads and deletes made
+meanwhile are applied to both. When every file is migrated the generations
+are swapped atomically, together with the query embedding model.
+
+The alias manifest (VECTOR_ALIAS_PATH) records the live generation and its
+embedding model, the previous generation (kept until the next migration)
+and, while one runs, the migration's checkpoint: every migrated file with
+the upload time of the version migrated. An interrupted migration resumes
+from it and only re-embeds files that are missing or changed since.
+
+Uploads are written in batches (begin_document, store_chunks,
+finish_document). A file whose upload began before the migration is
+migrated again once it is complete, before the switch.
+
+A reset rebuild from the document cache (IndexRebuildService) uses the
+same shadow index, with the live model: it restores into the next
+generation and only replaces the live one once every chunk is written.
+
+After the switch, the document cache gets the new model's embeddings of
+every cached document still in the index, so /vectors/rebuild and
+byte-identical uploads keep working without re-embedding.
+"""
+
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from app.config import settings
+from app.services.document_cache_service import DocumentCacheService
+from app.services.document_service import chunk_hash
+from app.services.embedding_service import EmbeddingService
+from app.services.maintenance import MaintenanceInProgressError, MaintenanceLock
+from app.services.ollama_scheduler import INGEST
+from app.services.vector_service import DEFAULT_NAMESPACE, VectorService
+
+logger = logging.getLogger(__name__)
+
+_CHECKPOINT_SECONDS = 5.0
+
+
+class MigrationInProgressError(MaintenanceInProgressError):
+    """A migration is already running."""
+
+
+def load_alias(path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Read the alias manifest; without one, generation 0 is live with
+    settings.EMBEDDING_MODEL.
+    """
+    alias = {"generation": 0, "embedding_model": settings.EMBEDDING_MODEL, "dimensions": 768}
+
+    path = Path(path or settings.VECTOR_ALIAS_PATH)
+    if path.exists():
+        with open(path, encoding="utf-8") as f:
+            alias.update(json.load(f))
+
+    if alias["embedding_model"] != settings.EMBEDDING_MODEL:
+        logger.warning(
+            f"Vector index generation {alias['generation']} was built with {alias['embedding_model']}; "
+            f"EMBEDDING_MODEL={settings.EMBEDDING_MODEL} only applies through a migration"
+        )
+    return alias
+
+
+def save_alias(path: Optional[str], alias: Dict[str, Any]):
+    """
+    Write the alias manifest atomically (readers see the old or the new file).
+    """
+    path = Path(path or settings.VECTOR_ALIAS_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(alias, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class IndexMigrationService:
+    def __init__(
+        self,
+        vector_service: VectorService,
+        embedding_service: EmbeddingService,
+        alias_path: Optional[str] = None,
+        max_chunks_per_sec: float = 0.0,
+        document_cache: Optional[DocumentCacheService] = None,
+        maintenance: Optional[MaintenanceLock] = None
+    ):
+        """
+        Args:
+            vector_service: The live vector service (swapped in place)
+            embedding_service: The query/ingest embedding service (its model
+                is switched with the index)
+            alias_path: Alias manifest (defaults to settings.VECTOR_ALIAS_PATH)
+            max_chunks_per_sec: Re-embedding rate limit (0 = none)
+            document_cache: Given the new model's embeddings after a switch
+            maintenance: Claimed while a migration runs (shared with rebuilds,
+                see IndexRebuildService)
+        """
+        self.vector_service = vector_service
+        self.embedding_service = embedding_service
+        self.document_cache = document_cache
+        self.alias_path = alias_path or settings.VECTOR_ALIAS_PATH
+        self.max_chunks_per_sec = max_chunks_per_sec
+        self.maintenance = maintenance or MaintenanceLock()
+        self.alias = load_alias(self.alias_path)
+
+        # Guards the state below and serializes document writes against the
+        # migration's own writes and the switch
+        self._lock = threading.Lock()
+        self._running = False
+        self._shadow: Optional[VectorService] = None
+        self._target: Optional[str] = None
+        self._done: Dict[str, Dict[str, Optional[float]]] = {}
+        # Files and namespaces written through store_chunks()/delete_all()
+        # during the migration: the worker must not overwrite them with what it read before
+        self._overridden: Set[Tuple[str, str]] = set()
+        self._cleared: Set[str] = set()
+        # Uploads in progress -> whether all their batches reach the shadow index
+        # (they began while it existed); the others are requeued once complete
+        self._uploads: Dict[Tuple[str, str], bool] = {}
+        self._requeued: List[Tuple[str, str]] = []
+        self._upload_finished = threading.Condition(self._lock)
+
+        self._listeners: List[Callable[[str], None]] = []
+
+        pending = self.alias.get("migration")
+        self._progress: Dict[str, Any] = {"status": "idle"}
+        if pending:
+            self._progress = {
+                "status": "interrupted" if pending["status"] == "running" else pending["status"],
+                "embedding_model": pending["embedding_model"],
+                "generation": pending["generation"]
+            }
+
+    def add_listener(self, listener: Callable[[str], None]):
+        """
+        Register a callback for model switches (called with the new model).
+        """
+        self._listeners.append(listener)
+
+    def get_progress(self) -> Dict[str, Any]:
+        """
+        Progress of the current (or last) migration, with throughput in chunks/sec.
+        """
+        with self._lock:
+            progress = dict(self._progress)
+            progress["live_generation"] = self.alias["generation"]
+            progress["live_model"] = self.alias["embedding_model"]
+
+        if "started_at" in progress:
+            elapsed = (progress.get("finished_at") or time.time()) - progress["started_at"]
+            progress["elapsed_s"] = round(elapsed, 2)
+            progress["chunks_per_sec"] = round(progress["chunks_embedded"] / elapsed, 1) if elapsed > 0 else 0.0
+        return progress
+
+    def start(self, embedding_model: str) -> Dict[str, Any]:
+        """
+        Migrate the index to another embedding model in a background thread.
+        An unfinished migration to the same model is resumed; one to another
+        model is discarded.
+
+        Raises:
+            MaintenanceInProgressError: if a migration (MigrationInProgressError)
+                or a rebuild is already running
+            ValueError: if the live index already uses this model
+        """
+        self.maintenance.claim(f"A migration to {embedding_model}", MigrationInProgressError)
+        with self._lock:
+            if embedding_model == self.alias["embedding_model"]:
+                self.maintenance.release()
+                raise ValueError(f"The live index already uses {embedding_model}")
+            self._running = True
+            self._progress = {"status": "starting", "embedding_model": embedding_model}
+
+        try:
+            migration = self._prepare(embedding_model)
+        except Exception:
+            with self._lock:
+                self._running = False
+            self.maintenance.release()
+            raise
+
+        thread = threading.Thread(target=self._run, args=(migration,), name="index-migration", daemon=True)
+        thread.start()
+        return self.get_progress()
+
+    def resume(self) -> Optional[Dict[str, Any]]:
+        """
+        Resume a migration interrupted by a restart (None if there is none).
+        """
+        pending = self.alias.get("migration")
+        if not pending or pending["status"] != "running":
+            return None
+
+        logger.warning(f"Resuming migration to {pending['embedding_model']} (generation {pending['generation']})")
+        return self.start(pending["embedding_model"])
+
+    def is_running(self) -> bool:
+        with self._lock:
+            return self._running
+
+    # ---------- Writes during a migration ----------
+
+    def begin_document(self, filename: str, namespace: str = DEFAULT_NAMESPACE):
+        """
+        Start writing a new version of a file in batches (store_chunks); it
+        must be ended with finish_document().
+        """
+        with self._lock:
+            mirrored = self._shadow is not None
+            self._uploads[(namespace, filename)] = mirrored
+            if mirrored:
+                self._overridden.add((namespace, filename))
+
+    def store_chunks(
+        self,
+        chunks: List[Dict[str, Any]],
+        embeddings: List[List[float]],
+        embedding_model: str,
+        filename: str,
+        namespace: str,
+        uploaded_at: float
+    ) -> Tuple[str, List[List[float]]]:
+        """
+        Write a batch of a file's chunks to the live index and, while a
+        migration runs, to the shadow index too (embedded with the target model).
+
+        Args:
+            embeddings: Chunk embeddings made with `embedding_model`
+            uploaded_at: Upload time, the same for every batch of the upload
+
+        Returns:
+            (model, embeddings) written to the live index: the index may have
+            switched models since the caller embedded the chunks
+        """
+        texts = [c["text"] for c in chunks]
+
+        by_model = {embedding_model: embeddings}
+        target = self._target
+        if target is not None and target not in by_model:
+            by_model[target] = self._embed(texts, target, throttle=False)
+
+        with self._lock:
+            # Only embeds here when a migration started or finished since the caller embedded
+            live_model = self.embedding_service.model
+            if live_model not in by_model:
+                by_model[live_model] = self._embed(texts, live_model, throttle=False)
+            self.vector_service.write_chunks(chunks, by_model[live_model], filename, namespace, uploaded_at)
+
+            if self._shadow is not None and self._uploads.get((namespace, filename)):
+                if self._target not in by_model:
+                    by_model[self._target] = self._embed(texts, self._target, throttle=False)
+                self._shadow.write_chunks(chunks, by_model[self._target], filename, namespace, uploaded_at)
+
+        return live_model, by_model[live_model]
+
+    def finish_document(
+        self,
+        filename: str,
+        namespace: str,
+        chunk_count: Optional[int],
+        uploaded_at: float
+    ):
+        """
+        End a file written with store_chunks(): switch it over to the new
+        version. With chunk_count None (the upload failed) the batches
+        written so far are deleted and the earlier version stays.
+        """
+        with self._lock:
+            mirrored = self._uploads.pop((namespace, filename), False)
+            self.vector_service.finish_document(filename, namespace, chunk_count, uploaded_at)
+
+            if self._shadow is not None and mirrored:
+                self._shadow.finish_document(filename, namespace, chunk_count, uploaded_at)
+                if chunk_count is not None:
+                    self._done.setdefault(namespace, {})[filename] = uploaded_at
+                else:
+                    # The worker migrates the earlier version, which is live again
+                    self._overridden.discard((namespace, filename))
+                    self._requeued.append((namespace, filename))
+            elif self._shadow is not None and not mirrored:
+                # Began before the migration: the worker migrates what is live now
+                self._done.get(namespace, {}).pop(filename, None)
+                self._requeued.append((namespace, filename))
+            self._upload_finished.notify_all()
+
+    def delete_all(self, namespace: str = DEFAULT_NAMESPACE) -> Dict[str, Any]:
+        """
+        Delete every vector of a namespace, in the shadow index too.
+        """
+        with self._lock:
+            result = self.vector_service.delete_all_vectors(namespace)
+            if self._shadow is not None:
+                self._shadow.delete_all_vectors(namespace)
+                self._cleared.add(namespace)
+                self._done.pop(namespace, None)
+        return result
+
+    # ---------- Migration ----------
+
+    def _prepare(self, embedding_model: str) -> Dict[str, Any]:
+        """
+        Checkpoint to resume, or a new migration. Drops the previous
+        generation and any abandoned shadow index.
+        """
+        backend = self.vector_service.backend
+        alias = dict(self.alias)
+
+        previous = alias.pop("previous", None)
+        if previous:
+            VectorService(backend=backend, generation=previous["generation"]).drop()
+
+        migration = alias.get("migration")
+        if migration and migration["embedding_model"] != embedding_model:
+            logger.warning(f"Discarding unfinished migration to {migration['embedding_model']}")
+            VectorService(backend=backend, generation=migration["generation"]).drop()
+            migration = None
+
+        if migration is None:
+            # Leftovers of an interrupted reset rebuild
+            VectorService(backend=backend, generation=alias["generation"] + 1).drop()
+            migration = {
+                "generation": alias["generation"] + 1,
+                "embedding_model": embedding_model,
+                "dimensions": None,
+                "started_at": time.time(),
+                "done": {}
+            }
+        migration["status"] = "running"
+        alias["migration"] = migration
+
+        save_alias(self.alias_path, alias)
+        with self._lock:
+            self.alias = alias
+        return migration
+
+    def _run(self, migration: Dict[str, Any]):
+        try:
+            self._migrate(migration)
+        except Exception as e:
+            logger.exception("Index migration failed")
+            self._finish(migration, "failed", error=str(e))
+        finally:
+            with self._lock:
+                self._running = False
+                self._shadow = None
+                self._target = None
+            self.maintenance.release()
+
+    def _migrate(self, migration: Dict[str, Any]):
+        target = migration["embedding_model"]
+        live = self.vector_service
+        shadow = VectorService(backend=live.backend, generation=migration["generation"])
+
+        with self._lock:
+            self._shadow = shadow
+            self._target = target
+            self._done = migration["done"]
+            self._overridden = set()
+            self._cleared = set()
+            self._requeued = []
+
+        plan = [(namespace, live.list_filenames(namespace)) for namespace in live.list_namespaces()]
+        self._update(
+            status="running",
+            embedding_model=target,
+            generation=migration["generation"],
+            started_at=time.time(),
+            finished_at=None,
+            files_total=sum(len(filenames) for _, filenames in plan),
+            files_done=0,
+            files_skipped=0,
+            chunks_embedded=0,
+            errors=[]
+        )
+        logger.info(f"Migrating vector index to {target}: {self._progress['files_total']} files")
+
+        checkpointed = time.time()
+        for namespace, filenames in plan:
+            for filename in filenames:
+                try:
+                    self._migrate_file(shadow, target, namespace, filename, migration)
+                except Exception as e:
+                    self._add_error(f"{namespace}/{filename}", e)
+
+                if time.time() - checkpointed > _CHECKPOINT_SECONDS:
+                    self._checkpoint(migration)
+                    checkpointed = time.time()
+
+        self._migrate_requeued(shadow, target, migration)
+        self._reconcile(shadow)
+
+        if self._progress["errors"]:
+            self._finish(migration, "incomplete")
+            return
+
+        self._switch(shadow, migration)
+
+    def _migrate_file(
+        self,
+        shadow: VectorService,
+        target: str,
+        namespace: str,
+        filename: str,
+        migration: Dict[str, Any]
+    ):
+        chunks, uploaded_at = self.vector_service.get_document(filename, namespace)
+
+        with self._lock:
+            migrated = self._done.get(namespace, {}).get(filename, -1)
+        if not chunks or migrated == uploaded_at:
+            with self._lock:
+                self._progress["files_skipped"] += 1
+            return
+
+        # Chunks deduplicated into ones already migrated keep their embedding
+        hashes = [chunk_hash(c["text"]) for c in chunks]
+        known = shadow.find_duplicate_embeddings(chunks, filename, namespace)
+        missing = {key: c["text"] for key, c in zip(hashes, chunks) if key not in known}
+        known.update(zip(missing, self._embed(list(missing.values()), target)))
+        embeddings = [known[key] for key in hashes]
+        if migration["dimensions"] is None:
+            migration["dimensions"] = len(embeddings[0])
+
+        with self._lock:
+            if (namespace, filename) not in self._overridden and namespace not in self._cleared:
+                shadow.replace_document(chunks, embeddings, filename, namespace, uploaded_at)
+                self._done.setdefault(namespace, {})[filename] = uploaded_at
+            self._progress["files_done"] += 1
+            self._progress["chunks_embedded"] += len(missing)
+
+    def _migrate_requeued(self, shadow: VectorService, target: str, migration: Dict[str, Any]):
+        """
+        Wait for the uploads that began before the migration, then migrate
+        those files again (the worker may have read them half written).
+        """
+        while True:
+            requeued = self._wait_for_uploads()
+            with self._lock:
+                self._progress["files_total"] += len(requeued)
+            if not requeued:
+                return
+
+            for namespace, filename in requeued:
+                try:
+                    self._migrate_file(shadow, target, namespace, filename, migration)
+                except Exception as e:
+                    self._add_error(f"{namespace}/{filename}", e)
+
+    def _wait_for_uploads(self) -> List[Tuple[str, str]]:
+        """
+        Wait until no upload that began before the shadow index is in
+        progress, and take the files to copy to it again.
+        """
+        with self._lock:
+            while not all(self._uploads.values()):
+                self._upload_finished.wait()
+            requeued, self._requeued = self._requeued, []
+        return requeued
+
+    def _reconcile(self, shadow: VectorService):
+        """
+        Remove files and namespaces from the shadow index that are no longer
+        live (deleted while the migration was interrupted).
+        """
+        with self._lock:
+            live_namespaces = set(self.vector_service.list_namespaces())
+
+            for namespace in shadow.list_namespaces():
+                if namespace not in live_namespaces:
+                    shadow.delete_all_vectors(namespace)
+                    continue
+
+                stale = set(shadow.list_filenames(namespace)) - set(self.vector_service.list_filenames(namespace))
+                for filename in sorted(stale):
+                    shadow.delete_by_filename(filename, namespace)
+                    self._done.get(namespace, {}).pop(filename, None)
+
+    def _switch(self, shadow: VectorService, migration: Dict[str, Any]):
+        """
+        Make the shadow index live: manifest first, then the in-process swap.
+        """
+        target = migration["embedding_model"]
+        dimensions = migration["dimensions"] or self.embedding_service.dimensions
+
+        alias = {
+            "generation": migration["generation"],
+            "embedding_model": target,
+            "dimensions": dimensions,
+            "previous": {"generation": self.alias["generation"], "embedding_model": self.alias["embedding_model"]}
+        }
+
+        def switch_model():
+            self.embedding_service.model = target
+            self.embedding_service.dimensions = dimensions
+
+        with self._lock:
+            save_alias(self.alias_path, alias)
+            self.alias = alias
+            self.vector_service.swap(shadow, on_swap=switch_model)
+            self._shadow = None
+            self._target = None
+            self._progress.update(status="caching")
+
+        self._cache_embeddings(target)
+        self._update(status="completed", finished_at=time.time())
+
+        progress = self.get_progress()
+        logger.warning(
+            f"Vector index migrated to {target} (generation {alias['generation']}): "
+            f"{progress['files_done']} files, {progress['chunks_embedded']} chunks re-embedded "
+            f"in {progress['elapsed_s']}s"
+        )
+
+        for listener in self._listeners:
+            try:
+                listener(target)
+            except Exception:
+                logger.exception("Migration listener failed")
+
+    def _cache_embeddings(self, target: str):
+        """
+        Store the migrated embeddings in the document cache: each cached
+        document gets them from the first of its sources still in the (now
+        live) index that has every one of its chunks.
+        """
+        if self.document_cache is None:
+            return
+
+        cached = not_cached = 0
+        for document_id, metadata in self.document_cache.documents():
+            if metadata.get("embedding_model") == target:
+                continue
+
+            stored = False
+            sources = sorted(metadata.get("sources", []), key=lambda s: s.get("uploaded_at") or 0.0, reverse=True)
+            for source in sources:
+                try:
+                    embeddings = {}
+                    for hashes, rows in self.vector_service.iter_chunk_embeddings(source["filename"], source["namespace"]):
+                        embeddings.update(zip(hashes, rows))
+                    stored = bool(embeddings) and self.document_cache.replace_embeddings(
+                        document_id, metadata.get("file_extension", ""), embeddings, target
+                    )
+                except Exception as e:
+                    logger.warning(f"Migration: caching {source['namespace']}/{source['filename']}: {e}")
+                if stored:
+                    break
+
+            cached += stored
+            not_cached += not stored
+
+        self._update(documents_cached=cached, documents_not_cached=not_cached)
+        logger.info(f"Document cache moved to {target}: {cached} documents, {not_cached} not in the index")
+
+    # ---------- Reset rebuilds ----------
+
+    def begin_rebuild(self) -> VectorService:
+        """
+        Open the next index generation for a reset rebuild (see
+        IndexRebuildService). Like a migration's shadow index, it gets the
+        uploads and namespace deletes made meanwhile, so nothing is lost when
+        end_rebuild() makes it live. Drops the previous generation and any
+        unfinished migration. The caller holds the maintenance claim.
+        """
+        backend = self.vector_service.backend
+        alias = dict(self.alias)
+
+        previous = alias.pop("previous", None)
+        if previous:
+            VectorService(backend=backend, generation=previous["generation"]).drop()
+
+        migration = alias.pop("migration", None)
+        if migration:
+            logger.warning(f"Discarding unfinished migration to {migration['embedding_model']}")
+            VectorService(backend=backend, generation=migration["generation"]).drop()
+
+        generation = alias["generation"] + 1
+        VectorService(backend=backend, generation=generation).drop()
+        shadow = VectorService(backend=backend, generation=generation)
+
+        save_alias(self.alias_path, alias)
+        with self._lock:
+            self.alias = alias
+            if migration:
+                self._progress = {"status": "idle"}
+            self._shadow = shadow
+            self._target = alias["embedding_model"]
+            self._done = {}
+            self._overridden = set()
+            self._cleared = set()
+            self._requeued = []
+        return shadow
+
+    def write_rebuilt(
+        self,
+        shadow: VectorService,
+        ids: List[str],
+        embeddings: np.ndarray,
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        namespace: str
+    ) -> int:
+        """
+        Upsert restored rows (see VectorService.upsert_rows) into the
+        rebuild's generation, except those of files uploaded or namespaces
+        cleared since it began: what they hold is newer.
+
+        Returns:
+            Rows written
+        """
+        with self._lock:
+            if namespace in self._cleared:
+                return 0
+
+            keep = [i for i, m in enumerate(metadatas) if (namespace, m["filename"]) not in self._overridden]
+            if len(keep) < len(ids):
+                ids = [ids[i] for i in keep]
+                embeddings = embeddings[keep]
+                documents = [documents[i] for i in keep]
+                metadatas = [metadatas[i] for i in keep]
+            if ids:
+                shadow.upsert_rows(ids, embeddings, documents, metadatas, namespace)
+        return len(ids)
+
+    def end_rebuild(self, shadow: VectorService, restored: Set[str], switch: bool):
+        """
+        Finish a reset rebuild. With switch, the namespaces it did not
+        restore and the files whose upload began before it are copied from
+        the live index (stored embeddings, no embedding calls), then its
+        generation is made live; the replaced one is kept as "previous" until
+        the next rebuild or migration. Otherwise it is dropped and the live
+        index stays as it was.
+
+        Args:
+            restored: Namespaces the rebuild restored from the cache
+        """
+        if not switch:
+            self._drop_rebuild(shadow)
+            return
+
+        try:
+            live = self.vector_service
+            for namespace in live.list_namespaces():
+                if namespace not in restored:
+                    for filename in live.list_filenames(namespace):
+                        self._copy_file(shadow, namespace, filename)
+
+            while True:
+                requeued = self._wait_for_uploads()
+                if not requeued:
+                    break
+                for namespace, filename in requeued:
+                    self._copy_file(shadow, namespace, filename)
+        except BaseException:
+            self._drop_rebuild(shadow)
+            raise
+
+        with self._lock:
+            alias = {
+                "generation": shadow.generation,
+                "embedding_model": self.alias["embedding_model"],
+                "dimensions": self.alias["dimensions"],
+                "previous": {"generation": self.alias["generation"], "embedding_model": self.alias["embedding_model"]}
+            }
+            save_alias(self.alias_path, alias)
+            self.alias = alias
+            self.vector_service.swap(shadow)
+            self._shadow = None
+            self._target = None
+
+    def _drop_rebuild(self, shadow: VectorService):
+        with self._lock:
+            self._shadow = None
+            self._target = None
+        shadow.drop()
+
+    def _copy_file(self, shadow: VectorService, namespace: str, filename: str):
+        """
+        Copy a live file with its stored embeddings to the rebuild's generation.
+        """
+        chunks, uploaded_at = self.vector_service.get_document(filename, namespace)
+        embeddings = {}
+        for hashes, rows in self.vector_service.iter_chunk_embeddings(filename, namespace):
+            embeddings.update(zip(hashes, rows))
+
+        with self._lock:
+            if (namespace, filename) in self._overridden or namespace in self._cleared:
+                return
+            if chunks:
+                shadow.replace_document(
+                    chunks, [embeddings[chunk_hash(c["text"])] for c in chunks], filename, namespace, uploaded_at
+                )
+            else:
+                shadow.delete_by_filename(filename, namespace)
+
+    def _embed(self, texts: List[str], model: str, throttle: bool = True) -> List[List[float]]:
+        """
+        Embed at ingest priority, paced to max_chunks_per_sec for the
+        migration's own work.
+        """
+        started = time.perf_counter()
+        embeddings = self.embedding_service.generate_embeddings(texts, priority=INGEST, model=model)
+
+        if throttle and self.max_chunks_per_sec > 0:
+            delay = len(texts) / self.max_chunks_per_sec - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+        return embeddings
+
+    def _checkpoint(self, migration: Dict[str, Any]):
+        with self._lock:
+            alias = dict(self.alias)
+            alias["migration"] = {**migration, "done": {ns: dict(files) for ns, files in self._done.items()}}
+            save_alias(self.alias_path, alias)
+
+    def _finish(self, migration: Dict[str, Any], status: str, error: Optional[str] = None):
+        migration["status"] = status
+        self._checkpoint(migration)
+        self._update(status=status, finished_at=time.time(), **({"error": error} if error else {}))
+        logger.warning(f"Migration to {migration['embedding_model']} {status}; POST it again to resume")
+
+    def _add_error(self, item: str, error: Exception):
+        logger.warning(f"Migration: {item}: {error}")
+        with self._lock:
+            errors = self._progress.setdefault("errors", [])
+            if len(errors) < 100:
+                errors.append({"item": item, "error": str(error)})
+
+    def _update(self, **fields: Any):
+        with self._lock:
+            self._progress.update(fields)
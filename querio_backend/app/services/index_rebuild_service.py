@@ -0,0 +1,358 @@
+"""
+Index Rebuild Service
+Restores the vector index from the document cache: cached chunks and
+embeddings are streamed into the vector backend, so a corrupted or
+migrated index comes back without a single embedding call.
+
+Documents are read by a pool of reader threads (JSON and .npy decoding),
+and their chunks are written in large batches that span documents.
+
+A reset rebuild restores into the next index generation (see
+IndexMigrationService.begin_rebuild) and only replaces the live index once
+every cached chunk is written, so a failed one loses nothing.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+import threading
+import time
+
+import numpy as np
+
+from app.services.index_migration_service import IndexMigrationService
+from app.services.maintenance import MaintenanceInProgressError
+from app.services.storage_backend import StorageBackend
+from app.services.vector_service import VectorService
+
+logger = logging.getLogger(__name__)
+
+
+class RebuildInProgressError(MaintenanceInProgressError):
+    """A rebuild is already running."""
+
+
+class IndexRebuildService:
+    def __init__(
+        self,
+        vector_service: VectorService,
+        storage: StorageBackend,
+        index_migration: IndexMigrationService,
+        embedding_model: Optional[str] = None,
+        readers: int = 4,
+        batch_size: int = 5000
+    ):
+        """
+        Args:
+            index_migration: Builds and switches the generation of a reset
+                rebuild; its maintenance claim is held while a rebuild runs,
+                so rebuilds and migrations never overlap
+            embedding_model: Only restore documents embedded with this model
+                (None restores everything cached)
+            readers: Threads loading cached documents
+            batch_size: Chunks per vector store write (Chroma splits further
+                to its own maximum)
+        """
+        self.vector_service = vector_service
+        self.storage = storage
+        self.index_migration = index_migration
+        self.embedding_model = embedding_model
+        self.readers = readers
+        self.batch_size = batch_size
+
+        self._lock = threading.Lock()
+        self._running = False
+        self._progress: Dict[str, Any] = {"status": "idle"}
+
+    def get_progress(self) -> Dict[str, Any]:
+        """
+        Progress of the current (or last) rebuild, with throughput in chunks/sec.
+        """
+        with self._lock:
+            progress = dict(self._progress)
+
+        if "started_at" in progress:
+            elapsed = (progress.get("finished_at") or time.time()) - progress["started_at"]
+            progress["elapsed_s"] = round(elapsed, 2)
+            progress["chunks_per_sec"] = round(progress["chunks_written"] / elapsed, 1) if elapsed > 0 else 0.0
+        return progress
+
+    def start(self, namespace: Optional[str] = None, reset: bool = False) -> Dict[str, Any]:
+        """
+        Run rebuild() in a background thread.
+
+        Raises:
+            MaintenanceInProgressError: if a rebuild (RebuildInProgressError)
+                or a migration is already running
+        """
+        self._claim()
+        thread = threading.Thread(
+            target=self._run, args=(namespace, reset), name="index-rebuild", daemon=True
+        )
+        thread.start()
+        return self.get_progress()
+
+    def rebuild(self, namespace: Optional[str] = None, reset: bool = False) -> Dict[str, Any]:
+        """
+        Restore every cached document (or those of one namespace) into the
+        vector store. Chunks are upserted, so rebuilding a healthy index is
+        harmless.
+
+        Args:
+            namespace: Only restore this namespace
+            reset: Restore into a new index generation that replaces the
+                live one when every chunk is written (drops vectors of files
+                in the restored namespaces that are not in the cache)
+
+        Returns:
+            Final progress
+
+        Raises:
+            MaintenanceInProgressError: if a rebuild (RebuildInProgressError)
+                or a migration is already running
+        """
+        self._claim()
+        self._run(namespace, reset)
+        return self.get_progress()
+
+    def is_running(self) -> bool:
+        with self._lock:
+            return self._running
+
+    def _claim(self):
+        self.index_migration.maintenance.claim("An index rebuild", RebuildInProgressError)
+        with self._lock:
+            self._running = True
+            self._progress = {"status": "starting"}
+
+    def _run(self, namespace: Optional[str], reset: bool):
+        try:
+            self._rebuild(namespace, reset)
+        except Exception as e:
+            logger.exception("Index rebuild failed")
+            self._update(status="failed", error=str(e), finished_at=time.time())
+        finally:
+            with self._lock:
+                self._running = False
+            self.index_migration.maintenance.release()
+
+    def _rebuild(self, namespace: Optional[str], reset: bool):
+        started = time.time()
+        plan, skipped, other_model = self._plan(namespace)
+        total_chunks = sum(metadata.get("chunk_count", 0) * len(sources) for _, metadata, sources in plan)
+
+        self._update(
+            status="running",
+            namespace=namespace,
+            started_at=started,
+            finished_at=None,
+            documents_total=len(plan),
+            documents_done=0,
+            documents_skipped=skipped + other_model,
+            documents_other_model=other_model,
+            chunks_total=total_chunks,
+            chunks_written=0,
+            chunks_superseded=0,
+            errors=[]
+        )
+
+        if not plan and other_model:
+            # Nothing to restore: the cache holds another model's embeddings (e.g. an earlier migration)
+            error = f"All {other_model} cached documents were embedded with another model than {self.embedding_model}"
+            logger.warning(f"Index rebuild: {error}")
+            self._update(status="failed", error=error, finished_at=time.time())
+            return
+        logger.info(f"Rebuilding vector index from {len(plan)} cached documents ({total_chunks} chunks)")
+
+        restored = {namespace} if namespace else {s["namespace"] for _, _, sources in plan for s in sources}
+        shadow = self.index_migration.begin_rebuild() if reset else None
+        complete = False
+        try:
+            self._restore(plan, shadow)
+
+            progress = self.get_progress()
+            missing = total_chunks - progress["chunks_written"] - progress["chunks_superseded"]
+            complete = not progress["errors"] and missing <= 0
+        finally:
+            if shadow is not None:
+                self.index_migration.end_rebuild(shadow, restored, switch=complete)
+
+        if not complete:
+            error = f"{max(missing, 0)} of {total_chunks} chunks were not restored ({len(progress['errors'])} errors)"
+            if reset:
+                error += "; the live index was kept"
+            logger.warning(f"Index rebuild: {error}")
+            self._update(status="failed", error=error, finished_at=time.time())
+            return
+
+        self._update(status="completed", finished_at=time.time())
+        progress = self.get_progress()
+        logger.info(
+            f"Rebuilt vector index: {progress['chunks_written']} chunks from "
+            f"{progress['documents_done']} documents in {progress['elapsed_s']}s "
+            f"({progress['chunks_per_sec']} chunks/sec)"
+        )
+
+    def _restore(self, plan, shadow: Optional[VectorService]):
+        """
+        Write every planned document, to the live index or (reset) the
+        rebuild's generation. A document is checked on its own before its
+        rows join a batch, so a bad one cannot fail the others.
+        """
+        # namespace -> pending rows (ids, embeddings, documents, metadatas)
+        pending: Dict[str, Tuple[List[str], List[np.ndarray], List[str], List[Dict[str, Any]]]] = {}
+        dimensions = None
+
+        for document_id, loaded in self._load_all(plan):
+            if isinstance(loaded, Exception):
+                self._add_error(document_id, loaded)
+                continue
+
+            chunks, embeddings, sources = loaded
+            try:
+                if dimensions is not None and embeddings.shape[1] != dimensions:
+                    raise ValueError(f"{embeddings.shape[1]}-d embeddings in a {dimensions}-d index")
+                rows = [
+                    (source["namespace"], self.vector_service.chunk_rows(
+                        chunks, embeddings, source["filename"], source.get("uploaded_at")
+                    ))
+                    for source in sources
+                ]
+            except Exception as e:
+                self._add_error(document_id, e)
+                continue
+            dimensions = embeddings.shape[1]
+
+            for target, (ids, documents, metadatas) in rows:
+                batch = pending.setdefault(target, ([], [], [], []))
+                batch[0].extend(ids)
+                batch[1].append(embeddings)
+                batch[2].extend(documents)
+                batch[3].extend(metadatas)
+
+                if len(batch[0]) >= self.batch_size:
+                    self._flush(target, pending.pop(target), shadow)
+
+            with self._lock:
+                self._progress["documents_done"] += 1
+
+        for target, batch in pending.items():
+            self._flush(target, batch, shadow)
+
+    def _plan(
+        self,
+        namespace: Optional[str]
+    ) -> Tuple[List[Tuple[str, Dict[str, Any], List[Dict[str, Any]]]], int, int]:
+        """
+        Read every cached metadata.json and decide what to restore. When
+        several cached versions were uploaded under the same (namespace,
+        filename), only the most recent one is restored.
+
+        Returns:
+            ([(document ID, metadata, sources to restore)], documents
+            skipped as unreadable or empty, documents skipped for another
+            embedding model)
+        """
+        latest: Dict[Tuple[str, str], Tuple[float, str]] = {}
+        documents: Dict[str, Dict[str, Any]] = {}
+        skipped = other_model = 0
+
+        for document_id in self.storage.list_documents():
+            try:
+                metadata = self.storage.load_metadata(document_id, "")
+            except (FileNotFoundError, ValueError):
+                skipped += 1
+                continue
+
+            if not metadata.get("chunk_count"):
+                # Nothing to restore (cached before empty documents were skipped)
+                skipped += 1
+                continue
+
+            if self.embedding_model and metadata.get("embedding_model") != self.embedding_model:
+                other_model += any(not namespace or s["namespace"] == namespace for s in metadata.get("sources", []))
+                continue
+
+            documents[document_id] = metadata
+            for source in metadata.get("sources", []):
+                if namespace and source["namespace"] != namespace:
+                    continue
+                key = (source["namespace"], source["filename"])
+                uploaded_at = source.get("uploaded_at") or 0.0
+                if key not in latest or uploaded_at > latest[key][0]:
+                    latest[key] = (uploaded_at, document_id)
+
+        restore: Dict[str, List[Dict[str, Any]]] = {}
+        for (source_namespace, filename), (_, document_id) in latest.items():
+            source = next(
+                s for s in documents[document_id]["sources"]
+                if (s["namespace"], s["filename"]) == (source_namespace, filename)
+            )
+            restore.setdefault(document_id, []).append(source)
+
+        plan = [(document_id, documents[document_id], sources) for document_id, sources in sorted(restore.items())]
+        return plan, skipped, other_model
+
+    def _load_all(self, plan):
+        """
+        Load cached documents with the reader pool, at most 2 per reader in
+        flight so memory stays bounded. Yields (document ID, (chunks,
+        embeddings, sources) or the exception raised loading it).
+        """
+        def load(document_id: str, metadata: Dict[str, Any], sources: List[Dict[str, Any]]):
+            extension = metadata.get("file_extension", "")
+            chunks = self.storage.load_chunks(document_id, extension)
+            embeddings = np.asarray(self.storage.load_embeddings(document_id, extension), dtype=np.float32)
+            if embeddings.ndim != 2 or not embeddings.shape[1]:
+                raise ValueError(f"Embeddings of shape {embeddings.shape}")
+            if len(chunks) != len(embeddings):
+                raise ValueError(f"{len(chunks)} chunks but {len(embeddings)} embeddings")
+            return chunks, embeddings, sources
+
+        with ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix="rebuild-reader") as executor:
+            queued = iter(plan)
+            in_flight = {}
+
+            def submit():
+                for document_id, metadata, sources in queued:
+                    in_flight[executor.submit(load, document_id, metadata, sources)] = document_id
+                    if len(in_flight) >= 2 * self.readers:
+                        return
+
+            submit()
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    document_id = in_flight.pop(future)
+                    error = future.exception()
+                    yield document_id, error if error is not None else future.result()
+                submit()
+
+    def _flush(self, namespace: str, rows, shadow: Optional[VectorService]):
+        ids, embeddings, documents, metadatas = rows
+        try:
+            embeddings = np.concatenate(embeddings)
+            if shadow is None:
+                self.vector_service.upsert_rows(ids, embeddings, documents, metadatas, namespace)
+                written = len(ids)
+            else:
+                written = self.index_migration.write_rebuilt(shadow, ids, embeddings, documents, metadatas, namespace)
+        except Exception as e:
+            self._add_error(namespace, e)
+            return
+
+        with self._lock:
+            self._progress["chunks_written"] += written
+            # Files uploaded (or namespaces cleared) during a reset rebuild keep their newer state
+            self._progress["chunks_superseded"] += len(ids) - written
+
+    def _add_error(self, item: str, error: Exception):
+        logger.warning(f"Rebuild: {item}: {error}")
+        with self._lock:
+            errors = self._progress.setdefault("errors", [])
+            if len(errors) < 100:
+                errors.append({"item": item, "error": str(error)})
+
+    def _update(self, **fields: Any):
+        with self._lock:
+            self._progress.update(fields)
@@ -0,0 +1,399 @@
+"""
+Ingest Pipeline
+Stores an uploaded file in bounded memory, whatever its size: text is
+extracted page by page and chunked as it arrives, and each batch of chunks
+is embedded and written to the vector index before the next one is read.
+The file's earlier embeddings (reused by a re-upload) and the chunks and
+embeddings kept for the document cache wait in temporary files, not in
+memory.
+"""
+
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import itertools
+import json
+import logging
+import math
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from app.config import settings
+from app.services.document_cache_service import DocumentCacheService
+from app.services.document_service import DocumentService, chunk_hash
+from app.services.embedding_service import EmbeddingService
+from app.services.index_migration_service import IndexMigrationService
+from app.services.vector_service import DEFAULT_NAMESPACE, VectorService
+
+logger = logging.getLogger(__name__)
+
+
+def batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """
+    Consecutive lists of up to size items.
+    """
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class _VectorSpool:
+    """float32 vectors appended to a temporary file and read back memory-mapped."""
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile()
+        self.count = 0
+        self.dim: Optional[int] = None
+
+    def append(self, vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if not len(vectors):
+            return
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+        self._file.write(vectors.tobytes())
+        self.count += len(vectors)
+
+    def array(self) -> np.ndarray:
+        self._file.flush()
+        if not self.count:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self._file, dtype=np.float32, mode="r", shape=(self.count, self.dim))
+
+    def close(self):
+        self._file.close()
+
+
+class ChunkEmbeddingSnapshot:
+    """
+    A file's stored embeddings by chunk hash, read before a new version
+    overwrites them. The vectors wait in a temporary file; only 8-byte hash
+    prefixes are kept in memory.
+    """
+
+    def __init__(self, pages: Iterable[Tuple[List[str], np.ndarray]], embedding_model: str):
+        """
+        Args:
+            pages: (chunk hashes, embeddings) pages (VectorService.iter_chunk_embeddings)
+            embedding_model: Model the embeddings were made with
+        """
+        self.embedding_model = embedding_model
+        self._vectors = _VectorSpool()
+
+        keys = []
+        for hashes, embeddings in pages:
+            keys.append(np.fromiter((int(key[:16], 16) for key in hashes), dtype=np.uint64, count=len(hashes)))
+            self._vectors.append(embeddings)
+
+        keys = np.concatenate(keys) if keys else np.zeros(0, dtype=np.uint64)
+        self._order = np.argsort(keys, kind="stable")
+        self._keys = keys[self._order]
+        self._embeddings = self._vectors.array()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def lookup(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Embeddings of the chunk hashes found.
+        """
+        if not len(self._keys):
+            return {}
+
+        keys = np.fromiter((int(key[:16], 16) for key in hashes), dtype=np.uint64, count=len(hashes))
+        positions = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        return {
+            key: np.array(self._embeddings[self._order[position]])
+            for key, value, position in zip(hashes, keys, positions) if self._keys[position] == value
+        }
+
+    def close(self):
+        self._embeddings = None
+        self._vectors.close()
+
+
+class ChunkSpool:
+    """A file's chunks and embeddings, written to temporary files as they are made."""
+
+    def __init__(self):
+        self._chunks = tempfile.TemporaryFile(mode="w+", encoding="utf-8")
+        self._vectors = _VectorSpool()
+
+    def append(self, chunks: List[Dict[str, Any]], embeddings: np.ndarray):
+        for chunk in chunks:
+            self._chunks.write(json.dumps(chunk) + "\n")
+        self._vectors.append(embeddings)
+
+    def __len__(self) -> int:
+        return self._vectors.count
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        self._chunks.flush()
+        self._chunks.seek(0)
+        for line in self._chunks:
+            yield json.loads(line)
+
+    def embeddings(self) -> np.ndarray:
+        """
+        The embeddings, memory-mapped.
+        """
+        return self._vectors.array()
+
+    def close(self):
+        self._chunks.close()
+        self._vectors.close()
+
+
+class IngestPipeline:
+    def __init__(
+        self,
+        document_service: DocumentService,
+        embedding_service: EmbeddingService,
+        vector_service: VectorService,
+        index_migration: IndexMigrationService,
+        document_cache: Optional[DocumentCacheService] = None,
+        batch_size: int = 256
+    ):
+        """
+        Args:
+            vector_service: The live vector service (read for reusable embeddings)
+            index_migration: Writes the batches (to the shadow index too while
+                a migration runs)
+            document_cache: Keeps chunks and embeddings for rebuilds and
+                byte-identical uploads (None disables it)
+            batch_size: Chunks embedded and written at a time
+        """
+        self.document_service = document_service
+        self.embedding_service = embedding_service
+        self.vector_service = vector_service
+        self.index_migration = index_migration
+        self.document_cache = document_cache
+        self.batch_size = batch_size
+
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._active: Dict[int, Dict[str, Any]] = {}
+        self._totals = {"files_ingested": 0, "files_failed": 0, "chunks_written": 0}
+
+    def get_progress(self) -> Dict[str, Any]:
+        """
+        Uploads being ingested (text read, chunks embedded and written so
+        far), and totals since startup.
+        """
+        now = time.time()
+        with self._lock:
+            uploads = [
+                {**progress, "elapsed_s": round(now - progress["started_at"], 2)}
+                for progress in self._active.values()
+            ]
+            return {"in_progress": uploads, **self._totals}
+
+    def ingest(
+        self,
+        file_path: Path,
+        filename: str,
+        namespace: str = DEFAULT_NAMESPACE,
+        document_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Parse, chunk, embed and store a file, replacing an earlier upload of
+        the same file in the namespace.
+
+        Returns:
+            Chunk count, whether the chunks and embeddings came from the document
+            cache, chunks embedded / reused / deduplicated, embedding calls saved
+            and elapsed time
+        """
+        started = time.perf_counter()
+        progress = {
+            "filename": filename,
+            "namespace": namespace,
+            "started_at": time.time(),
+            "characters_read": 0,
+            "pages_read": 0,
+            "chunks_embedded": 0,
+            "chunks_written": 0
+        }
+        key = next(self._ids)
+        with self._lock:
+            self._active[key] = progress
+
+        stats = {
+            "chunks_embedded": 0,
+            "chunks_reused": 0,
+            "chunks_deduplicated": 0,
+            "embedding_calls": 0,
+            "embedding_ms": 0.0
+        }
+        snapshot = spool = None
+
+        try:
+            embedding_model = self.embedding_service.model
+            cached = None
+            if self.document_cache is not None and document_id is not None:
+                cached = self.document_cache.lookup(document_id, filename, embedding_model)
+
+            if cached is not None:
+                # Byte-identical to a cached upload: no parsing, chunking or embedding
+                chunks, embeddings = cached
+                stats["chunks_reused"] = len(chunks)
+                batches = (
+                    (embedding_model, chunks[start:start + self.batch_size], embeddings[start:start + self.batch_size])
+                    for start in range(0, len(chunks), self.batch_size)
+                )
+            else:
+                if settings.INCREMENTAL_INGEST_ENABLED:
+                    # Read the stored embeddings and the model they belong to together (no migration switch in between)
+                    with self.vector_service.pinned():
+                        snapshot = ChunkEmbeddingSnapshot(
+                            self.vector_service.iter_chunk_embeddings(filename, namespace), self.embedding_service.model
+                        )
+                if self.document_cache is not None:
+                    spool = ChunkSpool()
+                chunks = self.document_service.iter_chunks(self._read_pages(file_path, progress))
+                batches = self._embed_batches(chunks, filename, namespace, snapshot, stats, progress)
+
+            uploaded_at = time.time()
+            models = set()
+
+            # Store in the namespace's partition, batch by batch (and in the shadow
+            # index while an embedding model migration runs)
+            self.index_migration.begin_document(filename, namespace)
+            chunk_count = None
+            try:
+                written = 0
+                for model, batch, batch_embeddings in batches:
+                    model, batch_embeddings = self.index_migration.store_chunks(
+                        chunks=batch,
+                        embeddings=batch_embeddings,
+                        embedding_model=model,
+                        filename=filename,
+                        namespace=namespace,
+                        uploaded_at=uploaded_at
+                    )
+                    models.add(model)
+                    if spool is not None and len(models) == 1:
+                        spool.append(batch, batch_embeddings)
+                    written += len(batch)
+                    with self._lock:
+                        progress["chunks_written"] = written
+                    logger.debug(f"Ingesting {filename} ({namespace}): {written} chunks written")
+                chunk_count = written
+            finally:
+                self.index_migration.finish_document(filename, namespace, chunk_count, uploaded_at)
+
+            # Keep chunks + embeddings so the index can be rebuilt without re-embedding
+            if cached is not None:
+                self.document_cache.add_source(document_id, filename, namespace, uploaded_at)
+            elif spool is not None and not chunk_count:
+                logger.info(f"Not caching {filename}: it has no text to chunk")
+            elif spool is not None and len(models) > 1:
+                logger.warning(f"Not caching {filename}: the embedding model changed while it was ingested")
+            elif spool is not None:
+                self.document_cache.store(
+                    file_path=file_path,
+                    filename=filename,
+                    namespace=namespace,
+                    chunks=spool,
+                    embeddings=spool.embeddings(),
+                    embedding_model=models.pop() if models else embedding_model,
+                    uploaded_at=uploaded_at,
+                    document_id=document_id
+                )
+        except BaseException:
+            with self._lock:
+                self._totals["files_failed"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._active.pop(key)
+            for spooled in (snapshot, spool):
+                if spooled is not None:
+                    spooled.close()
+
+        with self._lock:
+            self._totals["files_ingested"] += 1
+            self._totals["chunks_written"] += chunk_count
+
+        stats["embedding_ms"] = round(stats["embedding_ms"], 1)
+        stats["embedding_calls_saved"] = math.ceil(chunk_count / self.embedding_service.batch_size) - stats["embedding_calls"]
+        stats["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(
+            f"Ingested {filename} ({namespace}): {chunk_count} chunks, {stats['chunks_embedded']} embedded, "
+            f"{stats['chunks_reused']} reused, {stats['chunks_deduplicated']} deduplicated, "
+            f"{stats['embedding_calls_saved']} embedding calls saved "
+            f"in {stats['elapsed_ms']} ms"
+        )
+
+        return {"chunks": chunk_count, "cache_hit": cached is not None, **stats}
+
+    def _read_pages(self, file_path: Path, progress: Dict[str, Any]) -> Iterator[Tuple[Optional[int], str]]:
+        for number, text in self.document_service.iter_pages(str(file_path)):
+            with self._lock:
+                progress["characters_read"] += len(text)
+                if number is not None:
+                    progress["pages_read"] = number
+            yield number, text
+
+    def _embed_batches(
+        self,
+        chunks: Iterable[Dict[str, Any]],
+        filename: str,
+        namespace: str,
+        snapshot: Optional[ChunkEmbeddingSnapshot],
+        stats: Dict[str, Any],
+        progress: Dict[str, Any]
+    ) -> Iterator[Tuple[str, List[Dict[str, Any]], np.ndarray]]:
+        """
+        Embed chunks batch by batch, reusing the stored embedding of every
+        chunk whose text is unchanged since the file was last uploaded to the
+        namespace (snapshot) and, with chunk deduplication, of every chunk
+        duplicating one already stored. Repeated texts within a batch are
+        embedded once.
+
+        Yields:
+            (embedding model, chunks, float32 embeddings) per batch
+        """
+        for batch in batched(chunks, self.batch_size):
+            hashes = [chunk_hash(c["text"]) for c in batch]
+
+            with self.vector_service.pinned():
+                embedding_model = self.embedding_service.model
+                previous, duplicates = {}, {}
+                if snapshot is not None and snapshot.embedding_model == embedding_model:
+                    previous = snapshot.lookup(hashes)
+                if self.vector_service.chunk_registry is not None:
+                    duplicates = self.vector_service.find_duplicate_embeddings(
+                        [c for c, key in zip(batch, hashes) if key not in previous], filename, namespace
+                    )
+
+            embeddings = [previous.get(key, duplicates.get(key)) for key in hashes]
+            missing = {key: c["text"] for key, c, embedding in zip(hashes, batch, embeddings) if embedding is None}
+
+            started = time.perf_counter()
+            generated = dict(zip(
+                missing, self.embedding_service.generate_embeddings(list(missing.values()), model=embedding_model)
+            ))
+            stats["embedding_ms"] += (time.perf_counter() - started) * 1000
+
+            embeddings = np.asarray(
+                [embedding if embedding is not None else generated[key] for key, embedding in zip(hashes, embeddings)],
+                dtype=np.float32
+            )
+
+            reused = sum(key in previous for key in hashes)
+            stats["chunks_embedded"] += len(missing)
+            stats["chunks_reused"] += reused
+            stats["chunks_deduplicated"] += len(batch) - reused - len(missing)
+            stats["embedding_calls"] += math.ceil(len(missing) / self.embedding_service.batch_size)
+            with self._lock:
+                progress["chunks_embedded"] += len(batch)
+
+            yield embedding_model, batch, embeddings
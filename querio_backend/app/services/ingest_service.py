@@ -28,7 +28,7 @@ class IngestService:
 
         embeddings = self.embedding_service.generate_embeddings(texts)
 
-        self.vector_service.add_documents(
+        self.vector_service.replace_document(
             chunks=chunks,
             embeddings=embeddings,
             filename=path.name
@@ -1,5 +1,7 @@
 import json
 
+from app.services.ollama_scheduler import HYBRID
+
 
 class IntentSplitterService:
     def __init__(self, llm_service):
@@ -42,8 +44,28 @@ class IntentSplitterService:
         {question}
         """
 
-        response = self.llm_service.generate_text(prompt)
+        # Deterministic output, so identical questions hit the response cache.
+        # Runs on the small "split" tier; non-JSON output falls back to the default model.
+        response = self.llm_service.generate_text(
+            prompt,
+            options={"temperature": 0},
+            task="split",
+            validate=lambda text: self._parse(text) is not None,
+            priority=HYBRID
+        )
+
+        data = self._parse(response)
+        if data is not None:
+            return data
 
+        # Fallback safety
+        return {
+            "sql_part": question,
+            "rag_part": None
+        }
+
+    @staticmethod
+    def _parse(response: str):
         try:
             data = json.loads(response)
             return {
@@ -51,8 +73,4 @@ class IntentSplitterService:
                 "rag_part": data.get("rag_part")
             }
         except Exception:
-            # Fallback safety
-            return {
-                "sql_part": question,
-                "rag_part": None
-            }
\ No newline at end of file
+            return None
\ No newline at end of file
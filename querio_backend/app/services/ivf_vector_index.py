@@ -0,0 +1,404 @@
+"""
+IVF Vector Index
+Approximate nearest-neighbour search on top of the flat index storage.
+Vectors are partitioned by a k-means coarse quantizer into inverted lists;
+a query scans only the `nprobe` lists whose centroids are closest, so
+latency and recall both grow with nprobe.
+
+Extra files next to the flat index files:
+- centroids.npy: coarse quantizer (nlist x dim, normalized)
+- assignments.i32: inverted-list number of every row, in row order
+"""
+
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from app.services.embedding_service import truncate_embeddings
+from app.services.flat_vector_index import FlatVectorIndex
+
+logger = logging.getLogger(__name__)
+
+
+def train_kmeans(
+    vectors: np.ndarray,
+    n_clusters: int,
+    iterations: int = 10,
+    seed: int = 0
+) -> np.ndarray:
+    """
+    Spherical k-means (cosine) on normalized vectors.
+
+    Returns:
+        Normalized centroids (n_clusters x dim)
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+
+    for _ in range(iterations):
+        labels = np.argmax(vectors @ centroids.T, axis=1)
+
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        counts = np.bincount(labels, minlength=n_clusters)
+
+        # Re-seed empty clusters with random points
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = sums / norms
+
+    return centroids.astype(np.float32)
+
+
+class _Quantizer(NamedTuple):
+    """
+    Centroids and the rows of each inverted list. Retraining replaces the
+    whole tuple, so a search reading it once never mixes two trainings.
+    """
+    centroids: np.ndarray
+    lists: List[List[int]]
+    arrays: List[Optional[np.ndarray]]
+
+
+def _quantizer(centroids: np.ndarray, assignments: np.ndarray) -> _Quantizer:
+    """
+    Inverted lists of rows 0, 1, ... given their list numbers.
+    """
+    order = np.argsort(assignments, kind="stable")
+    counts = np.bincount(assignments, minlength=len(centroids))
+    lists = [rows.tolist() for rows in np.split(order, np.cumsum(counts)[:-1])]
+    return _Quantizer(centroids, lists, [None] * len(centroids))
+
+
+class IVFVectorIndex(FlatVectorIndex):
+    """Inverted-file ANN index with an nprobe recall/latency knob."""
+
+    _DATA_STATE = FlatVectorIndex._DATA_STATE + ("_quantizer", "trained_count", "_assignments")
+
+    def __init__(
+        self,
+        path: str,
+        name: str = "documents",
+        dtype: str = "float32",
+        nlist: int = 1024,
+        nprobe: int = 16,
+        train_min: int = 10000,
+        **kwargs: Any
+    ):
+        """
+        Args:
+            nlist: Maximum number of inverted lists (capped at ~count / 39 when trained)
+            nprobe: Lists scanned per query unless overridden per query
+            train_min: Vectors needed before the quantizer is trained; smaller
+                indexes are searched exactly
+        """
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_min = train_min
+
+        self._quantizer: Optional[_Quantizer] = None
+        self.trained_count = 0
+        self._assignments = np.zeros(0, dtype=np.int32)
+
+        # (Re)training runs in this thread; off in the copies compaction builds
+        self._trainer: Optional[threading.Thread] = None
+        self._auto_train = True
+
+        super().__init__(path, name=name, dtype=dtype, **kwargs)
+
+        with self._lock:
+            self._load_ivf()
+
+    @property
+    def centroids(self) -> Optional[np.ndarray]:
+        quantizer = self._quantizer
+        return quantizer.centroids if quantizer is not None else None
+
+    # ---------- Storage ----------
+
+    def _load_ivf(self):
+        centroids_path = self._data / "centroids.npy"
+        if not centroids_path.exists():
+            self._maybe_train()
+            return
+
+        centroids = np.load(centroids_path)
+        self.trained_count = self.count()
+
+        assignments_path = self._data / "assignments.i32"
+        assignments = (
+            np.fromfile(assignments_path, dtype=np.int32) if assignments_path.exists() else np.zeros(0, dtype=np.int32)
+        )[:self._count]
+
+        self._assignments = assignments
+        self._quantizer = _quantizer(centroids, assignments)
+
+        # Rows logged after their assignments were last written (crash): assign now
+        if len(assignments) < self._count:
+            self._assign_rows(len(assignments), self._count)
+
+    @staticmethod
+    def _nearest(centroids: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+
+    def _assign_rows(self, start: int, end: int):
+        """
+        Put rows [start, end) in their nearest lists and persist the assignments.
+        Called with the lock held.
+        """
+        if start >= end:
+            return
+
+        quantizer = self._quantizer
+        labels = self._nearest(quantizer.centroids, self._read_vectors(slice(start, end)))
+
+        with open(self._data / "assignments.i32", "ab") as f:
+            f.write(labels.tobytes())
+
+        self._assignments = np.concatenate([self._assignments, labels])
+        for offset, list_no in enumerate(labels):
+            quantizer.lists[list_no].append(start + offset)
+            quantizer.arrays[list_no] = None
+
+    def _training_due(self) -> bool:
+        """
+        Train once the index is big enough, and retrain after it has grown 4x.
+        """
+        live = self.count()
+        if live < self.train_min:
+            return False
+        return self.centroids is None or live >= 4 * self.trained_count
+
+    def _maybe_train(self):
+        """
+        Start (re)training in the background when due. Until it finishes,
+        searches use the previous lists (or an exact scan before the first
+        training). Called with the lock held.
+        """
+        if not self._auto_train or self._trainer is not None or not self._training_due():
+            return
+
+        self._trainer = threading.Thread(target=self._train_in_background, name=f"ivf-train-{self.name}", daemon=True)
+        self._trainer.start()
+
+    def _train_in_background(self):
+        try:
+            # Discarded trainings (rows renumbered meanwhile) start over if still due
+            while self._training_due():
+                self.train()
+        except Exception:
+            logger.exception(f"IVF index '{self.name}' training failed")
+        finally:
+            with self._lock:
+                self._trainer = None
+
+    def wait_for_training(self, timeout: Optional[float] = None):
+        """
+        Wait for a background (re)training to finish, if one is running.
+        """
+        trainer = self._trainer
+        if trainer is not None:
+            trainer.join(timeout)
+
+    def train(self) -> bool:
+        """
+        (Re)train the coarse quantizer on a sample of live vectors and reassign
+        every row. The work runs without the lock on a snapshot of the rows;
+        the new quantizer and lists then replace the old ones at once, with
+        the rows added meanwhile assigned to them.
+
+        Returns:
+            False when a compaction or reset renumbered the rows meanwhile
+            (nothing is replaced)
+        """
+        with self._lock:
+            data = self._data
+            storage = self._snapshot()
+            live = np.flatnonzero(self._alive)
+        if len(live) == 0:
+            return True
+
+        n_clusters = max(1, min(self.nlist, len(live) // 39))
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(live, min(len(live), 64 * n_clusters), replace=False))
+        centroids = train_kmeans(self._read_vectors(sample, storage), n_clusters)
+
+        assignments_tmp = data / "assignments.i32.tmp"
+        with open(assignments_tmp, "wb") as f:
+            for start in range(0, storage.count, self.block_rows):
+                rows = slice(start, min(start + self.block_rows, storage.count))
+                f.write(self._nearest(centroids, self._read_vectors(rows, storage)).tobytes())
+
+        with self._lock:
+            if self._data != data:
+                assignments_tmp.unlink(missing_ok=True)
+                logger.info(f"IVF index '{self.name}' changed during training; discarded")
+                return False
+
+            with open(assignments_tmp, "ab") as f:
+                if self._count > storage.count:
+                    f.write(self._nearest(centroids, self._read_vectors(slice(storage.count, self._count))).tobytes())
+            assignments = np.fromfile(assignments_tmp, dtype=np.int32)
+
+            # Without assignments, a restart reassigns every row to the centroids on disk,
+            # so a crash between these steps leaves the two consistent
+            (data / "assignments.i32").unlink(missing_ok=True)
+            with open(data / "centroids.npy.tmp", "wb") as f:
+                np.save(f, centroids)
+            os.replace(data / "centroids.npy.tmp", data / "centroids.npy")
+            os.replace(assignments_tmp, data / "assignments.i32")
+
+            self._assignments = assignments
+            self._quantizer = _quantizer(centroids, assignments)
+            self.trained_count = len(live)
+
+        logger.info(f"IVF index '{self.name}' trained: {n_clusters} lists over {len(live)} vectors")
+        return True
+
+    # ---------- Collection API ----------
+
+    def _append(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: Optional[List[str]],
+        metadatas: Optional[List[Dict[str, Any]]],
+        keep: List[int],
+        deleted: List[int]
+    ):
+        start = self._count
+        super()._append(ids, embeddings, documents, metadatas, keep, deleted)
+
+        if self._quantizer is not None:
+            self._assign_rows(start, self._count)
+
+        self._maybe_train()
+
+    def compact(self):
+        with self._lock:
+            super().compact()
+            self._maybe_train()
+
+    def _options(self) -> Dict[str, Any]:
+        return dict(super()._options(), nlist=self.nlist, nprobe=self.nprobe, train_min=self.train_min)
+
+    def _carry_over(self, compacted: "IVFVectorIndex"):
+        # Keep the quantizer: the compacted rows are assigned to it as they are copied
+        compacted._auto_train = False
+        if self._quantizer is None:
+            return
+        compacted._quantizer = _quantizer(self.centroids, np.zeros(0, dtype=np.int32))
+        compacted.trained_count = self.trained_count
+        np.save(compacted._data / "centroids.npy", self.centroids)
+
+    def _search(
+        self,
+        storage,
+        mask: np.ndarray,
+        queries: np.ndarray,
+        k: int,
+        stages: List[List[Dict[str, Any]]],
+        nprobe: Optional[int] = None,
+        prefix_dims: Optional[int] = None,
+        candidates: Optional[int] = None,
+        subset: Optional[np.ndarray] = None,
+        **search_options
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Scan the `nprobe` closest lists of each query (exact scan until trained).
+        The coarse quantizer is scored for the whole batch at once; lists differ
+        per query, so they are scanned query by query.
+
+        A pre-filtered `subset` is scored exactly instead: probing would find
+        few of its rows in the nearest lists.
+        """
+        quantizer = self._quantizer
+        if quantizer is None or subset is not None:
+            return super()._search(
+                storage, mask, queries, k, stages, prefix_dims=prefix_dims, candidates=candidates, subset=subset
+            )
+
+        nprobe = min(nprobe or self.nprobe, len(quantizer.centroids))
+        probes = np.argpartition(-(queries @ quantizer.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+
+        return [
+            self._probe(storage, quantizer, mask, q, probe, k, query_stages, prefix_dims, candidates)
+            for q, probe, query_stages in zip(queries, probes, stages)
+        ]
+
+    def _probe(
+        self,
+        storage,
+        quantizer: _Quantizer,
+        mask: np.ndarray,
+        q: np.ndarray,
+        probe: np.ndarray,
+        k: int,
+        stages: List[Dict[str, Any]],
+        prefix_dims: Optional[int],
+        candidates: Optional[int]
+    ):
+        """
+        Score the rows of the probed lists. With a prefix view, they are ranked
+        on it before reranking.
+        """
+        started = time.perf_counter()
+
+        lists = [self._list_rows(quantizer, list_no) for list_no in probe]
+        rows = np.concatenate(lists) if lists else np.zeros(0, dtype=np.int64)
+        rows = rows[rows < storage.count]
+        rows = rows[mask[rows]]
+
+        if len(rows) == 0:
+            return rows, np.zeros(0, dtype=np.float32)
+
+        # Sorted rows keep memory-mapped reads sequential
+        rows.sort()
+
+        dims = self._prefix_stage_dims(storage, prefix_dims)
+        if dims:
+            scores = self._prefix_scores(storage, rows, truncate_embeddings(q, dims), dims)
+            rows, _ = self._top_k(rows, scores, max(candidates or k * self.prefix_factor, k))
+            self._record_stage(stages, f"probe_{len(probe)}_lists_prefix_{dims}d", len(scores), started)
+            return self._rerank(storage, rows, q, k, stages)
+
+        scanned = len(rows)
+        rows, scores = self._top_k(rows, self._scores(storage, rows, q), self._candidates(storage, k))
+        self._record_stage(stages, f"probe_{len(probe)}_lists", scanned, started)
+
+        return self._rescore(storage, rows, scores, q, k, stages)
+
+    @staticmethod
+    def _list_rows(quantizer: _Quantizer, list_no: int) -> np.ndarray:
+        rows = quantizer.arrays[list_no]
+        if rows is None:
+            rows = np.array(quantizer.lists[list_no], dtype=np.int64)
+            quantizer.arrays[list_no] = rows
+        return rows
+
+    def get_ivf_stats(self) -> Dict[str, Any]:
+        """
+        Get quantizer size and list balance.
+        """
+        quantizer = self._quantizer
+        if quantizer is None:
+            return {"trained": False, "train_min": self.train_min, "training": self._trainer is not None}
+
+        sizes = np.array([len(rows) for rows in quantizer.lists])
+        return {
+            "trained": True,
+            "training": self._trainer is not None,
+            "nlist": len(quantizer.centroids),
+            "nprobe": self.nprobe,
+            "trained_count": self.trained_count,
+            "avg_list_size": round(float(sizes.mean()), 1),
+            "max_list_size": int(sizes.max())
+        }
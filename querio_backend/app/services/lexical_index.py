@@ -0,0 +1,290 @@
+"""
+Lexical Index
+In-memory BM25 inverted index kept next to each vector partition, so exact
+identifiers (invoice codes, SKUs, section numbers) that embed poorly can
+still be matched. Postings are compact per-term arrays of document numbers
+(uint32) and term frequencies (uint16), scored with NumPy at query time.
+Lexical and vector rankings are combined with reciprocal-rank fusion.
+"""
+
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import logging
+import math
+import os
+import pickle
+import re
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Words and identifiers: "INV-2024-0042", "SKU_88A", "4.2.1" stay one token
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./:#][a-z0-9]+)*")
+_PART_PATTERN = re.compile(r"[a-z0-9]+")
+
+_MAX_TF = 65535
+
+# Postings this short are always scored, however common the term
+_MIN_PRUNED_POSTINGS = 10000
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased tokens. Compound identifiers are kept whole and also split
+    into their parts, so "INV-2024-0042" matches both itself and "2024".
+    """
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(_PART_PATTERN.findall(token))
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuse rankings of IDs: score(id) = sum over rankings of 1 / (k + rank).
+
+    Returns:
+        (id, fused score) pairs, best first
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+
+    return sorted(scores.items(), key=lambda pair: pair[1], reverse=True)
+
+
+class BM25Index:
+    """BM25 over chunk texts with array-backed postings and tombstone deletes."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, common_ratio: float = 0.1):
+        """
+        Args:
+            k1: Term frequency saturation
+            b: Document length normalization
+            common_ratio: Query terms found in more than this share of documents
+                are skipped when the query has rarer terms (their long postings
+                dominate latency while adding almost nothing to the score)
+        """
+        self.k1 = k1
+        self.b = b
+        self.common_ratio = common_ratio
+
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        """
+        Drop every document.
+        """
+        with self._lock:
+            self._postings: Dict[str, Tuple[array, array]] = {}
+            self._ids: List[str] = []
+            self._doc_by_id: Dict[str, int] = {}
+            self._docs_by_filename: Dict[str, List[int]] = {}
+            self._lengths = np.zeros(1024, dtype=np.float32)
+            self._alive = np.zeros(1024, dtype=bool)
+            self._count = 0
+            self._live = 0
+            self._live_length = 0.0
+
+    # ---------- Updates ----------
+
+    def add(self, ids: List[str], texts: List[str], filenames: Optional[List[str]] = None):
+        """
+        Index chunk texts. IDs already present are skipped (as the vector store does).
+        """
+        with self._lock:
+            for i, (doc_id, text) in enumerate(zip(ids, texts)):
+                if doc_id in self._doc_by_id:
+                    continue
+
+                doc = self._count
+                self._reserve(doc + 1)
+
+                counts: Dict[str, int] = {}
+                for token in tokenize(text or ""):
+                    counts[token] = counts.get(token, 0) + 1
+
+                for term, tf in counts.items():
+                    postings = self._postings.get(term)
+                    if postings is None:
+                        postings = self._postings[term] = (array("I"), array("H"))
+                    postings[0].append(doc)
+                    postings[1].append(min(tf, _MAX_TF))
+
+                length = sum(counts.values())
+                self._lengths[doc] = length
+                self._alive[doc] = True
+                self._ids.append(doc_id)
+                self._doc_by_id[doc_id] = doc
+                if filenames is not None:
+                    self._docs_by_filename.setdefault(filenames[i], []).append(doc)
+
+                self._count += 1
+                self._live += 1
+                self._live_length += length
+
+    def delete_ids(self, ids: Iterable[str]):
+        with self._lock:
+            self._delete([self._doc_by_id[i] for i in ids if i in self._doc_by_id])
+
+    def delete_filename(self, filename: str):
+        with self._lock:
+            self._delete(self._docs_by_filename.pop(filename, []))
+
+    def _delete(self, docs: List[int]):
+        for doc in docs:
+            if not self._alive[doc]:
+                continue
+            self._alive[doc] = False
+            self._doc_by_id.pop(self._ids[doc], None)
+            self._live -= 1
+            self._live_length -= float(self._lengths[doc])
+
+        # Mostly tombstones: rebuild the postings without them
+        if self._count and self._live < self._count / 2:
+            self._compact()
+
+    def _reserve(self, size: int):
+        if size <= len(self._alive):
+            return
+        capacity = max(size, 2 * len(self._alive))
+        self._lengths = np.resize(self._lengths, capacity)
+        self._alive = np.concatenate([self._alive, np.zeros(capacity - len(self._alive), dtype=bool)])
+
+    def _compact(self):
+        alive = self._alive[:self._count]
+        renumber = (np.cumsum(alive) - 1).astype(np.uint32)
+
+        postings = {}
+        for term, (docs, tfs) in self._postings.items():
+            docs = np.frombuffer(docs, dtype=np.uint32)
+            keep = alive[docs]
+            if keep.any():
+                postings[term] = (
+                    array("I", renumber[docs[keep]].tobytes()),
+                    array("H", np.frombuffer(tfs, dtype=np.uint16)[keep].tobytes())
+                )
+            del docs
+
+        live = np.flatnonzero(alive)
+        self._postings = postings
+        self._ids = [self._ids[doc] for doc in live]
+        self._doc_by_id = {doc_id: doc for doc, doc_id in enumerate(self._ids)}
+        self._docs_by_filename = {
+            filename: [int(renumber[doc]) for doc in docs if alive[doc]]
+            for filename, docs in self._docs_by_filename.items()
+        }
+        self._lengths = np.resize(self._lengths[live], max(1024, len(live)))
+        self._alive = np.zeros(len(self._lengths), dtype=bool)
+        self._alive[:len(live)] = True
+        self._count = len(live)
+
+        logger.info(f"Compacted BM25 index to {self._count} documents")
+
+    # ---------- Search ----------
+
+    def search(self, query: str, top_k: int = 10) -> Tuple[List[Tuple[str, float]], int]:
+        """
+        BM25 top-k for a query.
+
+        Document frequencies include deleted documents until the next
+        compaction, a small bias in exchange for O(1) deletes.
+
+        Returns:
+            ((id, score) pairs best first, number of postings scanned)
+        """
+        terms = set(tokenize(query))
+
+        with self._lock:
+            if not terms or not self._live:
+                return [], 0
+
+            avg_length = self._live_length / self._live
+            doc_parts, score_parts = [], []
+            scanned = 0
+
+            found = sorted(
+                (self._postings[term] for term in terms if term in self._postings),
+                key=lambda postings: len(postings[0])
+            )
+            if found:
+                common = max(self.common_ratio * self._count, _MIN_PRUNED_POSTINGS)
+                found = found[:1] + [postings for postings in found[1:] if len(postings[0]) <= common]
+
+            for postings in found:
+                docs = np.frombuffer(postings[0], dtype=np.uint32)
+                tfs = np.frombuffer(postings[1], dtype=np.uint16).astype(np.float32)
+                scanned += len(docs)
+
+                idf = math.log(1 + (self._live - len(docs) + 0.5) / (len(docs) + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[docs] / avg_length)
+                scores = idf * tfs * (self.k1 + 1) / (tfs + norm)
+
+                keep = self._alive[docs]
+                doc_parts.append(docs[keep].astype(np.int64))
+                score_parts.append(scores[keep])
+                del docs
+
+            if not doc_parts:
+                return [], scanned
+
+            if len(doc_parts) == 1:
+                docs, scores = doc_parts[0], score_parts[0]
+            else:
+                docs, inverse = np.unique(np.concatenate(doc_parts), return_inverse=True)
+                scores = np.bincount(inverse, weights=np.concatenate(score_parts)).astype(np.float32)
+
+            if len(scores) > top_k:
+                top = np.argpartition(-scores, top_k - 1)[:top_k]
+                docs, scores = docs[top], scores[top]
+
+            order = np.argsort(-scores)
+            return [(self._ids[docs[i]], float(scores[i])) for i in order], scanned
+
+    def count(self) -> int:
+        return self._live
+
+    # ---------- Persistence ----------
+
+    def save(self, path: Path):
+        """
+        Write the index to a file atomically (read back with load()).
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with self._lock, open(tmp, "wb") as f:
+            state = {name: value for name, value in self.__dict__.items() if name != "_lock"}
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        """
+        Read an index written by save().
+        """
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        index = cls.__new__(cls)
+        index.__dict__.update(state)
+        index._lock = threading.RLock()
+        return index
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Get document, term and postings sizes.
+        """
+        with self._lock:
+            postings = sum(len(docs) for docs, _ in self._postings.values())
+            return {
+                "documents": self._live,
+                "terms": len(self._postings),
+                "postings": postings,
+                "postings_bytes": postings * 6
+            }
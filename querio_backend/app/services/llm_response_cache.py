@@ -0,0 +1,210 @@
+"""
+LLM Response Cache
+Disk-backed cache for deterministic (temperature 0) Ollama chat responses.
+
+Entries are keyed by the model digest plus the request messages and options,
+so they survive restarts but are never served for a different build of the
+model. When the digest reported by Ollama changes, every entry recorded for
+the old digest is dropped.
+"""
+
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+import ollama
+
+logger = logging.getLogger(__name__)
+
+
+class LLMResponseCache:
+    """SQLite-backed, size-bounded (LRU) cache of chat responses."""
+
+    def __init__(
+        self,
+        path: str = "data/llm_cache/responses.sqlite3",
+        max_bytes: int = 64 * 1024 * 1024,
+        digest_ttl: float = 30.0,
+        list_models: Optional[Callable[[], Any]] = None
+    ):
+        """
+        Initialize the response cache.
+
+        Args:
+            path: SQLite database file
+            max_bytes: Upper bound on the total size of cached responses
+            digest_ttl: Seconds a looked-up model digest is trusted before re-checking
+            list_models: Function returning the Ollama model list (defaults to ollama.list)
+        """
+        self.list_models = list_models or ollama.list
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.digest_ttl = digest_ttl
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_access ON responses (last_access)"
+        )
+        self._conn.commit()
+
+        row = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        self._total_bytes = row[0]
+
+        self._digests: Dict[str, tuple] = {}  # model -> (digest, checked_at)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        logger.info(f"LLMResponseCache initialized at {self.path} ({self._total_bytes} bytes)")
+
+    @staticmethod
+    def is_deterministic(options: Optional[Dict[str, Any]]) -> bool:
+        """
+        Only temperature-0 requests produce reproducible output.
+        """
+        return bool(options) and options.get("temperature") == 0
+
+    def get_model_digest(self, model: str) -> Optional[str]:
+        """
+        Get the digest of a local Ollama model, re-checking at most every digest_ttl seconds.
+        Entries for a previous digest of the model are purged when it changes.
+        """
+        cached = self._digests.get(model)
+        now = time.monotonic()
+        if cached and now - cached[1] < self.digest_ttl:
+            return cached[0]
+
+        name = model if ":" in model else f"{model}:latest"
+        digest = None
+        try:
+            for entry in self.list_models()["models"]:
+                if entry["model"] == name:
+                    digest = entry["digest"]
+                    break
+        except Exception as e:
+            logger.warning(f"Could not look up digest for {model}: {e}")
+            return None
+
+        if digest is None:
+            return None
+
+        if cached is None or cached[0] != digest:
+            self._purge_stale(model, digest)
+
+        self._digests[model] = (digest, now)
+        return digest
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached response.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+            self.hits += 1
+
+        return json.loads(row[0])
+
+    def put(self, key: str, model: str, digest: str, response: Dict[str, Any]) -> None:
+        """
+        Store a response and evict least recently used entries past max_bytes.
+        """
+        payload = json.dumps(response)
+        size = len(payload.encode("utf-8"))
+
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if old:
+                self._total_bytes -= old[0]
+
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, digest, response, size, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, digest, payload, size, time.time())
+            )
+            self._total_bytes += size
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """
+        Drop least recently used entries until the cache fits in max_bytes.
+        """
+        while self._total_bytes > self.max_bytes:
+            rows: List[tuple] = self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_access LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self._total_bytes = 0
+                break
+
+            for key, size in rows:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._total_bytes -= size
+                self.evictions += 1
+                if self._total_bytes <= self.max_bytes:
+                    break
+
+    def _purge_stale(self, model: str, digest: str) -> None:
+        """
+        Remove entries recorded for any other digest of this model.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses WHERE model = ? AND digest != ?",
+                (model, digest)
+            ).fetchone()
+
+            if row[0]:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE model = ? AND digest != ?", (model, digest)
+                )
+                self._conn.commit()
+                self._total_bytes -= row[1]
+                logger.info(f"Model {model} digest changed; invalidated {row[0]} cached responses")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics.
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+        return {
+            "entries": entries,
+            "size_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
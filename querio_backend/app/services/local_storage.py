@@ -9,13 +9,16 @@ import json
 import shutil
 import logging
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterable, List
 import numpy as np
 from app.services.storage_backend import StorageBackend
+from app.services.embedding_quantization import CODE_DTYPES, FORMATS, dequantize, quantize
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+_EMBEDDING_BLOCK = 4096  # vectors quantized at a time
+
 
 class LocalStorageBackend(StorageBackend):
     """
@@ -25,20 +28,23 @@ class LocalStorageBackend(StorageBackend):
     Each document gets a folder with 4 files:
     - document.{ext} (original file)
     - chunks.json
-    - embeddings.npy
+    - embeddings.npy (float32, float16 or int8 per settings.EMBEDDING_STORAGE_FORMAT;
+      int8 adds embedding_scales.npy)
     - metadata.json
 
     For local development, we don't organize by document type (simpler).
     """
 
-    def __init__(self, cache_dir: Path = None):
+    def __init__(self, cache_dir: Path = None, embedding_format: str = None):
         """
         Initialize local storage with cache directory.
 
         Args:
             cache_dir: Path to cache directory (defaults to settings.CACHE_DIR)
+            embedding_format: float32, float16 or int8 (defaults to settings.EMBEDDING_STORAGE_FORMAT)
         """
         self.cache_dir = cache_dir or Path(settings.CACHE_DIR)
+        self.embedding_format = embedding_format or settings.EMBEDDING_STORAGE_FORMAT
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         logger.info(f"LocalStorage initialized with cache_dir: {self.cache_dir}")
 
@@ -103,23 +109,29 @@ class LocalStorageBackend(StorageBackend):
         shutil.copy2(file_path, destination)
         logger.info(f"Saved original document to {destination}")
 
-    def save_chunks(self, document_id: str, file_extension: str, chunks: List[Dict]) -> None:
+    def save_chunks(self, document_id: str, file_extension: str, chunks: Iterable[Dict]) -> None:
         """
-        Save chunks.json to local storage.
+        Save chunks.json to local storage, one chunk at a time.
 
         Args:
             document_id: SHA-256 hash of document
             file_extension: File extension (not used, kept for interface)
-            chunks: List of document chunks
+            chunks: Document chunks (any iterable, e.g. spooled to disk)
         """
         doc_path = self._get_document_path(document_id)
         doc_path.mkdir(parents=True, exist_ok=True)
 
+        # Same layout as json.dump(chunks, f, indent=2)
         chunks_file = doc_path / "chunks.json"
+        count = 0
         with open(chunks_file, "w") as f:
-            json.dump(chunks, f, indent=2)
+            for chunk in chunks:
+                f.write(",\n  " if count else "[\n  ")
+                f.write(json.dumps(chunk, indent=2).replace("\n", "\n  "))
+                count += 1
+            f.write("\n]" if count else "[]")
 
-        logger.debug(f"Saved {len(chunks)} chunks to {chunks_file}")
+        logger.debug(f"Saved {count} chunks to {chunks_file}")
 
     def save_embeddings(self, document_id: str, file_extension: str, embeddings: np.ndarray) -> None:
         """
@@ -128,15 +140,38 @@ class LocalStorageBackend(StorageBackend):
         Args:
             document_id: SHA-256 hash of document
             file_extension: File extension (not used, kept for interface)
-            embeddings: NumPy array of shape (num_chunks, 1536)
+            embeddings: NumPy array of shape (num_chunks, embedding_dim);
+                may be memory-mapped, it is encoded in blocks
         """
         doc_path = self._get_document_path(document_id)
         doc_path.mkdir(parents=True, exist_ok=True)
 
-        embeddings_file = doc_path / "embeddings.npy"
-        np.save(embeddings_file, embeddings)
+        if self.embedding_format not in FORMATS:
+            raise ValueError(f"Unsupported embedding format {self.embedding_format}; expected one of {FORMATS}")
 
-        logger.debug(f"Saved embeddings {embeddings.shape} to {embeddings_file}")
+        # Compact formats: float16, or int8 with one scale per vector
+        embeddings_file = doc_path / "embeddings.npy"
+        codes = np.lib.format.open_memmap(
+            embeddings_file, mode="w+", dtype=CODE_DTYPES[self.embedding_format], shape=embeddings.shape
+        )
+        scales_file = doc_path / "embedding_scales.npy"
+        scales = None
+        if self.embedding_format == "int8":
+            scales = np.lib.format.open_memmap(scales_file, mode="w+", dtype=np.float32, shape=embeddings.shape[:1])
+        elif scales_file.exists():
+            scales_file.unlink()
+
+        for start in range(0, len(embeddings), _EMBEDDING_BLOCK):
+            block_codes, block_scales = quantize(embeddings[start:start + _EMBEDDING_BLOCK], self.embedding_format)
+            codes[start:start + len(block_codes)] = block_codes
+            if scales is not None:
+                scales[start:start + len(block_scales)] = block_scales
+
+        codes.flush()
+        if scales is not None:
+            scales.flush()
+
+        logger.debug(f"Saved embeddings {codes.shape} ({self.embedding_format}) to {embeddings_file}")
 
     def save_metadata(self, document_id: str, file_extension: str, metadata: Dict) -> None:
         """
@@ -190,7 +225,7 @@ class LocalStorageBackend(StorageBackend):
             file_extension: File extension (not used, kept for interface)
 
         Returns:
-            NumPy array of embeddings
+            NumPy float32 array of embeddings (decoded if stored quantized)
 
         Raises:
             FileNotFoundError if embeddings file doesn't exist
@@ -200,7 +235,10 @@ class LocalStorageBackend(StorageBackend):
         if not embeddings_file.exists():
             raise FileNotFoundError(f"Embeddings file not found: {embeddings_file}")
 
-        embeddings = np.load(embeddings_file)
+        scales_file = embeddings_file.with_name("embedding_scales.npy")
+        scales = np.load(scales_file) if scales_file.exists() else None
+
+        embeddings = dequantize(np.load(embeddings_file), scales)
         logger.debug(f"Loaded embeddings {embeddings.shape} from {embeddings_file}")
         return embeddings
 
@@ -0,0 +1,49 @@
+"""
+Maintenance Lock
+One claim shared by the index maintenance tasks that must not overlap:
+rebuilds from the document cache and embedding model migrations both
+build the next index generation and switch to it.
+"""
+
+from typing import Optional, Type
+import threading
+
+
+class MaintenanceInProgressError(RuntimeError):
+    """Another maintenance task is running."""
+
+
+class MaintenanceLock:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._task: Optional[str] = None
+        self._error: Type[MaintenanceInProgressError] = MaintenanceInProgressError
+
+    def claim(self, task: str, error: Type[MaintenanceInProgressError] = MaintenanceInProgressError):
+        """
+        Claim the lock until release().
+
+        Args:
+            task: What runs, for the error others get (e.g. "An index rebuild")
+            error: Raised to others while this task runs
+
+        Raises:
+            MaintenanceInProgressError: the running task's error type
+        """
+        with self._lock:
+            if self._task is not None:
+                raise self._error(f"{self._task} is already running")
+            self._task = task
+            self._error = error
+
+    def release(self):
+        with self._lock:
+            self._task = None
+            self._error = MaintenanceInProgressError
+
+    def running(self) -> Optional[str]:
+        """
+        The task holding the lock, if any.
+        """
+        with self._lock:
+            return self._task
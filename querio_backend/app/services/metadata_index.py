@@ -0,0 +1,363 @@
+"""
+Metadata Index
+Secondary indexes over chunk metadata, so a `where` filter can be resolved
+to a candidate set before any vector is scored.
+
+Indexed fields:
+- filename: exact match
+- source: any file the chunk came from (deduplicated chunks list several in
+  "sources", one per line; otherwise its filename)
+- page: page numbers of the chunk (from "page_numbers", e.g. "3,4")
+- heading: any heading on the chunk's path (from "headings", "A > B")
+- uploaded_at: upload time in epoch seconds, for range filters
+
+"source", "page" and "heading" are virtual filter keys; everything else in a filter
+is evaluated on the stored metadata as before.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import threading
+
+import numpy as np
+
+# Filter key -> how its values are read from chunk metadata
+_EXACT_FIELDS = ("filename", "source", "page", "heading")
+_RANGE_FIELDS = ("uploaded_at",)
+
+_RANGE_OPS = ("$gt", "$gte", "$lt", "$lte")
+
+
+def field_values(metadata: Dict[str, Any], key: str) -> List[Any]:
+    """
+    Values of a filter key for one chunk (several for the virtual keys).
+    """
+    if key == "page":
+        pages = metadata.get("page_numbers") or ""
+        return [int(page) for page in str(pages).split(",") if page.strip().isdigit()]
+    if key == "heading":
+        headings = metadata.get("headings") or ""
+        return [heading.strip() for heading in headings.split(" > ") if heading.strip()]
+    if key == "source":
+        return metadata["sources"].split("\n") if metadata.get("sources") else [metadata.get("filename")]
+    return [metadata.get(key)]
+
+
+def source_filter(where: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Rewrite "filename" conditions as "source" ones, so a filter on a file
+    also matches the deduplicated chunks it shares with other files.
+    """
+    if not where:
+        return where
+    return {
+        ("source" if key == "filename" else key):
+            [source_filter(clause) for clause in condition] if key in ("$and", "$or") else condition
+        for key, condition in where.items()
+    }
+
+
+def matches_where(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """
+    Evaluate a Chroma-style `where` filter ($and/$or, $eq/$ne/$in/$nin/$gt/$gte/$lt/$lte).
+    A multi-valued key matches when any of its values does ($ne/$nin: none does).
+    """
+    if not where:
+        return True
+
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+            continue
+
+        values = field_values(metadata, key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+
+        for op, operand in condition.items():
+            if op == "$eq" and operand not in values:
+                return False
+            if op == "$ne" and operand in values:
+                return False
+            if op == "$in" and not any(value in operand for value in values):
+                return False
+            if op == "$nin" and any(value in operand for value in values):
+                return False
+            if op in _RANGE_OPS and not any(_compare(value, op, operand) for value in values):
+                return False
+
+    return True
+
+
+def _compare(value: Any, op: str, operand: Any) -> bool:
+    # Missing values and mismatched types (str vs number) never match
+    numbers = isinstance(value, (int, float)) and isinstance(operand, (int, float))
+    if not numbers and type(value) is not type(operand):
+        return False
+    if op == "$gt":
+        return value > operand
+    if op == "$gte":
+        return value >= operand
+    if op == "$lt":
+        return value < operand
+    return value <= operand
+
+
+def uses_virtual_keys(where: Optional[Dict[str, Any]]) -> bool:
+    """
+    Whether a filter needs the index (stores like Chroma cannot evaluate it).
+    """
+    if not where:
+        return False
+    for key, condition in where.items():
+        if key in ("$and", "$or"):
+            if any(uses_virtual_keys(clause) for clause in condition):
+                return True
+        elif key in ("source", "page", "heading"):
+            return True
+    return False
+
+
+class MetadataIndex:
+    """Posting sets per metadata value plus sorted arrays for range fields."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._exact: Dict[str, Dict[Any, Set[int]]] = {field: {} for field in _EXACT_FIELDS}
+            self._ranges: Dict[str, Dict[int, float]] = {field: {} for field in _RANGE_FIELDS}
+            self._sorted: Dict[str, Optional[Tuple[np.ndarray, np.ndarray]]] = {field: None for field in _RANGE_FIELDS}
+            self._docs: Dict[int, Dict[str, Any]] = {}
+
+    # ---------- Updates ----------
+
+    def add(self, docs: Iterable[int], metadatas: Iterable[Dict[str, Any]]):
+        """
+        Index documents (chunk rows) by their metadata.
+        """
+        with self._lock:
+            for doc, metadata in zip(docs, metadatas):
+                metadata = metadata or {}
+                entry = {}
+
+                for field in _EXACT_FIELDS:
+                    values = [value for value in field_values(metadata, field) if value is not None]
+                    for value in values:
+                        self._exact[field].setdefault(value, set()).add(doc)
+                    entry[field] = values
+
+                for field in _RANGE_FIELDS:
+                    value = metadata.get(field)
+                    if isinstance(value, (int, float)):
+                        self._ranges[field][doc] = float(value)
+                        self._sorted[field] = None
+
+                self._docs[doc] = entry
+
+    def remove(self, docs: Iterable[int]):
+        with self._lock:
+            for doc in docs:
+                entry = self._docs.pop(doc, None)
+                if entry is None:
+                    continue
+
+                for field, values in entry.items():
+                    for value in values:
+                        postings = self._exact[field].get(value)
+                        if postings is not None:
+                            postings.discard(doc)
+                            if not postings:
+                                del self._exact[field][value]
+
+                for field in _RANGE_FIELDS:
+                    if self._ranges[field].pop(doc, None) is not None:
+                        self._sorted[field] = None
+
+    def count(self) -> int:
+        return len(self._docs)
+
+    # ---------- Filter resolution ----------
+
+    def resolve(self, where: Dict[str, Any]) -> Optional[Tuple[np.ndarray, Optional[Dict[str, Any]]]]:
+        """
+        Resolve a filter through the indexes.
+
+        Returns:
+            (sorted candidate documents, residual filter still to check on them
+            or None), or None when no indexed field narrows the filter
+        """
+        with self._lock:
+            resolved = self._resolve(where)
+
+        if resolved is None:
+            return None
+
+        docs, residual = resolved
+        return np.sort(np.fromiter(docs, dtype=np.int64, count=len(docs))), residual
+
+    def _resolve(self, where: Dict[str, Any]) -> Optional[Tuple[Set[int], Optional[Dict[str, Any]]]]:
+        # Top-level keys are an implicit $and
+        clauses = []
+        for key, condition in where.items():
+            if key == "$and":
+                clauses.extend(condition)
+            else:
+                clauses.append({key: condition})
+
+        if len(clauses) == 1 and "$or" not in clauses[0]:
+            key, condition = next(iter(clauses[0].items()))
+            docs = self._resolve_field(key, condition)
+            return None if docs is None else (docs, None)
+
+        if len(clauses) == 1:
+            return self._resolve_or(clauses[0]["$or"])
+
+        docs: Optional[Set[int]] = None
+        residual = []
+        for clause in clauses:
+            resolved = self._resolve(clause)
+            if resolved is None:
+                residual.append(clause)
+                continue
+            clause_docs, clause_residual = resolved
+            docs = set(clause_docs) if docs is None else docs & clause_docs
+            if clause_residual:
+                residual.append(clause_residual)
+
+        if docs is None:
+            return None
+        if not residual:
+            return docs, None
+        return docs, residual[0] if len(residual) == 1 else {"$and": residual}
+
+    def _resolve_or(self, clauses: List[Dict[str, Any]]) -> Optional[Tuple[Set[int], Optional[Dict[str, Any]]]]:
+        docs: Set[int] = set()
+        exact = True
+        for clause in clauses:
+            resolved = self._resolve(clause)
+            if resolved is None:
+                return None
+            docs |= resolved[0]
+            exact = exact and resolved[1] is None
+
+        # A partially resolved branch: check the whole $or on the union
+        return docs, None if exact else {"$or": clauses}
+
+    def _resolve_field(self, key: str, condition: Any) -> Optional[Set[int]]:
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+
+        if key in self._exact:
+            return self._resolve_exact(key, condition)
+        if key in self._ranges:
+            return self._resolve_range(key, condition)
+        return None
+
+    def _resolve_exact(self, key: str, condition: Dict[str, Any]) -> Optional[Set[int]]:
+        postings = self._exact[key]
+        docs: Optional[Set[int]] = None
+
+        for op, operand in condition.items():
+            if op == "$eq":
+                matched = set(postings.get(operand, ()))
+            elif op == "$in":
+                matched = set().union(*(postings.get(value, ()) for value in operand))
+            elif op in ("$ne", "$nin"):
+                excluded = [operand] if op == "$ne" else operand
+                matched = set(self._docs).difference(*(postings.get(value, ()) for value in excluded))
+            elif op in _RANGE_OPS:
+                # Distinct values are few (pages, headings): compare each once
+                matched = set().union(*(
+                    docs for value, docs in postings.items() if _compare(value, op, operand)
+                ))
+            else:
+                return None
+            docs = matched if docs is None else docs & matched
+
+        return docs
+
+    def _resolve_range(self, key: str, condition: Dict[str, Any]) -> Optional[Set[int]]:
+        if self._sorted[key] is None:
+            values = self._ranges[key]
+            docs = np.fromiter(values.keys(), dtype=np.int64, count=len(values))
+            keys = np.fromiter(values.values(), dtype=np.float64, count=len(values))
+            order = np.argsort(keys, kind="stable")
+            self._sorted[key] = (keys[order], docs[order])
+
+        keys, docs = self._sorted[key]
+        low, high = 0, len(keys)
+
+        for op, operand in condition.items():
+            if op == "$eq":
+                low = max(low, int(np.searchsorted(keys, operand, side="left")))
+                high = min(high, int(np.searchsorted(keys, operand, side="right")))
+            elif op == "$gt":
+                low = max(low, int(np.searchsorted(keys, operand, side="right")))
+            elif op == "$gte":
+                low = max(low, int(np.searchsorted(keys, operand, side="left")))
+            elif op == "$lt":
+                high = min(high, int(np.searchsorted(keys, operand, side="left")))
+            elif op == "$lte":
+                high = min(high, int(np.searchsorted(keys, operand, side="right")))
+            else:
+                return None
+
+        return set(docs[low:high].tolist()) if low < high else set()
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Get indexed document and distinct value counts.
+        """
+        with self._lock:
+            stats = {"documents": len(self._docs)}
+            for field, postings in self._exact.items():
+                stats[f"{field}_values"] = len(postings)
+            return stats
+
+
+class KeyedMetadataIndex(MetadataIndex):
+    """MetadataIndex over chunk IDs, for stores without row numbers (Chroma)."""
+
+    def clear(self):
+        with self._lock:
+            super().clear()
+            self._ids: List[str] = []
+            self._doc_by_id: Dict[str, int] = {}
+
+    def add_ids(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """
+        Index chunks by ID. IDs already present are skipped (as the store does).
+        """
+        with self._lock:
+            docs, kept = [], []
+            for chunk_id, metadata in zip(ids, metadatas):
+                if chunk_id in self._doc_by_id:
+                    continue
+                doc = len(self._ids)
+                self._ids.append(chunk_id)
+                self._doc_by_id[chunk_id] = doc
+                docs.append(doc)
+                kept.append(metadata)
+            self.add(docs, kept)
+
+    def remove_ids(self, ids: Iterable[str]):
+        with self._lock:
+            self.remove([self._doc_by_id.pop(i) for i in ids if i in self._doc_by_id])
+
+    def resolve_ids(self, where: Dict[str, Any]) -> Optional[Tuple[List[str], Optional[Dict[str, Any]]]]:
+        """
+        As resolve(), with chunk IDs instead of document numbers.
+        """
+        with self._lock:
+            resolved = self.resolve(where)
+            if resolved is None:
+                return None
+            docs, residual = resolved
+            return [self._ids[doc] for doc in docs], residual
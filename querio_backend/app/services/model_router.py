@@ -0,0 +1,162 @@
+"""
+Model Router
+Picks the Ollama model for each call type (tier) and falls back to the
+large default model when the tier model's output fails validation.
+Latency and fallback rate are recorded per tier.
+"""
+
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+import logging
+import threading
+import time
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class _TierStats:
+    """Rolling latency window and counters for one tier."""
+
+    def __init__(self, window: int = 500):
+        self.calls = 0
+        self.fallbacks = 0
+        self.latencies_ms: Deque[float] = deque(maxlen=window)
+        self.fallback_latencies_ms: Deque[float] = deque(maxlen=window)
+
+
+class ModelRouter:
+    """Maps call types to models, with validation-driven fallback."""
+
+    def __init__(self, models: Dict[str, str], fallback_model: str):
+        """
+        Initialize the router.
+
+        Args:
+            models: Task name -> model name (e.g. {"split": "qwen2.5:1.5b"})
+            fallback_model: Large model used when a tier model's output is rejected
+        """
+        self.models = dict(models)
+        self.fallback_model = fallback_model
+
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _TierStats] = {}
+
+    @classmethod
+    def from_settings(cls) -> "ModelRouter":
+        return cls(
+            models={
+                "split": settings.LLM_MODEL_SPLIT,
+                "sql": settings.LLM_MODEL_SQL,
+                "answer": settings.LLM_MODEL_ANSWER,
+                "synthesis": settings.LLM_MODEL_SYNTHESIS,
+            },
+            fallback_model=settings.LLM_MODEL_DEFAULT
+        )
+
+    def model_for(self, task: str) -> str:
+        """
+        Get the configured model for a task.
+        """
+        return self.models.get(task, self.fallback_model)
+
+    def run(
+        self,
+        task: str,
+        generate: Callable[[str], Any],
+        validate: Optional[Callable[[Any], bool]] = None
+    ) -> Any:
+        """
+        Run a generation on the task's model, retrying on the fallback model
+        if the output does not pass validation.
+
+        Args:
+            task: Call type (split, sql, answer, synthesis)
+            generate: Function taking a model name and returning its output
+            validate: Optional check on the output; False triggers the fallback
+
+        Returns:
+            Output of the tier model, or of the fallback model when rejected
+        """
+        model = self.model_for(task)
+
+        start = time.perf_counter()
+        result = generate(model)
+        self._record(task, (time.perf_counter() - start) * 1000)
+
+        if validate is None or model == self.fallback_model or validate(result):
+            return result
+
+        logger.info(f"{task}: output of {model} failed validation, falling back to {self.fallback_model}")
+
+        start = time.perf_counter()
+        result = generate(self.fallback_model)
+        self._record(task, (time.perf_counter() - start) * 1000, fallback=True)
+
+        return result
+
+    def _record(self, task: str, latency_ms: float, fallback: bool = False) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(task, _TierStats())
+            if fallback:
+                stats.fallbacks += 1
+                stats.fallback_latencies_ms.append(latency_ms)
+            else:
+                stats.calls += 1
+                stats.latencies_ms.append(latency_ms)
+
+    @staticmethod
+    def _percentile(values, pct: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return round(ordered[index], 1)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get per-tier latency and fallback statistics.
+        """
+        tiers = {}
+
+        with self._lock:
+            for task in sorted(set(self.models) | set(self._stats)):
+                stats = self._stats.get(task, _TierStats())
+                latencies = list(stats.latencies_ms)
+                fallback_latencies = list(stats.fallback_latencies_ms)
+
+                tiers[task] = {
+                    "model": self.model_for(task),
+                    "calls": stats.calls,
+                    "fallbacks": stats.fallbacks,
+                    "fallback_rate": round(stats.fallbacks / stats.calls, 3) if stats.calls else 0.0,
+                    "avg_latency_ms": round(sum(latencies) / len(latencies), 1) if latencies else 0.0,
+                    "p95_latency_ms": self._percentile(latencies, 95),
+                    "avg_fallback_latency_ms": (
+                        round(sum(fallback_latencies) / len(fallback_latencies), 1)
+                        if fallback_latencies else 0.0
+                    )
+                }
+
+        return {
+            "fallback_model": self.fallback_model,
+            "tiers": tiers
+        }
+
+
+_router: Optional[ModelRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_model_router() -> ModelRouter:
+    """
+    Get the shared ModelRouter instance.
+    """
+    global _router
+
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter.from_settings()
+            logger.info(f"ModelRouter initialized with tiers: {_router.models}")
+        return _router
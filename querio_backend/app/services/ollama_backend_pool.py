@@ -0,0 +1,370 @@
+"""
+Ollama Backend Pool
+Spreads Ollama calls over several Ollama processes (ports / NUMA nodes).
+
+- Health checks run in the background against /api/ps, which also reports
+  which models each backend currently has loaded.
+- Requests go to a healthy backend that already has the model loaded
+  (model affinity), breaking ties by fewest outstanding requests.
+- Optionally, chat requests are hedged: if the chosen backend has not
+  produced a first token within a p95-derived deadline, the request is
+  re-issued to a second backend and whichever streams first wins.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional, Set
+import logging
+import queue
+import threading
+import time
+
+import ollama
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _model_name(model: str) -> str:
+    """
+    Normalize a model name the way /api/ps reports it (implicit ":latest" tag).
+    """
+    return model if ":" in model else f"{model}:latest"
+
+
+class OllamaBackend:
+    """One Ollama server and its routing state."""
+
+    def __init__(self, host: str):
+        self.host = host
+        self.client = ollama.Client(host=host)
+        self.healthy = True
+        self.outstanding = 0
+        self.loaded_models: Set[str] = set()
+        self.requests = 0
+        self.errors = 0
+        self.last_check = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "host": self.host,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "loaded_models": sorted(self.loaded_models),
+            "requests": self.requests,
+            "errors": self.errors
+        }
+
+
+class OllamaBackendPool:
+    """Health-checked pool of Ollama backends with least-outstanding routing."""
+
+    def __init__(
+        self,
+        hosts: List[str],
+        health_interval: float = 10.0,
+        hedge: bool = False,
+        hedge_min_ms: float = 200.0,
+        hedge_min_samples: int = 20
+    ):
+        """
+        Initialize the pool.
+
+        Args:
+            hosts: Ollama base URLs, e.g. ["http://localhost:11434", "http://localhost:11435"]
+            health_interval: Seconds between background health checks
+            hedge: Re-issue slow chat requests to a second backend
+            hedge_min_ms: Lower bound on the hedging deadline
+            hedge_min_samples: First-token samples needed before hedging starts
+        """
+        if not hosts:
+            raise ValueError("At least one Ollama host is required")
+
+        self.backends = [OllamaBackend(host) for host in hosts]
+        self.health_interval = health_interval
+        self.hedge = hedge
+        self.hedge_min_ms = hedge_min_ms
+        self.hedge_min_samples = hedge_min_samples
+
+        self._lock = threading.Lock()
+        self._first_token_ms: Dict[str, Deque[float]] = {}
+        self.hedges_issued = 0
+        self.hedges_won = 0
+
+        self._stop = threading.Event()
+        self._health_thread: Optional[threading.Thread] = None
+
+    # ---------- Health ----------
+
+    def start(self) -> None:
+        """
+        Run an initial health check and start the background checker.
+        """
+        self.check_health()
+
+        if self._health_thread is None:
+            self._health_thread = threading.Thread(
+                target=self._health_loop, name="ollama-health", daemon=True
+            )
+            self._health_thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _health_loop(self) -> None:
+        while not self._stop.wait(self.health_interval):
+            self.check_health()
+
+    def check_health(self) -> None:
+        """
+        Probe every backend; /api/ps doubles as the list of loaded models.
+        """
+        for backend in self.backends:
+            try:
+                running = backend.client.ps()
+                loaded = {model["model"] for model in running["models"]}
+                with self._lock:
+                    if not backend.healthy:
+                        logger.info(f"Ollama backend {backend.host} is healthy again")
+                    backend.healthy = True
+                    backend.loaded_models = loaded
+            except Exception as e:
+                with self._lock:
+                    if backend.healthy:
+                        logger.warning(f"Ollama backend {backend.host} failed health check: {e}")
+                    backend.healthy = False
+            backend.last_check = time.monotonic()
+
+    # ---------- Routing ----------
+
+    def pick(self, model: str, exclude: Optional[Set[str]] = None) -> Optional[OllamaBackend]:
+        """
+        Choose a backend for a model: healthy first, then model affinity,
+        then fewest outstanding requests.
+        """
+        exclude = exclude or set()
+
+        with self._lock:
+            candidates = [b for b in self.backends if b.host not in exclude]
+            if not candidates:
+                return None
+
+            healthy = [b for b in candidates if b.healthy]
+            # If everything looks down, still try rather than fail outright
+            pool = healthy or candidates
+
+            return min(
+                pool,
+                key=lambda b: (_model_name(model) not in b.loaded_models, b.outstanding)
+            )
+
+    @contextmanager
+    def _use(self, backend: OllamaBackend, model: Optional[str]) -> Iterator[OllamaBackend]:
+        with self._lock:
+            backend.outstanding += 1
+            backend.requests += 1
+        try:
+            yield backend
+            if model:
+                with self._lock:
+                    backend.loaded_models.add(_model_name(model))
+        except (ConnectionError, OSError) as e:
+            with self._lock:
+                backend.errors += 1
+                backend.healthy = False
+            logger.warning(f"Ollama backend {backend.host} unreachable: {e}")
+            raise
+        except Exception:
+            with self._lock:
+                backend.errors += 1
+            raise
+        finally:
+            with self._lock:
+                backend.outstanding -= 1
+
+    # ---------- Calls ----------
+
+    def chat(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        options: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Run a chat completion on the best backend (hedged when enabled).
+        """
+        if self.hedge:
+            return self._hedged_chat(model, messages, options)
+
+        backend = self.pick(model)
+        with self._use(backend, model):
+            return backend.client.chat(model=model, messages=messages, options=options)
+
+    def chat_stream(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        options: Optional[Dict[str, Any]] = None
+    ) -> Iterator[Any]:
+        """
+        Stream a chat completion from the best backend (never hedged).
+        """
+        backend = self.pick(model)
+        with self._use(backend, model):
+            yield from backend.client.chat(
+                model=model, messages=messages, options=options, stream=True
+            )
+
+    def embed(self, model: str, texts: List[str]) -> List[List[float]]:
+        """
+        Embed a batch of texts with one /api/embed request on the best backend.
+        """
+        backend = self.pick(model)
+        with self._use(backend, model):
+            return list(backend.client.embed(model=model, input=texts)["embeddings"])
+
+    def list_models(self) -> Dict[str, Any]:
+        """
+        List local models from the first healthy backend.
+        """
+        backend = self.pick("")
+        with self._use(backend, None):
+            return backend.client.list()
+
+    # ---------- Hedging ----------
+
+    def _record_first_token(self, model: str, elapsed_ms: float) -> None:
+        with self._lock:
+            self._first_token_ms.setdefault(model, deque(maxlen=200)).append(elapsed_ms)
+
+    def hedge_deadline_ms(self, model: str) -> Optional[float]:
+        """
+        p95 time-to-first-token for the model, or None until enough samples exist.
+        """
+        with self._lock:
+            samples = sorted(self._first_token_ms.get(model, ()))
+
+        if len(samples) < self.hedge_min_samples:
+            return None
+
+        p95 = samples[int(0.95 * (len(samples) - 1))]
+        return max(self.hedge_min_ms, p95)
+
+    def _hedged_chat(self, model, messages, options) -> Dict[str, Any]:
+        results: "queue.Queue" = queue.Queue()
+        first_token = threading.Event()
+        state = {"winner": None}
+        state_lock = threading.Lock()
+
+        def run(backend: OllamaBackend) -> None:
+            start = time.perf_counter()
+            parts = []
+            last = None
+            try:
+                with self._use(backend, model):
+                    for chunk in backend.client.chat(
+                        model=model, messages=messages, options=options, stream=True
+                    ):
+                        if last is None:
+                            with state_lock:
+                                if state["winner"] is None:
+                                    state["winner"] = backend.host
+                                    self._record_first_token(
+                                        model, (time.perf_counter() - start) * 1000
+                                    )
+                            first_token.set()
+                            if state["winner"] != backend.host:
+                                # Lost the race; dropping the stream closes it
+                                results.put((backend.host, None, None))
+                                return
+                        parts.append(chunk["message"]["content"])
+                        last = chunk
+                results.put((backend.host, self._assemble(model, parts, last), None))
+            except Exception as e:
+                results.put((backend.host, None, e))
+
+        primary = self.pick(model)
+        launched = [primary]
+        threading.Thread(target=run, args=(primary,), daemon=True).start()
+
+        deadline_ms = self.hedge_deadline_ms(model)
+        if deadline_ms is not None and not first_token.wait(deadline_ms / 1000):
+            secondary = self.pick(model, exclude={primary.host})
+            if secondary is not None:
+                with self._lock:
+                    self.hedges_issued += 1
+                launched.append(secondary)
+                threading.Thread(target=run, args=(secondary,), daemon=True).start()
+
+        error = None
+        pending = len(launched)
+        while pending:
+            host, response, exc = results.get()
+            pending -= 1
+            if exc is not None:
+                error = exc
+                continue
+            if host == state["winner"]:
+                if host != primary.host:
+                    with self._lock:
+                        self.hedges_won += 1
+                return response
+            # The losing backend reports back empty-handed; keep waiting for the winner
+
+        raise error or RuntimeError("No Ollama backend produced a response")
+
+    @staticmethod
+    def _assemble(model: str, parts: List[str], last) -> Dict[str, Any]:
+        """
+        Build a non-streaming style response from streamed chunks.
+        """
+        response = {
+            "model": model,
+            "message": {"role": "assistant", "content": "".join(parts)},
+            "done": True
+        }
+        if last is not None:
+            for field in ("prompt_eval_count", "eval_count", "total_duration"):
+                if last.get(field) is not None:
+                    response[field] = last[field]
+        return response
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get per-backend routing state and hedging counters.
+        """
+        with self._lock:
+            backends = [backend.to_dict() for backend in self.backends]
+
+        return {
+            "backends": backends,
+            "hedging": {
+                "enabled": self.hedge,
+                "issued": self.hedges_issued,
+                "won_by_hedge": self.hedges_won
+            }
+        }
+
+
+_pool: Optional[OllamaBackendPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_backend_pool() -> OllamaBackendPool:
+    """
+    Get the shared OllamaBackendPool, starting its health checks on first use.
+    """
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = OllamaBackendPool(
+                hosts=settings.OLLAMA_HOSTS,
+                health_interval=settings.OLLAMA_HEALTH_INTERVAL,
+                hedge=settings.OLLAMA_HEDGE_ENABLED,
+                hedge_min_ms=settings.OLLAMA_HEDGE_MIN_MS
+            )
+            _pool.start()
+            logger.info(f"OllamaBackendPool initialized with hosts: {settings.OLLAMA_HOSTS}")
+        return _pool
@@ -0,0 +1,236 @@
+"""
+Ollama Client
+Shared gateway for every Ollama call made by the services.
+Identical chat requests that are in flight at the same time are coalesced
+into a single generation whose result is shared by all callers, and
+deterministic (temperature 0) responses are served from a persistent cache.
+Calls that do reach Ollama are admitted through the priority scheduler and
+sent to the least loaded backend of the backend pool.
+"""
+
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import hashlib
+import json
+import logging
+import threading
+
+from app.config import settings
+from app.services.llm_response_cache import LLMResponseCache
+from app.services.ollama_backend_pool import OllamaBackendPool, get_backend_pool
+from app.services.ollama_scheduler import INTERACTIVE, OllamaScheduler, get_ollama_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class _InFlightCall:
+    """A call currently being executed on behalf of one or more callers."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time.
+
+    The first caller for a key (the leader) executes the function; callers
+    arriving while it is running wait for it and receive the same result
+    (or the same exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _InFlightCall] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _InFlightCall()
+                self._calls[key] = call
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class OllamaClient:
+    """Process-wide entry point for Ollama requests."""
+
+    def __init__(
+        self,
+        response_cache: Optional[LLMResponseCache] = None,
+        scheduler: Optional[OllamaScheduler] = None,
+        pool: Optional[OllamaBackendPool] = None
+    ):
+        self._single_flight = SingleFlight()
+        self.response_cache = response_cache
+        self.scheduler = scheduler or get_ollama_scheduler()
+        self.pool = pool or get_backend_pool()
+
+    @staticmethod
+    def request_key(
+        model: str,
+        messages: List[Dict[str, Any]],
+        options: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Build a stable key for a chat request from (model, messages, options).
+        """
+        payload = json.dumps(
+            {"model": model, "messages": list(messages), "options": options or {}},
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def chat(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        options: Optional[Dict[str, Any]] = None,
+        priority: str = INTERACTIVE
+    ):
+        """
+        Run a chat completion, sharing the generation with any identical
+        request that is already in flight.
+
+        Deterministic requests are answered from the response cache when possible.
+        """
+        key = self.request_key(model, messages, options)
+
+        def call_ollama():
+            with self.scheduler.slot(priority):
+                return self.pool.chat(model=model, messages=messages, options=options)
+
+        digest = None
+        if self.response_cache and self.response_cache.is_deterministic(options):
+            digest = self.response_cache.get_model_digest(model)
+
+        if digest is None:
+            return self._single_flight.do(key, call_ollama)
+
+        cache_key = f"{digest}:{key}"
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        def generate():
+            response = call_ollama()
+            self.response_cache.put(
+                cache_key,
+                model,
+                digest,
+                {
+                    "model": model,
+                    "message": {
+                        "role": response["message"]["role"],
+                        "content": response["message"]["content"]
+                    }
+                }
+            )
+            return response
+
+        return self._single_flight.do(cache_key, generate)
+
+    def chat_stream(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        options: Optional[Dict[str, Any]] = None,
+        priority: str = INTERACTIVE,
+        on_done: Optional[Callable[[Any], None]] = None
+    ) -> Iterator[str]:
+        """
+        Stream a chat completion, yielding content pieces as Ollama generates them.
+        Streams are neither coalesced nor cached; the scheduler slot is held
+        until the stream finishes or the consumer stops iterating.
+
+        on_done, if given, receives the final chunk (with Ollama's token counts).
+        """
+        with self.scheduler.slot(priority):
+            for chunk in self.pool.chat_stream(model=model, messages=messages, options=options):
+                content = chunk["message"]["content"]
+                if content:
+                    yield content
+                if on_done is not None and chunk.get("done"):
+                    on_done(chunk)
+
+    def embed(self, model: str, texts: List[str], priority: str = INTERACTIVE) -> List[List[float]]:
+        """
+        Embed a batch of texts with one request while holding a single scheduler slot.
+        """
+        with self.scheduler.slot(priority):
+            return self.pool.embed(model=model, texts=texts)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get coalescing, response cache and scheduler statistics.
+        """
+        executed = self._single_flight.executed
+        coalesced = self._single_flight.coalesced
+
+        stats = {
+            "chat_requests": executed + coalesced,
+            "generations": executed,
+            "coalesced": coalesced,
+            "in_flight": self._single_flight.in_flight()
+        }
+
+        if self.response_cache:
+            stats["response_cache"] = self.response_cache.get_stats()
+
+        stats["scheduler"] = self.scheduler.get_stats()
+        stats["backends"] = self.pool.get_stats()
+
+        return stats
+
+
+_client: Optional[OllamaClient] = None
+_client_lock = threading.Lock()
+
+
+def get_ollama_client() -> OllamaClient:
+    """
+    Get the shared OllamaClient instance.
+    """
+    global _client
+
+    with _client_lock:
+        if _client is None:
+            response_cache = None
+            pool = get_backend_pool()
+            if settings.LLM_CACHE_ENABLED:
+                response_cache = LLMResponseCache(
+                    path=settings.LLM_CACHE_PATH,
+                    max_bytes=settings.LLM_CACHE_MAX_MB * 1024 * 1024,
+                    list_models=pool.list_models
+                )
+            _client = OllamaClient(response_cache=response_cache, pool=pool)
+            logger.info("OllamaClient initialized")
+        return _client
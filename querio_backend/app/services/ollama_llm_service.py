@@ -1,28 +1,83 @@
-import ollama
 import re
 import json
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Any
+
+from app.config import settings
+from app.services.ollama_client import get_ollama_client
+from app.services.model_router import get_model_router
+from app.services.ollama_scheduler import INTERACTIVE
 
 class OllamaLLMService:
-    def __init__(self, model="gemma2:9b"):
-        self.model = model
+    def __init__(self, model=None):
+        self.model = model or settings.LLM_MODEL_DEFAULT
         self.max_retries = 2  # Number of retries for SQL generation
-        
-    def generate_text(self, prompt: str, system_prompt: str = "You are a helpful AI.") -> str:
-        """Generate text with proper error handling"""
+        self.client = get_ollama_client()
+        self.router = get_model_router()
+        
+    def generate_text(
+        self,
+        prompt: str,
+        system_prompt: str = "You are a helpful AI.",
+        options: Optional[Dict[str, Any]] = None,
+        task: Optional[str] = None,
+        validate: Optional[Callable[[str], bool]] = None,
+        priority: str = INTERACTIVE
+    ) -> str:
+        """
+        Generate text with proper error handling.
+        When a task is given, the task's model tier is used and `validate`
+        decides whether to fall back to the default model.
+        """
+        if task is None:
+            return self._generate_text_with_model(self.model, prompt, system_prompt, options, priority)
+
+        return self.router.run(
+            task,
+            lambda model: self._generate_text_with_model(model, prompt, system_prompt, options, priority),
+            validate
+        )
+
+    def _generate_text_with_model(self, model: str, prompt: str, system_prompt: str, options: Optional[Dict[str, Any]], priority: str) -> str:
         try:
-            response = ollama.chat(
-                model=self.model,
+            response = self.client.chat(
+                model=model,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": prompt}
-                ]
+                ],
+                options=options,
+                priority=priority
             )
             return response["message"]["content"].strip()
         except Exception as e:
             print(f"Ollama API error: {e}")
             return ""
 
+    def stream_text(
+        self,
+        prompt: str,
+        system_prompt: str = "You are a helpful AI.",
+        options: Optional[Dict[str, Any]] = None,
+        task: Optional[str] = None,
+        priority: str = INTERACTIVE
+    ) -> Iterator[str]:
+        """
+        Stream generated text piece by piece.
+        Streams use the task's model tier but cannot fall back, since output
+        is sent before it could be validated.
+        """
+        model = self.router.model_for(task) if task else self.model
+
+        yield from self.client.chat_stream(
+            model=model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            options=options,
+            priority=priority
+        )
+
     def generate_sql(self, question: str, schema_rows: list) -> str:
         """
         Generate SQL with schema validation and self-correction
@@ -40,9 +95,36 @@ class OllamaLLMService:
         # Check if multiple statements might be needed
         needs_multiple = self._needs_multiple_statements(question)
         
+        # Generate on the SQL tier model; fall back to the default model if it never validates
+        sql = self.router.run(
+            "sql",
+            lambda model: self._generate_validated_sql(
+                model, question, schema_rows, schema_dict, valid_columns,
+                table_names, query_type, needs_multiple
+            ),
+            validate=lambda result: result is not None
+        )
+        if sql is not None:
+            return sql
+        
+        # If all attempts fail, use a safe fallback based on question
+        return self._get_safe_fallback_query(question, table_names, query_type, needs_multiple)
+
+    def _generate_validated_sql(
+        self,
+        model: str,
+        question: str,
+        schema_rows: list,
+        schema_dict: Dict,
+        valid_columns: set,
+        table_names: list,
+        query_type: str,
+        needs_multiple: bool
+    ) -> Optional[str]:
+        """Run the generation attempts on one model; None if no attempt validates"""
         # Try up to max_retries times
         for attempt in range(self.max_retries):
-            sql = self._attempt_sql_generation(question, schema_rows, query_type, needs_multiple, attempt)
+            sql = self._attempt_sql_generation(model, question, schema_rows, query_type, needs_multiple, attempt)
             
             # Clean SQL
             sql = self._clean_sql(sql)
@@ -64,8 +146,7 @@ class OllamaLLMService:
             
             print(f"Attempt {attempt + 1} failed: {schema_error if not is_valid_schema else syntax_error}")
         
-        # If all attempts fail, use a safe fallback based on question
-        return self._get_safe_fallback_query(question, table_names, query_type, needs_multiple)
+        return None
 
     def _detect_query_type(self, question: str) -> str:
         """Detect the type of query from the question"""
@@ -160,7 +241,7 @@ class OllamaLLMService:
         
         return prompt
 
-    def _attempt_sql_generation(self, question: str, schema_rows: list, query_type: str, needs_multiple: bool, attempt: int) -> str:
+    def _attempt_sql_generation(self, model: str, question: str, schema_rows: list, query_type: str, needs_multiple: bool, attempt: int) -> str:
         """Attempt to generate SQL with different prompts based on attempt number"""
         
         schema_prompt = self._create_schema_prompt(schema_rows)
@@ -242,8 +323,8 @@ Available tables: {', '.join(table_names)}
 
 SQL:"""
 
-        response = ollama.chat(
-            model=self.model,
+        response = self.client.chat(
+            model=model,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
@@ -424,8 +505,8 @@ Instructions:
 
 Answer:"""
 
-        response = ollama.chat(
-            model=self.model,
+        response = self.client.chat(
+            model=self.router.model_for("answer"),
             messages=[
                 {"role": "system", "content": "You are a helpful assistant that provides accurate answers based only on the given context."},
                 {"role": "user", "content": prompt}
@@ -466,19 +547,17 @@ Examples:
 
 Now process:"""
 
-        response = self.generate_text(prompt, "You are a precise question analyzer. Return only valid JSON.")
+        response = self.generate_text(
+            prompt,
+            "You are a precise question analyzer. Return only valid JSON.",
+            options={"temperature": 0},  # Deterministic, so responses can be cached
+            task="split",
+            validate=lambda text: self._parse_split_response(text) is not None
+        )
         
-        try:
-            # Extract JSON from response
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if json_match:
-                data = json.loads(json_match.group())
-                return {
-                    "sql_part": data.get("sql_part"),
-                    "rag_part": data.get("rag_part")
-                }
-        except Exception as e:
-            print(f"Intent split error: {e}")
+        parsed = self._parse_split_response(response)
+        if parsed is not None:
+            return parsed
         
         # Fallback
         sql_indicators = ['how many', 'count', 'total', 'sum', 'revenue', 'average', 'list', 'show', 'top', 'names']
@@ -491,5 +570,19 @@ Now process:"""
             "sql_part": question if has_sql else None,
             "rag_part": question if has_rag else None
         }
-    
 
+    def _parse_split_response(self, response: str) -> Optional[Dict[str, Optional[str]]]:
+        """Extract the sql_part/rag_part JSON from a split response; None if malformed"""
+        try:
+            # Extract JSON from response
+            json_match = re.search(r'\{.*\}', response, re.DOTALL)
+            if json_match:
+                data = json.loads(json_match.group())
+                return {
+                    "sql_part": data.get("sql_part"),
+                    "rag_part": data.get("rag_part")
+                }
+        except Exception as e:
+            print(f"Intent split error: {e}")
+        
+        return None
@@ -0,0 +1,166 @@
+"""
+Ollama Scheduler
+Admission control in front of every Ollama call.
+
+Requests are queued per priority class and dispatched with weighted fair
+queuing, so interactive queries get most of the capacity without starving
+hybrid synthesis or background ingestion. Callers hold a slot only for the
+duration of one call (or one embedding batch), which makes long-running
+ingestion preemptible between batches.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, Optional
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+HYBRID = "hybrid"
+INGEST = "ingest"
+
+DEFAULT_WEIGHTS = {
+    INTERACTIVE: 8.0,
+    HYBRID: 4.0,
+    INGEST: 1.0,
+}
+
+
+class _Ticket:
+    """A queued request for a slot."""
+
+    __slots__ = ("priority", "start_tag", "finish_tag", "enqueued_at")
+
+    def __init__(self, priority: str, start_tag: float, finish_tag: float):
+        self.priority = priority
+        self.start_tag = start_tag
+        self.finish_tag = finish_tag
+        self.enqueued_at = time.perf_counter()
+
+
+class _ClassStats:
+    """Counters and rolling wait-time window for one priority class."""
+
+    def __init__(self, window: int = 500):
+        self.queued = 0
+        self.dispatched = 0
+        self.max_queue_depth = 0
+        self.waits_ms: Deque[float] = deque(maxlen=window)
+
+
+class OllamaScheduler:
+    """Weighted fair queue with a fixed number of concurrent Ollama slots."""
+
+    def __init__(self, max_concurrency: int = 2, weights: Optional[Dict[str, float]] = None):
+        """
+        Initialize the scheduler.
+
+        Args:
+            max_concurrency: Calls allowed to run against Ollama at once
+            weights: Share of capacity per priority class
+        """
+        self.max_concurrency = max_concurrency
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+
+        self._cond = threading.Condition()
+        self._queue: list = []
+        self._seq = itertools.count()
+        self._active = 0
+        self._virtual_time = 0.0
+        self._last_finish = {priority: 0.0 for priority in self.weights}
+        self._stats = {priority: _ClassStats() for priority in self.weights}
+
+    @contextmanager
+    def slot(self, priority: str = INTERACTIVE) -> Iterator[None]:
+        """
+        Hold one Ollama slot for the duration of the block.
+        """
+        self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _acquire(self, priority: str) -> None:
+        if priority not in self.weights:
+            raise ValueError(f"Unknown priority class: {priority}")
+
+        with self._cond:
+            # Virtual start/finish tags: each class advances by 1/weight per request
+            start_tag = max(self._virtual_time, self._last_finish[priority])
+            finish_tag = start_tag + 1.0 / self.weights[priority]
+            self._last_finish[priority] = finish_tag
+
+            ticket = _Ticket(priority, start_tag, finish_tag)
+            heapq.heappush(self._queue, (finish_tag, next(self._seq), ticket))
+
+            stats = self._stats[priority]
+            stats.queued += 1
+            stats.max_queue_depth = max(stats.max_queue_depth, stats.queued)
+
+            while self._active >= self.max_concurrency or self._queue[0][2] is not ticket:
+                self._cond.wait()
+
+            heapq.heappop(self._queue)
+            self._active += 1
+            self._virtual_time = max(self._virtual_time, ticket.start_tag)
+
+            stats.queued -= 1
+            stats.dispatched += 1
+            stats.waits_ms.append((time.perf_counter() - ticket.enqueued_at) * 1000)
+
+            # Another slot may still be free for the next ticket in line
+            self._cond.notify_all()
+
+    def _release(self) -> None:
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get queue depth and wait-time statistics per priority class.
+        """
+        classes = {}
+
+        with self._cond:
+            for priority, stats in self._stats.items():
+                waits = sorted(stats.waits_ms)
+                classes[priority] = {
+                    "weight": self.weights[priority],
+                    "queue_depth": stats.queued,
+                    "max_queue_depth": stats.max_queue_depth,
+                    "dispatched": stats.dispatched,
+                    "avg_wait_ms": round(sum(waits) / len(waits), 1) if waits else 0.0,
+                    "p95_wait_ms": round(waits[int(0.95 * (len(waits) - 1))], 1) if waits else 0.0
+                }
+
+            return {
+                "max_concurrency": self.max_concurrency,
+                "active": self._active,
+                "classes": classes
+            }
+
+
+_scheduler: Optional[OllamaScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_ollama_scheduler() -> OllamaScheduler:
+    """
+    Get the shared OllamaScheduler instance.
+    """
+    global _scheduler
+
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = OllamaScheduler(max_concurrency=settings.OLLAMA_MAX_CONCURRENCY)
+            logger.info(f"OllamaScheduler initialized with {_scheduler.max_concurrency} slots")
+        return _scheduler
@@ -3,28 +3,91 @@ RAG (Retrieval-Augmented Generation) Service
 Combines vector search with Ollama LLM generation to answer questions from documents.
 """
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 import logging
-import ollama
+import re
+import threading
+import time
 
-from app.services.vector_service import VectorService
+from app.services.chunk_dedup import chunk_sources
+from app.services.vector_service import DEFAULT_NAMESPACE, VectorService
 from app.services.embedding_service import EmbeddingService
+from app.services.ollama_client import get_ollama_client
+from app.services.model_router import get_model_router
+from app.services.semantic_answer_cache import SemanticAnswerCache
+from app.services.context_packer import ContextPacker
+from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+NO_INFORMATION_ANSWER = "I don't have enough information to answer that based on the uploaded documents."
+
+# Answer paths reported in responses
+PATH_NO_INFORMATION = "no_information"
+PATH_EXTRACTIVE = "extractive"
+PATH_CACHE = "cache"
+PATH_GENERATED = "generated"
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+_TERM_PATTERN = re.compile(r"\w+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "explain",
+    "for", "from", "how", "i", "in", "is", "it", "me", "of", "on", "or", "tell",
+    "that", "the", "this", "to", "was", "we", "what", "when", "where", "which",
+    "who", "why", "with", "you", "your"
+}
+
+
+def _chunk_keys(chunks: List[Dict[str, Any]]) -> List[str]:
+    return [f"{c.get('namespace', DEFAULT_NAMESPACE)}/{c['id']}" for c in chunks]
+
 
 class RAGService:
     """Service for Retrieval-Augmented Generation using Ollama."""
 
-    def __init__(self, llm_model: str = "gemma2:9b"):
+    def __init__(
+        self,
+        llm_model: Optional[str] = None,
+        embedding_service: Optional[EmbeddingService] = None,
+        vector_service: Optional[VectorService] = None,
+        answer_cache: Optional[SemanticAnswerCache] = None
+    ):
         """
         Initialize RAG service.
+
+        Args:
+            llm_model: Fixed model for answers; defaults to the "answer" model tier
+            embedding_service: Shared embedding service (created if omitted)
+            vector_service: Shared vector service; its change notifications
+                invalidate the answer cache, so pass the one used for ingestion
+            answer_cache: Semantic answer cache (built from settings if omitted)
         """
-        self.embedding_service = EmbeddingService()
-        self.vector_service = VectorService()
+        self.embedding_service = embedding_service or EmbeddingService()
+        self.vector_service = vector_service or VectorService()
+        self.client = get_ollama_client()
+        self.router = get_model_router()
 
-        self.llm_model = llm_model
+        self.fixed_model = llm_model is not None
+        self.llm_model = llm_model or self.router.model_for("answer")
         self.temperature = 0.1
+        self.context_packer = ContextPacker(budget_tokens=settings.CONTEXT_TOKEN_BUDGET)
+
+        # Retrieval-confidence gating (Chroma distances: lower is closer)
+        self.max_distance = settings.RAG_MAX_DISTANCE
+        self.extractive_enabled = settings.RAG_EXTRACTIVE_ENABLED
+        self.extractive_distance = settings.RAG_EXTRACTIVE_DISTANCE
+        self.extractive_sentences = settings.RAG_EXTRACTIVE_SENTENCES
+
+        self._path_lock = threading.Lock()
+        self.path_counts = {
+            path: 0 for path in (PATH_NO_INFORMATION, PATH_EXTRACTIVE, PATH_CACHE, PATH_GENERATED)
+        }
+
+        self.answer_cache = answer_cache
+        if self.answer_cache is None and settings.SEMANTIC_CACHE_ENABLED:
+            self.answer_cache = SemanticAnswerCache.from_settings()
+        if self.answer_cache is not None:
+            self.vector_service.add_listener(self.answer_cache.invalidate)
 
         logger.info(f"RAGService initialized with model: {self.llm_model}")
 
@@ -32,92 +95,391 @@ class RAGService:
         self,
         question: str,
         top_k: int = 3,
-        include_sources: bool = True
+        include_sources: bool = True,
+        search_options: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """
         Full RAG pipeline: retrieve relevant chunks and generate an answer.
+
+        Args:
+            search_options: Vector search knobs (nprobe, prefix_dims, candidates)
         """
         try:
-            # Step 1: Embed question
-            query_embedding = self.embedding_service.generate_single_embedding(question)
-
-            # Step 2: Vector search
-            search_results = self.vector_service.search(
-                query_embedding=query_embedding,
-                top_k=top_k
-            )
+            cache_version = self.answer_cache.version if self.answer_cache else None
 
-            chunks = search_results.get("chunks", [])
+            # Step 1-2: Embed question and search (chunks beyond the distance threshold are dropped)
+            query_embedding, chunks, retrieval = self._retrieve(question, top_k, search_options)
 
+            # Nothing relevant enough: answer without calling the LLM
             if not chunks:
+                self._record_path(PATH_NO_INFORMATION)
                 return {
                     "question": question,
-                    "answer": "I don't have enough information to answer that based on the uploaded documents.",
+                    "answer": NO_INFORMATION_ANSWER,
                     "sources": [],
                     "chunks_used": 0,
-                    "model": self.llm_model
+                    "model": None,
+                    "path": PATH_NO_INFORMATION,
+                    "retrieval": retrieval
                 }
 
-            # Step 3: Build context
-            context = self._build_context(chunks)
-
-            # Step 4: Create prompt
-            prompt = self._create_prompt(question, context)
-
-            # Step 5: Generate answer using Ollama
-            response = ollama.chat(
-                model=self.llm_model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "You are a helpful assistant that answers questions strictly "
-                            "based on the provided context. "
-                            "If the context does not contain enough information, say so clearly."
-                        )
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                options={"temperature": self.temperature}
-            )
+            # Paraphrase of an answered question over the same chunks: reuse its answer
+            cached = self._cache_lookup(query_embedding, chunks)
+            if cached is not None:
+                cached["question"] = question
+                cached["retrieval"] = retrieval
+                if not include_sources:
+                    cached.pop("sources", None)
+                return cached
+
+            # High-confidence retrieval: quote the best-matching sentences
+            if self._use_extractive(chunks):
+                self._record_path(PATH_EXTRACTIVE)
+                result = {
+                    "question": question,
+                    "answer": self._extract_answer(question, chunks),
+                    "chunks_used": len(chunks),
+                    "model": None,
+                    "path": PATH_EXTRACTIVE,
+                    "retrieval": retrieval
+                }
+                if include_sources:
+                    result["sources"] = self._format_sources(chunks)
+                return result
+
+            # Step 3-4: Build context and prompt
+            messages, context_report = self._build_messages(question, chunks)
+
+            # Step 5: Generate answer using Ollama (identical in-flight calls are shared)
+            def generate(model: str):
+                return self.client.chat(
+                    model=model,
+                    messages=messages,
+                    options={"temperature": self.temperature}
+                )
+
+            if self.fixed_model:
+                response = generate(self.llm_model)
+            else:
+                response = self.router.run(
+                    "answer",
+                    generate,
+                    validate=lambda r: bool(r["message"]["content"].strip())
+                )
 
             answer = response["message"]["content"]
+            self.context_packer.calibrate(messages, response.get("prompt_eval_count"))
 
             result = {
                 "question": question,
                 "answer": answer,
                 "chunks_used": len(chunks),
-                "model": self.llm_model
+                "model": response["model"],
+                "sources": self._format_sources(chunks),
+                "context": context_report,
+                "path": PATH_GENERATED
             }
 
-            if include_sources:
-                result["sources"] = self._format_sources(chunks)
+            self._record_path(PATH_GENERATED)
+            self._cache_store(query_embedding, chunks, result, cache_version)
+            result["retrieval"] = retrieval
+
+            if not include_sources:
+                result.pop("sources")
 
             return result
 
         except Exception as e:
             raise Exception(f"RAG pipeline failed: {str(e)}")
 
-    def _build_context(self, chunks: List[Dict[str, Any]]) -> str:
+    def stream_answer(
+        self,
+        question: str,
+        top_k: int = 3,
+        search_options: Optional[Dict[str, Any]] = None
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Streaming RAG pipeline.
+
+        Yields (event, data) pairs: "sources" as soon as retrieval finishes,
+        one "token" per generated piece, then "done" with the full answer.
+        """
+        cache_version = self.answer_cache.version if self.answer_cache else None
+
+        query_embedding, chunks, retrieval = self._retrieve(question, top_k, search_options)
+        sources = self._format_sources(chunks)
+
+        yield "sources", {
+            "sources": sources,
+            "chunks_used": len(chunks),
+            "retrieval": retrieval
+        }
+
+        if not chunks:
+            self._record_path(PATH_NO_INFORMATION)
+            yield "token", {"text": NO_INFORMATION_ANSWER}
+            yield "done", {"answer": NO_INFORMATION_ANSWER, "model": None, "path": PATH_NO_INFORMATION}
+            return
+
+        cached = self._cache_lookup(query_embedding, chunks)
+        if cached is not None:
+            yield "token", {"text": cached["answer"]}
+            yield "done", {"answer": cached["answer"], "model": cached["model"], "path": PATH_CACHE}
+            return
+
+        if self._use_extractive(chunks):
+            self._record_path(PATH_EXTRACTIVE)
+            answer = self._extract_answer(question, chunks)
+            yield "token", {"text": answer}
+            yield "done", {"answer": answer, "model": None, "path": PATH_EXTRACTIVE}
+            return
+
+        messages, context_report = self._build_messages(question, chunks)
+
+        parts = []
+        for piece in self.client.chat_stream(
+            model=self.llm_model,
+            messages=messages,
+            options={"temperature": self.temperature},
+            on_done=lambda final: self.context_packer.calibrate(
+                messages, final.get("prompt_eval_count")
+            )
+        ):
+            parts.append(piece)
+            yield "token", {"text": piece}
+
+        answer = "".join(parts)
+
+        self._cache_store(
+            query_embedding,
+            chunks,
+            {
+                "question": question,
+                "answer": answer,
+                "chunks_used": len(chunks),
+                "model": self.llm_model,
+                "sources": sources,
+                "context": context_report,
+                "path": PATH_GENERATED
+            },
+            cache_version
+        )
+
+        self._record_path(PATH_GENERATED)
+        yield "done", {
+            "answer": answer,
+            "model": self.llm_model,
+            "context": context_report,
+            "path": PATH_GENERATED
+        }
+
+    def retrieve_batch(
+        self,
+        questions: List[str],
+        top_k: int = 3,
+        search_options: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
         """
-        Build context string from retrieved chunks.
+        Retrieve chunks for many questions: one embedding batch and one
+        vector query instead of a round trip per question. No answers are
+        generated (query expansion, hybrid flows, offline evaluation).
+
+        Returns:
+            Per-question chunks and search stages, plus batch retrieval timings
         """
-        context_parts = []
+        if not questions:
+            return {"results": [], "retrieval": {}}
+
+        # The index must not switch embedding models between embedding and search
+        with self.vector_service.pinned():
+            started = time.perf_counter()
+            query_embeddings = self.embedding_service.generate_query_embeddings(questions)
+            embedding_ms = (time.perf_counter() - started) * 1000
+
+            batch = self.vector_service.search_batch(
+                query_embeddings=query_embeddings,
+                top_k=top_k,
+                max_distance=self.max_distance,
+                query_texts=questions,
+                **(search_options or {})
+            )
 
-        for i, chunk in enumerate(chunks, 1):
-            metadata = chunk.get("metadata", {})
-            filename = metadata.get("filename", "Unknown")
-            text = chunk.get("text", "")
-            score = chunk.get("score", 0.0)
+        results = []
+        for question, found in zip(questions, batch["results"]):
+            results.append({
+                "question": question,
+                "chunks": found["chunks"],
+                "stages": found["stages"]
+            })
+
+        return {
+            "results": results,
+            "retrieval": {
+                "embedding_ms": round(embedding_ms, 3),
+                "search": batch["search_stats"]
+            }
+        }
+
+    def _retrieve(
+        self,
+        question: str,
+        top_k: int,
+        search_options: Optional[Dict[str, Any]]
+    ) -> Tuple[List[float], List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Embed the question and search for chunks.
+
+        Returns:
+            (query embedding, chunks, retrieval timings incl. per-stage search cost)
+        """
+        with self.vector_service.pinned():
+            started = time.perf_counter()
+            query_embedding = self.embedding_service.generate_single_embedding(question)
+            embedding_ms = (time.perf_counter() - started) * 1000
 
-            context_parts.append(
-                f"[Source {i}: {filename} | relevance={score:.3f}]\n{text}\n"
+            search_results = self.vector_service.search(
+                query_embedding=query_embedding,
+                top_k=top_k,
+                max_distance=self.max_distance,
+                query_text=question,
+                **(search_options or {})
             )
 
-        return "\n".join(context_parts)
+        retrieval = {
+            "embedding_ms": round(embedding_ms, 3),
+            "search": search_results.get("search_stats", {})
+        }
+
+        return query_embedding, search_results.get("chunks", []), retrieval
+
+    def _cache_lookup(
+        self,
+        query_embedding: List[float],
+        chunks: List[Dict[str, Any]]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached answer for this question embedding and retrieved chunks.
+        """
+        if self.answer_cache is None:
+            return None
+
+        cached = self.answer_cache.lookup(query_embedding, _chunk_keys(chunks))
+        if cached is not None:
+            cached["path"] = PATH_CACHE
+            self._record_path(PATH_CACHE)
+
+        return cached
+
+    def _use_extractive(self, chunks: List[Dict[str, Any]]) -> bool:
+        """
+        Whether retrieval is confident enough to skip generation.
+        """
+        return self.extractive_enabled and chunks[0]["score"] <= self.extractive_distance
+
+    def _extract_answer(self, question: str, chunks: List[Dict[str, Any]]) -> str:
+        """
+        Pick the sentences of the retrieved chunks that share the most terms
+        with the question, in document order.
+        """
+        terms = {
+            term for term in _TERM_PATTERN.findall(question.lower())
+            if term not in _STOPWORDS
+        }
+
+        scored = []
+        for chunk_rank, chunk in enumerate(chunks):
+            for position, sentence in enumerate(_SENTENCE_SPLIT.split(chunk.get("text", ""))):
+                sentence = sentence.strip()
+                if not sentence:
+                    continue
+                overlap = len(terms & set(_TERM_PATTERN.findall(sentence.lower())))
+                scored.append((overlap, -chunk_rank, -position, sentence))
+
+        ranked = sorted(scored, reverse=True)
+        best = [item for item in ranked[:self.extractive_sentences] if item[0] > 0] or ranked[:1]
+
+        # Keep the original reading order: best chunk first, then position in chunk
+        best.sort(key=lambda item: (-item[1], -item[2]))
+
+        return " ".join(sentence for _, _, _, sentence in best)
+
+    def _record_path(self, path: str):
+        with self._path_lock:
+            self.path_counts[path] += 1
+
+    def get_path_stats(self) -> Dict[str, int]:
+        """
+        Get how many answers took each path.
+        """
+        with self._path_lock:
+            return dict(self.path_counts)
+
+    def _cache_store(
+        self,
+        query_embedding: List[float],
+        chunks: List[Dict[str, Any]],
+        result: Dict[str, Any],
+        cache_version: Optional[int]
+    ):
+        """
+        Remember a generated answer, keyed by question embedding and chunk IDs
+        (qualified by namespace: tenants can have identical chunk IDs).
+        """
+        if self.answer_cache is None or not result["answer"].strip():
+            return
+
+        self.answer_cache.store(
+            query_embedding,
+            chunk_ids=_chunk_keys(chunks),
+            filenames=[f for c in chunks for f in chunk_sources(c.get("metadata", {}))],
+            result=result,
+            version=cache_version
+        )
+
+    def _build_messages(
+        self,
+        question: str,
+        chunks: List[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        """
+        Build the chat messages for a question and its retrieved chunks.
+
+        Returns:
+            (messages, context report with prompt token savings)
+        """
+        context, context_report = self._build_context(chunks)
+        prompt = self._create_prompt(question, context)
+
+        messages = [
+            {
+                "role": "system",
+                "content": (
+                    "You are a helpful assistant that answers questions strictly "
+                    "based on the provided context. "
+                    "If the context does not contain enough information, say so clearly."
+                )
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+
+        return messages, context_report
+
+    def _build_context(self, chunks: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+        """
+        Build context string from retrieved chunks: overlapping neighbours are
+        merged, near-duplicates dropped and the rest packed into the token budget.
+        """
+        context, report = self.context_packer.pack(chunks)
+
+        logger.debug(
+            f"Context packed: {report['raw_tokens']} -> {report['packed_tokens']} tokens "
+            f"({report['passages']} passages)"
+        )
+
+        return context, report
 
     def _create_prompt(self, question: str, context: str) -> str:
         """
@@ -148,6 +510,7 @@ Answer:
             metadata = chunk.get("metadata", {})
             sources.append({
                 "filename": metadata.get("filename", "Unknown"),
+                "files": chunk_sources(metadata),
                 "chunk_index": metadata.get("chunk_index", 0),
                 "relevance_score": chunk.get("score", 0.0),
                 "preview": chunk.get("text", "")[:200] + "..."
@@ -0,0 +1,182 @@
+"""
+Semantic Answer Cache
+Reuses RAG answers across paraphrased questions. A cached answer is served
+when the new question's embedding is close enough to a previously answered
+one AND retrieval returned the same chunks, so the answer is grounded in the
+same context it was generated from.
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+import copy
+import logging
+import threading
+import time
+
+import numpy as np
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticAnswerCache:
+    """In-memory LRU of (question embedding, chunk IDs) -> RAG result."""
+
+    def __init__(
+        self,
+        threshold: float = 0.92,
+        max_entries: int = 1000,
+        ttl_seconds: float = 3600
+    ):
+        """
+        Args:
+            threshold: Minimum cosine similarity between question embeddings
+            max_entries: Entries kept before least recently used ones are evicted
+            ttl_seconds: Maximum age of an entry (0 disables expiry)
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+
+        # Bumped on every invalidation; results computed before a bump are not stored
+        self.version = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(
+        self,
+        query_embedding: List[float],
+        chunk_ids: Iterable[str]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Find a cached result for a similar question over the same chunks.
+
+        Returns:
+            A copy of the cached result, or None
+        """
+        query = self._normalize(query_embedding)
+        chunk_ids = frozenset(chunk_ids)
+        now = time.time()
+
+        with self._lock:
+            best_id = None
+            best_similarity = self.threshold
+
+            for entry_id, entry in list(self._entries.items()):
+                if self.ttl_seconds and now - entry["created_at"] > self.ttl_seconds:
+                    del self._entries[entry_id]
+                    continue
+                if entry["chunk_ids"] != chunk_ids:
+                    continue
+
+                similarity = float(np.dot(query, entry["embedding"]))
+                if similarity >= best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            result = copy.deepcopy(self._entries[best_id]["result"])
+
+        logger.debug(f"Semantic cache hit (similarity={best_similarity:.3f})")
+        return result
+
+    def store(
+        self,
+        query_embedding: List[float],
+        chunk_ids: Iterable[str],
+        filenames: Iterable[str],
+        result: Dict[str, Any],
+        version: Optional[int] = None
+    ) -> None:
+        """
+        Cache a generated result for the question embedding and retrieved chunks.
+
+        Args:
+            version: `self.version` read before retrieval; the result is dropped
+                if documents changed since then
+        """
+        entry = {
+            "embedding": self._normalize(query_embedding),
+            "chunk_ids": frozenset(chunk_ids),
+            "filenames": frozenset(filenames),
+            "result": copy.deepcopy(result),
+            "created_at": time.time()
+        }
+
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, filename: Optional[str] = None) -> int:
+        """
+        Drop entries whose sources include `filename` (all entries when None).
+
+        Returns:
+            Number of entries removed
+        """
+        with self._lock:
+            if filename is None:
+                stale = list(self._entries)
+            else:
+                stale = [
+                    entry_id for entry_id, entry in self._entries.items()
+                    if filename in entry["filenames"]
+                ]
+
+            for entry_id in stale:
+                del self._entries[entry_id]
+
+            self.version += 1
+
+            self.invalidations += len(stale)
+
+        if stale:
+            logger.info(f"Semantic cache: invalidated {len(stale)} entries ({filename or 'all'})")
+
+        return len(stale)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get hit/miss counters and size.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "threshold": self.threshold
+            }
+
+    @classmethod
+    def from_settings(cls) -> "SemanticAnswerCache":
+        return cls(
+            threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+            max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.SEMANTIC_CACHE_TTL
+        )
@@ -0,0 +1,82 @@
+"""
+Storage backend interface for the document cache.
+
+A backend stores, per document (keyed by the SHA-256 of its content), the
+original file, its chunks, their embeddings and document metadata.
+"""
+
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+
+class StorageBackend(ABC):
+    """Abstract document cache storage (local filesystem, S3, ...)."""
+
+    @abstractmethod
+    def exists(self, document_id: str, file_extension: str) -> bool:
+        """
+        Check if all cache files exist for this document.
+        """
+
+    @abstractmethod
+    def save_document(self, document_id: str, file_path: Path, file_extension: str) -> None:
+        """
+        Save the original document.
+        """
+
+    @abstractmethod
+    def save_chunks(self, document_id: str, file_extension: str, chunks: Iterable[Dict]) -> None:
+        """
+        Save the document's chunks (iterated once, so they can be streamed from disk).
+        """
+
+    @abstractmethod
+    def save_embeddings(self, document_id: str, file_extension: str, embeddings: np.ndarray) -> None:
+        """
+        Save the chunk embeddings (one row per chunk; may be memory-mapped).
+        """
+
+    @abstractmethod
+    def save_metadata(self, document_id: str, file_extension: str, metadata: Dict) -> None:
+        """
+        Save document metadata.
+        """
+
+    @abstractmethod
+    def load_chunks(self, document_id: str, file_extension: str) -> List[Dict]:
+        """
+        Load the document's chunks.
+        """
+
+    @abstractmethod
+    def load_embeddings(self, document_id: str, file_extension: str) -> np.ndarray:
+        """
+        Load the chunk embeddings as a float32 array.
+        """
+
+    @abstractmethod
+    def load_metadata(self, document_id: str, file_extension: str) -> Dict:
+        """
+        Load document metadata.
+        """
+
+    @abstractmethod
+    def delete(self, document_id: str, file_extension: str) -> None:
+        """
+        Delete all cache files for a document.
+        """
+
+    @abstractmethod
+    def list_documents(self) -> List[str]:
+        """
+        List all cached document IDs.
+        """
+
+    @abstractmethod
+    def get_stats(self) -> Dict:
+        """
+        Get storage statistics.
+        """
@@ -0,0 +1,155 @@
+"""
+Token Counter
+Counts prompt tokens for context budgeting. Uses a HuggingFace `tokenizer.json`
+(e.g. the one shipped with the answer model) when TOKENIZER_PATH is set,
+otherwise a subword-aware estimate that is much closer to real counts than
+whitespace splitting.
+
+Estimates are calibrated against the prompt_eval_count Ollama reports for
+answered prompts: once enough prompts were seen, they are scaled by the
+observed ratio of real to estimated tokens. Counts stay labelled as
+estimates either way.
+"""
+
+from typing import Any, Dict, Optional
+import logging
+import re
+import threading
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Words, single digits (Gemma/Llama tokenizers split numbers into digits) and punctuation
+_PIECE_PATTERN = re.compile(r"[^\W\d_]+|\d|[^\w\s]|_")
+
+# Average characters per subword piece for long words
+_CHARS_PER_PIECE = 4
+
+# Prompts needed before estimates are scaled to Ollama's counts
+_CALIBRATION_MIN_SAMPLES = 5
+
+# Ignore prompts whose real/estimated ratio is implausible (e.g. partly cached prompts)
+_CALIBRATION_RATIO_RANGE = (0.25, 4.0)
+
+
+class TokenCounter:
+    """Counts tokens with a real tokenizer when available, else estimates."""
+
+    def __init__(self, tokenizer_path: Optional[str] = None):
+        """
+        Args:
+            tokenizer_path: Path to a HuggingFace tokenizer.json file
+        """
+        self.tokenizer = None
+        self.name = "estimate"
+
+        self._lock = threading.Lock()
+        self.calibration_samples = 0
+        self._estimated_tokens = 0
+        self._ollama_tokens = 0
+
+        if tokenizer_path:
+            try:
+                from tokenizers import Tokenizer
+
+                self.tokenizer = Tokenizer.from_file(tokenizer_path)
+                self.name = tokenizer_path
+            except Exception as e:
+                logger.warning(f"Could not load tokenizer {tokenizer_path}, estimating instead: {e}")
+        else:
+            logger.info("TOKENIZER_PATH is not set: prompt token counts are estimates")
+
+    @property
+    def estimated(self) -> bool:
+        """
+        True when counts are estimates (no tokenizer loaded).
+        """
+        return self.tokenizer is None
+
+    @property
+    def scale(self) -> float:
+        """
+        Factor applied to estimates (1.0 until calibrated).
+        """
+        with self._lock:
+            if self.calibration_samples < _CALIBRATION_MIN_SAMPLES or not self._estimated_tokens:
+                return 1.0
+            return self._ollama_tokens / self._estimated_tokens
+
+    def count(self, text: str) -> int:
+        """
+        Count tokens in text.
+        """
+        if not text:
+            return 0
+
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+
+        return round(self._estimate(text) * self.scale)
+
+    def calibrate(self, text: str, prompt_eval_count: Optional[int]) -> None:
+        """
+        Record the token count Ollama reported for a prompt.
+
+        Args:
+            text: Prompt text (all message contents)
+            prompt_eval_count: Tokens Ollama evaluated for it (None if not reported)
+        """
+        if self.tokenizer is not None or not prompt_eval_count:
+            return
+
+        estimate = self._estimate(text)
+        if not estimate:
+            return
+
+        low, high = _CALIBRATION_RATIO_RANGE
+        if not low <= prompt_eval_count / estimate <= high:
+            return
+
+        with self._lock:
+            self.calibration_samples += 1
+            self._estimated_tokens += estimate
+            self._ollama_tokens += prompt_eval_count
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get the tokenizer in use and the estimate calibration.
+        """
+        stats: Dict[str, Any] = {"tokenizer": self.name, "estimated": self.estimated}
+
+        if self.estimated:
+            stats["calibration"] = {
+                "samples": self.calibration_samples,
+                "scale": round(self.scale, 3)
+            }
+
+        return stats
+
+    @staticmethod
+    def _estimate(text: str) -> int:
+        """
+        Uncalibrated subword estimate.
+        """
+        tokens = 0
+        for piece in _PIECE_PATTERN.findall(text):
+            # Short words are usually one token; long ones split into subwords
+            tokens += max(1, -(-len(piece) // _CHARS_PER_PIECE)) if len(piece) > 6 else 1
+
+        return tokens
+
+
+_token_counter: Optional[TokenCounter] = None
+
+
+def get_token_counter() -> TokenCounter:
+    """
+    Get the shared token counter.
+    """
+    global _token_counter
+
+    if _token_counter is None:
+        _token_counter = TokenCounter(settings.TOKENIZER_PATH)
+
+    return _token_counter
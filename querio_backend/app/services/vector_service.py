@@ -3,39 +3,1038 @@ Vector Service
 Handles vector storage and retrieval using ChromaDB (local).
 """
 
-from typing import List, Dict, Any
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Dict, Any, Optional, Set, Tuple
 import logging
+import re
+import shutil
+import threading
+import time
+import weakref
 from pathlib import Path
 import chromadb
 import logging
 
+import numpy as np
+
+from app.config import settings
+from app.services.chunk_dedup import ChunkRegistry, dedup_row_id, get_chunk_registry, minhash_signature, row_chunk_hash
+from app.services.document_service import chunk_hash
+from app.services.flat_vector_index import FlatVectorIndex
+from app.services.ivf_vector_index import IVFVectorIndex
+from app.services.lexical_index import BM25Index, reciprocal_rank_fusion
+from app.services.metadata_index import KeyedMetadataIndex, matches_where, source_filter, uses_virtual_keys
+
 
 BASE_DIR = Path(__file__).resolve().parents[2]  # project root
 CHROMA_DIR = BASE_DIR / "data" / "chroma"
 logger = logging.getLogger("rag_app.vector_service")
 
+DEFAULT_NAMESPACE = "default"
+
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+
+_SIDE_INDEX_BUILD_PAGE = 5000
+
+# Chroma collection names: 3-63 chars, alphanumeric at both ends
+_NAMESPACE_PATTERN = re.compile(r"^[A-Za-z0-9](?:[A-Za-z0-9_-]{0,46}[A-Za-z0-9])?$")
+
+
+def validate_namespace(namespace: str) -> str:
+    """
+    Check a namespace name (letters, digits, "_" and "-"; at most 48 chars).
+    """
+    if not _NAMESPACE_PATTERN.match(namespace or ""):
+        raise ValueError(
+            f"Invalid namespace {namespace!r}: use up to 48 letters, digits, '_' or '-', "
+            "starting and ending with a letter or digit"
+        )
+    return namespace
+
+
+def upload_tag(uploaded_at: float) -> str:
+    """
+    Identifies an upload written in batches: its row IDs end with "@" + tag.
+    """
+    return f"{uploaded_at:.6f}"
+
+
+def _row_upload(row_id: str) -> Optional[str]:
+    """
+    The upload_tag() in a row ID, or None for a row stored in one piece.
+    """
+    _, at, tag = row_id.rpartition("@")
+    return tag if at else None
+
+
+# Per-generation state exchanged by VectorService.swap()
+_GENERATION_STATE = (
+    "generation", "_partitions", "_closed", "_closed_count", "_lexical", "_building", "_metadata", "collection"
+)
+
+
 class VectorService:
-    def __init__(self):
-        self.client = chromadb.PersistentClient(
-            path="data/chroma"
+    def __init__(self, backend: Optional[str] = None, generation: int = 0):
+        """
+        Each namespace (tenant) gets its own partition: a Chroma collection or
+        a flat/ivf index directory. Partitions are opened on first use and
+        closed when least recently used beyond VECTOR_MAX_OPEN_NAMESPACES or
+        idle for VECTOR_NAMESPACE_IDLE_SECONDS (checked on each access). The default namespace keeps
+        the original "documents" collection and is never closed.
+
+        Args:
+            backend: "chroma" (default), "flat" (exact in-process NumPy index) or
+                "ivf" (approximate inverted-file index); defaults to settings.VECTOR_BACKEND
+            generation: Index generation (0 = the original layout); each embedding
+                model migration builds the next one beside the live one
+        """
+        self.backend = backend or settings.VECTOR_BACKEND
+        self.generation = generation
+        self.max_open_namespaces = settings.VECTOR_MAX_OPEN_NAMESPACES
+        self.namespace_idle_seconds = settings.VECTOR_NAMESPACE_IDLE_SECONDS
+
+        self.client = chromadb.PersistentClient(path="data/chroma") if self.backend == "chroma" else None
+
+        # namespace -> (collection, last used), least recently used first
+        self._partitions: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._partitions_lock = threading.Lock()
+        # Closed flat/ivf indexes, alive only while a request still uses them
+        self._closed: "weakref.WeakValueDictionary[str, Any]" = weakref.WeakValueDictionary()
+        self._closed_count = 0
+
+        # Side indexes per open namespace, built from the partition on first use:
+        # BM25 (in the background), and for Chroma the metadata index (flat/ivf
+        # indexes keep their own)
+        self.lexical_enabled = settings.LEXICAL_INDEX_ENABLED
+        self.metadata_index_enabled = settings.METADATA_INDEX_ENABLED
+        self.prefilter_selectivity = settings.METADATA_PREFILTER_SELECTIVITY
+        self._lexical: Dict[str, BM25Index] = {}
+        # BM25 indexes still being built (writes already go to them)
+        self._building: Dict[str, BM25Index] = {}
+        self._metadata: Dict[str, KeyedMetadataIndex] = {}
+        self._side_lock = threading.RLock()
+
+        # Unique chunks and the file chunks they stand for (None = one row per file chunk)
+        self.chunk_registry: Optional[ChunkRegistry] = (
+            get_chunk_registry(settings.CHUNK_REGISTRY_PATH) if settings.CHUNK_DEDUP_ENABLED else None
+        )
+        # Near duplicates are merged only when set (None = exact copies only)
+        self.dedup_threshold = settings.CHUNK_DEDUP_THRESHOLD
+
+        # Writes are serialized so a replace never interleaves with another write
+        self._write_lock = threading.RLock()
+        # (namespace, filename) -> tags of its uploads being written in batches
+        self._uploads: Dict[Tuple[str, str], Set[str]] = {}
+        # Sections pinned to the current generation (embed + search); swap() waits for them
+        self._pin_condition = threading.Condition()
+        self._pins = 0
+        self._swapping = False
+        # Largest add/upsert Chroma accepts (flat/ivf have no limit)
+        self.max_batch_size = self.client.get_max_batch_size() if self.client is not None else None
+
+        self.collection = self.partition(DEFAULT_NAMESPACE)
+        self.lexical_index(DEFAULT_NAMESPACE)
+        self.metadata_index(DEFAULT_NAMESPACE)
+
+        logger.debug(f"Opened {self.backend} vector index generation {self.generation}")
+
+        # Called with a filename whenever its vectors change (None = everything)
+        self._listeners: List[Callable[[Optional[str]], None]] = []
+
+    # ---------- Partitions ----------
+
+    def partition(self, namespace: str = DEFAULT_NAMESPACE, create: bool = True):
+        """
+        Get the collection of a namespace, opening it if needed.
+
+        Args:
+            create: Create a missing partition; otherwise return None for it
+                (reads must not leave empty partitions behind)
+        """
+        validate_namespace(namespace)
+        now = time.time()
+
+        with self._partitions_lock:
+            if namespace in self._partitions:
+                collection = self._partitions[namespace][0]
+            elif namespace in self._closed:
+                # Closed while a request still held it: reuse that object, as a
+                # second index on the same files would diverge from it
+                collection = self._closed.pop(namespace)
+            elif create or self._partition_exists(namespace):
+                collection = self._open_partition(namespace)
+            else:
+                return None
+
+            self._partitions[namespace] = (collection, now)
+            self._partitions.move_to_end(namespace)
+            evicted = self._evict(now, keep=namespace)
+
+        for closed, lexical in evicted:
+            self._save_lexical_index(closed, lexical)
+
+        return collection
+
+    def _partition_location(self, namespace: str) -> str:
+        """
+        Collection name (chroma) or index directory (flat/ivf) of a namespace.
+        Later generations add a ".g<n>" suffix (chroma) or live under
+        FLAT_INDEX_DIR/generation-<n> (flat/ivf).
+        """
+        if self.backend == "chroma":
+            name = "documents" if namespace == DEFAULT_NAMESPACE else f"ns_{namespace}"
+            return f"{name}{self._collection_suffix()}"
+
+        if namespace == DEFAULT_NAMESPACE:
+            return str(self._generation_root() / ("documents_ivf" if self.backend == "ivf" else "documents"))
+        return str(self._namespace_root() / namespace)
+
+    def _registry_scope(self, namespace: str) -> str:
+        # Unique per backend, generation and namespace
+        return f"{self.backend}:{self._partition_location(namespace)}"
+
+    def _collection_suffix(self) -> str:
+        # Namespaces cannot contain ".", so the suffix is unambiguous
+        return f".g{self.generation}" if self.generation else ""
+
+    def _generation_root(self) -> Path:
+        root = Path(settings.FLAT_INDEX_DIR)
+        return root / f"generation-{self.generation}" if self.generation else root
+
+    def _namespace_root(self) -> Path:
+        """
+        Directory holding the flat/ivf partitions of non-default namespaces.
+        """
+        return self._generation_root() / ("namespaces_ivf" if self.backend == "ivf" else "namespaces")
+
+    def _partition_exists(self, namespace: str) -> bool:
+        location = self._partition_location(namespace)
+        if self.backend == "chroma":
+            return location in [getattr(c, "name", c) for c in self.client.list_collections()]
+        return Path(location).exists()
+
+    def _open_partition(self, namespace: str):
+        location = self._partition_location(namespace)
+        name = "documents" if namespace == DEFAULT_NAMESPACE else f"ns_{namespace}"
+
+        if self.backend == "chroma":
+            return self.client.get_or_create_collection(name=location)
+
+        options = dict(
+            path=location,
+            name=name,
+            dtype=settings.FLAT_INDEX_DTYPE,
+            threads=settings.FLAT_INDEX_THREADS,
+            rescore=settings.FLAT_INDEX_RESCORE,
+            rescore_factor=settings.FLAT_INDEX_RESCORE_FACTOR,
+            prefix_dims=settings.MATRYOSHKA_DIMS,
+            prefix_factor=settings.MATRYOSHKA_CANDIDATE_FACTOR,
+            metadata_index=self.metadata_index_enabled,
+            prefilter_selectivity=self.prefilter_selectivity
         )
 
-        self.collection = self.client.get_or_create_collection(
-            name="documents"
+        if self.backend == "ivf":
+            return IVFVectorIndex(
+                nlist=settings.IVF_NLIST,
+                nprobe=settings.IVF_NPROBE,
+                train_min=settings.IVF_TRAIN_MIN,
+                **options
+            )
+
+        return FlatVectorIndex(**options)
+
+    def _evict(self, now: float, keep: str) -> List[Tuple[str, BM25Index]]:
+        """
+        Close partitions beyond the open limit or idle too long (never the
+        default namespace or `keep`, the one just requested).
+
+        Returns:
+            (namespace, BM25 index) of the closed partitions with a complete
+            BM25 index, to save once the partitions lock is released
+        """
+        open_count = len(self._partitions) - 1  # the default does not count
+        evicted = []
+
+        for namespace, (collection, last_used) in list(self._partitions.items()):
+            if namespace in (DEFAULT_NAMESPACE, keep):
+                continue
+
+            idle = self.namespace_idle_seconds and now - last_used > self.namespace_idle_seconds
+            if open_count <= self.max_open_namespaces and not idle:
+                continue
+
+            del self._partitions[namespace]
+            lexical = self._lexical.pop(namespace, None)
+            if lexical is not None and self._building.pop(namespace, None) is None:
+                evicted.append((namespace, lexical))
+            self._metadata.pop(namespace, None)
+            open_count -= 1
+            self._closed_count += 1
+
+            if hasattr(collection, "close"):
+                collection.close()
+                self._closed[namespace] = collection
+            logger.info(f"Closed idle vector namespace '{namespace}'")
+
+        return evicted
+
+    def lexical_index(self, namespace: str = DEFAULT_NAMESPACE, building: bool = False) -> Optional[BM25Index]:
+        """
+        Get the namespace's BM25 index. The first call loads the copy saved
+        when the namespace was last closed, or starts building the index from
+        the stored chunks in a background thread. Until the build finishes,
+        searches get None and rank by vector alone.
+
+        Args:
+            building: Also return an index still being built (writes must
+                reach it)
+
+        Returns:
+            The index; None when disabled, still building, or the namespace
+            does not exist
+        """
+        if not self.lexical_enabled:
+            return None
+        index = self._lexical.get(namespace)
+        if index is None:
+            index = self._open_lexical_index(namespace)
+        if index is None or (not building and namespace in self._building):
+            return None
+        return index
+
+    def metadata_index(self, namespace: str = DEFAULT_NAMESPACE) -> Optional[KeyedMetadataIndex]:
+        """
+        Get the namespace's metadata index (Chroma only: flat/ivf indexes
+        maintain their own), building it the first time.
+        """
+        if self.backend != "chroma" or not self.metadata_index_enabled:
+            return None
+        index = self._metadata.get(namespace)
+        return index if index is not None else self._build_metadata_index(namespace)
+
+    def _lexical_path(self, namespace: str) -> Path:
+        return Path(settings.LEXICAL_INDEX_DIR) / (re.sub(r"[^A-Za-z0-9_.-]+", "_", self._registry_scope(namespace)) + ".bm25")
+
+    def _open_lexical_index(self, namespace: str) -> Optional[BM25Index]:
+        """
+        Load or start building a namespace's BM25 index (see lexical_index).
+        """
+        builder = None
+        with self._side_lock:
+            index = self._lexical.get(namespace)
+            if index is not None:
+                return index
+            collection = self.partition(namespace, create=False)
+            if collection is None:
+                return None
+
+            index = self._load_lexical_index(namespace, collection)
+            if index is None:
+                index = BM25Index()
+                self._building[namespace] = index
+                builder = threading.Thread(
+                    target=self._build_lexical_index,
+                    args=(namespace, collection, index, self._lexical, self._building),
+                    name=f"bm25-{namespace}",
+                    daemon=True
+                )
+            self._lexical[namespace] = index
+
+        if builder is not None:
+            builder.start()
+        return index
+
+    def _load_lexical_index(self, namespace: str, collection) -> Optional[BM25Index]:
+        """
+        The BM25 index saved when the namespace was closed, if it still
+        matches the partition. The file is removed: it is only valid until
+        the namespace changes.
+        """
+        path = self._lexical_path(namespace)
+        if not path.exists():
+            return None
+        try:
+            index = BM25Index.load(path)
+        except Exception as e:
+            logger.warning(f"Ignoring saved BM25 index {path}: {e}")
+            return None
+        finally:
+            path.unlink(missing_ok=True)
+
+        if index.count() != collection.count():
+            logger.info(f"Saved BM25 index of namespace '{namespace}' is out of date, rebuilding it")
+            return None
+        logger.info(f"Loaded BM25 index for namespace '{namespace}': {index.count()} chunks")
+        return index
+
+    def _save_lexical_index(self, namespace: str, index: BM25Index):
+        """
+        Save a closed namespace's BM25 index for its next opening (unless it
+        was opened again meanwhile).
+        """
+        with self._side_lock:
+            if namespace in self._lexical:
+                return
+            try:
+                index.save(self._lexical_path(namespace))
+            except OSError as e:
+                logger.warning(f"Could not save the BM25 index of namespace '{namespace}': {e}")
+
+    def _build_lexical_index(
+        self,
+        namespace: str,
+        collection,
+        index: BM25Index,
+        lexical: Dict[str, BM25Index],
+        building: Dict[str, BM25Index]
+    ):
+        """
+        Fill a registered BM25 index from the stored chunks (background
+        thread). The IDs are listed first and their rows read page by page,
+        each page under the write lock: writes in between reach the index
+        themselves, and a page read after them sees their result. Stops
+        early when the namespace is closed or the generation swapped.
+        """
+        started = time.perf_counter()
+
+        def current() -> bool:
+            return self._lexical is lexical and lexical.get(namespace) is index
+
+        try:
+            with self._write_lock:
+                ids = collection.get(include=[])["ids"] if current() else []
+
+            for start in range(0, len(ids), _SIDE_INDEX_BUILD_PAGE):
+                with self._write_lock:
+                    if not current():
+                        break
+                    page = collection.get(
+                        ids=ids[start:start + _SIDE_INDEX_BUILD_PAGE], include=["documents", "metadatas"]
+                    )
+                    index.delete_ids(page["ids"])
+                    index.add(page["ids"], page["documents"], [(m or {}).get("filename", "") for m in page["metadatas"]])
+        except Exception:
+            logger.exception(f"Building the BM25 index of namespace '{namespace}' failed")
+            with self._side_lock:
+                if lexical.get(namespace) is index:
+                    del lexical[namespace]
+            return
+        finally:
+            with self._side_lock:
+                if building.get(namespace) is index:
+                    del building[namespace]
+
+        if current():
+            logger.info(
+                f"Built BM25 index for namespace '{namespace}': {index.count()} chunks "
+                f"in {time.perf_counter() - started:.1f}s"
+            )
+
+    def _build_metadata_index(self, namespace: str) -> Optional[KeyedMetadataIndex]:
+        """
+        Build the namespace's metadata index, reading its chunks by ID page by page.
+        """
+        with self._write_lock, self._side_lock:
+            metadata = self._metadata.get(namespace)
+            collection = self.partition(namespace, create=False) if metadata is None else None
+            if collection is None:
+                return metadata
+
+            metadata = KeyedMetadataIndex()
+            started = time.perf_counter()
+
+            for page in self._pages(collection, ["metadatas"]):
+                metadata.add_ids(page["ids"], [m or {} for m in page["metadatas"]])
+            self._metadata[namespace] = metadata
+
+        logger.info(
+            f"Built metadata index for namespace '{namespace}': {metadata.count()} chunks "
+            f"in {time.perf_counter() - started:.1f}s"
         )
+        return metadata
+
+    def _reset_partition(self, namespace: str):
+        """
+        Empty a partition: Chroma drops and recreates the collection, flat/ivf
+        remove their files. Missing partitions are left missing.
+        """
+        collection = self.partition(namespace, create=False)
+        if collection is None:
+            return
+
+        if self.backend != "chroma":
+            collection.reset()
+            return
+
+        location = self._partition_location(namespace)
+        with self._partitions_lock:
+            self.client.delete_collection(name=location)
+            collection = self.client.get_or_create_collection(name=location)
+            self._partitions[namespace] = (collection, time.time())
+            if namespace == DEFAULT_NAMESPACE:
+                self.collection = collection
+
+    def list_namespaces(self) -> List[str]:
+        """
+        All namespaces with a partition, open or not.
+        """
+        if self.backend == "chroma":
+            suffix = self._collection_suffix()
+            names = [getattr(c, "name", c) for c in self.client.list_collections()]
+            namespaces = {
+                n[3:len(n) - len(suffix)] for n in names
+                if n.startswith("ns_") and (n.endswith(suffix) if suffix else "." not in n)
+            }
+        else:
+            root = self._namespace_root()
+            namespaces = {d.name for d in root.iterdir() if d.is_dir()} if root.exists() else set()
+
+        with self._partitions_lock:
+            namespaces.update(self._partitions)
+
+        namespaces.discard(DEFAULT_NAMESPACE)
+        return [DEFAULT_NAMESPACE] + sorted(namespaces)
+
+    def get_namespace_stats(self) -> Dict[str, Any]:
+        """
+        Per-namespace vector counts and sizes.
+
+        Closed flat/ivf partitions report the count recorded when they were
+        last closed; Chroma shares one database, so no per-collection size.
+        """
+        with self._partitions_lock:
+            open_partitions = {ns: collection for ns, (collection, _) in self._partitions.items()}
+
+        namespaces = []
+        for namespace in self.list_namespaces():
+            location = self._partition_location(namespace)
+            collection = open_partitions.get(namespace)
+
+            if self.backend == "chroma":
+                if collection is None:
+                    collection = self.client.get_collection(name=location)
+                count, size = collection.count(), None
+            elif collection is not None:
+                count, size = collection.count(), collection.size_bytes()
+            else:
+                count = FlatVectorIndex.stored_count(location)
+                size = sum(f.stat().st_size for f in Path(location).iterdir() if f.is_file())
+
+            namespaces.append({
+                "namespace": namespace,
+                "open": namespace in open_partitions,
+                "vector_count": count,
+                "size_bytes": size
+            })
+
+        return {
+            "backend": self.backend,
+            "open": len(open_partitions),
+            "max_open": self.max_open_namespaces,
+            "idle_seconds": self.namespace_idle_seconds,
+            "closed_since_start": self._closed_count,
+            "namespaces": namespaces
+        }
+
+    # ---------- Generations ----------
+
+    @contextmanager
+    def pinned(self) -> Iterator[None]:
+        """
+        Keep the current generation for the duration of the block (a query
+        embedded with one model must be searched in that model's index).
+        """
+        with self._pin_condition:
+            while self._swapping:
+                self._pin_condition.wait()
+            self._pins += 1
+        try:
+            yield
+        finally:
+            with self._pin_condition:
+                self._pins -= 1
+                if not self._pins:
+                    self._pin_condition.notify_all()
+
+    def swap(self, other: "VectorService", on_swap: Optional[Callable[[], None]] = None):
+        """
+        Atomically exchange generations with another service of the same
+        backend: this service (and everyone holding it) reads and writes
+        `other`'s partitions from now on, and `other` gets the previous ones.
+        Waits for pinned sections to finish; new ones wait for the swap.
+
+        Args:
+            on_swap: Called while nothing is pinned, right after the exchange
+                (e.g. to switch the query embedding model)
+        """
+        if other.backend != self.backend:
+            raise ValueError(f"Cannot swap a {self.backend} index with a {other.backend} index")
+
+        with self._pin_condition:
+            self._swapping = True
+            while self._pins:
+                self._pin_condition.wait()
+
+        try:
+            with self._write_lock, other._write_lock, self._side_lock, other._side_lock, \
+                    self._partitions_lock, other._partitions_lock:
+                for name in _GENERATION_STATE:
+                    mine = getattr(self, name)
+                    setattr(self, name, getattr(other, name))
+                    setattr(other, name, mine)
+                if on_swap is not None:
+                    on_swap()
+        finally:
+            with self._pin_condition:
+                self._swapping = False
+                self._pin_condition.notify_all()
+
+        logger.warning(f"Switched vector index to generation {self.generation}")
+
+        self._notify(None)
+
+    def drop(self):
+        """
+        Delete every partition of this generation (the service is unusable
+        afterwards).
+        """
+        with self._write_lock:
+            namespaces = self.list_namespaces()
+            with self._partitions_lock:
+                open_partitions = [collection for collection, _ in self._partitions.values()]
+                self._partitions.clear()
+                self._lexical.clear()
+                self._building.clear()
+                self._metadata.clear()
 
-        print("📦 Chroma collection count:", self.collection.count())
+            for collection in open_partitions:
+                if hasattr(collection, "close"):
+                    collection.close()
 
+            for namespace in namespaces:
+                location = self._partition_location(namespace)
+                self._lexical_path(namespace).unlink(missing_ok=True)
+                if self.chunk_registry is not None:
+                    self.chunk_registry.clear(self._registry_scope(namespace))
+                if self.backend == "chroma":
+                    try:
+                        self.client.delete_collection(name=location)
+                    except Exception:
+                        pass  # never created
+                else:
+                    shutil.rmtree(location, ignore_errors=True)
+
+            if self.backend != "chroma":
+                shutil.rmtree(self._namespace_root(), ignore_errors=True)
+                if self.generation:
+                    shutil.rmtree(self._generation_root(), ignore_errors=True)
+
+        logger.warning(f"Dropped vector index generation {self.generation}")
+
+    def add_listener(self, listener: Callable[[Optional[str]], None]):
+        """
+        Register a callback for document changes (used for cache invalidation).
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, filename: Optional[str]):
+        for listener in self._listeners:
+            try:
+                listener(filename)
+            except Exception:
+                logger.exception("Vector change listener failed")
 
     def add_documents(
         self,
         chunks: List[Dict[str, Any]],
         embeddings: List[List[float]],
         filename: str,
-        namespace: str = "default"  # kept for compatibility
+        namespace: str = DEFAULT_NAMESPACE,
+        uploaded_at: Optional[float] = None
+    ):
+        """
+        Store document chunks with embeddings in the namespace's partition.
+        Chunks already stored under the same IDs are overwritten (upsert);
+        with chunk deduplication the file's previous chunks are replaced.
+        """
+        ids, documents, metadatas = self.chunk_rows(chunks, embeddings, filename, uploaded_at)
+        self.upsert_rows(ids, embeddings, documents, metadatas, namespace)
+
+    def upsert_rows(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        namespace: str = DEFAULT_NAMESPACE
+    ):
+        """
+        Upsert prepared rows (see chunk_rows), possibly from several files,
+        and update the side indexes. Bulk loads use it to write large batches.
+
+        With chunk deduplication the rows of each file replace whatever that
+        file had stored, so a file's rows must all be in one call.
+        """
+        if self.chunk_registry is not None:
+            files: Dict[str, Tuple[List[List[float]], List[str], List[Dict[str, Any]]]] = {}
+            for embedding, document, metadata in zip(embeddings, documents, metadatas):
+                rows = files.setdefault(metadata["filename"], ([], [], []))
+                rows[0].append(embedding)
+                rows[1].append(document)
+                rows[2].append(metadata)
+
+            with self._write_lock:
+                self._write_deduplicated(namespace, files)
+
+            for filename in files:
+                self._notify(filename)
+            return
+
+        with self._write_lock:
+            collection = self.partition(namespace)
+            self._upsert(collection, ids, embeddings, documents, metadatas)
+
+            lexical = self.lexical_index(namespace, building=True)
+            if lexical is not None:
+                lexical.delete_ids(ids)
+                lexical.add(ids, documents, [m["filename"] for m in metadatas])
+
+            metadata_index = self.metadata_index(namespace)
+            if metadata_index is not None:
+                metadata_index.remove_ids(ids)
+                metadata_index.add_ids(ids, metadatas)
+
+        logger.debug(f"Upserted {len(ids)} rows into namespace {namespace}")
+
+        for filename in dict.fromkeys(m["filename"] for m in metadatas):
+            self._notify(filename)
+
+    def replace_document(
+        self,
+        chunks: List[Dict[str, Any]],
+        embeddings: List[List[float]],
+        filename: str,
+        namespace: str = DEFAULT_NAMESPACE,
+        uploaded_at: Optional[float] = None
+    ):
+        """
+        Replace every stored chunk of a file with a new version (re-upload).
+
+        Flat/ivf apply it as one change: searches see the old or the new
+        version. Chroma upserts the new chunks first and then deletes the old
+        ones left over, so the file is never missing, though a search in
+        between may also see old chunks beyond the new version's length.
+        """
+        ids, documents, metadatas = self.chunk_rows(chunks, embeddings, filename, uploaded_at)
+
+        with self._write_lock:
+            if self.chunk_registry is not None:
+                self._write_deduplicated(namespace, {filename: (embeddings, documents, metadatas)})
+                self._notify(filename)
+                return
+
+            collection = self.partition(namespace)
+
+            if self.backend == "chroma":
+                stale = set(self._filename_ids(collection, namespace, filename)) - set(ids)
+                self._upsert(collection, ids, embeddings, documents, metadatas)
+                stale = sorted(stale)
+                for start in range(0, len(stale), self.max_batch_size):
+                    collection.delete(ids=stale[start:start + self.max_batch_size])
+            else:
+                collection.replace(ids, embeddings, documents, metadatas, where={"filename": filename})
+
+            lexical = self.lexical_index(namespace, building=True)
+            if lexical is not None:
+                lexical.delete_filename(filename)
+                lexical.delete_ids(ids)
+                lexical.add(ids, documents, [filename] * len(ids))
+
+            metadata_index = self.metadata_index(namespace)
+            if metadata_index is not None:
+                metadata_index.remove_ids(self._filename_ids(collection, namespace, filename))
+                metadata_index.remove_ids(ids)
+                metadata_index.add_ids(ids, metadatas)
+
+        logger.info(f"Replaced {filename} with {len(ids)} chunks ({namespace})")
+
+        self._notify(filename)
+
+    def write_chunks(
+        self,
+        chunks: List[Dict[str, Any]],
+        embeddings: List[List[float]],
+        filename: str,
+        namespace: str,
+        uploaded_at: float
+    ):
+        """
+        Write one batch of a new version of a file that is stored in batches
+        (large uploads). The rows are stored under IDs of this upload (see
+        upload_tag) beside the earlier version, which finish_document() then
+        replaces. In between, searches see both.
+
+        Args:
+            uploaded_at: Upload time, the same for every batch of the upload
+        """
+        upload = upload_tag(uploaded_at)
+        ids, documents, metadatas = self.chunk_rows(chunks, embeddings, filename, uploaded_at, upload)
+
+        with self._write_lock:
+            self._uploads.setdefault((namespace, filename), set()).add(upload)
+            if self.chunk_registry is not None:
+                self._write_deduplicated(namespace, {filename: (embeddings, documents, metadatas)}, upload=upload)
+
+        if self.chunk_registry is None:
+            self.upsert_rows(ids, embeddings, documents, metadatas, namespace)
+        else:
+            self._notify(filename)
+
+    def finish_document(
+        self,
+        filename: str,
+        namespace: str,
+        chunk_count: Optional[int],
+        uploaded_at: float
     ):
         """
-        Store document chunks with embeddings in ChromaDB.
+        Complete a file written with write_chunks(): switch it over to the
+        upload's rows and delete the earlier version (and, with chunk
+        deduplication, the unique chunks no longer referenced and rows stored
+        before deduplication). With chunk_count None (the upload failed) the
+        upload's rows are deleted instead and the earlier version stays.
+
+        Rows left by other uploads of the file that are no longer being
+        written (a process that stopped mid-upload) are deleted too.
+        """
+        upload = upload_tag(uploaded_at)
+
+        with self._write_lock:
+            writing = self._uploads.get((namespace, filename), set())
+            writing.discard(upload)
+            if not writing:
+                self._uploads.pop((namespace, filename), None)
+
+            collection = self.partition(namespace)
+
+            if self.chunk_registry is not None:
+                registry = self.chunk_registry
+                scope = self._registry_scope(namespace)
+                with registry.transaction():
+                    if chunk_count is None:
+                        touched = registry.drop_uploads(scope, filename, [upload])
+                        legacy = []
+                    else:
+                        touched = registry.commit_upload(scope, filename, upload, keep=writing)
+                        legacy = self._legacy_ids(collection, namespace, filename)
+                    written, deleted = self._sync_unique_chunks(namespace, collection, touched, {}, legacy)
+                logger.info(
+                    f"Finished {filename} ({namespace}) at {chunk_count} chunks: "
+                    f"{len(written)} unique chunks rewritten, {len(deleted)} deleted"
+                )
+                self._notify(filename)
+                return
+
+            if chunk_count is None:
+                stale = [
+                    row_id for row_id in self._filename_ids(collection, namespace, filename)
+                    if _row_upload(row_id) == upload
+                ]
+            else:
+                stale = [
+                    row_id for row_id in self._filename_ids(collection, namespace, filename)
+                    if _row_upload(row_id) != upload and _row_upload(row_id) not in writing
+                ]
+            batch = self.max_batch_size or max(len(stale), 1)
+            for start in range(0, len(stale), batch):
+                collection.delete(ids=stale[start:start + batch])
+
+            lexical = self.lexical_index(namespace, building=True)
+            if lexical is not None:
+                lexical.delete_ids(stale)
+
+            metadata_index = self.metadata_index(namespace)
+            if metadata_index is not None:
+                metadata_index.remove_ids(stale)
+
+        logger.info(f"Finished {filename} ({namespace}) at {chunk_count} chunks: {len(stale)} stale chunks deleted")
+        self._notify(filename)
+
+    def _write_deduplicated(
+        self,
+        namespace: str,
+        files: Dict[str, Tuple[List[List[float]], List[str], List[Dict[str, Any]]]],
+        upload: Optional[str] = None
+    ):
+        """
+        Replace whole files (or write one batch of each, see upload) through
+        the chunk registry, with the write lock held. Each file chunk becomes
+        a reference to a unique chunk: an existing one it duplicates, or a new
+        row stored under dedup_row_id(hash). Rows stored before deduplication
+        for these files are deleted.
+
+        Args:
+            files: filename -> (embeddings, texts, metadatas) of its new
+                version, as made by chunk_rows (empty lists delete the file)
+            upload: The rows are one batch of an upload of each file
+                (write_chunks): they are staged as that upload's references,
+                which finish_document() makes the file's
+        """
+        registry = self.chunk_registry
+        scope = self._registry_scope(namespace)
+        collection = self.partition(namespace)
+
+        with registry.transaction():
+            # Unique chunk -> (embedding, text) for chunks new in this write
+            supplied: Dict[str, Tuple[List[float], str]] = {}
+            touched: Set[str] = set()
+            legacy: List[str] = []
+
+            for filename, (embeddings, documents, metadatas) in files.items():
+                if upload is None:
+                    touched.update(registry.remove_file(scope, filename))
+                    legacy.extend(self._legacy_ids(collection, namespace, filename))
+
+                for embedding, text, metadata in zip(embeddings, documents, metadatas):
+                    signature = minhash_signature(text)
+                    canonical = registry.match(
+                        scope, metadata["chunk_hash"], signature, self.dedup_threshold, filename
+                    )
+                    if canonical is None:
+                        canonical = metadata["chunk_hash"]
+                        registry.add_chunk(scope, canonical, signature)
+                    supplied.setdefault(canonical, (embedding, text))
+                    if upload is not None:
+                        registry.stage_reference(scope, filename, upload, metadata, text, canonical)
+                    else:
+                        registry.add_reference(scope, filename, metadata, text, canonical)
+                    touched.add(canonical)
+
+            ids, deleted = self._sync_unique_chunks(namespace, collection, touched, supplied, legacy)
+
+        file_chunks = sum(len(rows[1]) for rows in files.values())
+        logger.info(
+            f"Stored {len(files)} file(s) with {file_chunks} chunks ({namespace}): "
+            f"{len(ids)} unique chunks written, {len(deleted)} deleted"
+        )
+
+    def _legacy_ids(self, collection, namespace: str, filename: str) -> List[str]:
+        """
+        IDs of a file's rows stored before chunk deduplication.
+        """
+        registry = self.chunk_registry
+        scope = self._registry_scope(namespace)
+        return [
+            row_id for row_id in self._filename_ids(collection, namespace, filename)
+            if row_chunk_hash(row_id) is None or not registry.has_chunk(scope, row_chunk_hash(row_id))
+        ]
+
+    def _sync_unique_chunks(
+        self,
+        namespace: str,
+        collection,
+        touched: Set[str],
+        supplied: Dict[str, Tuple[List[float], str]],
+        deleted: List[str]
+    ) -> Tuple[List[str], List[str]]:
+        """
+        Rewrite every unique chunk whose references changed with the metadata
+        of its primary file chunk plus "sources" (newline-separated files) and
+        "duplicates" (reference count), or delete it when nothing references
+        it any more (called inside a registry transaction). A unique chunk
+        only referenced by uploads still being written takes its metadata
+        from their staged references.
+
+        Args:
+            supplied: Embedding and text of unique chunks not stored yet
+            deleted: Other row IDs to delete
+
+        Returns:
+            (row IDs written, row IDs deleted)
+        """
+        registry = self.chunk_registry
+        scope = self._registry_scope(namespace)
+
+        stored: Dict[str, Tuple[Any, str, Dict[str, Any]]] = {}
+        lookup = [dedup_row_id(canonical) for canonical in sorted(touched)]
+        for start in range(0, len(lookup), _SIDE_INDEX_BUILD_PAGE):
+            rows = collection.get(
+                ids=lookup[start:start + _SIDE_INDEX_BUILD_PAGE],
+                include=["embeddings", "documents", "metadatas"]
+            )
+            for i, row_id in enumerate(rows["ids"]):
+                stored[row_id] = (rows["embeddings"][i], rows["documents"][i], rows["metadatas"][i] or {})
+
+        ids, embeddings, documents, metadatas = [], [], [], []
+        deleted = list(deleted)
+        for canonical in sorted(touched):
+            row_id = dedup_row_id(canonical)
+            current = stored.get(row_id)
+            references = registry.references(scope, canonical)
+            staged = not references
+            if staged:
+                references = registry.references(scope, canonical, staged=True)
+            embedding = current[0] if current is not None else supplied.get(canonical, (None,))[0]
+
+            if not references or embedding is None:
+                registry.remove_chunk(scope, canonical)
+                if current is not None:
+                    deleted.append(row_id)
+                continue
+
+            # Keep the current primary file chunk while it is still referenced
+            primary = references[0]
+            if current is not None and (current[2].get("filename"), current[2].get("chunk_index")) in references:
+                primary = (current[2]["filename"], current[2]["chunk_index"])
+            primary_metadata, text = registry.reference(scope, *primary, staged=staged)
+            metadata = {
+                **primary_metadata,
+                "sources": "\n".join(dict.fromkeys(filename for filename, _ in references)),
+                "duplicates": len(references)
+            }
+            if current is not None and current[1] == text and current[2] == metadata:
+                continue
+
+            ids.append(row_id)
+            embeddings.append(np.asarray(embedding, dtype=np.float32).tolist())
+            documents.append(text)
+            metadatas.append(metadata)
+
+        if self.backend == "chroma":
+            self._upsert(collection, ids, embeddings, documents, metadatas)
+            for start in range(0, len(deleted), self.max_batch_size):
+                collection.delete(ids=deleted[start:start + self.max_batch_size])
+        else:
+            collection.replace(ids, embeddings, documents, metadatas, delete_ids=deleted)
+
+        changed = ids + deleted
+        lexical = self.lexical_index(namespace, building=True)
+        if lexical is not None:
+            lexical.delete_ids(changed)
+            lexical.add(ids, documents, [m["filename"] for m in metadatas])
+
+        metadata_index = self.metadata_index(namespace)
+        if metadata_index is not None:
+            metadata_index.remove_ids(changed)
+            metadata_index.add_ids(ids, metadatas)
+
+        return ids, deleted
+
+    @staticmethod
+    def chunk_rows(
+        chunks: List[Dict[str, Any]],
+        embeddings: List[List[float]],
+        filename: str,
+        uploaded_at: Optional[float] = None,
+        upload: Optional[str] = None
+    ) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+        """
+        IDs, texts and metadata stored for a file's chunks.
+
+        Args:
+            uploaded_at: Upload time to record (epoch seconds; default now)
+            upload: upload_tag() of an upload written in batches, appended to the IDs
         """
         if len(chunks) != len(embeddings):
             raise ValueError(
@@ -45,11 +1044,10 @@ class VectorService:
         ids = []
         documents = []
         metadatas = []
+        uploaded_at = uploaded_at if uploaded_at is not None else time.time()
 
-        for chunk, embedding in zip(chunks, embeddings):
-            vector_id = f"{filename}_{chunk['chunk_index']}"
-
-            ids.append(vector_id)
+        for chunk in chunks:
+            ids.append(f"{filename}_{chunk['chunk_index']}" + (f"@{upload}" if upload else ""))
             documents.append(chunk["text"])
 
             metadatas.append({
@@ -59,77 +1057,592 @@ class VectorService:
                 "start_char": chunk.get("start_char", 0),
                 "end_char": chunk.get("end_char", 0),
                 "headings": " > ".join(chunk.get("headings", [])) if chunk.get("headings") else "",
-                "page_numbers": ",".join(map(str, chunk.get("page_numbers", []))) if chunk.get("page_numbers") else ""
+                "page_numbers": ",".join(map(str, chunk.get("page_numbers", []))) if chunk.get("page_numbers") else "",
+                "uploaded_at": uploaded_at,
+                "chunk_hash": chunk_hash(chunk["text"])
             })
 
+        return ids, documents, metadatas
 
-        self.collection.add(
-            ids=ids,
-            embeddings=embeddings,
-            documents=documents,
-            metadatas=metadatas
+    def list_filenames(self, namespace: str = DEFAULT_NAMESPACE) -> List[str]:
+        """
+        Files with chunks stored in a namespace.
+        """
+        collection = self.partition(namespace, create=False)
+        if collection is None:
+            return []
+
+        filenames = set()
+        for page in self._pages(collection, ["metadatas"]):
+            for metadata in page["metadatas"]:
+                metadata = metadata or {}
+                # Deduplicated chunks list every file they came from
+                filenames.update(metadata["sources"].split("\n") if metadata.get("sources") else [metadata.get("filename")])
+
+        filenames.discard(None)
+        return sorted(filenames)
+
+    def get_document(
+        self,
+        filename: str,
+        namespace: str = DEFAULT_NAMESPACE
+    ) -> Tuple[List[Dict[str, Any]], Optional[float]]:
+        """
+        A stored file's chunks, rebuilt from their text and metadata (the
+        inverse of chunk_rows), in chunk order.
+
+        Returns:
+            (chunks, upload time); no chunks when the file is not stored
+        """
+        collection = self.partition(namespace, create=False)
+        if collection is None:
+            return [], None
+
+        references = (
+            self.chunk_registry.file_chunks(self._registry_scope(namespace), filename)
+            if self.chunk_registry is not None else []
         )
-        # logger.info(f"Added {len(ids)} chunks to ChromaDB")
-        print("📦 Count after add:", self.collection.count())
+        if references:
+            rows = {
+                "documents": [r["text"] for r in references],
+                "metadatas": [r["metadata"] for r in references]
+            }
+        else:
+            rows = collection.get(where={"filename": filename}, include=["documents", "metadatas"])
+
+        chunks = []
+        uploaded_at = None
+        for text, metadata in zip(rows["documents"], rows["metadatas"]):
+            metadata = metadata or {}
+            uploaded_at = metadata.get("uploaded_at", uploaded_at)
+            chunks.append({
+                "chunk_index": metadata["chunk_index"],
+                "text": text,
+                "token_count": metadata.get("token_count", 0),
+                "start_char": metadata.get("start_char", 0),
+                "end_char": metadata.get("end_char", 0),
+                "headings": metadata["headings"].split(" > ") if metadata.get("headings") else [],
+                "page_numbers": [int(p) for p in metadata["page_numbers"].split(",")] if metadata.get("page_numbers") else []
+            })
+
+        chunks.sort(key=lambda c: c["chunk_index"])
+        return chunks, uploaded_at
+
+    def iter_chunk_embeddings(
+        self,
+        filename: str,
+        namespace: str = DEFAULT_NAMESPACE
+    ) -> Iterator[Tuple[List[str], np.ndarray]]:
+        """
+        Stored embeddings of a file's chunks by chunk hash, so a new version
+        only embeds the chunks whose text changed. Read in pages, so a large
+        file's embeddings are never all in memory.
+
+        Yields:
+            (chunk hashes, float32 embeddings) of up to 5000 chunks
+        """
+        collection = self.partition(namespace, create=False)
+        if collection is None:
+            return
+
+        filename_ids = self._filename_ids(collection, namespace, filename)
+        for rows in self._pages(collection, ["documents", "metadatas", "embeddings"], filename_ids):
+            if len(rows["ids"]):
+                # Chunks stored before chunk hashes were recorded are hashed here
+                yield (
+                    [(m or {}).get("chunk_hash") or chunk_hash(t) for t, m in zip(rows["documents"], rows["metadatas"])],
+                    np.asarray(rows["embeddings"], dtype=np.float32)
+                )
+
+        if self.chunk_registry is None:
+            return
+
+        scope = self._registry_scope(namespace)
+        from_index = 0
+        while True:
+            references = self.chunk_registry.file_canonicals(scope, filename, from_index, _SIDE_INDEX_BUILD_PAGE)
+            if not references:
+                break
+            found = self._unique_chunk_embeddings(collection, {key: canonical for _, key, canonical in references})
+            if found:
+                yield list(found), np.asarray(list(found.values()), dtype=np.float32)
+            from_index = references[-1][0] + 1
+
+    def find_duplicate_embeddings(
+        self,
+        chunks: List[Dict[str, Any]],
+        filename: str,
+        namespace: str = DEFAULT_NAMESPACE
+    ) -> Dict[str, List[float]]:
+        """
+        Stored embeddings of the unique chunks that a file's new chunks would
+        be deduplicated into (exact copies, and near duplicates from other
+        files when CHUNK_DEDUP_THRESHOLD is set), by chunk hash, so they need
+        no embedding call.
+        """
+        collection = self.partition(namespace, create=False)
+        if self.chunk_registry is None or collection is None:
+            return {}
+
+        scope = self._registry_scope(namespace)
+        matches = {}
+        for chunk in chunks:
+            key = chunk_hash(chunk["text"])
+            if key not in matches:
+                matches[key] = self.chunk_registry.match(
+                    scope, key, minhash_signature(chunk["text"]), self.dedup_threshold, filename
+                )
+
+        return self._unique_chunk_embeddings(
+            collection, {key: canonical for key, canonical in matches.items() if canonical is not None}
+        )
+
+    def _unique_chunk_embeddings(self, collection, canonical_by_hash: Dict[str, str]) -> Dict[str, List[float]]:
+        """
+        Embeddings of unique chunks, keyed by the chunk hashes mapped to them.
+        """
+        lookup = sorted({dedup_row_id(canonical) for canonical in canonical_by_hash.values()})
+        stored = {}
+        for start in range(0, len(lookup), _SIDE_INDEX_BUILD_PAGE):
+            rows = collection.get(ids=lookup[start:start + _SIDE_INDEX_BUILD_PAGE], include=["embeddings"])
+            for row_id, embedding in zip(rows["ids"], rows["embeddings"]):
+                stored[row_id] = np.asarray(embedding, dtype=np.float32).tolist()
+
+        return {
+            key: stored[dedup_row_id(canonical)]
+            for key, canonical in canonical_by_hash.items() if dedup_row_id(canonical) in stored
+        }
+
+    def _upsert(
+        self,
+        collection,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]]
+    ):
+        """
+        Upsert in batches of at most the backend's maximum batch size
+        (Chroma rejects larger calls; flat/ivf take everything at once).
+        """
+        batch = self.max_batch_size or max(len(ids), 1)
+        for start in range(0, len(ids), batch):
+            end = start + batch
+            collection.upsert(
+                ids=ids[start:end],
+                embeddings=embeddings[start:end],
+                documents=documents[start:end],
+                metadatas=metadatas[start:end]
+            )
+
+    @staticmethod
+    def _pages(collection, include: List[str], ids: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Read a partition's rows (or those with the given IDs) page by page,
+        by ID: offsets shift under concurrent writes, and Chroma skips to an
+        offset by scanning.
+        """
+        if ids is None:
+            ids = collection.get(include=[])["ids"]
+        for start in range(0, len(ids), _SIDE_INDEX_BUILD_PAGE):
+            yield collection.get(ids=ids[start:start + _SIDE_INDEX_BUILD_PAGE], include=include)
+
+    def _filename_ids(self, collection, namespace: str, filename: str) -> List[str]:
+        """
+        IDs of a file's stored chunks, from the metadata index when there is one.
+        """
+        metadata_index = self.metadata_index(namespace)
+        if metadata_index is not None:
+            resolved = metadata_index.resolve_ids({"filename": filename})
+            return resolved[0] if resolved else []
+        return collection.get(where={"filename": filename}, include=[])["ids"]
 
     def search(
         self,
         query_embedding: List[float],
         top_k: int = 3,
-        namespace: str = "default",  # ignored, for compatibility
-        filter_dict: Dict[str, Any] | None = None
+        namespace: str = DEFAULT_NAMESPACE,
+        filter_dict: Dict[str, Any] | None = None,
+        max_distance: Optional[float] = None,
+        nprobe: Optional[int] = None,
+        prefix_dims: Optional[int] = None,
+        candidates: Optional[int] = None,
+        query_text: Optional[str] = None,
+        mode: Optional[str] = None
     ) -> Dict[str, Any]:
         """
-        Search for similar vectors in ChromaDB.
+        Search for similar vectors in one namespace.
+
+        Args:
+            max_distance: Drop results farther than this distance (None keeps all;
+                BM25 matches are kept regardless)
+            nprobe: Inverted lists scanned by the "ivf" backend (higher = better
+                recall, slower)
+            prefix_dims: First-stage Matryoshka prefix size for the "flat"/"ivf"
+                backends (0 = skip the prefix stage)
+            candidates: First-stage candidates reranked on full embeddings
+            query_text: Question text for the lexical (BM25) side
+            mode: "vector", "lexical" or "hybrid" (reciprocal-rank fusion of
+                both); defaults to RETRIEVAL_MODE, and to "vector" without text
+
+        filter_dict is a Chroma-style `where` on chunk metadata; besides the
+        stored fields it accepts "page" and "heading" (any page / heading of
+        the chunk). With chunk deduplication "filename" matches any file a
+        chunk came from. Filters on filename, page, heading and uploaded_at are
+        resolved through the metadata index first.
+
+        The search knobs only apply to the in-process backends; Chroma ignores them.
         """
-        results = self.collection.query(
+        batch = self.search_batch(
             query_embeddings=[query_embedding],
-            n_results=top_k,
-            where=filter_dict
+            top_k=top_k,
+            namespace=namespace,
+            filter_dict=filter_dict,
+            max_distance=max_distance,
+            nprobe=nprobe,
+            prefix_dims=prefix_dims,
+            candidates=candidates,
+            query_texts=[query_text] if query_text is not None else None,
+            mode=mode
         )
 
-        chunks = []
-        for i in range(len(results["ids"][0])):
-            chunks.append({
-                "id": results["ids"][0][i],
-                "score": results["distances"][0][i],
-                "text": results["documents"][0][i],
-                "metadata": results["metadatas"][0][i]
+        result = batch["results"][0]
+        search_stats = {**batch["search_stats"], "stages": result.pop("stages")}
+
+        return {**result, "search_stats": search_stats}
+
+    def search_batch(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int = 3,
+        namespace: str = DEFAULT_NAMESPACE,
+        filter_dict: Dict[str, Any] | None = None,
+        max_distance: Optional[float] = None,
+        nprobe: Optional[int] = None,
+        prefix_dims: Optional[int] = None,
+        candidates: Optional[int] = None,
+        query_texts: Optional[List[str]] = None,
+        mode: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Search for many query embeddings with one backend query.
+
+        Chroma receives all embeddings in a single call; the flat/ivf indexes
+        score them together as one matrix.
+
+        Args: as for search(), with one query text per embedding
+
+        Returns:
+            {"results": per query {"chunks", "total_found", "stages"},
+             "search_stats": backend, mode, query count, total time and,
+             with a filter, the filter plan}
+        """
+        mode = self._search_mode(mode, query_texts)
+        if mode != "vector" and self.lexical_index(namespace) is None:
+            # No BM25 index yet (still building): rank by vector alone meanwhile
+            mode = "vector"
+
+        # Chroma can only evaluate "source" through the metadata index
+        if self.chunk_registry is not None and (self.backend != "chroma" or self.metadata_index_enabled):
+            filter_dict = source_filter(filter_dict)
+
+        search_options = {}
+        if self.backend != "chroma":
+            for name, value in (("nprobe", nprobe), ("prefix_dims", prefix_dims), ("candidates", candidates)):
+                if value is not None:
+                    search_options[name] = value
+
+        # Fusion needs deeper lists than the final top_k
+        depth = top_k if mode == "vector" else max(top_k, settings.HYBRID_CANDIDATES)
+
+        collection = self.partition(namespace, create=False)
+        started = time.perf_counter()
+
+        where, filter_stats = filter_dict, None
+        if filter_dict and collection is not None and self.backend == "chroma":
+            where, filter_stats = self._plan_chroma_filter(namespace, filter_dict, search_options)
+
+        empty = [[] for _ in query_embeddings]
+        results = {"ids": empty, "distances": empty, "documents": empty, "metadatas": empty}
+        if collection is not None and mode != "lexical" and search_options.get("ids") != []:
+            results = collection.query(
+                query_embeddings=query_embeddings,
+                n_results=depth,
+                where=where,
+                **search_options
+            )
+        filter_stats = results.get("filter", filter_stats)
+        query_stats = results.get("stats") or [{} for _ in query_embeddings]
+
+        per_query = []
+        for q, stats in enumerate(query_stats):
+            chunks = []
+            for i in range(len(results["ids"][q])):
+                if max_distance is not None and results["distances"][q][i] > max_distance:
+                    continue
+                chunks.append({
+                    "id": results["ids"][q][i],
+                    "namespace": namespace,
+                    "score": results["distances"][q][i],
+                    "text": results["documents"][q][i],
+                    "metadata": results["metadatas"][q][i]
+                })
+
+            per_query.append({
+                "chunks": chunks,
+                "total_found": len(chunks),
+                "stages": stats.get("stages", [])
             })
 
+        if mode != "vector" and collection is not None:
+            self._fuse_lexical(
+                collection,
+                namespace,
+                per_query,
+                query_embeddings,
+                query_texts,
+                depth,
+                top_k,
+                filter_dict
+            )
+
+        search_stats = {
+            "backend": self.backend,
+            "mode": mode,
+            "namespace": namespace,
+            "queries": len(query_embeddings),
+            "ms": round((time.perf_counter() - started) * 1000, 3)
+        }
+        if filter_stats is not None:
+            search_stats["filter"] = filter_stats
+
         return {
-            "chunks": chunks,
-            "total_found": len(chunks)
+            "results": per_query,
+            "search_stats": search_stats
         }
 
-    def get_index_stats(self) -> Dict[str, Any]:
+    def _plan_chroma_filter(
+        self,
+        namespace: str,
+        filter_dict: Dict[str, Any],
+        search_options: Dict[str, Any]
+    ) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
         """
-        Get basic statistics about the ChromaDB collection.
+        Choose how Chroma applies a filter. Selective filters (and those on
+        "page"/"heading", which Chroma cannot evaluate) are resolved to chunk
+        IDs and only those are queried ("prefilter", setting
+        search_options["ids"]); broad ones go to Chroma's own `where`
+        ("postfilter").
+
+        Returns:
+            (`where` to pass to Chroma, plan stats)
         """
-        count = self.collection.count()
-        return {
+        started = time.perf_counter()
+
+        index = self.metadata_index(namespace)
+        resolved = index.resolve_ids(filter_dict) if index is not None else None
+        if resolved is None:
+            return filter_dict, {"plan": "postfilter", "indexed": False}
+
+        ids, residual = resolved
+        live = index.count()
+        selectivity = len(ids) / live if live else 0.0
+
+        prefilter = selectivity <= self.prefilter_selectivity or uses_virtual_keys(filter_dict)
+        if prefilter:
+            search_options["ids"] = ids
+
+        stats = {
+            "plan": "prefilter" if prefilter else "postfilter",
+            "indexed": True,
+            "candidates": len(ids),
+            "selectivity": round(selectivity, 4),
+            "ms": round((time.perf_counter() - started) * 1000, 3)
+        }
+        return (residual if prefilter else filter_dict), stats
+
+    def _search_mode(self, mode: Optional[str], query_texts: Optional[List[str]]) -> str:
+        mode = mode or settings.RETRIEVAL_MODE
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode {mode}; expected one of {SEARCH_MODES}")
+
+        # The lexical side needs the question text and an index
+        if query_texts is None or not self.lexical_enabled:
+            return "vector"
+        return mode
+
+    def _fuse_lexical(
+        self,
+        collection,
+        namespace: str,
+        per_query: List[Dict[str, Any]],
+        query_embeddings: List[List[float]],
+        query_texts: List[str],
+        depth: int,
+        top_k: int,
+        filter_dict: Optional[Dict[str, Any]]
+    ):
+        """
+        Replace each query's vector chunks with the reciprocal-rank fusion of
+        the vector and BM25 rankings (BM25 alone in "lexical" mode, where the
+        vector list is empty). Chunks only BM25 found are fetched in one `get`,
+        and their distance to the query is computed from the stored embedding.
+        """
+        lexical = self.lexical_index(namespace)
+
+        rankings = []
+        for result, text in zip(per_query, query_texts):
+            started = time.perf_counter()
+            hits, scanned = lexical.search(text, depth) if lexical is not None else ([], 0)
+            result["stages"].append({
+                "stage": "bm25",
+                "rows": scanned,
+                "ms": round((time.perf_counter() - started) * 1000, 3)
+            })
+
+            vector_ids = [chunk["id"] for chunk in result["chunks"]]
+            lexical_ids = [chunk_id for chunk_id, _ in hits]
+            rankings.append((vector_ids, lexical_ids))
+
+        known = {chunk["id"] for result in per_query for chunk in result["chunks"]}
+        missing = sorted({
+            chunk_id for _, lexical_ids in rankings for chunk_id in lexical_ids
+        } - known)
+
+        fetched: Dict[str, Dict[str, Any]] = {}
+        if missing:
+            rows = collection.get(ids=missing, include=["documents", "metadatas", "embeddings"])
+            for i, chunk_id in enumerate(rows["ids"]):
+                embedding = np.asarray(rows["embeddings"][i], dtype=np.float32)
+                fetched[chunk_id] = {
+                    "text": rows["documents"][i],
+                    "metadata": rows["metadatas"][i],
+                    "embedding": embedding / (np.linalg.norm(embedding) or 1.0)
+                }
+
+        for q, (result, (vector_ids, lexical_ids)) in enumerate(zip(per_query, rankings)):
+            by_id = {chunk["id"]: chunk for chunk in result["chunks"]}
+            query = np.asarray(query_embeddings[q], dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1.0)
+
+            vector_rank = {chunk_id: rank for rank, chunk_id in enumerate(vector_ids, start=1)}
+            lexical_rank = {chunk_id: rank for rank, chunk_id in enumerate(lexical_ids, start=1)}
+
+            chunks = []
+            for chunk_id, fused in reciprocal_rank_fusion([vector_ids, lexical_ids], k=settings.RRF_K):
+                chunk = by_id.get(chunk_id)
+                if chunk is None:
+                    row = fetched.get(chunk_id)
+                    if row is None or (filter_dict and not matches_where(row["metadata"], filter_dict)):
+                        continue
+                    chunk = {
+                        "id": chunk_id,
+                        "namespace": namespace,
+                        "score": float(2 - 2 * np.dot(query, row["embedding"])),
+                        "text": row["text"],
+                        "metadata": row["metadata"]
+                    }
+
+                chunk["vector_rank"] = vector_rank.get(chunk_id)
+                chunk["lexical_rank"] = lexical_rank.get(chunk_id)
+                chunk["fused_score"] = round(fused, 6)
+                chunks.append(chunk)
+
+                if len(chunks) == top_k:
+                    break
+
+            result["chunks"] = chunks
+            result["total_found"] = len(chunks)
+
+    def get_index_stats(self, namespace: str = DEFAULT_NAMESPACE) -> Dict[str, Any]:
+        """
+        Get basic statistics about a namespace's collection.
+        """
+        collection = self.partition(namespace, create=False)
+        if collection is None:
+            return {"total_vector_count": 0, "collection_name": None, "namespace": namespace, "backend": self.backend}
+
+        count = collection.count()
+        stats = {
             "total_vector_count": count,
-            "collection_name": self.collection.name
+            "collection_name": collection.name,
+            "namespace": namespace,
+            "backend": self.backend
         }
 
-    def delete_by_filename(self, filename: str):
+        if self.backend == "ivf":
+            stats["ivf"] = collection.get_ivf_stats()
+
+        if self.chunk_registry is not None:
+            stats["dedup"] = self.chunk_registry.get_stats(self._registry_scope(namespace))
+
+        lexical = self.lexical_index(namespace, building=True)
+        if lexical is not None:
+            stats["lexical"] = {**lexical.get_stats(), "ready": namespace not in self._building}
+
+        if self.backend == "chroma":
+            metadata_index = self.metadata_index(namespace)
+            metadata_stats = metadata_index.get_stats() if metadata_index is not None else None
+        else:
+            metadata_stats = collection.get_metadata_stats()
+        if metadata_stats is not None:
+            stats["metadata"] = metadata_stats
+
+        return stats
+
+    def delete_by_filename(self, filename: str, namespace: str = DEFAULT_NAMESPACE):
         """
         Delete all vectors associated with a filename.
         """
-        self.collection.delete(
-            where={"filename": filename}
-        )
+        collection = self.partition(namespace, create=False)
+        if collection is None:
+            return
+
+        if self.chunk_registry is not None:
+            with self._write_lock:
+                self._write_deduplicated(namespace, {filename: ([], [], [])})
+            logger.info(f"Deleted vectors for filename: {filename} ({namespace})")
+            self._notify(filename)
+            return
+
+        with self._write_lock:
+            collection.delete(
+                where={"filename": filename}
+            )
 
-        logger.info(f"Deleted vectors for filename: {filename}")
+            lexical = self.lexical_index(namespace, building=True)
+            if lexical is not None:
+                lexical.delete_filename(filename)
 
-    def delete_all_vectors(self) -> Dict[str, Any]:
+            metadata_index = self.metadata_index(namespace)
+            if metadata_index is not None:
+                metadata_index.remove_ids(self._filename_ids(collection, namespace, filename))
+
+        logger.info(f"Deleted vectors for filename: {filename} ({namespace})")
+
+        self._notify(filename)
+
+    def delete_all_vectors(self, namespace: str = DEFAULT_NAMESPACE) -> Dict[str, Any]:
         """
-        Delete ALL vectors from the collection.
+        Delete ALL vectors from a namespace's collection by dropping and
+        recreating it, in constant time whatever its size.
         """
-        self.collection.delete(where={})
+        with self._write_lock:
+            self._reset_partition(namespace)
+            if self.chunk_registry is not None:
+                self.chunk_registry.clear(self._registry_scope(namespace))
+
+            lexical = self.lexical_index(namespace, building=True)
+            if lexical is not None:
+                lexical.clear()
+
+            metadata_index = self.metadata_index(namespace)
+            if metadata_index is not None:
+                metadata_index.clear()
 
+        logger.warning(f"Deleted ALL vectors from namespace '{namespace}'")
 
-        logger.warning("Deleted ALL vectors from ChromaDB")
+        self._notify(None)
 
         return {
             "status": "success",
@@ -0,0 +1,100 @@
+"""
+Server-Sent Events helpers for the streaming query endpoints.
+Formats (event, data) pairs as SSE frames and records time-to-first-byte
+and time-to-first-token per endpoint.
+"""
+
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Iterator, Tuple
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """
+    Format one Server-Sent Event frame.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class StreamMetrics:
+    """Rolling time-to-first-byte / first-token / total latency per endpoint."""
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Dict[str, Deque[float]]] = {}
+        self._streams: Dict[str, int] = {}
+
+    def record(self, endpoint: str, **timings_ms: float) -> None:
+        with self._lock:
+            self._streams[endpoint] = self._streams.get(endpoint, 0) + 1
+            samples = self._samples.setdefault(endpoint, {})
+            for name, value in timings_ms.items():
+                if value is not None:
+                    samples.setdefault(name, deque(maxlen=self.window)).append(value)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get average and p95 of each timing per endpoint.
+        """
+        stats = {}
+
+        with self._lock:
+            for endpoint, samples in self._samples.items():
+                timings = {}
+                for name, values in samples.items():
+                    ordered = sorted(values)
+                    timings[name] = {
+                        "avg": round(sum(ordered) / len(ordered), 1),
+                        "p95": round(ordered[int(0.95 * (len(ordered) - 1))], 1)
+                    }
+                stats[endpoint] = {"streams": self._streams[endpoint], **timings}
+
+        return stats
+
+
+stream_metrics = StreamMetrics()
+
+
+def sse_stream(
+    endpoint: str,
+    events: Iterable[Tuple[str, Dict[str, Any]]],
+    started: float
+) -> Iterator[str]:
+    """
+    Turn an (event, data) iterator into SSE frames, timing the stream from
+    `started` (perf_counter at request arrival).
+    """
+    first_byte_ms = None
+    first_token_ms = None
+
+    try:
+        for event, data in events:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if first_byte_ms is None:
+                first_byte_ms = elapsed_ms
+            if event == "token" and first_token_ms is None:
+                first_token_ms = elapsed_ms
+            if event == "done":
+                data = {**data, "ttfb_ms": round(first_byte_ms, 1)}
+                if first_token_ms is not None:
+                    data["time_to_first_token_ms"] = round(first_token_ms, 1)
+
+            yield sse_event(event, data)
+
+    except Exception as e:
+        logger.exception(f"Stream {endpoint} failed")
+        yield sse_event("error", {"message": str(e)})
+
+    finally:
+        stream_metrics.record(
+            endpoint,
+            ttfb_ms=first_byte_ms,
+            first_token_ms=first_token_ms,
+            total_ms=(time.perf_counter() - started) * 1000
+        )
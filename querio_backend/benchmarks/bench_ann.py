@@ -0,0 +1,79 @@
+"""
+IVF ANN Benchmark
+Builds an IVF index on a synthetic 768-d corpus and prints the recall@k vs
+QPS curve over nprobe, with the exact flat scan as the baseline.
+
+Usage:
+    python -m benchmarks.bench_ann --vectors 200000 --nlist 1024 --nprobe 1,2,4,8,16,32,64
+"""
+
+from pathlib import Path
+import argparse
+import shutil
+import tempfile
+import time
+
+from app.services.flat_vector_index import FlatVectorIndex
+from app.services.ivf_vector_index import IVFVectorIndex
+from benchmarks.bench_flat_index import exact_top_k, recall, synthetic_corpus
+
+
+def measure(index, queries, k, **search_options):
+    found = []
+    start = time.perf_counter()
+    for q in queries:
+        found.append(index.query([q.tolist()], n_results=k, **search_options)["ids"][0])
+    elapsed = time.perf_counter() - start
+    return found, len(queries) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IVF recall/QPS curve")
+    parser.add_argument("--vectors", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--nprobe", default="1,2,4,8,16,32,64")
+    parser.add_argument("--batch", type=int, default=10000)
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.vectors, args.dim)
+    queries = synthetic_corpus(args.queries, args.dim, seed=1)
+    truth = exact_top_k(corpus, queries, args.top_k)
+    ids = [str(i) for i in range(args.vectors)]
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_ann_"))
+
+    try:
+        flat = FlatVectorIndex(str(workdir / "flat"))
+        for i in range(0, args.vectors, args.batch):
+            flat.add(ids[i:i + args.batch], corpus[i:i + args.batch])
+
+        start = time.perf_counter()
+        ivf = IVFVectorIndex(str(workdir / "ivf"), nlist=args.nlist, train_min=args.vectors)
+        for i in range(0, args.vectors, args.batch):
+            ivf.add(ids[i:i + args.batch], corpus[i:i + args.batch])
+        ivf.wait_for_training()
+        build_s = time.perf_counter() - start
+
+        stats = ivf.get_ivf_stats()
+        print(
+            f"{args.vectors} vectors x {args.dim} dims, k={args.top_k}, "
+            f"nlist={stats['nlist']} (avg list {stats['avg_list_size']}), build {build_s:.1f}s"
+        )
+        print(f"{'index':<12}{'nprobe':>8}{'recall':>10}{'qps':>10}")
+
+        found, qps = measure(flat, queries, args.top_k)
+        print(f"{'flat':<12}{'-':>8}{recall(found, truth):>10.3f}{qps:>10.1f}")
+
+        for nprobe in [int(n) for n in args.nprobe.split(",")]:
+            found, qps = measure(ivf, queries, args.top_k, nprobe=nprobe)
+            print(f"{'ivf':<12}{nprobe:>8}{recall(found, truth):>10.3f}{qps:>10.1f}")
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
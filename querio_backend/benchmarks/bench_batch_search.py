@@ -0,0 +1,64 @@
+"""
+Batch Search Benchmark
+Runs the same queries one by one and as batches against the flat and IVF
+indexes and prints queries per second for each batch size.
+
+Usage:
+    python -m benchmarks.bench_batch_search --vectors 100000 --batch-sizes 1,8,32,64
+"""
+
+from pathlib import Path
+import argparse
+import shutil
+import tempfile
+import time
+
+from app.services.flat_vector_index import FlatVectorIndex
+from app.services.ivf_vector_index import IVFVectorIndex
+from benchmarks.bench_flat_index import synthetic_corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched vs per-query search")
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=256)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--batch-sizes", default="1,8,32,64")
+    parser.add_argument("--nlist", type=int, default=256)
+    parser.add_argument("--batch", type=int, default=10000)
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.vectors, args.dim)
+    queries = synthetic_corpus(args.queries, args.dim, seed=1).tolist()
+    ids = [str(i) for i in range(args.vectors)]
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_batch_"))
+    print(f"{args.vectors} vectors x {args.dim} dims, {args.queries} queries, k={args.top_k}")
+    print(f"{'index':<8}{'batch':>8}{'qps':>10}")
+
+    try:
+        indexes = {
+            "flat": FlatVectorIndex(str(workdir / "flat")),
+            "ivf": IVFVectorIndex(str(workdir / "ivf"), nlist=args.nlist, train_min=args.vectors)
+        }
+
+        for name, index in indexes.items():
+            for i in range(0, args.vectors, args.batch):
+                index.add(ids[i:i + args.batch], corpus[i:i + args.batch])
+            if isinstance(index, IVFVectorIndex):
+                index.wait_for_training()
+
+            for size in [int(n) for n in args.batch_sizes.split(",")]:
+                start = time.perf_counter()
+                for i in range(0, args.queries, size):
+                    index.query(queries[i:i + size], n_results=args.top_k)
+                qps = args.queries / (time.perf_counter() - start)
+                print(f"{name:<8}{size:>8}{qps:>10.1f}")
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Chunk Deduplication Benchmark
+Stores a synthetic corpus whose files share a legal notice (half of them with
+a one-word variation) without chunk deduplication, with exact-copy
+deduplication and with near duplicates merged too, and reports the
+rows stored, the chunks that need an embedding call, ingest time, and how many
+distinct passages a top-10 search for the notice returns.
+
+Usage:
+    python -m benchmarks.bench_chunk_dedup --files 200
+"""
+
+from pathlib import Path
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from app.config import settings
+from app.services.document_service import DocumentService, chunk_hash
+
+
+def corpus(files: int, seed: int = 0):
+    rng = random.Random(seed)
+    words = ["".join(rng.choice("abcdefghijklmnop") for _ in range(rng.randint(2, 9))) for _ in range(5000)]
+
+    def paragraph(n: int) -> str:
+        return " ".join(rng.choice(words) for _ in range(n))
+
+    notice = "\n\n".join(paragraph(100) for _ in range(3))
+    variant = notice.replace(notice.split()[40], "amended", 1)
+
+    documents = {}
+    for f in range(files):
+        body = "\n\n".join(paragraph(rng.randint(40, 120)) for _ in range(8))
+        documents[f"doc{f}.txt"] = f"{notice if f % 2 else variant}\n\n{body}"
+    return documents, notice
+
+
+def embed(text: str, dim: int) -> list:
+    seed = int(chunk_hash(text)[:8], 16)
+    return np.random.RandomState(seed).standard_normal(dim).astype(np.float32).tolist()
+
+
+def run(documents, notice: str, dim: int, dedup: bool, threshold=None):
+    settings.CHUNK_DEDUP_ENABLED = dedup
+    settings.CHUNK_DEDUP_THRESHOLD = threshold
+    # Registries are shared per path: give each run its own
+    settings.CHUNK_REGISTRY_PATH = f"data/chunk_registry_{threshold}.sqlite3"
+    from app.services.vector_service import VectorService
+
+    service = VectorService(backend="flat")
+    chunker = DocumentService(upload_dir="data/uploads")
+
+    embedded = 0
+    started = time.perf_counter()
+    for filename, text in documents.items():
+        chunks = chunker.chunk_text(text)
+        known = service.find_duplicate_embeddings(chunks, filename)
+        missing = {chunk_hash(c["text"]) for c in chunks} - set(known)
+        embedded += len(missing)
+        embeddings = [known.get(chunk_hash(c["text"])) or embed(c["text"], dim) for c in chunks]
+        service.replace_document(chunks, embeddings, filename)
+    seconds = time.perf_counter() - started
+
+    query = embed(chunker.chunk_text(notice)[0]["text"], dim)
+    top = service.search(query, top_k=10, mode="vector")["chunks"]
+    distinct = len({chunk_hash(c["text"]) for c in top})
+
+    return service.collection.count(), embedded, seconds, distinct
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stored rows and embedding calls with chunk deduplication")
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--threshold", type=float, default=0.9, help="Near-duplicate threshold of the last run")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_dedup_"))
+    cwd = os.getcwd()
+    os.chdir(workdir)  # flat index and chunk registry live under data/
+
+    try:
+        documents, notice = corpus(args.files)
+        chunker = DocumentService(upload_dir="data/uploads")
+        chunks = sum(len(chunker.chunk_text(text)) for text in documents.values())
+        print(f"{args.files} files, {chunks} chunks, {args.dim} dims")
+        print(f"{'dedup':>6}{'rows':>8}{'embedded':>10}{'seconds':>9}{'distinct in top 10':>20}")
+
+        for label, dedup, threshold in (("off", False, None), ("exact", True, None), ("near", True, args.threshold)):
+            rows, embedded, seconds, distinct = run(documents, notice, args.dim, dedup, threshold)
+            print(f"{label:>6}{rows:>8}{embedded:>10}{seconds:>9.2f}{distinct:>20}")
+            shutil.rmtree(workdir / "data", ignore_errors=True)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
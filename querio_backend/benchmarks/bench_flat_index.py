@@ -0,0 +1,123 @@
+"""
+Flat Index vs Chroma Benchmark
+Builds the same synthetic corpus in the flat NumPy index and in a Chroma
+PersistentClient collection, then compares query latency, on-disk/memory
+footprint and recall@k against exact brute-force results.
+
+Usage:
+    python -m benchmarks.bench_flat_index --vectors 100000 --dim 768 --queries 200
+"""
+
+from pathlib import Path
+from typing import Callable, List
+import argparse
+import resource
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from app.services.flat_vector_index import FlatVectorIndex
+
+
+def synthetic_corpus(n: int, dim: int, seed: int = 0, clusters: int = 256) -> np.ndarray:
+    """
+    Clustered unit vectors (closer to real embeddings than uniform noise).
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, size=n)] + 0.5 * rng.normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> List[set]:
+    scores = queries @ corpus.T
+    return [set(np.argpartition(-row, k - 1)[:k].tolist()) for row in scores]
+
+
+def recall(found: List[List[str]], truth: List[set]) -> float:
+    hits = sum(len({int(i) for i in ids} & expected) for ids, expected in zip(found, truth))
+    return hits / sum(len(expected) for expected in truth)
+
+
+def dir_size_mb(path: Path) -> float:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file()) / 1e6
+
+
+def rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def time_queries(query: Callable[[List[float]], List[str]], queries: np.ndarray):
+    latencies, results = [], []
+    for q in queries:
+        start = time.perf_counter()
+        results.append(query(q.tolist()))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, np.percentile(latencies, [50, 95])
+
+
+def report(name: str, build_s: float, latency, found, truth, disk_mb: float):
+    print(
+        f"{name:<14} build {build_s:7.1f}s  p50 {latency[0]:7.2f} ms  p95 {latency[1]:7.2f} ms  "
+        f"recall {recall(found, truth):.3f}  disk {disk_mb:8.1f} MB  peak rss {rss_mb():8.1f} MB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flat NumPy index vs Chroma")
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=5000, help="Vectors per add() call")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--skip-chroma", action="store_true")
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.vectors, args.dim)
+    queries = synthetic_corpus(args.queries, args.dim, seed=1)
+    truth = exact_top_k(corpus, queries, args.top_k)
+    ids = [str(i) for i in range(args.vectors)]
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_flat_"))
+    print(f"{args.vectors} vectors x {args.dim} dims, {args.queries} queries, k={args.top_k}")
+
+    try:
+        for dtype in ("float32", "float16"):
+            path = workdir / f"flat_{dtype}"
+            start = time.perf_counter()
+            index = FlatVectorIndex(str(path), dtype=dtype, threads=args.threads)
+            for i in range(0, args.vectors, args.batch):
+                index.add(ids[i:i + args.batch], corpus[i:i + args.batch])
+            build_s = time.perf_counter() - start
+
+            found, latency = time_queries(
+                lambda q: index.query([q], n_results=args.top_k)["ids"][0], queries
+            )
+            report(f"flat {dtype}", build_s, latency, found, truth, dir_size_mb(path))
+
+        if not args.skip_chroma:
+            import chromadb
+
+            path = workdir / "chroma"
+            start = time.perf_counter()
+            client = chromadb.PersistentClient(path=str(path))
+            collection = client.get_or_create_collection(name="bench")
+            batch = min(args.batch, client.get_max_batch_size())
+            for i in range(0, args.vectors, batch):
+                collection.add(ids=ids[i:i + batch], embeddings=corpus[i:i + batch])
+            build_s = time.perf_counter() - start
+
+            found, latency = time_queries(
+                lambda q: collection.query(query_embeddings=[q], n_results=args.top_k)["ids"][0], queries
+            )
+            report("chroma hnsw", build_s, latency, found, truth, dir_size_mb(path))
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
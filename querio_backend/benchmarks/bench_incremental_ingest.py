@@ -0,0 +1,63 @@
+"""
+Incremental Ingest Benchmark
+Chunks a synthetic handbook, applies one edit (a paragraph replaced,
+inserted or deleted) and counts the chunks of the new version that must be
+embedded again, for fixed and content-defined chunking.
+
+Usage:
+    python -m benchmarks.bench_incremental_ingest --pages 300
+"""
+
+import argparse
+import random
+import time
+
+from app.services.document_service import CHUNKING_MODES, DocumentService, chunk_hash
+
+
+def handbook(pages: int, seed: int = 0):
+    rng = random.Random(seed)
+    words = ["".join(rng.choice("abcdefghijklmnop") for _ in range(rng.randint(2, 9))) for _ in range(5000)]
+    # About 3000 characters per page, in paragraphs of 40-120 words
+    paragraphs = []
+    while sum(len(p) for p in paragraphs) < pages * 3000:
+        paragraphs.append(" ".join(rng.choice(words) for _ in range(rng.randint(40, 120))))
+    return paragraphs
+
+
+def edits(paragraphs):
+    middle = len(paragraphs) // 2
+    new = "The refund window is now sixty days for all enterprise customers with an active contract."
+    return {
+        "replace": paragraphs[:middle] + [new] + paragraphs[middle + 1:],
+        "insert": paragraphs[:middle] + [new] + paragraphs[middle:],
+        "delete": paragraphs[:middle] + paragraphs[middle + 1:]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunks re-embedded after a one-paragraph edit")
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--batch", type=int, default=16, help="Texts per embedding call")
+    args = parser.parse_args()
+
+    service = DocumentService(upload_dir="data/uploads")
+    paragraphs = handbook(args.pages)
+    original = "\n\n".join(paragraphs)
+    print(f"{args.pages} pages, {len(original)} characters")
+    print(f"{'mode':>8}{'edit':>9}{'chunks':>8}{'embedded':>10}{'reused':>8}{'calls saved':>13}{'chunk ms':>10}")
+
+    for mode in CHUNKING_MODES:
+        started = time.perf_counter()
+        stored = {chunk_hash(c["text"]) for c in service.chunk_text(original, mode=mode)}
+        chunk_ms = (time.perf_counter() - started) * 1000
+
+        for edit, version in edits(paragraphs).items():
+            chunks = service.chunk_text("\n\n".join(version), mode=mode)
+            embedded = sum(chunk_hash(c["text"]) not in stored for c in chunks)
+            saved = -(-len(chunks) // args.batch) - -(-embedded // args.batch)
+            print(f"{mode:>8}{edit:>9}{len(chunks):>8}{embedded:>10}{len(chunks) - embedded:>8}{saved:>13}{chunk_ms:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
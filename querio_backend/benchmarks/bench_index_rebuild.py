@@ -0,0 +1,87 @@
+"""
+Index Rebuild Benchmark
+Fills a document cache with synthetic documents, then restores a vector
+index from it with different reader and batch settings. readers=1 with one
+document per write is the per-file baseline (what re-uploading every file
+would cost, minus the embedding calls).
+
+Usage:
+    python -m benchmarks.bench_index_rebuild --backend flat --documents 500 --chunks 100
+"""
+
+from pathlib import Path
+import argparse
+import os
+import shutil
+import tempfile
+
+from app.services.embedding_service import EmbeddingService
+from app.services.index_migration_service import IndexMigrationService
+from app.services.index_rebuild_service import IndexRebuildService
+from app.services.local_storage import LocalStorageBackend
+from app.services.vector_service import DEFAULT_NAMESPACE, VectorService
+from benchmarks.bench_flat_index import synthetic_corpus
+
+
+def fill_cache(storage: LocalStorageBackend, documents: int, chunks: int, dim: int):
+    for d in range(documents):
+        document_id = f"{d:064x}"
+        rows = [
+            {
+                "text": f"document {d} chunk {c} " + "lorem ipsum " * 40,
+                "chunk_index": c,
+                "token_count": 80,
+                "page_numbers": [c // 4 + 1]
+            }
+            for c in range(chunks)
+        ]
+        storage.save_chunks(document_id, "txt", rows)
+        storage.save_embeddings(document_id, "txt", synthetic_corpus(chunks, dim, seed=d, clusters=16))
+        storage.save_metadata(document_id, "txt", {
+            "document_id": document_id,
+            "file_extension": "txt",
+            "chunk_count": chunks,
+            "embedding_model": "bench",
+            "embedding_dim": dim,
+            "sources": [{"namespace": DEFAULT_NAMESPACE, "filename": f"doc{d}.txt", "uploaded_at": float(d)}]
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vector index rebuild from the document cache")
+    parser.add_argument("--backend", default="flat", choices=["chroma", "flat", "ivf"])
+    parser.add_argument("--documents", type=int, default=500)
+    parser.add_argument("--chunks", type=int, default=100)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--configs", default="1:0,4:5000,8:10000",
+                        help="readers:batch_size pairs (batch 0 = one document per write)")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_rebuild_"))
+    cwd = os.getcwd()
+    os.chdir(workdir)  # Chroma and flat indexes live under data/
+    print(f"{args.backend}: {args.documents} documents x {args.chunks} chunks x {args.dim} dims")
+
+    try:
+        storage = LocalStorageBackend(cache_dir=workdir / "cache")
+        fill_cache(storage, args.documents, args.chunks, args.dim)
+        vector_service = VectorService(backend=args.backend)
+        index_migration = IndexMigrationService(vector_service, EmbeddingService(model="bench", dimensions=args.dim))
+
+        print(f"{'readers':>8}{'batch':>8}{'seconds':>10}{'chunks/sec':>12}")
+        for config in args.configs.split(","):
+            readers, batch_size = (int(v) for v in config.split(":"))
+            rebuild = IndexRebuildService(
+                vector_service, storage, index_migration, readers=readers, batch_size=batch_size or args.chunks
+            )
+            progress = rebuild.rebuild(reset=True)
+            assert progress["status"] == "completed" and not progress["errors"], progress
+            print(f"{readers:>8}{batch_size or args.chunks:>8}{progress['elapsed_s']:>10.2f}{progress['chunks_per_sec']:>12.0f}")
+
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+BM25 Lexical Index Benchmark
+Indexes a synthetic chunk corpus (Zipf-distributed vocabulary plus one
+unique identifier per chunk) and measures build time, postings size and
+lookup latency for identifier queries and short keyword queries.
+
+Usage:
+    python -m benchmarks.bench_lexical --chunks 1000000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from app.services.lexical_index import BM25Index
+
+
+def synthetic_chunks(n: int, words_per_chunk: int, vocabulary: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    words = np.array([f"w{i}" for i in range(vocabulary)])
+    for start in range(0, n, 10000):
+        size = min(10000, n - start)
+        ranks = np.minimum(rng.zipf(1.2, size=(size, words_per_chunk)), vocabulary) - 1
+        for offset, row in enumerate(ranks):
+            yield f"SKU-{start + offset:07d}", " ".join(words[row]) + f" SKU-{start + offset:07d}"
+
+
+def latency(index: BM25Index, queries, top_k: int):
+    latencies, scanned = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, postings = index.search(query, top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        scanned.append(postings)
+    return np.percentile(latencies, [50, 95]), int(np.median(scanned))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BM25 lexical index")
+    parser.add_argument("--chunks", type=int, default=1_000_000)
+    parser.add_argument("--words", type=int, default=60)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=20)
+    args = parser.parse_args()
+
+    index = BM25Index()
+    start = time.perf_counter()
+    batch_ids, batch_texts = [], []
+    for chunk_id, text in synthetic_chunks(args.chunks, args.words, args.vocabulary):
+        batch_ids.append(chunk_id)
+        batch_texts.append(text)
+        if len(batch_ids) == 10000:
+            index.add(batch_ids, batch_texts)
+            batch_ids, batch_texts = [], []
+    index.add(batch_ids, batch_texts)
+    build_s = time.perf_counter() - start
+
+    stats = index.get_stats()
+    print(
+        f"{stats['documents']} chunks, {stats['terms']} terms, {stats['postings']} postings "
+        f"({stats['postings_bytes'] / 1e6:.0f} MB), build {build_s:.0f}s"
+    )
+
+    rng = np.random.default_rng(1)
+    identifiers = [f"where is SKU-{i:07d}" for i in rng.integers(0, args.chunks, args.queries)]
+    # Mid-frequency keywords (ranks 100-5000), like topical words in a question
+    keywords = [
+        " ".join(f"w{w}" for w in rng.integers(100, 5000, 3)) for _ in range(args.queries)
+    ]
+
+    print(f"{'queries':<22}{'p50 ms':>9}{'p95 ms':>9}{'postings':>10}")
+    for name, queries in (("identifier", identifiers), ("3 keywords", keywords)):
+        (p50, p95), scanned = latency(index, queries, args.top_k)
+        print(f"{name:<22}{p50:>9.3f}{p95:>9.3f}{scanned:>10}")
+
+
+if __name__ == "__main__":
+    main()
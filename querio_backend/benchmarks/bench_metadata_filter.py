@@ -0,0 +1,81 @@
+"""
+Metadata Filter Benchmark
+Searches a flat index with filename filters of increasing selectivity and
+compares three ways of applying them: the old per-row metadata scan, an
+indexed full scan that skips non-matching rows (post-filter) and scoring
+only the matching rows (pre-filter).
+
+Usage:
+    python -m benchmarks.bench_metadata_filter --vectors 100000 --files 1000
+"""
+
+from pathlib import Path
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from app.services.flat_vector_index import FlatVectorIndex
+from benchmarks.bench_flat_index import synthetic_corpus
+
+
+def p50_ms(index: FlatVectorIndex, queries, where, top_k: int) -> float:
+    latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        index.query([q], n_results=top_k, where=where)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return float(np.percentile(latencies, 50))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Metadata pre-filter vs post-filter")
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--selectivities", default="0.001,0.01,0.05,0.1,0.2,0.3,0.5")
+    parser.add_argument("--batch", type=int, default=10000)
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.vectors, args.dim)
+    queries = synthetic_corpus(args.queries, args.dim, seed=1).tolist()
+    ids = [str(i) for i in range(args.vectors)]
+    metadatas = [{"filename": f"file{i % args.files}.pdf", "chunk_index": i // args.files} for i in range(args.vectors)]
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_filter_"))
+    print(f"{args.vectors} vectors x {args.dim} dims, {args.files} files, k={args.top_k}")
+
+    try:
+        indexed = FlatVectorIndex(str(workdir / "indexed"))
+        unindexed = FlatVectorIndex(str(workdir / "unindexed"), metadata_index=False)
+        for index in (indexed, unindexed):
+            for i in range(0, args.vectors, args.batch):
+                index.add(ids[i:i + args.batch], corpus[i:i + args.batch], metadatas=metadatas[i:i + args.batch])
+
+        unfiltered = p50_ms(indexed, queries, None, args.top_k)
+        print(f"unfiltered p50 {unfiltered:.2f} ms")
+        print(f"{'selectivity':>12}{'metadata scan':>15}{'postfilter':>12}{'prefilter':>11}{'planned':>10}")
+
+        for selectivity in [float(s) for s in args.selectivities.split(",")]:
+            files = max(1, round(selectivity * args.files))
+            where = {"filename": {"$in": [f"file{i}.pdf" for i in range(files)]}}
+
+            scan = p50_ms(unindexed, queries, where, args.top_k)
+            indexed.prefilter_selectivity = 0.0
+            post = p50_ms(indexed, queries, where, args.top_k)
+            indexed.prefilter_selectivity = 1.0
+            pre = p50_ms(indexed, queries, where, args.top_k)
+            planned = "pre" if pre < post else "post"
+
+            print(f"{files / args.files:>12.3f}{scan:>15.2f}{post:>12.2f}{pre:>11.2f}{planned:>10}")
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Quantized Storage Benchmark
+Compares float32 / float16 / int8 scan matrices in the flat index, with and
+without full-precision rescoring: bytes per vector, scan-matrix footprint,
+on-disk size, query latency and recall@k against exact search.
+
+Usage:
+    python -m benchmarks.bench_quantization --vectors 100000 --dim 768
+"""
+
+from pathlib import Path
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from app.services.embedding_quantization import bytes_per_vector
+from app.services.flat_vector_index import FlatVectorIndex
+from benchmarks.bench_flat_index import dir_size_mb, exact_top_k, recall, synthetic_corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantized embedding storage")
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=10000)
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.vectors, args.dim)
+    queries = synthetic_corpus(args.queries, args.dim, seed=1)
+    truth = exact_top_k(corpus, queries, args.top_k)
+    ids = [str(i) for i in range(args.vectors)]
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_quant_"))
+    print(f"{args.vectors} vectors x {args.dim} dims, k={args.top_k}, rescore factor {args.rescore_factor}")
+    print(f"{'format':<10}{'rescore':>8}{'B/vec':>8}{'scan MB':>10}{'disk MB':>10}{'p50 ms':>9}{'recall':>9}")
+
+    try:
+        for dtype in ("float32", "float16", "int8"):
+            for rescore in ((False,) if dtype == "float32" else (False, True)):
+                path = workdir / f"{dtype}_{rescore}"
+                index = FlatVectorIndex(
+                    str(path),
+                    dtype=dtype,
+                    rescore=rescore,
+                    rescore_factor=args.rescore_factor
+                )
+                for i in range(0, args.vectors, args.batch):
+                    index.add(ids[i:i + args.batch], corpus[i:i + args.batch])
+
+                latencies, found = [], []
+                for q in queries:
+                    start = time.perf_counter()
+                    found.append(index.query([q.tolist()], n_results=args.top_k)["ids"][0])
+                    latencies.append((time.perf_counter() - start) * 1000)
+
+                per_vector = bytes_per_vector(args.dim, dtype)
+                print(
+                    f"{dtype:<10}{'yes' if rescore else 'no':>8}{per_vector:>8}"
+                    f"{per_vector * args.vectors / 1e6:>10.1f}{dir_size_mb(path):>10.1f}"
+                    f"{np.percentile(latencies, 50):>9.2f}{recall(found, truth):>9.3f}"
+                )
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
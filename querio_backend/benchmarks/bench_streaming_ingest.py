@@ -0,0 +1,127 @@
+"""
+Streaming Ingest Benchmark
+Ingests synthetic text files of growing size through the streaming pipeline
+(text read in blocks, chunks embedded and written in batches) and through a
+whole-document path (all text, chunks and embeddings in memory before the
+first write), and reports the peak Python memory each needs on top of what
+the vector index keeps. Embeddings are synthetic; the flat backend runs
+without side indexes or deduplication.
+
+Usage:
+    python -m benchmarks.bench_streaming_ingest --mb 2 4 8
+"""
+
+from pathlib import Path
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from app.config import settings
+from app.services.document_service import DocumentService, chunk_hash
+
+
+class SyntheticEmbeddings:
+    """Stands in for EmbeddingService: a fixed random vector per text."""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.model = "synthetic"
+        self.dimensions = dim
+        self.batch_size = settings.EMBEDDING_BATCH_SIZE
+
+    def generate_embeddings(self, texts, priority=None, model=None):
+        return [
+            np.random.RandomState(int(chunk_hash(text)[:8], 16)).standard_normal(self.dim).astype(np.float32).tolist()
+            for text in texts
+        ]
+
+
+def write_text(path: Path, megabytes: int, seed: int = 0):
+    rng = random.Random(seed)
+    words = ["".join(rng.choice("abcdefghijklmnop") for _ in range(rng.randint(2, 9))) for _ in range(5000)]
+    with open(path, "w", encoding="utf-8") as f:
+        written = 0
+        while written < megabytes * 1024 * 1024:
+            paragraph = " ".join(rng.choice(words) for _ in range(rng.randint(40, 120))) + "\n\n"
+            f.write(paragraph)
+            written += len(paragraph)
+
+
+def run(path: Path, embeddings: SyntheticEmbeddings, streaming: bool, batch_size: int):
+    from app.services.index_migration_service import IndexMigrationService
+    from app.services.ingest_pipeline import IngestPipeline
+    from app.services.vector_service import VectorService
+
+    vector_service = VectorService(backend="flat")
+    document_service = DocumentService(upload_dir="data/uploads")
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+
+    if streaming:
+        migration = IndexMigrationService(vector_service, embeddings, alias_path="data/vector_alias.json")
+        pipeline = IngestPipeline(document_service, embeddings, vector_service, migration, batch_size=batch_size)
+        chunks = pipeline.ingest(path, path.name)["chunks"]
+    else:
+        text = document_service.load_text(str(path))
+        all_chunks = document_service.chunk_text(text)
+        vectors = embeddings.generate_embeddings([c["text"] for c in all_chunks])
+        vector_service.replace_document(all_chunks, vectors, path.name)
+        chunks = len(all_chunks)
+        del text, all_chunks, vectors
+
+    seconds = time.perf_counter() - started
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    vector_service.partition().close()
+
+    return chunks, seconds, (retained - baseline) / 2 ** 20, (peak - retained) / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak ingest memory, streaming vs whole document")
+    parser.add_argument("--mb", type=int, nargs="+", default=[2, 4, 8], help="File sizes")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--batch", type=int, default=settings.INGEST_BATCH_SIZE, help="Chunks per pipeline batch")
+    parser.add_argument("--skip-whole", action="store_true", help="Only run the streaming pipeline")
+    args = parser.parse_args()
+
+    settings.CHUNK_DEDUP_ENABLED = False
+    settings.LEXICAL_INDEX_ENABLED = False
+    settings.METADATA_INDEX_ENABLED = False
+    settings.INCREMENTAL_INGEST_ENABLED = False
+    embeddings = SyntheticEmbeddings(args.dim)
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_streaming_"))
+    cwd = os.getcwd()
+    os.chdir(workdir)  # flat index lives under data/
+
+    try:
+        print(f"{args.dim} dims, {args.batch} chunks per batch")
+        print(f"{'MB':>4}{'path':>11}{'chunks':>9}{'seconds':>9}{'index MB':>10}{'peak extra MB':>15}")
+
+        for megabytes in args.mb:
+            path = workdir / f"doc{megabytes}.txt"
+            write_text(path, megabytes)
+            for streaming in (False, True):
+                if not streaming and args.skip_whole:
+                    continue
+                chunks, seconds, retained, transient = run(path, embeddings, streaming, args.batch)
+                name = "streaming" if streaming else "whole"
+                print(f"{megabytes:>4}{name:>11}{chunks:>9}{seconds:>9.2f}{retained:>10.1f}{transient:>15.1f}")
+                shutil.rmtree(workdir / "data", ignore_errors=True)
+            path.unlink()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
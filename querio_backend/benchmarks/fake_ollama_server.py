@@ -0,0 +1,354 @@
+"""
+Fake Ollama Server
+Deterministic stand-in for Ollama, for benchmarks and load tests that must
+run offline (no GPU, no gemma2 / nomic-embed downloads).
+
+Implements the endpoints the services use:
+- POST /api/chat        templated SQL / intent-split JSON / answers, streaming or not
+- POST /api/embeddings  hash-based embedding for one prompt
+- POST /api/embed       hash-based embeddings for a batch of inputs
+- GET  /api/tags        model list with stable digests (used by the response cache)
+- GET  /api/ps          models "loaded" so far (used by backend affinity routing)
+
+Latency is simulated as time-to-first-token drawn from a configurable
+distribution plus a fixed decode rate (tokens/sec).
+
+Usage:
+    python -m benchmarks.fake_ollama_server --port 11434 --ttft-ms 300 --tokens-per-sec 40
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+import uvicorn
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+@dataclass
+class FakeOllamaConfig:
+    """Knobs for the simulated model behaviour."""
+
+    dimensions: int = 768
+    ttft_ms: float = 200.0                 # Mean time to first token
+    ttft_jitter_ms: float = 50.0           # Spread of the distribution
+    distribution: str = "normal"           # fixed | uniform | normal | lognormal
+    tokens_per_sec: float = 50.0           # Decode speed
+    embed_ms_per_input: float = 5.0        # Embedding latency per text
+    seed: int = 0
+    models: List[str] = field(default_factory=lambda: ["gemma2:9b", "nomic-embed-text-v2-moe:latest"])
+    digest_salt: str = ""                  # Change to simulate a model update
+    responses: Dict[str, str] = field(default_factory=dict)  # regex -> canned answer
+
+
+def hash_embedding(text: str, dimensions: int) -> List[float]:
+    """
+    Deterministic, L2-normalized embedding via signed feature hashing of word
+    unigrams and bigrams. Texts sharing words get similar vectors, so
+    retrieval results are meaningful as well as reproducible.
+    """
+    vector = [0.0] * dimensions
+    words = [w.lower() for w in re.findall(r"\w+", text)]
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    for feature in features or [text]:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        index = value % dimensions
+        sign = 1.0 if (value >> 63) & 1 else -1.0
+        vector[index] += sign
+
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class FakeOllama:
+    """Response generation and latency model."""
+
+    def __init__(self, config: FakeOllamaConfig):
+        self.config = config
+        self._rng = random.Random(config.seed)
+        self.loaded_models: Dict[str, float] = {}
+        self.requests = 0
+
+    # ---------- Latency ----------
+
+    def sample_ttft(self) -> float:
+        """
+        Draw a time-to-first-token in seconds.
+        """
+        cfg = self.config
+        if cfg.distribution == "fixed":
+            ms = cfg.ttft_ms
+        elif cfg.distribution == "uniform":
+            ms = self._rng.uniform(cfg.ttft_ms - cfg.ttft_jitter_ms, cfg.ttft_ms + cfg.ttft_jitter_ms)
+        elif cfg.distribution == "lognormal":
+            sigma = math.sqrt(math.log(1 + (cfg.ttft_jitter_ms / max(cfg.ttft_ms, 1e-6)) ** 2))
+            mu = math.log(max(cfg.ttft_ms, 1e-6)) - sigma ** 2 / 2
+            ms = self._rng.lognormvariate(mu, sigma)
+        else:
+            ms = self._rng.gauss(cfg.ttft_ms, cfg.ttft_jitter_ms)
+        return max(ms, 0.0) / 1000
+
+    # ---------- Models ----------
+
+    def digest(self, model: str) -> str:
+        return hashlib.sha256(f"{model}{self.config.digest_salt}".encode("utf-8")).hexdigest()
+
+    def touch(self, model: str) -> None:
+        name = model if ":" in model else f"{model}:latest"
+        self.loaded_models[name] = time.time()
+
+    # ---------- Responses ----------
+
+    def respond(self, messages: List[Dict[str, Any]]) -> str:
+        """
+        Pick a canned or templated reply based on the prompt.
+        """
+        system = " ".join(m.get("content", "") for m in messages if m.get("role") == "system")
+        user = " ".join(m.get("content", "") for m in messages if m.get("role") != "system")
+        prompt = f"{system}\n{user}"
+
+        for pattern, answer in self.config.responses.items():
+            if re.search(pattern, user, re.IGNORECASE):
+                return answer
+
+        if "SQL:" in user or "sql" in system.lower():
+            return self._sql_reply(user)
+
+        if "sql_part" in prompt:
+            return self._split_reply(user)
+
+        return self._answer_reply(user)
+
+    @staticmethod
+    def _extract_question(user: str) -> str:
+        """
+        The question is the first non-empty line after the last "Question:" label
+        (earlier ones belong to few-shot examples).
+        """
+        index = user.lower().rfind("question:")
+        if index < 0:
+            return user.strip()
+        for line in user[index + len("question:"):].splitlines():
+            if line.strip():
+                return line.strip().strip('"')
+        return user.strip()
+
+    def _sql_reply(self, user: str) -> str:
+        question = self._extract_question(user).lower()
+
+        tables = re.findall(r"Table:\s*(\w+)", user)
+        if not tables:
+            listed = re.search(r"(?:Tables in database|Available tables):\s*(.+)", user)
+            tables = [t.strip() for t in listed.group(1).split(",")] if listed else ["companies"]
+
+        table = next((t for t in tables if t.rstrip("s") in question), tables[0])
+
+        if any(word in question for word in ("how many", "count", "number of")):
+            return f"SELECT COUNT(*) FROM {table};"
+
+        columns = re.findall(rf"Table:\s*{table}\n((?:\s+- .+\n?)+)", user)
+        names = re.findall(r"- (\w+)", columns[0]) if columns else []
+        select = ", ".join(names[:3]) if names else "*"
+        return f"SELECT {select} FROM {table};"
+
+    def _split_reply(self, user: str) -> str:
+        question = self._extract_question(user)
+        parts = re.split(r"\s+and\s+", question, maxsplit=1)
+        sql_part = parts[0].strip() or None
+        rag_part = parts[1].strip() if len(parts) > 1 else None
+        return json.dumps({"sql_part": sql_part, "rag_part": rag_part})
+
+    def _answer_reply(self, user: str) -> str:
+        context = re.search(r"Context:\s*(.+?)\s*Question:", user, re.DOTALL)
+        question = self._extract_question(user)
+
+        if context:
+            body = re.sub(r"\[Source[^\]]*\]", "", context.group(1))
+            sentences = re.split(r"(?<=[.!?])\s+", " ".join(body.split()))
+            summary = " ".join(sentences[:2]).strip()
+            if summary:
+                return f"Based on the provided documents: {summary}"
+
+        return f"This is a simulated answer to: {question}"
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        """
+        Split text into streamable pieces that concatenate back to the original.
+        """
+        return re.findall(r"\S+\s*|\s+", text) or [text]
+
+
+def create_app(config: Optional[FakeOllamaConfig] = None) -> FastAPI:
+    """
+    Build the fake Ollama ASGI app.
+    """
+    config = config or FakeOllamaConfig()
+    fake = FakeOllama(config)
+    app = FastAPI(title="Fake Ollama")
+    app.state.fake = fake
+
+    def now() -> str:
+        return datetime.now(timezone.utc).isoformat()
+
+    @app.get("/")
+    def root():
+        return PlainTextResponse("Ollama is running")
+
+    @app.get("/api/version")
+    def version():
+        return {"version": "0.0.0-fake"}
+
+    @app.get("/api/tags")
+    def tags():
+        return {
+            "models": [
+                {
+                    "name": model,
+                    "model": model,
+                    "modified_at": now(),
+                    "size": 0,
+                    "digest": fake.digest(model),
+                    "details": {"format": "gguf", "family": "fake"}
+                }
+                for model in config.models
+            ]
+        }
+
+    @app.get("/api/ps")
+    def ps():
+        return {
+            "models": [
+                {"name": model, "model": model, "size": 0, "digest": fake.digest(model)}
+                for model in fake.loaded_models
+            ]
+        }
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        model = body.get("model", "")
+        messages = body.get("messages", [])
+        stream = body.get("stream", True)
+        fake.requests += 1
+        fake.touch(model)
+
+        text = fake.respond(messages)
+        pieces = fake.tokenize(text)
+        prompt_tokens = sum(len(TOKEN_PATTERN.findall(m.get("content", ""))) for m in messages)
+        ttft = fake.sample_ttft()
+        per_token = 1.0 / config.tokens_per_sec if config.tokens_per_sec > 0 else 0.0
+
+        def final(duration_ns: int) -> Dict[str, Any]:
+            return {
+                "model": model,
+                "created_at": now(),
+                "message": {"role": "assistant", "content": ""},
+                "done": True,
+                "done_reason": "stop",
+                "total_duration": duration_ns,
+                "prompt_eval_count": prompt_tokens,
+                "eval_count": len(pieces)
+            }
+
+        if not stream:
+            start = time.perf_counter_ns()
+            await asyncio.sleep(ttft + per_token * len(pieces))
+            response = final(time.perf_counter_ns() - start)
+            response["message"]["content"] = text
+            return JSONResponse(response)
+
+        async def generate():
+            start = time.perf_counter_ns()
+            await asyncio.sleep(ttft)
+            for i, piece in enumerate(pieces):
+                if i:
+                    await asyncio.sleep(per_token)
+                yield json.dumps({
+                    "model": model,
+                    "created_at": now(),
+                    "message": {"role": "assistant", "content": piece},
+                    "done": False
+                }) + "\n"
+            yield json.dumps(final(time.perf_counter_ns() - start)) + "\n"
+
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+    @app.post("/api/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        fake.requests += 1
+        fake.touch(body.get("model", ""))
+        await asyncio.sleep(config.embed_ms_per_input / 1000)
+        return {"embedding": hash_embedding(body.get("prompt", ""), config.dimensions)}
+
+    @app.post("/api/embed")
+    async def embed(request: Request):
+        body = await request.json()
+        inputs = body.get("input", "")
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        fake.requests += 1
+        fake.touch(body.get("model", ""))
+        await asyncio.sleep(config.embed_ms_per_input * len(inputs) / 1000)
+        return {
+            "model": body.get("model", ""),
+            "embeddings": [hash_embedding(text, config.dimensions) for text in inputs],
+            "prompt_eval_count": sum(len(TOKEN_PATTERN.findall(text)) for text in inputs)
+        }
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic fake Ollama server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--dimensions", type=int, default=768)
+    parser.add_argument("--ttft-ms", type=float, default=200.0)
+    parser.add_argument("--ttft-jitter-ms", type=float, default=50.0)
+    parser.add_argument("--distribution", choices=["fixed", "uniform", "normal", "lognormal"], default="normal")
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0)
+    parser.add_argument("--embed-ms", type=float, default=5.0, help="Embedding latency per input")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--models", default="gemma2:9b,nomic-embed-text-v2-moe:latest")
+    parser.add_argument("--digest-salt", default="", help="Change to simulate a model update")
+    parser.add_argument("--responses", help="JSON file mapping question regexes to canned answers")
+    args = parser.parse_args()
+
+    responses = {}
+    if args.responses:
+        with open(args.responses) as f:
+            responses = json.load(f)
+
+    config = FakeOllamaConfig(
+        dimensions=args.dimensions,
+        ttft_ms=args.ttft_ms,
+        ttft_jitter_ms=args.ttft_jitter_ms,
+        distribution=args.distribution,
+        tokens_per_sec=args.tokens_per_sec,
+        embed_ms_per_input=args.embed_ms,
+        seed=args.seed,
+        models=[m.strip() for m in args.models.split(",") if m.strip()],
+        digest_salt=args.digest_salt,
+        responses=responses
+    )
+
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
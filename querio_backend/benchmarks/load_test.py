@@ -0,0 +1,71 @@
+"""
+Load Test
+Fires concurrent questions at a running Querio API and reports latency
+percentiles and throughput. Pair with the fake Ollama server to run offline.
+
+Usage:
+    python -m benchmarks.load_test --endpoint /query/documents --requests 200 --concurrency 16
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import argparse
+import time
+
+import requests
+
+DEFAULT_QUESTIONS = [
+    "What is the refund policy?",
+    "Explain the shipping process",
+    "Describe the onboarding guidelines",
+    "What are the support procedures?",
+    "Summarize the pricing policy",
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test for the Querio API")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", default="/query/documents")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--questions", help="File with one question per line")
+    args = parser.parse_args()
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions) as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    url = args.base_url.rstrip("/") + args.endpoint
+
+    def one(i: int):
+        start = time.perf_counter()
+        response = requests.post(url, params={"question": questions[i % len(questions)]}, timeout=300)
+        return (time.perf_counter() - start) * 1000, response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [ms for ms, status in results if status == 200]
+    errors = sum(1 for _, status in results if status != 200)
+
+    print(f"endpoint     {args.endpoint}")
+    print(f"requests     {args.requests} (concurrency {args.concurrency}, errors {errors})")
+    print(f"throughput   {args.requests / elapsed:.1f} req/s")
+    print(f"latency p50  {percentile(latencies, 50):.1f} ms")
+    print(f"latency p95  {percentile(latencies, 95):.1f} ms")
+    print(f"latency p99  {percentile(latencies, 99):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Shared fixtures. Run the suite from querio_backend/: `python -m pytest -q`.
+"""
+
+from pathlib import Path
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+import requests
+
+from app.config import settings
+from app.services import embedding_service as embedding_module
+from app.services.embedding_service import EmbeddingService
+from app.services.ollama_backend_pool import OllamaBackendPool
+from app.services.ollama_client import OllamaClient
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def fake_ollama():
+    """
+    Start benchmarks/fake_ollama_server instances; returns a factory taking
+    the server's command-line options and returning its base URL.
+    """
+    processes = []
+
+    def start(*args: str) -> str:
+        port = free_port()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.fake_ollama_server", "--port", str(port), *args],
+            cwd=BACKEND_DIR,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        processes.append(process)
+
+        url = f"http://127.0.0.1:{port}"
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline:
+            try:
+                requests.get(f"{url}/api/tags", timeout=1)
+                return url
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        raise RuntimeError(f"Fake Ollama server on port {port} did not start")
+
+    yield start
+
+    for process in processes:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    Run in an empty directory: services keep their files under data/.
+    """
+    monkeypatch.chdir(tmp_path)
+    # Registries are shared per path, so give each test its own file
+    monkeypatch.setattr(settings, "CHUNK_REGISTRY_PATH", str(tmp_path / "data" / "chunk_registry.sqlite3"))
+    return tmp_path
+
+
+@pytest.fixture
+def ollama_client(fake_ollama):
+    """
+    An OllamaClient (no response cache) on one fast fake server.
+    """
+    url = fake_ollama("--distribution", "fixed", "--ttft-ms", "5", "--tokens-per-sec", "0", "--embed-ms", "0")
+    return OllamaClient(pool=OllamaBackendPool([url]))
+
+
+@pytest.fixture
+def embedding_service(ollama_client, monkeypatch):
+    monkeypatch.setattr(embedding_module, "get_ollama_client", lambda: ollama_client)
+    return EmbeddingService()
@@ -0,0 +1,119 @@
+import time
+
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.services.document_service import chunk_hash
+from app.services.vector_service import DEFAULT_NAMESPACE, VectorService
+
+SHARED = ["Confidential. Do not distribute outside the company.", "Contact support@example.com for help."]
+
+
+def chunks(texts):
+    return [{"chunk_index": i, "text": text, "token_count": len(text.split())} for i, text in enumerate(texts)]
+
+
+def embeddings(texts):
+    # One vector per distinct text, so duplicates embed identically
+    return [
+        np.random.default_rng(int(chunk_hash(text)[:8], 16)).normal(size=8).tolist()
+        for text in texts
+    ]
+
+
+@pytest.fixture
+def service(workdir, monkeypatch):
+    monkeypatch.setattr(settings, "CHUNK_DEDUP_ENABLED", True)
+    monkeypatch.setattr(settings, "VECTOR_BACKEND", "flat")
+    return VectorService()
+
+
+def wait_for_lexical_index(service):
+    deadline = time.monotonic() + 10
+    while service.lexical_index() is None:
+        assert time.monotonic() < deadline, "BM25 index was not built"
+        time.sleep(0.01)
+
+
+def store(service, filename, texts):
+    service.add_documents(chunks(texts), embeddings(texts), filename)
+
+
+def test_shared_chunks_are_stored_once(service):
+    store(service, "a.txt", SHARED + ["Quarterly revenue grew 12%."])
+    store(service, "b.txt", SHARED + ["The office moves to Berlin in May."])
+
+    stats = service.chunk_registry.get_stats(service._registry_scope(DEFAULT_NAMESPACE))
+    assert stats == {"unique_chunks": 4, "file_chunks": 6, "files": 2, "duplicates_removed": 2}
+    assert service.partition().count() == 4
+    assert [c["text"] for c in service.get_document("b.txt")[0]] == SHARED + ["The office moves to Berlin in May."]
+
+
+def test_delete_drops_references_and_unreferenced_chunks(service):
+    store(service, "a.txt", SHARED + ["Quarterly revenue grew 12%."])
+    store(service, "b.txt", SHARED + ["The office moves to Berlin in May."])
+    registry = service.chunk_registry
+    scope = service._registry_scope(DEFAULT_NAMESPACE)
+
+    service.delete_by_filename("a.txt")
+
+    for text in SHARED:
+        assert registry.references(scope, chunk_hash(text)) == [("b.txt", SHARED.index(text))]
+    assert not registry.has_chunk(scope, chunk_hash("Quarterly revenue grew 12%."))
+    assert registry.get_stats(scope) == {"unique_chunks": 3, "file_chunks": 3, "files": 1, "duplicates_removed": 0}
+    assert service.partition().count() == 3
+    assert service.list_filenames() == ["b.txt"]
+
+    # Search results still name the remaining file
+    found = service.search(embeddings(SHARED[:1])[0], top_k=1)["chunks"]
+    assert found[0]["metadata"]["filename"] == "b.txt"
+
+    service.delete_by_filename("b.txt")
+
+    assert registry.get_stats(scope) == {"unique_chunks": 0, "file_chunks": 0, "files": 0, "duplicates_removed": 0}
+    assert not any(registry.has_chunk(scope, chunk_hash(text)) for text in SHARED)
+    assert service.partition().count() == 0
+
+
+POLICY = (
+    "Employees may work remotely for up to {days} days per week after their probation period. "
+    "Requests go to the direct manager, who confirms them in writing within five working days. "
+    "Remote days cannot be carried over to the following week and do not apply to on-call "
+    "duty, customer site visits or the quarterly planning meetings held at the Berlin office. "
+    "Equipment for working from home is provided by the IT department on request."
+)
+
+
+def test_near_duplicate_keeps_its_own_text(service):
+    old, new = POLICY.format(days="three"), POLICY.format(days="two")
+    store(service, "policy_2023.txt", [old])
+    store(service, "policy_2024.txt", [new])
+
+    assert service.partition().count() == 2
+    assert [c["text"] for c in service.get_document("policy_2024.txt")[0]] == [new]
+
+    found = service.search(
+        embeddings([new])[0], top_k=5, filter_dict={"filename": "policy_2024.txt"}
+    )["chunks"]
+    assert [c["text"] for c in found] == [new]
+    assert found[0]["metadata"]["sources"] == "policy_2024.txt"
+
+    wait_for_lexical_index(service)
+    lexical = service.search(embeddings([new])[0], top_k=1, query_text="two days", mode="lexical")["chunks"]
+    assert lexical[0]["text"] == new
+
+
+def test_near_duplicates_merge_when_enabled(workdir, monkeypatch):
+    monkeypatch.setattr(settings, "CHUNK_DEDUP_ENABLED", True)
+    monkeypatch.setattr(settings, "CHUNK_DEDUP_THRESHOLD", 0.8)
+    monkeypatch.setattr(settings, "VECTOR_BACKEND", "flat")
+    service = VectorService()
+    old, new = POLICY.format(days="three"), POLICY.format(days="two")
+
+    store(service, "policy_2023.txt", [old])
+    store(service, "policy_2024.txt", [new])
+
+    assert service.partition().count() == 1
+    # The file keeps its own text in the registry
+    assert [c["text"] for c in service.get_document("policy_2024.txt")[0]] == [new]
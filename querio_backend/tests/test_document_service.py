@@ -0,0 +1,72 @@
+import random
+
+import pytest
+
+from app.services.document_service import DocumentService
+
+
+def sample_text(words: int = 3000) -> str:
+    rng = random.Random(7)
+    vocabulary = ["invoice", "customer", "payment", "overdue", "the", "of", "and", "SKU_88A", "2024", "Berlin"]
+    text = []
+    for i in range(words):
+        text.append(rng.choice(vocabulary))
+        if i % 17 == 16:
+            text.append(".\n")
+    return " ".join(text)
+
+
+def pieces(text: str, sizes):
+    position, i = 0, 0
+    while position < len(text):
+        size = sizes[i % len(sizes)]
+        yield None, text[position:position + size]
+        position += size
+        i += 1
+
+
+@pytest.fixture
+def service(workdir):
+    return DocumentService()
+
+
+@pytest.mark.parametrize("mode", ["fixed", "content"])
+@pytest.mark.parametrize("sizes", [[1], [37, 500, 3], [499], [100000]])
+def test_iter_chunks_matches_chunk_text(service, mode, sizes):
+    text = sample_text() if sizes != [1] else sample_text(300)
+
+    whole = service.chunk_text(text, chunk_size=500, overlap=50, mode=mode)
+    streamed = list(service.iter_chunks(pieces(text, sizes), chunk_size=500, overlap=50, mode=mode))
+
+    assert streamed == whole
+
+
+@pytest.mark.parametrize("mode", ["fixed", "content"])
+def test_chunks_cover_text(service, mode):
+    text = sample_text()
+
+    chunks = service.chunk_text(text, chunk_size=500, overlap=50, mode=mode)
+
+    assert [c["chunk_index"] for c in chunks] == list(range(len(chunks)))
+    assert chunks[0]["start_char"] == 0
+    assert chunks[-1]["end_char"] == len(text)
+    for chunk in chunks:
+        assert text[chunk["start_char"]:chunk["end_char"]] == chunk["text"]
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk["start_char"] <= previous["end_char"]
+
+
+def test_page_numbers(service):
+    pages = [(1, "a" * 800), (2, "\n" + "b" * 300), (3, "\n" + "c" * 900)]
+
+    chunks = list(service.iter_chunks(pages, chunk_size=500, overlap=50, mode="fixed"))
+
+    text = "".join(page for _, page in pages)
+    whole = service.chunk_text(text, chunk_size=500, overlap=50, mode="fixed")
+    assert [{k: v for k, v in chunk.items() if k != "page_numbers"} for chunk in chunks] == whole
+    for chunk in chunks:
+        covered = {
+            number for number, start, end in [(1, 0, 800), (2, 800, 1101), (3, 1101, 2002)]
+            if start < chunk["end_char"] and end > chunk["start_char"]
+        }
+        assert set(chunk["page_numbers"]) == covered
@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+
+from app.services.flat_vector_index import FlatVectorIndex
+
+DIM = 16
+
+
+def vectors(seed: int, n: int) -> list:
+    return np.random.default_rng(seed).normal(size=(n, DIM)).astype(np.float32).tolist()
+
+
+def rows(filename: str, n: int, version: str = "v1"):
+    ids = [f"{filename}_{i}" for i in range(n)]
+    documents = [f"{filename} {version} chunk {i}" for i in range(n)]
+    metadatas = [{"filename": filename, "chunk_index": i} for i in range(n)]
+    return ids, documents, metadatas
+
+
+def contents(index: FlatVectorIndex) -> dict:
+    found = index.get()
+    return dict(zip(found["ids"], found["documents"]))
+
+
+@pytest.fixture(params=["float32", "int8"])
+def dtype(request):
+    return request.param
+
+
+def test_replace_deletes_stale_rows(tmp_path, dtype):
+    index = FlatVectorIndex(str(tmp_path / "index"), dtype=dtype)
+    ids, documents, metadatas = rows("a.txt", 6)
+    index.add(ids, vectors(0, 6), documents, metadatas)
+    ids, documents, metadatas = rows("b.txt", 3)
+    index.add(ids, vectors(1, 3), documents, metadatas)
+
+    # A shorter new version of a.txt
+    ids, documents, metadatas = rows("a.txt", 4, "v2")
+    index.replace(ids, vectors(2, 4), documents, metadatas, where={"filename": "a.txt"})
+
+    stored = contents(index)
+    assert index.count() == 7
+    assert [stored[f"a.txt_{i}"] for i in range(4)] == documents
+    assert "a.txt_4" not in stored and "a.txt_5" not in stored
+    assert stored["b.txt_0"] == "b.txt v1 chunk 0"
+
+
+def test_query_finds_replaced_vector(tmp_path, dtype):
+    index = FlatVectorIndex(str(tmp_path / "index"), dtype=dtype)
+    ids, documents, metadatas = rows("a.txt", 20)
+    index.add(ids, vectors(0, 20), documents, metadatas)
+
+    replacement = vectors(3, 1)
+    index.replace(["a.txt_7"], replacement, ["new text"], [{"filename": "a.txt", "chunk_index": 7}])
+
+    found = index.query(replacement, n_results=1)
+    assert found["ids"] == [["a.txt_7"]]
+    assert found["documents"] == [["new text"]]
+    assert found["distances"][0][0] == pytest.approx(0.0, abs=0.05)
+
+
+def test_compact_keeps_live_rows(tmp_path, dtype):
+    index = FlatVectorIndex(str(tmp_path / "index"), dtype=dtype)
+    ids, documents, metadatas = rows("a.txt", 10)
+    index.add(ids, vectors(0, 10), documents, metadatas)
+    index.delete(ids=ids[:3])
+    before = index.get(include=["documents", "metadatas", "embeddings"])
+
+    index.compact()
+
+    after = index.get(include=["documents", "metadatas", "embeddings"])
+    assert index.count() == 7
+    assert after["ids"] == before["ids"]
+    assert after["documents"] == before["documents"]
+    assert after["metadatas"] == before["metadatas"]
+    assert np.allclose(after["embeddings"], before["embeddings"])
+    assert index.query(vectors(0, 10)[5:6], n_results=1)["ids"] == [["a.txt_5"]]
+
+
+def test_mostly_deleted_index_compacts_itself(tmp_path):
+    index = FlatVectorIndex(str(tmp_path / "index"))
+    ids, documents, metadatas = rows("a.txt", 10)
+    index.add(ids, vectors(0, 10), documents, metadatas)
+
+    index.delete(where={"chunk_index": {"$lt": 6}})
+
+    assert index.count() == 4
+    assert len(index.ids) == 4
+    assert sorted(contents(index)) == [f"a.txt_{i}" for i in range(6, 10)]
+
+
+@pytest.mark.parametrize("closed", [True, False])
+def test_reopen(tmp_path, dtype, closed):
+    path = str(tmp_path / "index")
+    index = FlatVectorIndex(path, dtype=dtype)
+    ids, documents, metadatas = rows("a.txt", 8)
+    index.add(ids, vectors(0, 8), documents, metadatas)
+    ids, documents, metadatas = rows("a.txt", 5, "v2")
+    index.replace(ids, vectors(1, 5), documents, metadatas, where={"filename": "a.txt"})
+    index.delete(ids=["a.txt_0"])
+    index.compact()
+    index.add(["b.txt_0"], vectors(2, 1), ["b.txt v1 chunk 0"], [{"filename": "b.txt", "chunk_index": 0}])
+    expected = index.get(include=["documents", "metadatas", "embeddings"])
+    if closed:
+        index.close()
+    # Not closed: reopening replays the row log, as after a crash
+
+    reopened = FlatVectorIndex(path, dtype=dtype)
+
+    found = reopened.get(include=["documents", "metadatas", "embeddings"])
+    assert reopened.count() == 5
+    assert found["ids"] == expected["ids"]
+    assert found["documents"] == expected["documents"]
+    assert found["metadatas"] == expected["metadatas"]
+    assert np.allclose(found["embeddings"], expected["embeddings"])
+    assert reopened.get(where={"filename": "b.txt"})["ids"] == ["b.txt_0"]
+    if closed:
+        assert FlatVectorIndex.stored_count(path) == 5
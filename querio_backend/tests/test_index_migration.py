@@ -0,0 +1,191 @@
+from pathlib import Path
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.services.document_cache_service import DocumentCacheService, file_sha256
+from app.services.document_service import DocumentService, chunk_hash
+from app.services.index_migration_service import IndexMigrationService, load_alias
+from app.services.ingest_pipeline import IngestPipeline
+from app.services.local_storage import LocalStorageBackend
+from app.services.ollama_scheduler import INGEST
+from app.services.vector_service import VectorService
+
+NEW_MODEL = "mxbai-embed-large"
+
+
+def report(topic: str, parts: int = 12) -> str:
+    return "\n\n".join(
+        f"{topic} report, part {i}. Revenue in region {i} grew by {i + 2} percent over the quarter."
+        for i in range(parts)
+    )
+
+
+@pytest.fixture
+def embed_calls(embedding_service, monkeypatch):
+    """
+    Make NEW_MODEL's embeddings differ from the live model's (the fake
+    server ignores the model) and record the texts each model embedded.
+    """
+    generate = embedding_service.generate_embeddings
+    calls = []
+
+    def generate_embeddings(texts, priority=INGEST, model=None):
+        model = model or embedding_service.model
+        calls.append((model, list(texts)))
+        rows = generate(texts, priority=priority, model=model)
+        return [row[::-1] for row in rows] if model == NEW_MODEL else rows
+
+    monkeypatch.setattr(embedding_service, "generate_embeddings", generate_embeddings)
+    return calls
+
+
+@pytest.fixture
+def pipeline(workdir, embedding_service, embed_calls, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_BACKEND", "flat")
+    vector_service = VectorService()
+    document_cache = DocumentCacheService(LocalStorageBackend(cache_dir=Path("data/cache")))
+    return IngestPipeline(
+        document_service=DocumentService(),
+        embedding_service=embedding_service,
+        vector_service=vector_service,
+        index_migration=IndexMigrationService(vector_service, embedding_service, document_cache=document_cache),
+        document_cache=document_cache,
+        batch_size=8
+    )
+
+
+def upload(pipeline: IngestPipeline, workdir: Path, filename: str, text: str) -> str:
+    path = workdir / "data" / "uploads" / filename
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    document_id = file_sha256(path)
+    pipeline.ingest(path, filename, document_id=document_id)
+    return document_id
+
+
+def wait_for(migration: IndexMigrationService, *statuses: str) -> dict:
+    deadline = time.monotonic() + 30
+    while True:
+        progress = migration.get_progress()
+        if progress["status"] in statuses:
+            return progress
+        assert time.monotonic() < deadline, progress
+        time.sleep(0.02)
+
+
+def stored(service: VectorService, filename: str):
+    """
+    A stored file's chunk texts and their embeddings, in chunk order.
+    """
+    texts = [c["text"] for c in service.get_document(filename)[0]]
+    embeddings = {}
+    for hashes, rows in service.iter_chunk_embeddings(filename):
+        embeddings.update(zip(hashes, rows))
+    return texts, np.asarray([embeddings[chunk_hash(text)] for text in texts])
+
+
+def test_migration_switches_index_model_and_cache(pipeline, workdir, embed_calls):
+    sales_id = upload(pipeline, workdir, "sales.txt", report("Sales"))
+    upload(pipeline, workdir, "costs.txt", report("Costs"))
+    migration = pipeline.index_migration
+    service = pipeline.vector_service
+    before = {filename: stored(service, filename)[0] for filename in ("sales.txt", "costs.txt")}
+
+    migration.start(NEW_MODEL)
+    progress = wait_for(migration, "completed", "failed", "incomplete")
+
+    assert progress["status"] == "completed", progress
+    assert progress["files_done"] == 2
+    assert pipeline.embedding_service.model == NEW_MODEL
+    assert service.generation == 1
+    alias = load_alias(migration.alias_path)
+    assert alias["generation"] == 1 and alias["embedding_model"] == NEW_MODEL
+    assert alias["previous"]["generation"] == 0 and "migration" not in alias
+
+    texts, embeddings = stored(service, "sales.txt")
+    assert texts == before["sales.txt"]
+    assert stored(service, "costs.txt")[0] == before["costs.txt"]
+    new = np.asarray(pipeline.embedding_service.generate_embeddings(texts, model=NEW_MODEL))
+    assert np.allclose(embeddings, new)
+
+    # The document cache now holds the new model's embeddings
+    cached = pipeline.document_cache.lookup(sales_id, "sales.txt", NEW_MODEL)
+    assert cached is not None
+    assert np.allclose(cached[1], new)
+
+
+def test_failed_migration_resumes_from_checkpoint(pipeline, workdir, embed_calls, monkeypatch):
+    upload(pipeline, workdir, "sales.txt", report("Sales"))
+    upload(pipeline, workdir, "costs.txt", report("Costs"))
+    migration = pipeline.index_migration
+    generate = pipeline.embedding_service.generate_embeddings
+
+    def fail_on_costs(texts, priority=INGEST, model=None):
+        if model == NEW_MODEL and any("Costs" in text for text in texts):
+            raise RuntimeError("Ollama went away")
+        return generate(texts, priority=priority, model=model)
+
+    monkeypatch.setattr(pipeline.embedding_service, "generate_embeddings", fail_on_costs)
+    migration.start(NEW_MODEL)
+    progress = wait_for(migration, "completed", "failed", "incomplete")
+
+    # Not switched: the live index and model are unchanged
+    assert progress["status"] == "incomplete", progress
+    assert [e["item"] for e in progress["errors"]] == ["default/costs.txt"]
+    assert pipeline.vector_service.generation == 0
+    assert pipeline.embedding_service.model != NEW_MODEL
+
+    # After a restart, the same model resumes from the checkpoint
+    monkeypatch.setattr(pipeline.embedding_service, "generate_embeddings", generate)
+    embed_calls.clear()
+    alias = load_alias(migration.alias_path)
+    assert list(alias["migration"]["done"]["default"]) == ["sales.txt"]
+    restarted = IndexMigrationService(
+        VectorService(generation=alias["generation"]), pipeline.embedding_service, alias_path=migration.alias_path
+    )
+    assert restarted.get_progress()["status"] == "incomplete"
+
+    restarted.start(NEW_MODEL)
+    progress = wait_for(restarted, "completed", "failed", "incomplete")
+
+    assert progress["status"] == "completed", progress
+    assert progress["files_skipped"] == 1
+    migrated = [text for model, texts in embed_calls if model == NEW_MODEL for text in texts]
+    assert migrated and all("Costs" in text for text in migrated)
+    assert restarted.vector_service.generation == 1
+    texts, embeddings = stored(restarted.vector_service, "sales.txt")
+    assert np.allclose(embeddings, generate(texts, model=NEW_MODEL))
+
+
+def test_upload_during_migration_reaches_new_index(pipeline, workdir, embed_calls, monkeypatch):
+    upload(pipeline, workdir, "sales.txt", report("Sales"))
+    migration = pipeline.index_migration
+    generate = pipeline.embedding_service.generate_embeddings
+    migrating, release = threading.Event(), threading.Event()
+
+    def hold_migration(texts, priority=INGEST, model=None):
+        if threading.current_thread().name == "index-migration":
+            migrating.set()
+            assert release.wait(30)
+        return generate(texts, priority=priority, model=model)
+
+    monkeypatch.setattr(pipeline.embedding_service, "generate_embeddings", hold_migration)
+    migration.start(NEW_MODEL)
+    assert migrating.wait(30)
+
+    # Written to the live index and, embedded with the new model, to the shadow index
+    upload(pipeline, workdir, "late.txt", report("Late"))
+    release.set()
+    progress = wait_for(migration, "completed", "failed", "incomplete")
+
+    assert progress["status"] == "completed", progress
+    service = pipeline.vector_service
+    assert service.generation == 1
+    assert service.list_filenames() == ["late.txt", "sales.txt"]
+    texts, embeddings = stored(service, "late.txt")
+    assert texts == [c["text"] for c in DocumentService().chunk_text(report("Late"))]
+    assert np.allclose(embeddings, generate(texts, model=NEW_MODEL))
@@ -0,0 +1,147 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.services.document_cache_service import DocumentCacheService, file_sha256
+from app.services.document_service import DocumentService, chunk_hash
+from app.services.index_migration_service import IndexMigrationService, MigrationInProgressError, load_alias
+from app.services.index_rebuild_service import IndexRebuildService, RebuildInProgressError
+from app.services.local_storage import LocalStorageBackend
+from app.services.vector_service import DEFAULT_NAMESPACE, VectorService
+
+
+def embeddings(texts):
+    # One vector per distinct text, so a restored chunk can be found again
+    return np.asarray([
+        np.random.default_rng(int(chunk_hash(text)[:8], 16)).normal(size=8)
+        for text in texts
+    ], dtype=np.float32)
+
+
+def report(topic: str) -> str:
+    return "\n\n".join(
+        f"{topic} report, part {i}. Revenue in region {i} grew by {i + 2} percent over the quarter."
+        for i in range(12)
+    )
+
+
+@pytest.fixture
+def rebuild(workdir, embedding_service, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_BACKEND", "flat")
+    vector_service = VectorService()
+    return IndexRebuildService(
+        vector_service=vector_service,
+        storage=LocalStorageBackend(cache_dir=Path("data/cache")),
+        index_migration=IndexMigrationService(vector_service, embedding_service),
+        batch_size=16
+    )
+
+
+def cache(rebuild: IndexRebuildService, workdir: Path, filename: str, text: str, namespace: str = DEFAULT_NAMESPACE):
+    path = workdir / filename
+    path.write_text(text, encoding="utf-8")
+    chunks = DocumentService().chunk_text(text) if text else []
+    DocumentCacheService(rebuild.storage).store(
+        file_path=path,
+        filename=filename,
+        namespace=namespace,
+        chunks=chunks,
+        embeddings=embeddings([c["text"] for c in chunks]) if chunks else np.zeros((0, 0), dtype=np.float32),
+        embedding_model=settings.EMBEDDING_MODEL
+    )
+    return chunks
+
+
+def stored_texts(rebuild: IndexRebuildService, filename: str, namespace: str = DEFAULT_NAMESPACE):
+    return [c["text"] for c in rebuild.vector_service.get_document(filename, namespace)[0]]
+
+
+def store_live(rebuild: IndexRebuildService, filename: str, texts, namespace: str = DEFAULT_NAMESPACE):
+    chunks = [{"chunk_index": i, "text": text, "token_count": 4} for i, text in enumerate(texts)]
+    rebuild.vector_service.add_documents(chunks, embeddings(texts), filename, namespace)
+
+
+def test_rebuild_restores_cached_documents(rebuild, workdir):
+    sales = cache(rebuild, workdir, "sales.txt", report("Sales"))
+    costs = cache(rebuild, workdir, "costs.txt", report("Costs"), namespace="finance")
+
+    progress = rebuild.rebuild()
+
+    assert progress["status"] == "completed", progress
+    assert progress["documents_done"] == 2
+    assert progress["chunks_written"] == progress["chunks_total"] == len(sales) + len(costs)
+    assert stored_texts(rebuild, "sales.txt") == [c["text"] for c in sales]
+    assert stored_texts(rebuild, "costs.txt", "finance") == [c["text"] for c in costs]
+
+
+def test_reset_replaces_restored_namespaces_only(rebuild, workdir):
+    sales = cache(rebuild, workdir, "sales.txt", report("Sales"))
+    store_live(rebuild, "stale.txt", ["Not in the document cache."])
+    store_live(rebuild, "notes.txt", ["Kept: this namespace is not restored."], namespace="other")
+
+    progress = rebuild.rebuild(reset=True)
+
+    assert progress["status"] == "completed", progress
+    service = rebuild.vector_service
+    assert service.list_filenames() == ["sales.txt"]
+    assert stored_texts(rebuild, "sales.txt") == [c["text"] for c in sales]
+    assert stored_texts(rebuild, "notes.txt", "other") == ["Kept: this namespace is not restored."]
+
+    # Switched to a new generation; the replaced one is kept as "previous"
+    alias = load_alias(rebuild.index_migration.alias_path)
+    assert service.generation == alias["generation"] == 1
+    assert alias["previous"]["generation"] == 0
+    found = service.search(embeddings(["Kept: this namespace is not restored."])[0], top_k=1, namespace="other")
+    assert found["chunks"][0]["metadata"]["filename"] == "notes.txt"
+
+
+def test_empty_cached_document_is_skipped(rebuild, workdir):
+    sales = cache(rebuild, workdir, "sales.txt", report("Sales"))
+    cache(rebuild, workdir, "empty.txt", "")
+
+    progress = rebuild.rebuild(reset=True)
+
+    assert progress["status"] == "completed", progress
+    assert progress["documents_skipped"] == 1
+    assert progress["errors"] == []
+    assert stored_texts(rebuild, "sales.txt") == [c["text"] for c in sales]
+
+
+def test_failed_reset_keeps_live_index(rebuild, workdir):
+    sales = cache(rebuild, workdir, "sales.txt", report("Sales"))
+    costs = cache(rebuild, workdir, "costs.txt", report("Costs"))
+    store_live(rebuild, "stale.txt", ["Still served after the failed rebuild."])
+    # A cached document whose embeddings no longer match its chunks
+    costs_id = file_sha256(workdir / "costs.txt")
+    rebuild.storage.save_embeddings(costs_id, "txt", embeddings([c["text"] for c in costs])[:-1])
+
+    progress = rebuild.rebuild(reset=True)
+
+    assert progress["status"] == "failed"
+    assert [e["item"] for e in progress["errors"]] == [costs_id]
+    assert progress["chunks_written"] == len(sales)
+    assert "the live index was kept" in progress["error"]
+    assert rebuild.vector_service.generation == 0
+    assert rebuild.vector_service.list_filenames() == ["stale.txt"]
+    assert not (Path(settings.FLAT_INDEX_DIR) / "generation-1").exists()
+
+
+def test_rebuild_and_migration_share_one_claim(rebuild, workdir):
+    cache(rebuild, workdir, "sales.txt", report("Sales"))
+    migration = rebuild.index_migration
+
+    migration.maintenance.claim("A migration to other-model", MigrationInProgressError)
+    with pytest.raises(MigrationInProgressError, match="migration to other-model"):
+        rebuild.rebuild(reset=True)
+    migration.maintenance.release()
+
+    migration.maintenance.claim("An index rebuild", RebuildInProgressError)
+    with pytest.raises(RebuildInProgressError, match="index rebuild"):
+        migration.start("other-model")
+    migration.maintenance.release()
+
+    assert rebuild.rebuild()["status"] == "completed"
+    assert migration.maintenance.running() is None
+    assert not migration.is_running()
@@ -0,0 +1,143 @@
+from pathlib import Path
+
+import pytest
+
+from app.config import settings
+from app.services.document_cache_service import DocumentCacheService, file_sha256
+from app.services.document_service import DocumentService
+from app.services.index_migration_service import IndexMigrationService
+from app.services.ingest_pipeline import IngestPipeline
+from app.services.local_storage import LocalStorageBackend
+from app.services.vector_service import DEFAULT_NAMESPACE, VectorService
+
+
+def handbook(version: str, sections: int = 40) -> str:
+    return "\n\n".join(
+        f"Section {i} ({version}). Expense reports for trip {i} are filed within {i + 3} days "
+        f"of return, with receipts for every item above {10 * i} euros."
+        for i in range(sections)
+    )
+
+
+@pytest.fixture(params=[True, False], ids=["dedup", "no-dedup"])
+def pipeline(request, workdir, embedding_service, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_BACKEND", "flat")
+    monkeypatch.setattr(settings, "CHUNK_DEDUP_ENABLED", request.param)
+    vector_service = VectorService()
+    return IngestPipeline(
+        document_service=DocumentService(),
+        embedding_service=embedding_service,
+        vector_service=vector_service,
+        index_migration=IndexMigrationService(vector_service, embedding_service),
+        document_cache=DocumentCacheService(LocalStorageBackend(cache_dir=Path("data/cache"))),
+        batch_size=8
+    )
+
+
+def upload(workdir: Path, filename: str, text: str) -> Path:
+    path = workdir / "data" / "uploads" / filename
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    return path
+
+
+def stored_texts(pipeline: IngestPipeline, filename: str):
+    return [c["text"] for c in pipeline.vector_service.get_document(filename)[0]]
+
+
+def test_ingest_stores_every_chunk(pipeline, workdir):
+    text = handbook("v1")
+    path = upload(workdir, "handbook.txt", text)
+
+    result = pipeline.ingest(path, "handbook.txt", document_id=file_sha256(path))
+
+    expected = [c["text"] for c in DocumentService().chunk_text(text)]
+    assert len(expected) > pipeline.batch_size
+    assert result["chunks"] == len(expected)
+    assert result["chunks_embedded"] == len(set(expected))
+    assert stored_texts(pipeline, "handbook.txt") == expected
+
+    progress = pipeline.get_progress()
+    assert progress["in_progress"] == []
+    assert progress["files_ingested"] == 1
+    assert progress["chunks_written"] == len(expected)
+
+
+def test_identical_upload_uses_document_cache(pipeline, workdir):
+    path = upload(workdir, "handbook.txt", handbook("v1"))
+    first = pipeline.ingest(path, "handbook.txt", document_id=file_sha256(path))
+
+    copy = upload(workdir, "copy.txt", handbook("v1"))
+    second = pipeline.ingest(copy, "copy.txt", document_id=file_sha256(copy))
+
+    assert second["cache_hit"]
+    assert second["chunks_embedded"] == 0
+    assert stored_texts(pipeline, "copy.txt") == stored_texts(pipeline, "handbook.txt")
+    assert second["chunks"] == first["chunks"]
+
+
+def test_failed_ingest_keeps_previous_version(pipeline, workdir, monkeypatch):
+    path = upload(workdir, "handbook.txt", handbook("v1"))
+    pipeline.ingest(path, "handbook.txt")
+    before = stored_texts(pipeline, "handbook.txt")
+    rows = pipeline.vector_service.partition().count()
+
+    generate = pipeline.embedding_service.generate_embeddings
+    calls = []
+
+    def fail_on_second_batch(texts, **kwargs):
+        calls.append(len(texts))
+        if len(calls) == 2:
+            raise RuntimeError("Ollama went away")
+        return generate(texts, **kwargs)
+
+    monkeypatch.setattr(pipeline.embedding_service, "generate_embeddings", fail_on_second_batch)
+    path = upload(workdir, "handbook.txt", handbook("v2", sections=60))
+
+    with pytest.raises(RuntimeError):
+        pipeline.ingest(path, "handbook.txt")
+
+    # The first batch was written before the failure
+    assert len(calls) == 2
+    assert stored_texts(pipeline, "handbook.txt") == before
+    assert pipeline.vector_service.partition().count() == rows
+    assert pipeline.get_progress()["files_failed"] == 1
+
+
+def test_reupload_replaces_longer_version(pipeline, workdir):
+    path = upload(workdir, "handbook.txt", handbook("v1", sections=60))
+    pipeline.ingest(path, "handbook.txt")
+
+    text = handbook("v2", sections=10)
+    path = upload(workdir, "handbook.txt", text)
+    pipeline.ingest(path, "handbook.txt")
+
+    assert stored_texts(pipeline, "handbook.txt") == [c["text"] for c in DocumentService().chunk_text(text)]
+    hits = pipeline.vector_service.search(
+        pipeline.embedding_service.generate_embeddings(["Section 50 (v1)"])[0], top_k=50
+    )["chunks"]
+    assert all("(v1)" not in hit["text"] for hit in hits)
+
+
+def test_interrupted_batches_are_not_served(workdir, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_BACKEND", "flat")
+    service = VectorService()
+    chunks = [{"chunk_index": i, "text": f"old text {i}", "token_count": 3} for i in range(3)]
+    service.add_documents(chunks, [[1.0, float(i), 0.0] for i in range(3)], "a.txt")
+
+    uploaded_at = 1000.0
+    new = [{"chunk_index": i, "text": f"new text {i}", "token_count": 3} for i in range(5)]
+    service.write_chunks(new[:3], [[0.0, 1.0, float(i)] for i in range(3)], "a.txt", DEFAULT_NAMESPACE, uploaded_at)
+    service.finish_document("a.txt", DEFAULT_NAMESPACE, None, uploaded_at)
+
+    assert [c["text"] for c in service.get_document("a.txt")[0]] == [c["text"] for c in chunks]
+    assert service.partition().count() == 3
+
+
+def test_empty_upload_is_not_cached(pipeline, workdir):
+    path = upload(workdir, "empty.txt", "")
+
+    result = pipeline.ingest(path, "empty.txt", document_id=file_sha256(path))
+
+    assert result["chunks"] == 0
+    assert pipeline.document_cache.storage.list_documents() == []
@@ -0,0 +1,110 @@
+import time
+
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.services.lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+from app.services.vector_service import VectorService
+
+TEXTS = {
+    "a_0": "Invoice INV-2024-0042 for 12 units of SKU_88A is overdue.",
+    "a_1": "Payment terms are thirty days from the invoice date.",
+    "b_0": "The Berlin office handles customer invoices for 2024.",
+    "b_1": "Overdue invoices are escalated after two reminders.",
+}
+
+
+@pytest.fixture
+def index():
+    index = BM25Index()
+    ids = list(TEXTS)
+    index.add(ids, [TEXTS[i] for i in ids], [i.split("_")[0] + ".txt" for i in ids])
+    return index
+
+
+def ids(hits):
+    return [doc_id for doc_id, _ in hits]
+
+
+def test_identifiers_are_kept_whole_and_split():
+    assert tokenize("See INV-2024-0042, section 4.2.1") == [
+        "see", "inv-2024-0042", "inv", "2024", "0042", "section", "4.2.1", "4", "2", "1"
+    ]
+
+
+def test_exact_identifier_ranks_first(index):
+    hits, scanned = index.search("inv-2024-0042", top_k=3)
+
+    assert ids(hits)[0] == "a_0"
+    assert scanned > 0
+    # "2024" alone also matches the Berlin chunk, below the exact identifier
+    assert ids(index.search("INV-2024-0042", top_k=3)[0])[:2] == ["a_0", "b_0"]
+
+
+def test_term_frequency_and_rarity_rank(index):
+    hits, _ = index.search("overdue invoices", top_k=4)
+
+    assert ids(hits)[0] == "b_1"
+    assert set(ids(hits)) == {"a_0", "b_0", "b_1"}
+    assert [score for _, score in hits] == sorted((score for _, score in hits), reverse=True)
+
+
+def test_deletes_and_compaction(index):
+    index.delete_filename("a.txt")
+
+    assert index.count() == 2
+    assert index.search("thirty days")[0] == []
+
+    index.delete_ids(["b_0"])  # under half alive: compacts
+    assert index.get_stats()["documents"] == len(index._ids) == 1
+    assert ids(index.search("overdue")[0]) == ["b_1"]
+
+    index.add(["c_0"], ["Another overdue invoice."], ["c.txt"])
+    assert set(ids(index.search("overdue")[0])) == {"b_1", "c_0"}
+
+
+def test_save_and_load(index, tmp_path):
+    path = tmp_path / "bm25.pkl"
+    index.save(path)
+
+    loaded = BM25Index.load(path)
+
+    assert loaded.search("overdue invoices", 4) == index.search("overdue invoices", 4)
+    loaded.delete_filename("b.txt")
+    assert ids(loaded.search("overdue")[0]) == ["a_0"]
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["x", "y", "z"], ["z", "x"]], k=60)
+
+    assert [item for item, _ in fused] == ["x", "z", "y"]
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+    assert fused[2][1] == pytest.approx(1 / 62)
+
+
+def test_hybrid_search_finds_identifier_the_vectors_miss(workdir, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_BACKEND", "flat")
+    service = VectorService()
+    rng = np.random.default_rng(3)
+    texts = [f"Filler paragraph {i} about quarterly planning." for i in range(30)] + [TEXTS["a_0"]]
+    embeddings = rng.normal(size=(len(texts), 16)).tolist()
+    chunks = [{"chunk_index": i, "text": text, "token_count": 8} for i, text in enumerate(texts)]
+    service.add_documents(chunks, embeddings, "a.txt")
+
+    deadline = time.monotonic() + 10
+    while service.lexical_index() is None:
+        assert time.monotonic() < deadline, "BM25 index was not built"
+        time.sleep(0.01)
+
+    # The query embedding is closest to a filler chunk
+    query = embeddings[0]
+    vector = service.search(query, top_k=3, query_text="INV-2024-0042", mode="vector")["chunks"]
+    hybrid = service.search(query, top_k=3, query_text="INV-2024-0042", mode="hybrid")["chunks"]
+
+    assert TEXTS["a_0"] not in [c["text"] for c in vector]
+    # Each is first in one ranking, so they tie at the top of the fusion
+    assert {c["text"] for c in hybrid[:2]} == {texts[0], TEXTS["a_0"]}
+    found = next(c for c in hybrid if c["text"] == TEXTS["a_0"])
+    assert found["lexical_rank"] == 1
+    assert found["fused_score"] > 0
@@ -0,0 +1,94 @@
+import json
+import time
+
+import pytest
+
+from app.services.llm_response_cache import LLMResponseCache
+from app.services.ollama_client import OllamaClient
+
+MODEL = "gemma2:9b"
+MESSAGES = [{"role": "user", "content": "Summarize the overdue invoices."}]
+
+
+class Models:
+    """Stands in for ollama.list: the digest can be changed by the test."""
+
+    def __init__(self, digest: str = "sha256:aaa"):
+        self.digest = digest
+
+    def __call__(self):
+        return {"models": [{"model": MODEL, "digest": self.digest}]}
+
+
+@pytest.fixture
+def models():
+    return Models()
+
+
+@pytest.fixture
+def cache(workdir, models):
+    return LLMResponseCache(path="data/llm_cache/responses.sqlite3", digest_ttl=0, list_models=models)
+
+
+@pytest.fixture
+def client(ollama_client, cache):
+    return OllamaClient(response_cache=cache, pool=ollama_client.pool)
+
+
+def test_deterministic_chat_is_served_from_cache(client):
+    first = client.chat(MODEL, MESSAGES, {"temperature": 0})
+    second = client.chat(MODEL, MESSAGES, {"temperature": 0})
+
+    assert second["message"] == {"role": "assistant", "content": first["message"]["content"]}
+    stats = client.get_stats()
+    assert stats["generations"] == 1
+    assert stats["response_cache"]["hits"] == 1
+
+
+def test_sampled_chat_is_not_cached(client):
+    client.chat(MODEL, MESSAGES, {"temperature": 0.7})
+    client.chat(MODEL, MESSAGES)
+
+    stats = client.get_stats()
+    assert stats["generations"] == 2
+    assert stats["response_cache"]["entries"] == 0
+
+
+def test_new_model_digest_invalidates_entries(client, models):
+    client.chat(MODEL, MESSAGES, {"temperature": 0})
+
+    models.digest = "sha256:bbb"
+    client.chat(MODEL, MESSAGES, {"temperature": 0})
+
+    stats = client.get_stats()
+    assert stats["generations"] == 2
+    # Only the entry for the new digest is left
+    assert stats["response_cache"]["entries"] == 1
+    assert stats["response_cache"]["hits"] == 0
+
+
+def test_entries_survive_restart(cache, models):
+    cache.put("key", MODEL, models.digest, {"model": MODEL, "message": {"role": "assistant", "content": "42"}})
+
+    reopened = LLMResponseCache(path=str(cache.path), list_models=models)
+
+    assert reopened.get("key")["message"]["content"] == "42"
+    assert reopened.get_stats()["size_bytes"] == cache.get_stats()["size_bytes"]
+
+
+def test_least_recently_used_entries_are_evicted(workdir, models):
+    response = {"model": MODEL, "message": {"role": "assistant", "content": "x" * 200}}
+    size = len(json.dumps(response))
+    # Room for three responses
+    cache = LLMResponseCache(path="data/llm_cache/small.sqlite3", max_bytes=3 * size, list_models=models)
+
+    for key in ("a", "b", "c"):
+        cache.put(key, MODEL, models.digest, response)
+        time.sleep(0.01)  # distinct access times
+    cache.get("a")
+    cache.put("d", MODEL, models.digest, response)
+
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in ("a", "c", "d"))
+    assert cache.get_stats()["evictions"] == 1
+    assert cache.get_stats()["size_bytes"] == 3 * size
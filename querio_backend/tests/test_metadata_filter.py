@@ -0,0 +1,140 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.services.flat_vector_index import FlatVectorIndex
+from app.services.metadata_index import MetadataIndex, matches_where
+from app.services.vector_service import VectorService
+
+ROWS = 200
+FILES = 10
+DIM = 16
+
+
+def metadata(i: int) -> dict:
+    return {
+        "filename": f"f{i % FILES}.txt",
+        "chunk_index": i // FILES,
+        "token_count": 50 + i % 7,
+        "page_numbers": f"{i % 12 + 1},{i % 12 + 2}",
+        "headings": f"Chapter {i % 4} > Section {i % 3}",
+        "uploaded_at": 1000.0 + (i % FILES) * 100
+    }
+
+
+METADATAS = [metadata(i) for i in range(ROWS)]
+VECTORS = np.random.default_rng(5).normal(size=(ROWS, DIM)).astype(np.float32)
+
+FILTERS = [
+    {"filename": "f3.txt"},
+    {"filename": {"$in": ["f1.txt", "f2.txt"]}},
+    {"filename": {"$ne": "f0.txt"}},
+    {"page": 4},
+    {"heading": "Section 2"},
+    {"uploaded_at": {"$gte": 1300.0, "$lt": 1600.0}},
+    {"$and": [{"filename": "f3.txt"}, {"page": {"$gt": 6}}]},
+    {"$and": [{"heading": "Chapter 1"}, {"token_count": 53}]},
+    {"$or": [{"filename": "f4.txt"}, {"page": 12}]},
+]
+
+
+def expected(where) -> list:
+    return [i for i, m in enumerate(METADATAS) if matches_where(m, where)]
+
+
+@pytest.mark.parametrize("where", FILTERS, ids=str)
+def test_index_resolution_matches_scan(where):
+    index = MetadataIndex()
+    index.add(range(ROWS), METADATAS)
+
+    docs, residual = index.resolve(where)
+
+    matched = [doc for doc in docs.tolist() if residual is None or matches_where(METADATAS[doc], residual)]
+    assert matched == expected(where)
+
+
+def test_resolution_keeps_unindexed_clauses_as_residual():
+    index = MetadataIndex()
+    index.add(range(ROWS), METADATAS)
+
+    docs, residual = index.resolve({"$and": [{"heading": "Chapter 1"}, {"token_count": 53}]})
+
+    assert residual == {"token_count": 53}
+    assert set(docs.tolist()) == set(expected({"heading": "Chapter 1"}))
+    # An $or branch the index cannot narrow leaves the whole filter to a scan
+    assert index.resolve({"$or": [{"filename": "f4.txt"}, {"token_count": 51}]}) is None
+
+
+def test_removed_rows_are_not_resolved():
+    index = MetadataIndex()
+    index.add(range(ROWS), METADATAS)
+
+    index.remove([i for i in range(ROWS) if i % FILES == 3][:5])
+
+    assert len(index.resolve({"filename": "f3.txt"})[0]) == ROWS // FILES - 5
+    assert len(index.resolve({"uploaded_at": {"$eq": 1300.0}})[0]) == ROWS // FILES - 5
+
+
+@pytest.fixture
+def flat(tmp_path):
+    index = FlatVectorIndex(str(tmp_path / "index"))
+    ids = [f"{m['filename']}_{m['chunk_index']}" for m in METADATAS]
+    index.add(ids, VECTORS.tolist(), [f"chunk {i}" for i in range(ROWS)], METADATAS)
+    return index
+
+
+@pytest.mark.parametrize("where, plan", [
+    ({"filename": "f3.txt"}, "prefilter"),
+    ({"$and": [{"filename": "f3.txt"}, {"page": {"$gt": 6}}]}, "prefilter"),
+    ({"filename": {"$ne": "f0.txt"}}, "postfilter"),
+    ({"uploaded_at": {"$gte": 1000.0}}, "postfilter"),
+])
+def test_plan_follows_selectivity(flat, where, plan):
+    rows = expected(where)
+    query = VECTORS[rows[len(rows) // 2]]
+
+    found = flat.query([query.tolist()], n_results=5, where=where)
+
+    assert found["filter"]["plan"] == plan
+    assert found["filter"]["candidates"] == len(rows)
+    assert found["documents"][0][0] == f"chunk {rows[len(rows) // 2]}"
+    assert all(matches_where(m, where) for m in found["metadatas"][0])
+    assert len(found["ids"][0]) == min(5, len(rows))
+
+
+def test_prefilter_and_postfilter_rank_alike(flat):
+    where = {"heading": "Section 2"}
+    query = VECTORS[0].tolist()
+
+    flat.prefilter_selectivity = 1.0
+    prefiltered = flat.query([query], n_results=10, where=where)
+    flat.prefilter_selectivity = 0.0
+    postfiltered = flat.query([query], n_results=10, where=where)
+
+    assert (prefiltered["filter"]["plan"], postfiltered["filter"]["plan"]) == ("prefilter", "postfilter")
+    assert prefiltered["ids"] == postfiltered["ids"]
+    assert np.allclose(prefiltered["distances"], postfiltered["distances"], atol=1e-5)
+
+
+def test_search_reports_filter_plan(workdir, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_BACKEND", "flat")
+    service = VectorService()
+    for filename, rows in itertools.groupby(sorted(range(ROWS), key=lambda i: METADATAS[i]["filename"]),
+                                            key=lambda i: METADATAS[i]["filename"]):
+        rows = list(rows)
+        chunks = [{
+            "chunk_index": METADATAS[i]["chunk_index"],
+            "text": f"chunk {i}",
+            "token_count": METADATAS[i]["token_count"],
+            "page_numbers": [int(p) for p in METADATAS[i]["page_numbers"].split(",")],
+            "headings": METADATAS[i]["headings"].split(" > ")
+        } for i in rows]
+        service.add_documents(chunks, VECTORS[rows].tolist(), filename, uploaded_at=METADATAS[rows[0]]["uploaded_at"])
+
+    result = service.search(VECTORS[13].tolist(), top_k=3, filter_dict={"filename": "f3.txt", "page": 2})
+
+    assert result["search_stats"]["filter"]["plan"] == "prefilter"
+    assert result["chunks"][0]["text"] == "chunk 13"
+    assert all(c["metadata"]["filename"] == "f3.txt" for c in result["chunks"])
@@ -0,0 +1,102 @@
+import time
+
+import numpy as np
+import pytest
+
+from app.services.ollama_backend_pool import OllamaBackendPool
+from tests.conftest import free_port
+
+MODEL = "gemma2:9b"
+MESSAGES = [{"role": "user", "content": "Use the context below. Context: Paris is in France. Question: Where is Paris?"}]
+
+
+def test_routes_to_backend_with_model_loaded(fake_ollama):
+    hosts = [fake_ollama("--distribution", "fixed", "--ttft-ms", "5") for _ in range(2)]
+    pool = OllamaBackendPool(hosts)
+
+    # Only the second backend has the model loaded
+    pool.backends[1].client.chat(model=MODEL, messages=MESSAGES)
+    pool.check_health()
+    assert pool.pick(MODEL).host == hosts[1]
+
+    response = pool.chat(MODEL, MESSAGES)
+    assert response["message"]["content"]
+    assert [b.requests for b in pool.backends] == [0, 1]
+
+
+def test_routes_to_least_outstanding(fake_ollama):
+    hosts = [fake_ollama("--distribution", "fixed", "--ttft-ms", "5") for _ in range(2)]
+    pool = OllamaBackendPool(hosts)
+    pool.check_health()
+
+    pool.backends[0].outstanding = 1
+    assert pool.pick(MODEL).host == hosts[1]
+    pool.backends[0].outstanding = 0
+    pool.backends[1].outstanding = 1
+    assert pool.pick(MODEL).host == hosts[0]
+
+
+def test_unhealthy_backend_is_skipped(fake_ollama):
+    live = fake_ollama("--distribution", "fixed", "--ttft-ms", "5")
+    dead = f"http://127.0.0.1:{free_port()}"
+    pool = OllamaBackendPool([dead, live])
+
+    pool.check_health()
+    assert [b.healthy for b in pool.backends] == [False, True]
+
+    for _ in range(3):
+        assert pool.chat(MODEL, MESSAGES)["message"]["content"]
+    assert [b.requests for b in pool.backends] == [0, 3]
+
+
+def test_unreachable_backend_is_marked_unhealthy():
+    pool = OllamaBackendPool([f"http://127.0.0.1:{free_port()}"])
+
+    with pytest.raises(Exception):
+        pool.chat(MODEL, MESSAGES)
+
+    backend = pool.backends[0]
+    assert not backend.healthy
+    assert backend.errors == 1
+    assert backend.outstanding == 0
+
+
+def test_slow_request_is_hedged(fake_ollama):
+    slow = fake_ollama("--distribution", "fixed", "--ttft-ms", "3000")
+    fast = fake_ollama("--distribution", "fixed", "--ttft-ms", "5")
+    pool = OllamaBackendPool([slow, fast], hedge=True, hedge_min_ms=50, hedge_min_samples=1)
+    pool.check_health()
+    pool._record_first_token(MODEL, 20.0)
+
+    # Make the slow backend the primary
+    pool.backends[1].outstanding = 1
+    started = time.perf_counter()
+    response = pool.chat(MODEL, MESSAGES)
+    elapsed = time.perf_counter() - started
+    pool.backends[1].outstanding = 0
+
+    assert response["message"]["content"]
+    assert response["prompt_eval_count"] > 0
+    assert pool.hedges_issued == 1
+    assert pool.hedges_won == 1
+    assert elapsed < 2.0
+
+
+def test_no_hedge_before_enough_samples(fake_ollama):
+    hosts = [fake_ollama("--distribution", "fixed", "--ttft-ms", "5") for _ in range(2)]
+    pool = OllamaBackendPool(hosts, hedge=True, hedge_min_samples=5)
+    pool.check_health()
+
+    assert pool.hedge_deadline_ms(MODEL) is None
+    pool.chat(MODEL, MESSAGES)
+    assert pool.hedges_issued == 0
+    assert pool.hedge_deadline_ms(MODEL) is None
+
+
+def test_embed_batch(fake_ollama):
+    pool = OllamaBackendPool([fake_ollama("--embed-ms", "0")])
+
+    embeddings = pool.embed("nomic-embed-text-v2-moe", ["first text", "second text", "third"])
+
+    assert len(embeddings) == 3
+    assert np.allclose(np.linalg.norm(np.array(embeddings), axis=1), 1.0)
@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+from app.services.ollama_scheduler import HYBRID, INGEST, INTERACTIVE, OllamaScheduler
+
+
+def wait_until(condition, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def queued(scheduler: OllamaScheduler) -> int:
+    return sum(c["queue_depth"] for c in scheduler.get_stats()["classes"].values())
+
+
+def test_backlog_is_served_in_proportion_to_weights():
+    scheduler = OllamaScheduler(max_concurrency=1)
+    order = []
+    release = threading.Event()
+
+    def hold():
+        with scheduler.slot(HYBRID):
+            release.wait(10)
+
+    def call(priority):
+        with scheduler.slot(priority):
+            order.append(priority)
+
+    blocker = threading.Thread(target=hold)
+    blocker.start()
+    wait_until(lambda: scheduler.get_stats()["active"] == 1)
+
+    threads = [threading.Thread(target=call, args=(p,)) for p in [INGEST] * 16 + [INTERACTIVE] * 16]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: queued(scheduler) == 32)
+    release.set()
+    for thread in threads + [blocker]:
+        thread.join(10)
+
+    # Weights 8:1 - one ingest call per eight interactive ones, queued first or not
+    assert order[:9].count(INGEST) == 1
+    assert order[:18].count(INGEST) == 2
+    stats = scheduler.get_stats()["classes"]
+    assert stats[INGEST]["dispatched"] == stats[INTERACTIVE]["dispatched"] == 16
+    assert stats[INGEST]["max_queue_depth"] == 16
+
+
+def test_concurrency_is_capped():
+    scheduler = OllamaScheduler(max_concurrency=2)
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def call(priority):
+        with scheduler.slot(priority):
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            time.sleep(0.03)
+            with lock:
+                running.pop()
+
+    threads = [threading.Thread(target=call, args=(p,)) for p in [INTERACTIVE, HYBRID, INGEST] * 3]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert max(peak) == 2
+    assert scheduler.get_stats()["active"] == 0
+
+
+def test_slot_is_released_on_error():
+    scheduler = OllamaScheduler(max_concurrency=1)
+
+    with pytest.raises(RuntimeError):
+        with scheduler.slot(INGEST):
+            raise RuntimeError("embedding failed")
+
+    with scheduler.slot(INTERACTIVE):
+        assert scheduler.get_stats()["active"] == 1
+
+
+def test_unknown_priority_is_rejected():
+    with pytest.raises(ValueError):
+        with OllamaScheduler().slot("batch"):
+            pass
@@ -0,0 +1,106 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import pytest
+
+from app.services.ollama_backend_pool import OllamaBackendPool
+from app.services.ollama_client import OllamaClient, SingleFlight
+
+CALLERS = 8
+
+
+def run_together(fn, callers: int = CALLERS):
+    with ThreadPoolExecutor(max_workers=callers) as executor:
+        futures = [executor.submit(fn) for _ in range(callers)]
+        return [future.result() for future in futures]
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        assert release.wait(10)
+        return {"answer": 42}
+
+    def call():
+        return flight.do("key", slow)
+
+    with ThreadPoolExecutor(max_workers=CALLERS) as executor:
+        leader = executor.submit(call)
+        assert started.wait(10)
+        followers = [executor.submit(call) for _ in range(CALLERS - 1)]
+        while flight.coalesced < CALLERS - 1:
+            time.sleep(0.005)
+        release.set()
+        results = [leader.result()] + [f.result() for f in followers]
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert (flight.executed, flight.coalesced, flight.in_flight()) == (1, CALLERS - 1, 0)
+
+
+def test_error_is_shared_and_key_released():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def failing():
+        started.set()
+        assert release.wait(10)
+        raise RuntimeError("model not loaded")
+
+    def call():
+        try:
+            flight.do("key", failing)
+        except RuntimeError as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(call)
+        assert started.wait(10)
+        follower = executor.submit(call)
+        while not flight.coalesced:
+            time.sleep(0.005)
+        release.set()
+        errors = [leader.result(), follower.result()]
+
+    assert errors[0] is errors[1]
+    # The next call runs again instead of replaying the failure
+    assert flight.do("key", lambda: "ok") == "ok"
+    assert flight.executed == 2
+
+
+@pytest.fixture
+def slow_client(fake_ollama):
+    url = fake_ollama("--distribution", "fixed", "--ttft-ms", "300", "--tokens-per-sec", "0")
+    return OllamaClient(pool=OllamaBackendPool([url]))
+
+
+def test_identical_chats_are_generated_once(slow_client):
+    messages = [{"role": "user", "content": "How many invoices are overdue?"}]
+
+    responses = run_together(lambda: slow_client.chat("gemma2:9b", messages, {"temperature": 0}))
+
+    assert len({r["message"]["content"] for r in responses}) == 1
+    stats = slow_client.get_stats()
+    assert stats["chat_requests"] == CALLERS
+    # Every caller arrives well within the 300 ms generation
+    assert (stats["generations"], stats["coalesced"]) == (1, CALLERS - 1)
+
+
+def test_different_chats_are_not_coalesced(slow_client):
+    questions = iter(range(CALLERS))
+    lock = threading.Lock()
+
+    def ask():
+        with lock:
+            i = next(questions)
+        return slow_client.chat("gemma2:9b", [{"role": "user", "content": f"Question {i}"}])
+
+    run_together(ask)
+
+    assert slow_client.get_stats()["generations"] == CALLERS